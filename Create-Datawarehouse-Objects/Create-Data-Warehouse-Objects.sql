@@ -64,6 +64,16 @@ CREATE TABLE [Financial_Securities].[Equities].[Yahoo_Equity_Prices](
 	    [Volume] [bigint] NULL,
 CONSTRAINT PK_US_Yahoo_Equity_Prices PRIMARY KEY([Date], [Ticker_ID]));
 
+CREATE TABLE [Financial_Securities].[Equities].[Yahoo_Equity_Prices_STG](
+            [Ticker_ID] [int] NOT NULL,
+	    [Date] [date] NOT NULL,
+	    [Open] [real] NULL,
+	    [High] [real] NULL,
+	    [Low] [real] NULL,
+	    [Close] [real] NULL,
+	    [Volume] [bigint] NULL,
+CONSTRAINT PK_Yahoo_Equity_Prices_STG PRIMARY KEY([Ticker_ID], [Date]));
+
 ALTER TABLE [Financial_Securities].[Equities].[Industry_Groups]
 ADD CONSTRAINT FK_Industry_Groups_Sector 
 FOREIGN KEY (Sector_ID)
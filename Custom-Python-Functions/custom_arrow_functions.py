@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Arrow compute path for the period bars and return columns.
+
+The daily prices are held in a pyarrow Table instead of a block-managed DataFrame. The period bars are aggregated
+with the Arrow hash aggregations and the return columns of calculate_return_columns are calculated with the Arrow
+compute kernels, using running sums over the Tables sorted by 'Ticker' and 'Date' in place of pandas groupby. The
+results stay Arrow Tables so they can be written by the Parquet writer directly, and are converted to pandas without
+consolidating the columns into new blocks when the pandas functions need them.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from custom_profiling_functions import profile_function
+
+# Number of periods in a Year of each period type
+_PERIODS_PER_YEAR = {'Year': 1, 'Quarter': 4, 'Month': 12, 'Daily': 252}
+
+# Hash aggregation of each column of the period bars, as in get_pricing_data
+_BAR_AGGREGATIONS = [('Date', 'last'), ('Open', 'first'), ('High', 'max'), ('Low', 'min'), ('Close', 'last'),
+                     ('Volume', 'last')]
+
+
+def prices_to_arrow(df_pricing):
+
+    """
+    Converts a DataFrame of prices to a pyarrow Table.
+
+    Args:
+        - df_pricing: DataFrame of prices, or a pyarrow Table which is returned as is.
+
+    Returns:
+        - A pyarrow Table with the same columns, without the index.
+    """
+
+    if isinstance(df_pricing, pa.Table):
+        return df_pricing
+
+    return pa.Table.from_pandas(df_pricing, preserve_index=False)
+
+
+def arrow_to_pandas(table, arrow_dtypes=False):
+
+    """
+    Converts a pyarrow Table to a DataFrame without consolidating the columns into blocks.
+
+    Numeric columns without nulls are handed to pandas without being copied. With arrow_dtypes the columns keep
+    their Arrow memory as pyarrow-backed pandas dtypes, which the plotting and NumPy based functions do not support.
+
+    Args:
+        - table: pyarrow Table.
+        - arrow_dtypes: Boolean indicating whether to return pyarrow-backed columns instead of NumPy columns.
+
+    Returns:
+        - A DataFrame with the columns of the Table.
+    """
+
+    if arrow_dtypes:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    return table.to_pandas(split_blocks=True)
+
+
+@profile_function
+def read_arrow_prices(prices_file):
+
+    """
+    Reads daily prices from a Parquet or CSV file straight into a pyarrow Table, as read_price_file does for pandas.
+
+    Args:
+        - prices_file: String with the path of a .parquet or .csv file with 'Ticker', 'Date' and price columns.
+
+    Returns:
+        - A pyarrow Table sorted by 'Ticker' and 'Date', with a 'Year' column added when it is missing.
+    """
+
+    if prices_file.lower().endswith('.parquet'):
+        table = pq.read_table(prices_file)
+    elif prices_file.lower().endswith('.csv'):
+        table = pv.read_csv(prices_file, convert_options=pv.ConvertOptions(column_types={'Date': pa.timestamp('ns')}))
+    else:
+        raise ValueError(f"Invalid price file: {prices_file}. Must be a .parquet or .csv file.")
+
+    if 'Year' not in table.column_names:
+        table = table.append_column('Year', pc.year(table['Date']).cast(pa.int32()))
+
+    return table.sort_by([('Ticker', 'ascending'), ('Date', 'ascending')])
+
+
+@profile_function
+def get_arrow_pricing_data(prices, period):
+
+    """
+    Aggregates the daily prices into period bars with Arrow hash aggregations, like get_pricing_data.
+
+    Args:
+        - prices: pyarrow Table (or DataFrame) with 'Ticker', 'Date', 'Year', 'Open', 'High', 'Low', 'Close' and
+          'Volume' columns, sorted by 'Ticker' and 'Date'.
+        - period: String specifying the period type for aggregation ('Year', 'Quarter', or 'Month').
+
+    Returns:
+        - A pyarrow Table of period bars sorted by 'Ticker' and the period keys, with the columns of get_pricing_data.
+    """
+
+    table = prices_to_arrow(prices)
+
+    keys = ['Ticker', 'Year']
+    if period == 'Quarter':
+        table = table.append_column('Quarter', pc.quarter(table['Date']).cast(pa.int32()))
+        keys.append('Quarter')
+    elif period == 'Month':
+        table = table.append_column('Month', pc.month(table['Date']).cast(pa.int32()))
+        keys.append('Month')
+
+    # Without threads the first and last aggregations follow the row order, i.e. the Date order of each Ticker
+    table_bars = table.group_by(keys, use_threads=False).aggregate(_BAR_AGGREGATIONS)
+    table_bars = table_bars.select(keys + [f'{col}_{how}' for col, how in _BAR_AGGREGATIONS])
+    table_bars = table_bars.rename_columns(keys + [col for col, _ in _BAR_AGGREGATIONS])
+
+    return table_bars.sort_by([(key, 'ascending') for key in keys])
+
+
+def _shift(values, fill):
+
+    """
+    Shifts an Arrow array down by one position, filling the first position.
+    """
+
+    return pa.concat_arrays([pa.array([fill], type=values.type), values.slice(0, len(values) - 1)])
+
+
+def _np_round(values, decimals=2):
+
+    """
+    Rounds an Arrow array the same way as numpy.round (pc.round rounds some halves differently).
+    """
+
+    scale = 10.0 ** decimals
+
+    return pc.divide(pc.round(pc.multiply(values, scale), 0, round_mode='half_to_even'), scale)
+
+
+class _TickerRuns:
+
+    """
+    Row positions of the runs of each Ticker in a Table sorted by 'Ticker', used to calculate running sums by Ticker
+    with one cumulative sum over the whole column.
+    """
+
+    def __init__(self, tickers):
+
+        is_start = pc.not_equal(tickers, _shift(tickers, None)).fill_null(True)
+        self.is_start = is_start
+        self.run = pc.subtract(pc.cumulative_sum(is_start.cast(pa.int64())), 1)
+        self.starts = pc.indices_nonzero(is_start).cast(pa.int64())
+        self.position = pc.subtract(pa.array(np.arange(len(tickers))), pc.take(self.starts, self.run))
+
+    def cumsum(self, values):
+
+        """
+        Returns the running sum of values within each Ticker.
+        """
+
+        total = pc.cumulative_sum(values)
+        before_run = pc.subtract(pc.take(total, self.starts), pc.take(values, self.starts))
+
+        return pc.subtract(total, pc.take(before_run, self.run))
+
+    def mean(self, values, include):
+
+        """
+        Returns the mean of the included values of each Ticker, broadcast to the rows of the Ticker.
+        """
+
+        # Without threads the groups are returned in the order of the runs
+        weights = include.cast(pa.float64())
+        table_runs = pa.table({'Run': self.run, 'Value': pc.if_else(include, values, 0.0), 'Weight': weights})
+        table_runs = table_runs.group_by('Run', use_threads=False).aggregate([('Value', 'sum'), ('Weight', 'sum')])
+        means = pc.divide(table_runs['Value_sum'], table_runs['Weight_sum']).combine_chunks()
+
+        return pc.take(means, self.run)
+
+    def expanding_std(self, values, include):
+
+        """
+        Returns the expanding sample standard deviation of the included values of each Ticker (NaN with fewer than 2
+        values) and the expanding count of included values, as _expanding_std_by_group.
+        """
+
+        count = self.cumsum(include.cast(pa.int64()))
+
+        # Center each Ticker before the running sums to limit cancellation in the variance formula
+        centered = pc.if_else(include, pc.subtract(values, self.mean(values, include)), 0.0)
+        sum1 = self.cumsum(centered)
+        sum2 = self.cumsum(pc.multiply(centered, centered))
+
+        variance = pc.divide(pc.subtract(sum2, pc.divide(pc.multiply(sum1, sum1), count.cast(pa.float64()))),
+                             pc.subtract(count, 1).cast(pa.float64()))
+        std = pc.sqrt(pc.max_element_wise(variance, 0.0))
+
+        return pc.if_else(pc.less(count, 2), np.nan, std), count
+
+
+@profile_function
+def calculate_arrow_return_columns(table, period, log_returns=True):
+
+    """
+    Calculates the return columns of calculate_return_columns with Arrow compute kernels.
+
+    The values match calculate_return_columns to floating point precision. A rounded value can differ by 0.01 when
+    it falls on a rounding boundary, since the Arrow and NumPy logarithms differ in the last bit.
+
+    Args:
+        - table: pyarrow Table (or DataFrame) with 'Ticker', 'Open' and 'Close' columns, sorted by 'Ticker' and
+          'Date'.
+        - period: A string representing the period type column ('Year', 'Quarter', 'Month', or 'Daily').
+        - log_returns: Boolean indicating whether to add the 'Log % Return' column, which calculate_return_columns
+          does not return.
+
+    Returns:
+        - A pyarrow Table with one row per input row and only the new columns: '% Return', 'Log % Return',
+          'Cumulative % Return', 'Annualized % Return', 'Annualized Volatility' and 'Annualized Downside Volatility'
+          (prefixed with the period when it is not 'Daily').
+    """
+
+    if period not in _PERIODS_PER_YEAR:
+        raise ValueError(f"Invalid period: {period}. Must be one of {', '.join(_PERIODS_PER_YEAR)}.")
+
+    table = prices_to_arrow(table)
+    no_of_periods = _PERIODS_PER_YEAR[period]
+    label = '' if period == 'Daily' else period + ' '
+
+    runs = _TickerRuns(table['Ticker'].combine_chunks())
+    close = table['Close'].combine_chunks().cast(pa.float64())
+    open_ = table['Open'].combine_chunks().cast(pa.float64())
+
+    # The first period return is based on 'Close' and 'Open', subsequent periods on the previous close
+    prev_close = pc.if_else(runs.is_start, np.nan, _shift(close, np.nan))
+    base = pc.if_else(pc.is_nan(prev_close), open_, prev_close)
+    ratio = pc.divide(close, base)
+    ret = pc.subtract(ratio, 1.0)
+    log_ret = pc.ln(ratio)
+
+    # Cumulative returns from the running sums of the log returns, which are the running products of the returns
+    cum_ret = pc.subtract(pc.exp(runs.cumsum(pc.if_else(pc.is_nan(log_ret), 0.0, log_ret))), 1.0)
+    ret_count = pc.add(runs.position, 1).cast(pa.float64())
+    ann_ret = pc.subtract(pc.power(pc.add(cum_ret, 1.0), pc.divide(float(no_of_periods), ret_count)), 1.0)
+
+    # Volatility is 0 for the first period of a Ticker and downside volatility is 0 until the first negative return
+    all_returns = pc.invert(pc.is_nan(ret))
+    vol, _ = runs.expanding_std(ret, all_returns)
+    downside_vol, neg_count = runs.expanding_std(ret, pc.and_(all_returns, pc.less(ret, 0.0)))
+    vol = pc.if_else(pc.greater(runs.position, 0), pc.multiply(vol, np.sqrt(no_of_periods)), 0.0)
+    downside_vol = pc.if_else(pc.greater(neg_count, 0), pc.multiply(downside_vol, np.sqrt(no_of_periods)), 0.0)
+
+    # Convert Returns to percentages
+    columns = {label + '% Return': ret}
+    if log_returns:
+        columns[label + 'Log % Return'] = log_ret
+    columns.update({label + 'Cumulative % Return': cum_ret, label + 'Annualized % Return': ann_ret,
+                    label + 'Annualized Volatility': vol, label + 'Annualized Downside Volatility': downside_vol})
+
+    return pa.table({name: _np_round(pc.multiply(values, 100.0)) for name, values in columns.items()})
+
+
+@profile_function
+def calculate_arrow_returns(prices, period):
+
+    """
+    Builds the period bars of the daily prices and adds the return columns, all in Arrow.
+
+    Args:
+        - prices: pyarrow Table (or DataFrame) of daily prices sorted by 'Ticker' and 'Date'.
+        - period: A string representing the period type ('Year', 'Quarter', 'Month', or 'Daily').
+
+    Returns:
+        - A pyarrow Table of the period bars (the daily prices for 'Daily') with the return columns appended.
+    """
+
+    table = prices_to_arrow(prices) if period == 'Daily' else get_arrow_pricing_data(prices, period)
+    table_ret = calculate_arrow_return_columns(table, period)
+
+    for name in table_ret.column_names:
+        table = table.append_column(name, table_ret[name])
+
+    return table
+
+
+@profile_function
+def write_arrow_parquet(table, path):
+
+    """
+    Writes a pyarrow Table to a Parquet file without converting it to pandas, replacing the file in one step.
+
+    Args:
+        - table: pyarrow Table.
+        - path: String with the path of the .parquet file.
+
+    Returns:
+        - int: The number of rows written.
+    """
+
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+    return table.num_rows
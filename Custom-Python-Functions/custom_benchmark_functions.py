@@ -0,0 +1,786 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic S&P-scale data generator and benchmark suite for the functions in custom_python_functions.py.
+
+The generator produces daily OHLCV panels from geometric Brownian motion paths together with a GICS hierarchy
+that mirrors SP500_GICS_Combined.csv. The benchmark suite times every calculation and ETL transform on these
+panels and records peak memory so results can be saved as a baseline and compared later.
+"""
+
+import os
+import json
+import time
+import inspect
+import tempfile
+import tracemalloc
+import datetime as dt
+import pandas as pd
+import numpy as np
+import sqlalchemy as sa
+from custom_python_functions import get_pricing_data, calculate_return, calculate_stats, calculate_drawdowns
+from custom_python_functions import calculate_portfolio_return, calculate_return_columns, calculate_drawdown_columns
+from custom_distribution_functions import calculate_return_distributions
+from custom_ranking_functions import calculate_ranks, select_top_k
+from custom_rollup_functions import calculate_gics_rollup
+from custom_rolling_functions import calculate_rolling_metrics
+from custom_simulation_functions import simulate_portfolio
+from custom_optimization_functions import calculate_return_moments, evaluate_random_portfolios, solve_max_sharpe
+from custom_optimization_functions import calculate_efficient_frontier
+from custom_export_functions import build_export_tables
+from custom_local_backend_functions import build_local_tables, create_local_warehouse, run_local_query
+from custom_cache_functions import enable_result_cache, disable_result_cache
+from custom_streaming_functions import SnapshotBook
+from custom_service_functions import MetricsStore
+from custom_arrow_functions import prices_to_arrow, get_arrow_pricing_data, calculate_arrow_return_columns
+from custom_period_functions import PeriodTable
+from custom_python_functions import plot_top_returns_bar_chart
+from custom_chart_functions import period_labels
+from custom_screening_functions import FactorScreen, calculate_factor_screen
+from custom_service_functions import read_service_prices
+from custom_warehouse_functions import read_partitioned_prices
+from custom_etl_functions import adjust_yahoo_prices, create_price_tables, TickerIdCache, read_price_load_keys
+from custom_etl_functions import stage_price_batch, merge_price_batch
+
+
+# Default location of the GICS source file relative to this folder
+GICS_COMBINED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data-Source-Files',
+                                  'SP500_GICS_Combined.csv')
+
+# Registry of benchmarks: name -> (setup function, run function)
+BENCHMARKS = {}
+
+
+def _create_ticker_symbols(n_tickers):
+
+    """
+    Creates unique upper case ticker symbols ('AAA', 'AAB', ...).
+
+    Args:
+        - n_tickers: Integer specifying the number of symbols to create.
+
+    Returns:
+        - A list of ticker symbol strings.
+    """
+
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    width = max(3, int(np.ceil(np.log(max(n_tickers, 2)) / np.log(26))))
+
+    # Write each ticker number in base 26 using letters as digits
+    numbers = np.arange(n_tickers)
+    digits = [letters[(numbers // (26 ** i)) % 26] for i in reversed(range(width))]
+
+    return [''.join(chars) for chars in zip(*digits)]
+
+
+def generate_synthetic_gics(n_tickers, seed=42, gics_file=None):
+
+    """
+    Generates a GICS classification for synthetic tickers that mirrors SP500_GICS_Combined.csv.
+
+    Sub-Industries are drawn with the same frequency as in the source file so the Sector, Industry Group,
+    Industry and Sub-Industry ticker counts keep the real proportions.
+
+    Args:
+        - n_tickers: Integer specifying the number of tickers.
+        - seed: Integer seed for the random number generator.
+        - gics_file: String with the path of SP500_GICS_Combined.csv (defaults to the Data-Source-Files folder).
+
+    Returns:
+        - A DataFrame with the same columns as SP500_GICS_Combined.csv.
+    """
+
+    if gics_file is None:
+        gics_file = GICS_COMBINED_FILE
+
+    if not os.path.isfile(gics_file):
+        raise FileNotFoundError(f"GICS file not found: {gics_file}")
+
+    df_gics = pd.read_csv(gics_file)
+
+    # Count the tickers of each Sub-Industry to use as sampling weights
+    gics_cols = ['Sector_ID', 'Sector', 'Industry_Group_ID', 'Industry_Group', 'Industry_ID', 'Industry',
+                 'Sub_Industry_ID', 'Sub_Industry']
+    df_sub_industries = df_gics.groupby(gics_cols).size().reset_index(name='Count')
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(df_sub_industries), size=n_tickers,
+                       p=df_sub_industries['Count'] / df_sub_industries['Count'].sum())
+
+    df_tmp = df_sub_industries.iloc[picks][gics_cols].reset_index(drop=True)
+    tickers = _create_ticker_symbols(n_tickers)
+    df_tmp.insert(0, 'Ticker', tickers)
+    df_tmp.insert(1, 'Name', [ticker + ' Synthetic Corp' for ticker in tickers])
+
+    return df_tmp
+
+
+def generate_synthetic_pricing(n_tickers, n_years, seed=42, start_date='2021-01-01'):
+
+    """
+    Generates a daily OHLCV pricing panel from geometric Brownian motion paths.
+
+    Each ticker gets its own annual drift and volatility. The output has the same columns and sort order as
+    the pricing query used in the analysis notebooks.
+
+    Args:
+        - n_tickers: Integer specifying the number of tickers.
+        - n_years: Integer specifying the number of years of business days to generate.
+        - seed: Integer seed for the random number generator.
+        - start_date: String with the first date in 'YYYY-MM-DD' format.
+
+    Returns:
+        - A DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume' and 'Year' columns.
+    """
+
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start=start_date, periods=int(n_years * 252))
+    n_days = len(dates)
+
+    # Annual drift and volatility for each ticker, converted to daily values
+    mu = rng.normal(0.08, 0.10, n_tickers) / 252
+    sigma = rng.uniform(0.15, 0.60, n_tickers) / np.sqrt(252)
+    start_prices = rng.uniform(10, 500, n_tickers)
+
+    # Geometric Brownian motion: log price increments are normal with drift mu - sigma^2 / 2
+    shocks = rng.standard_normal((n_days, n_tickers))
+    log_returns = (mu - 0.5 * sigma ** 2) + sigma * shocks
+    close = start_prices * np.exp(np.cumsum(log_returns, axis=0))
+
+    # Open gaps from the previous close and intraday ranges scaled by the ticker volatility
+    prev_close = np.vstack([start_prices, close[:-1]])
+    open_ = prev_close * np.exp(sigma * 0.3 * rng.standard_normal((n_days, n_tickers)))
+    high = np.maximum(open_, close) * (1 + np.abs(sigma * 0.5 * rng.standard_normal((n_days, n_tickers))))
+    low = np.minimum(open_, close) * (1 - np.abs(sigma * 0.5 * rng.standard_normal((n_days, n_tickers))))
+    volume = rng.lognormal(mean=15, sigma=0.5, size=(n_days, n_tickers)).astype(np.int64)
+
+    # Flatten the Date x Ticker matrices into a panel sorted by Ticker and Date
+    tickers = _create_ticker_symbols(n_tickers)
+    df_tmp = pd.DataFrame({
+        'Ticker': np.repeat(tickers, n_days),
+        'Date': np.tile(dates.values, n_tickers),
+        'Open': np.round(open_.T.ravel(), 2),
+        'High': np.round(high.T.ravel(), 2),
+        'Low': np.round(low.T.ravel(), 2),
+        'Close': np.round(close.T.ravel(), 2),
+        'Volume': volume.T.ravel()
+    })
+    df_tmp['Year'] = df_tmp['Date'].dt.year
+
+    return df_tmp
+
+
+def register_benchmark(name, setup, run):
+
+    """
+    Registers a benchmark in the suite.
+
+    Args:
+        - name: String with the benchmark name.
+        - setup: Function taking (df_pricing, df_gics) and returning a tuple of arguments for run. Not timed.
+        - run: Function executed with the arguments returned by setup. Timed.
+    """
+
+    BENCHMARKS[name] = (setup, run)
+
+
+def measure(run, make_args):
+
+    """
+    Measures the wall time of a function in an untraced run and its peak traced memory in a second, traced run, since
+    tracemalloc slows down every allocation of the call.
+
+    Args:
+        - run: The function to execute.
+        - make_args: Function returning a fresh tuple of arguments for run, called before each of the two runs.
+
+    Returns:
+        - tuple: Elapsed seconds of the untraced run and peak memory in MB allocated during the traced run.
+    """
+
+    args = make_args()
+    start_time = time.perf_counter()
+    run(*args)
+    elapsed = time.perf_counter() - start_time
+
+    # Fresh arguments since most functions modify their input
+    args = make_args()
+    tracemalloc.start()
+    try:
+        run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return elapsed, peak / (1024 ** 2)
+
+
+def run_benchmark_suite(ticker_counts=(100, 500, 5000), n_years=3, seed=42, benchmarks=None, repeats=1):
+
+    """
+    Runs the registered benchmarks on synthetic panels of several sizes.
+
+    Args:
+        - ticker_counts: Tuple of integers with the number of tickers of each panel.
+        - n_years: Integer specifying the number of years of daily data per ticker.
+        - seed: Integer seed for the synthetic data.
+        - benchmarks: List of benchmark names to run (defaults to all registered benchmarks).
+        - repeats: Integer specifying how many times each benchmark runs; the fastest run is kept.
+
+    Returns:
+        - A DataFrame with 'Benchmark', 'Tickers', 'Rows', 'Seconds' and 'Peak Memory MB' columns.
+    """
+
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS)
+
+    unknown = [name for name in benchmarks if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {unknown}")
+
+    results = []
+    for n_tickers in ticker_counts:
+        df_pricing = generate_synthetic_pricing(n_tickers, n_years, seed)
+        df_gics = generate_synthetic_gics(n_tickers, seed)
+
+        for name in benchmarks:
+            setup, run = BENCHMARKS[name]
+            timings = []
+            for _ in range(repeats):
+                # Every run gets fresh arguments since most functions modify their input
+                timings.append(measure(run, lambda: setup(df_pricing, df_gics)))
+
+            elapsed, peak_mb = min(timings)
+            results.append({
+                'Benchmark': name,
+                'Tickers': n_tickers,
+                'Rows': len(df_pricing),
+                'Seconds': round(elapsed, 4),
+                'Peak Memory MB': round(peak_mb, 2)
+            })
+            print(f"{name} ({n_tickers} tickers): {elapsed:.3f} s, {peak_mb:.1f} MB")
+
+    return pd.DataFrame(results)
+
+
+def save_benchmark_baseline(df_results, path):
+
+    """
+    Saves benchmark results as a JSON baseline file.
+
+    Args:
+        - df_results: DataFrame returned by run_benchmark_suite.
+        - path: String with the path of the baseline file.
+    """
+
+    baseline = {
+        'Created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'Results': df_results.to_dict(orient='records')
+    }
+
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+
+def compare_benchmark_baseline(df_results, path, tolerance=0.20):
+
+    """
+    Compares benchmark results with a saved baseline.
+
+    Args:
+        - df_results: DataFrame returned by run_benchmark_suite.
+        - path: String with the path of the baseline file.
+        - tolerance: Float specifying the allowed relative slowdown or memory growth before flagging a regression.
+
+    Returns:
+        - A DataFrame with baseline and current values, their ratios and a 'Regression' flag.
+    """
+
+    with open(path, 'r') as baseline_file:
+        df_baseline = pd.DataFrame(json.load(baseline_file)['Results'])
+
+    df_tmp = pd.merge(df_baseline, df_results, on=['Benchmark', 'Tickers'], suffixes=(' Baseline', ''))
+
+    df_tmp['Time Ratio'] = round(df_tmp['Seconds'] / df_tmp['Seconds Baseline'], 2)
+    df_tmp['Memory Ratio'] = round(df_tmp['Peak Memory MB'] / df_tmp['Peak Memory MB Baseline'], 2)
+    df_tmp['Regression'] = (df_tmp['Time Ratio'] > 1 + tolerance) | (df_tmp['Memory Ratio'] > 1 + tolerance)
+
+    return df_tmp[['Benchmark', 'Tickers', 'Seconds Baseline', 'Seconds', 'Time Ratio',
+                   'Peak Memory MB Baseline', 'Peak Memory MB', 'Memory Ratio', 'Regression']]
+
+
+def _adjust_downloads(downloads):
+
+    """
+    Adjusts the Yahoo download of every Ticker with adjust_yahoo_prices, as fetch_yahoo_prices does per Ticker.
+    """
+
+    return [adjust_yahoo_prices(df_tmp, ticker) for ticker, df_tmp in downloads]
+
+
+def _merge_staged_prices(engine, tickers, ticker_ids, calendar_dates):
+
+    """
+    Merges the staged prices of every Ticker into Yahoo_Equity_Prices in one transaction with merge_price_batch.
+    """
+
+    with engine.begin() as conn:
+        return merge_price_batch(conn, tickers, ticker_ids, calendar_dates, schema=None)
+
+
+def _equity_workflow_copy(df_pricing):
+
+    """
+    Runs the return and drawdown steps of Equity-Performance-Analysis.ipynb with a copy before every call.
+
+    Args:
+        - df_pricing: Daily pricing DataFrame.
+
+    Returns:
+        - The daily returns with drawdowns.
+    """
+
+    df_yearly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Year').copy(), 'Year')
+    df_quarterly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Quarter').copy(), 'Quarter')
+    df_monthly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Month').copy(), 'Month')
+    df_ret = calculate_return(df_pricing.copy(), 'Daily')
+    df_ret2 = calculate_drawdowns(df_ret.copy(), 'Ticker', 'Daily')
+
+    return df_ret2, df_yearly_ret, df_quarterly_ret, df_monthly_ret
+
+
+def _equity_workflow_columns(df_pricing):
+
+    """
+    Runs the return and drawdown steps of Equity-Performance-Analysis.ipynb with the column returning functions,
+    keeping the new columns next to the pricing data instead of copying it.
+
+    Args:
+        - df_pricing: Daily pricing DataFrame.
+
+    Returns:
+        - The daily return and drawdown columns and the period returns.
+    """
+
+    df_pricing_yr = get_pricing_data(df_pricing, 'Year')
+    df_yearly_ret = calculate_return_columns(df_pricing_yr, 'Year')
+    df_pricing_qtr = get_pricing_data(df_pricing, 'Quarter')
+    df_quarterly_ret = calculate_return_columns(df_pricing_qtr, 'Quarter')
+    df_pricing_mth = get_pricing_data(df_pricing, 'Month')
+    df_monthly_ret = calculate_return_columns(df_pricing_mth, 'Month')
+    df_ret = calculate_return_columns(df_pricing, 'Daily')
+
+    # Drawdowns only need the key columns and the cumulative return
+    df_keys = pd.concat([df_pricing[['Ticker', 'Date']], df_ret[['Cumulative % Return']]], axis=1)
+    df_drawdowns = calculate_drawdown_columns(df_keys, 'Ticker', 'Daily')
+
+    return df_ret, df_drawdowns, df_yearly_ret, df_quarterly_ret, df_monthly_ret
+
+
+def _setup_etl_adjust_prices(df_pricing, df_gics):
+
+    """
+    Builds the Yahoo download of every Ticker for the price adjustment benchmark.
+    """
+
+    # Simulate the raw Yahoo download with an 'Adj Close' column and a few missing prices, indexed by Date per Ticker
+    df_tmp = df_pricing[['Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume']].copy()
+    df_tmp['Adj Close'] = df_tmp['Close'] * 0.98
+    df_tmp.loc[df_tmp.index[::97], ['Open', 'High', 'Low']] = np.nan
+
+    downloads = [(ticker, df_ticker.drop(columns='Ticker').set_index('Date'))
+                 for ticker, df_ticker in df_tmp.groupby('Ticker', sort=False)]
+
+    return (downloads,)
+
+
+def _setup_etl_merge(df_pricing, df_gics):
+
+    """
+    Stages the synthetic prices in a SQLite price load database in the temporary folder for the merge benchmark.
+    """
+
+    path = os.path.join(tempfile.gettempdir(), 'benchmark_price_load.db')
+    if os.path.exists(path):
+        os.remove(path)
+    engine = sa.create_engine('sqlite:///' + path)
+    create_price_tables(engine)
+
+    tickers = df_pricing['Ticker'].unique().tolist()
+    tbl_calendar = sa.table('Market_Calendar', sa.column('Country', sa.String), sa.column('Date', sa.Date))
+
+    with engine.begin() as conn:
+        TickerIdCache(None).create_missing(conn, pd.DataFrame({'Ticker': tickers, 'Name': tickers,
+                                                               'Sub_Industry_ID': 1}))
+        conn.execute(sa.insert(tbl_calendar), [{'Country': 'United States', 'Date': date}
+                                               for date in df_pricing['Date'].drop_duplicates().dt.date])
+        ticker_ids, calendar_dates = read_price_load_keys(conn, schema=None)
+
+        # Every 50th price is missing from the staged rows, so the merge forward fills its calendar date
+        stage_price_batch(conn, df_pricing.drop(index=df_pricing.index[::50]), ticker_ids, schema=None)
+
+    return (engine, tickers, ticker_ids, calendar_dates)
+
+
+def _setup_returns(period):
+
+    """
+    Returns a setup function building the input of the calculate_return benchmark for a period type.
+    """
+
+    def setup(df_pricing, df_gics):
+        if period == 'Daily':
+            return (df_pricing.copy(), period)
+        return (get_pricing_data(df_pricing.copy(), period), period)
+
+    return setup
+
+
+def _setup_stats(df_pricing, df_gics):
+
+    """
+    Builds the combined Year and Quarter returns used by calculate_stats.
+    """
+
+    df_yearly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Year'), 'Year')
+    df_quarterly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Quarter'), 'Quarter')
+    df_comb_ret = pd.merge(df_yearly_ret[['Ticker', 'Year', 'Year % Return']],
+                           df_quarterly_ret[['Ticker', 'Year', 'Quarter', 'Quarter % Return']], on=['Ticker', 'Year'])
+
+    return (df_comb_ret, 'Ticker', 'Quarter')
+
+
+def _setup_drawdowns(df_pricing, df_gics):
+
+    """
+    Builds the monthly returns used by calculate_drawdowns.
+    """
+
+    return (calculate_return(get_pricing_data(df_pricing.copy(), 'Month'), 'Month'), 'Ticker', 'Month')
+
+
+def _setup_portfolio_return(df_pricing, df_gics):
+
+    """
+    Builds the monthly returns with Sectors used by calculate_portfolio_return.
+    """
+
+    df_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Month'), 'Month')
+    df_ret = df_ret.merge(df_gics[['Ticker', 'Sector']], on='Ticker')
+
+    return (df_ret, ['Sector', 'Ticker'], 'Month')
+
+
+def _setup_return_distributions(df_pricing, df_gics):
+
+    """
+    Builds the daily returns with Sectors used by calculate_return_distributions.
+    """
+
+    df_ret = calculate_return(df_pricing.copy(), 'Daily')
+    df_ret = df_ret.merge(df_gics[['Ticker', 'Sector']], on='Ticker').dropna(subset=['% Return'])
+
+    return (df_ret, '% Return', 'Sector')
+
+
+def _setup_ranks(df_pricing, df_gics):
+
+    """
+    Builds the monthly returns ranked within each Year and Month.
+    """
+
+    df_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Month'), 'Month')
+
+    return (df_ret, 'Month % Return', ['Year', 'Month'])
+
+
+def _setup_top_k(df_pricing, df_gics):
+
+    """
+    Builds the monthly returns used to select the top 10 Tickers of each Year and Month.
+    """
+
+    df_ret, return_type, group_cols = _setup_ranks(df_pricing, df_gics)
+
+    return (df_ret, return_type, 10, group_cols)
+
+
+def _setup_gics_rollup(df_pricing, df_gics):
+
+    """
+    Builds the daily returns and GICS membership used by calculate_gics_rollup.
+    """
+
+    df_ret = calculate_return(df_pricing.copy(), 'Daily')
+
+    return (df_ret, df_gics[['Ticker', 'Sector', 'Industry_Group', 'Industry', 'Sub_Industry']], 'Daily')
+
+
+def _setup_return_moments(df_pricing, df_gics):
+
+    """
+    Builds the annualized mean vector and covariance matrix used by the portfolio optimizer.
+    """
+
+    return calculate_return_moments(df_pricing)
+
+
+def _setup_export_tables(df_pricing, df_gics):
+
+    """
+    Builds the arguments of build_export_tables with the GICS membership of the synthetic tickers.
+    """
+
+    return (df_pricing, df_gics[['Ticker', 'Sector', 'Industry_Group', 'Industry', 'Sub_Industry']])
+
+
+def _setup_local_query(df_pricing, df_gics):
+
+    """
+    Loads the synthetic prices into an in-memory local warehouse and returns the arguments of run_local_query.
+    """
+
+    warehouse = create_local_warehouse(build_local_tables(df_gics, df_pricing))
+
+    return (warehouse, 'FN_Yahoo_Ticker_Quarter_Returns_by_Year_Statistics')
+
+
+def _cached_return_columns(cache_folder, df_tmp, period):
+
+    """
+    Runs calculate_return_columns with the result cache enabled, disabling it again for the other benchmarks.
+    """
+
+    enable_result_cache(cache_folder)
+    try:
+        return calculate_return_columns(df_tmp, period)
+    finally:
+        disable_result_cache()
+
+
+def _setup_cached_returns(df_pricing, df_gics):
+
+    """
+    Fills a result cache in the temporary folder with the daily returns so the benchmark measures a warm session.
+    """
+
+    cache_folder = os.path.join(tempfile.gettempdir(), 'benchmark_result_cache')
+    _cached_return_columns(cache_folder, df_pricing, 'Daily')
+
+    return (cache_folder, df_pricing, 'Daily')
+
+
+def _setup_snapshot_update(df_pricing, df_gics):
+
+    """
+    Builds a SnapshotBook holding the last Date of the synthetic prices and a snapshot changing 10% of the tickers.
+    """
+
+    df_last = df_pricing.groupby('Ticker').tail(2)
+    df_snapshot = df_last.groupby('Ticker').agg(Last=('Close', 'last'), Previous=('Close', 'first'), High=('High', 'last'),
+                                                Low=('Low', 'last'), Volume=('Volume', 'last'), Time=('Date', 'last'))
+    df_snapshot = df_snapshot.reset_index()
+    df_snapshot['Change'] = (df_snapshot['Last'] - df_snapshot['Previous']).round(2)
+    df_snapshot['% Change'] = (df_snapshot['Change'] / df_snapshot['Previous'] * 100).round(2)
+
+    book = SnapshotBook(df_gics, levels=['Sector', 'Industry'])
+    book.apply(df_snapshot)
+
+    df_update = df_snapshot.sample(frac=0.1, random_state=42)
+    df_update['Last'] = df_update['Last'] * 1.01
+    df_update['Change'] = (df_update['Last'] - df_update['Previous']).round(2)
+    df_update['% Change'] = (df_update['Change'] / df_update['Previous'] * 100).round(2)
+
+    return (book, df_update)
+
+
+def _setup_metrics_store(df_pricing, df_gics):
+
+    """
+    Builds a MetricsStore on the synthetic prices and answers the benchmarked request once to fill its caches.
+    """
+
+    store = MetricsStore(df_pricing, df_gics[['Ticker', 'Sector', 'Industry_Group', 'Industry', 'Sub_Industry']])
+    path = '/returns?period=Month&level=Sector'
+    store.handle(path)
+
+    return (store, path)
+
+
+def _setup_arrow_prices(period):
+
+    """
+    Returns a setup function converting the synthetic prices to a pyarrow Table, outside of the timed call.
+    """
+
+    def setup(df_pricing, df_gics):
+        return (prices_to_arrow(df_pricing), period)
+
+    return setup
+
+
+def _setup_export_tables_arrow(df_pricing, df_gics):
+
+    """
+    Builds the arguments of build_export_tables with the Arrow compute path.
+    """
+
+    return _setup_export_tables(df_pricing, df_gics) + (('Year', 'Quarter', 'Month'), None, None, 'arrow')
+
+
+def _setup_period_returns(df_pricing, df_gics):
+
+    """
+    Builds the Year and daily returns whose 'Year % Return' is attached to the daily rows.
+    """
+
+    df_yearly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Year'), 'Year')
+    df_daily_ret = calculate_return(df_pricing.copy(), 'Daily')
+
+    return (df_yearly_ret, df_daily_ret)
+
+
+def _merge_year_return(df_yearly_ret, df_daily_ret):
+
+    """
+    Attaches the 'Year % Return' to the daily returns with a merge on 'Ticker' and 'Year'.
+    """
+
+    return df_daily_ret.merge(df_yearly_ret[['Ticker', 'Year', 'Year % Return']], on=['Ticker', 'Year'], how='left')
+
+
+def _period_table_year_return(df_yearly_ret, df_daily_ret):
+
+    """
+    Attaches the 'Year % Return' to the daily returns with the parent codes of a PeriodTable.
+    """
+
+    return PeriodTable({'Year': df_yearly_ret, 'Daily': df_daily_ret}, 'Ticker').frame('Daily')
+
+
+def _setup_stats_period_table(df_pricing, df_gics):
+
+    """
+    Builds the PeriodTable of the Year and Quarter returns used by calculate_stats.
+    """
+
+    df_yearly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Year'), 'Year')
+    df_quarterly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Quarter'), 'Quarter')
+
+    return (PeriodTable({'Year': df_yearly_ret, 'Quarter': df_quarterly_ret}, 'Ticker'), 'Ticker', 'Quarter')
+
+
+def _setup_month_labels(df_pricing, df_gics):
+
+    """
+    Builds the Month bars whose 'Mon-YYYY' plot labels are benchmarked.
+    """
+
+    return (get_pricing_data(df_pricing.copy(), 'Month'),)
+
+
+def _month_labels_apply(df_tmp):
+
+    """
+    Builds the 'Mon-YYYY' labels with a Timestamp per row, as the plotting functions did.
+    """
+
+    return df_tmp['Month'].apply(lambda x: pd.Timestamp(f'2024-{x}-01').strftime('%b')) + "-" + df_tmp['Year'].astype(str)
+
+
+def _month_labels_vectorized(df_tmp):
+
+    """
+    Builds the 'Mon-YYYY' labels once per distinct Month with period_labels.
+    """
+
+    return period_labels(df_tmp, 'Month', month_format='name')
+
+
+def _setup_top_returns_figure(df_pricing, df_gics):
+
+    """
+    Builds the Month returns of the top returns chart, without the figure cache and without showing the figure.
+    """
+
+    df_monthly_ret = calculate_return(get_pricing_data(df_pricing.copy(), 'Month'), 'Month')
+
+    return (df_monthly_ret, 'Ticker', 'Month', 5)
+
+
+def _setup_factor_screen(df_pricing, df_gics):
+
+    """
+    Builds the FactorScreen and the weights of a five factor screen of the top 20 Tickers per Date.
+    """
+
+    weights = {'Momentum': 1, 'Reversal': 0.5, 'Volatility': -0.5, 'Drawdown': 0.5, 'Volume Trend': 0.25}
+
+    return (FactorScreen(df_pricing, df_gics, 'Sector'), weights, 20)
+
+
+def _setup_warehouse_engine(df_pricing, df_gics):
+
+    """
+    Loads the synthetic prices into a local warehouse file in the temporary folder and returns an engine of it.
+    """
+
+    path = os.path.join(tempfile.gettempdir(), 'benchmark_warehouse.db')
+    if os.path.exists(path):
+        os.remove(path)
+    create_local_warehouse(build_local_tables(df_gics, df_pricing), path)
+
+    return sa.create_engine('sqlite:///' + path)
+
+
+# Register the pricing, return and ETL benchmarks
+register_benchmark('get_pricing_data Year', lambda df_pricing, df_gics: (df_pricing.copy(), 'Year'), get_pricing_data)
+register_benchmark('get_pricing_data Quarter', lambda df_pricing, df_gics: (df_pricing.copy(), 'Quarter'), get_pricing_data)
+register_benchmark('get_pricing_data Month', lambda df_pricing, df_gics: (df_pricing.copy(), 'Month'), get_pricing_data)
+register_benchmark('get_arrow_pricing_data Month', _setup_arrow_prices('Month'), get_arrow_pricing_data)
+register_benchmark('calculate_return Year', _setup_returns('Year'), calculate_return)
+register_benchmark('calculate_return Month', _setup_returns('Month'), calculate_return)
+register_benchmark('calculate_return Daily', _setup_returns('Daily'), calculate_return)
+register_benchmark('calculate_return_columns Daily', lambda df_pricing, df_gics: (df_pricing, 'Daily'),
+                   calculate_return_columns)
+register_benchmark('calculate_arrow_return_columns Daily', _setup_arrow_prices('Daily'), calculate_arrow_return_columns)
+register_benchmark('calculate_stats Quarter', _setup_stats, calculate_stats)
+register_benchmark('calculate_stats Quarter PeriodTable', _setup_stats_period_table, calculate_stats)
+register_benchmark('Year % Return merge Daily', _setup_period_returns, _merge_year_return)
+register_benchmark('Year % Return PeriodTable Daily', _setup_period_returns, _period_table_year_return)
+register_benchmark('Month labels apply', _setup_month_labels, _month_labels_apply)
+register_benchmark('Month labels period_labels', _setup_month_labels, _month_labels_vectorized)
+register_benchmark('plot_top_returns_bar_chart figure Month', _setup_top_returns_figure,
+                   inspect.unwrap(plot_top_returns_bar_chart))
+register_benchmark('calculate_drawdowns Month', _setup_drawdowns, calculate_drawdowns)
+register_benchmark('calculate_portfolio_return Month', _setup_portfolio_return, calculate_portfolio_return)
+register_benchmark('calculate_return_distributions Daily', _setup_return_distributions, calculate_return_distributions)
+register_benchmark('calculate_ranks Month', _setup_ranks, calculate_ranks)
+register_benchmark('select_top_k Month', _setup_top_k, select_top_k)
+register_benchmark('calculate_gics_rollup Daily', _setup_gics_rollup, calculate_gics_rollup)
+register_benchmark('calculate_factor_screen Daily',
+                   lambda df_pricing, df_gics: (df_pricing, {'Momentum': 1, 'Volatility': -0.5}, 20, df_gics),
+                   calculate_factor_screen)
+register_benchmark('FactorScreen screen', _setup_factor_screen, FactorScreen.screen)
+register_benchmark('calculate_rolling_metrics Daily', lambda df_pricing, df_gics: (df_pricing,), calculate_rolling_metrics)
+register_benchmark('simulate_portfolio bootstrap', lambda df_pricing, df_gics: (df_pricing,), simulate_portfolio)
+register_benchmark('evaluate_random_portfolios', _setup_return_moments, evaluate_random_portfolios)
+register_benchmark('solve_max_sharpe', _setup_return_moments, solve_max_sharpe)
+register_benchmark('calculate_efficient_frontier', _setup_return_moments, calculate_efficient_frontier)
+register_benchmark('build_export_tables', _setup_export_tables, build_export_tables)
+register_benchmark('build_export_tables arrow', _setup_export_tables_arrow, build_export_tables)
+register_benchmark('create_local_warehouse', lambda df_pricing, df_gics: (build_local_tables(df_gics, df_pricing),),
+                   create_local_warehouse)
+register_benchmark('run_local_query', _setup_local_query, run_local_query)
+register_benchmark('read_service_prices sqlite',
+                   lambda df_pricing, df_gics: (_setup_warehouse_engine(df_pricing, df_gics), None),
+                   read_service_prices)
+register_benchmark('read_partitioned_prices sqlite',
+                   lambda df_pricing, df_gics: (_setup_warehouse_engine(df_pricing, df_gics), None, 'ticker', 8, 4),
+                   read_partitioned_prices)
+register_benchmark('calculate_return_columns Daily cached', _setup_cached_returns, _cached_return_columns)
+register_benchmark('SnapshotBook apply', _setup_snapshot_update, SnapshotBook.apply)
+register_benchmark('MetricsStore handle cached', _setup_metrics_store, MetricsStore.handle)
+register_benchmark('Equity workflow copy API', lambda df_pricing, df_gics: (df_pricing,), _equity_workflow_copy)
+register_benchmark('Equity workflow column API', lambda df_pricing, df_gics: (df_pricing,), _equity_workflow_columns)
+register_benchmark('ETL price adjustment', _setup_etl_adjust_prices, _adjust_downloads)
+register_benchmark('ETL calendar merge', _setup_etl_merge, _merge_staged_prices)
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in persistent cache of the DataFrames returned by the return, statistics, drawdown and portfolio calculations.
+
+Functions decorated with cache_result look up their result by a fingerprint of the input columns they read, of their
+other arguments and of the source files defining them and the helper modules they import, so a notebook reopened on
+unchanged prices reads the results back from Parquet files instead of calculating them again, and any change to the
+prices or the code is a miss. The cache folder is capped in size and the least recently used results are evicted
+first. Sessions sharing a folder merge their changes into the index file under a lock file, so no session drops the
+entries of another. When the cache is disabled the decorator only checks a flag before calling the original function.
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import contextlib
+import hashlib
+import threading
+import functools
+import datetime as dt
+import pandas as pd
+import numpy as np
+
+
+# Name of the index file written in the cache folder
+INDEX_FILE = '_cache_index.json'
+
+# Name of the lock file serializing the index updates of the sessions sharing the cache folder
+LOCK_FILE = '_cache_index.lock'
+
+# Seconds after which a lock file left by a crashed session is broken
+LOCK_TIMEOUT = 30.0
+
+# Global cache settings shared by every decorated function
+_RESULT_CACHE = {'cache': None}
+
+# Hash of the source files of the module of each decorated function and of its helper modules, read once per session
+_SOURCE_HASHES = {}
+
+
+class ResultCache:
+
+    """
+    Folder of Parquet files holding function results by fingerprint, with a size cap and LRU eviction.
+
+    The index file keeps the function, size, calculation seconds and last use of every entry, so the least recently
+    used entries can be evicted across sessions. Every write of the index re-reads it under the lock file of the
+    folder and merges the entries of the other sessions. Hits, misses, writes and evictions are counted per function
+    for the current session.
+    """
+
+    def __init__(self, cache_folder, max_mb=512):
+
+        """
+        Args:
+            - cache_folder: String with the folder holding the cached results (created if missing).
+            - max_mb: Number with the maximum total size of the cached results in MB.
+        """
+
+        if max_mb <= 0:
+            raise ValueError("max_mb must be greater than 0")
+
+        os.makedirs(cache_folder, exist_ok=True)
+
+        self.cache_folder = cache_folder
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._removed = set()
+
+        # A smaller cap than in the previous session evicts the least recently used entries right away
+        with self._folder_lock():
+            self._index = self._load_index()
+            self._save_index(keep=None)
+
+    @contextlib.contextmanager
+    def _folder_lock(self):
+
+        """
+        Holds the lock file of the cache folder, so the sessions sharing the folder update the index one at a time.
+        """
+
+        path = os.path.join(self.cache_folder, LOCK_FILE)
+        while True:
+            try:
+                lock_fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > LOCK_TIMEOUT:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+
+        try:
+            yield
+        finally:
+            os.close(lock_fd)
+            os.remove(path)
+
+    def _read_index(self):
+
+        """
+        Reads the index file as written by the last session, without checking the Parquet files.
+        """
+
+        path = os.path.join(self.cache_folder, INDEX_FILE)
+        if not os.path.isfile(path):
+            return {}
+
+        with open(path, 'r') as index_file:
+            return json.load(index_file)
+
+    def _load_index(self):
+
+        """
+        Reads the index file, dropping the entries whose Parquet file no longer exists and removing the Parquet files
+        missing from the index, which would otherwise never be evicted or counted in the size cap.
+        """
+
+        index = {key: entry for key, entry in self._read_index().items() if os.path.isfile(self._path(key))}
+
+        # Partial writes end in '.parquet.tmp' and are left to the session writing them
+        for file_name in os.listdir(self.cache_folder):
+            if file_name.endswith('.parquet') and file_name[:-len('.parquet')] not in index:
+                os.remove(os.path.join(self.cache_folder, file_name))
+
+        return index
+
+    def _save_index(self, keep=None):
+
+        """
+        Merges the index file written by the other sessions into the index, evicts the least recently used entries
+        over the size cap and writes the index file through a temporary file, so an interrupted write leaves the
+        previous index. Must be called while holding the folder lock.
+        """
+
+        for key, entry in self._read_index().items():
+            if key in self._removed:
+                continue
+            if (key not in self._index) or (entry['Last Used'] > self._index[key]['Last Used']):
+                self._index[key] = entry
+
+        self._index = {key: entry for key, entry in self._index.items() if os.path.isfile(self._path(key))}
+        self._removed.clear()
+        self._evict(keep=keep)
+
+        path = os.path.join(self.cache_folder, INDEX_FILE)
+        with open(path + '.tmp', 'w') as index_file:
+            json.dump(self._index, index_file, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def _path(self, key):
+
+        """
+        Returns the path of the Parquet file of a key.
+        """
+
+        return os.path.join(self.cache_folder, key + '.parquet')
+
+    def _count(self, function, stat, seconds=0.0):
+
+        """
+        Adds one to a statistic of a function, and the seconds saved for hits.
+        """
+
+        counts = self.stats.setdefault(function, {'Hits': 0, 'Misses': 0, 'Writes': 0, 'Evictions': 0,
+                                                  'Seconds Saved': 0.0})
+        counts[stat] += 1
+        counts['Seconds Saved'] += seconds
+
+    def get(self, key, function):
+
+        """
+        Reads the cached result of a key and marks it as most recently used.
+
+        Args:
+            - key: String with the fingerprint of the call.
+            - function: String with the name of the cached function, for the statistics.
+
+        Returns:
+            - The cached DataFrame, or None when the key is not cached.
+        """
+
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                # The result may have been cached by another session since the index was read
+                with self._folder_lock():
+                    entry = self._read_index().get(key)
+                if (entry is None) or (not os.path.isfile(self._path(key))):
+                    self._count(function, 'Misses')
+                    return None
+                self._index[key] = entry
+
+            start_time = time.perf_counter()
+            try:
+                df_result = pd.read_parquet(self._path(key))
+            except (OSError, ValueError):
+                # A file removed or truncated outside the cache is a miss
+                with self._folder_lock():
+                    del self._index[key]
+                    self._removed.add(key)
+                    if os.path.isfile(self._path(key)):
+                        os.remove(self._path(key))
+                    self._save_index()
+                self._count(function, 'Misses')
+                return None
+
+            with self._folder_lock():
+                entry['Last Used'] = dt.datetime.now().isoformat()
+                self._save_index()
+            self._count(function, 'Hits', max(entry['Seconds'] - (time.perf_counter() - start_time), 0.0))
+
+        return df_result
+
+    def put(self, key, function, df_result, seconds):
+
+        """
+        Writes a result to the cache and evicts the least recently used entries over the size cap.
+
+        Results that cannot be written as Parquet or are larger than the cap on their own are not cached.
+
+        Args:
+            - key: String with the fingerprint of the call.
+            - function: String with the name of the cached function.
+            - df_result: DataFrame returned by the function.
+            - seconds: Number of seconds the function took to calculate the result.
+
+        Returns:
+            - Boolean indicating whether the result was cached.
+        """
+
+        path = self._path(key)
+        with self._lock:
+            try:
+                df_result.to_parquet(path + '.tmp')
+            except (ImportError, ValueError, TypeError):
+                if os.path.isfile(path + '.tmp'):
+                    os.remove(path + '.tmp')
+                return False
+
+            size = os.path.getsize(path + '.tmp')
+            if size > self.max_bytes:
+                os.remove(path + '.tmp')
+                return False
+
+            # The file is moved in under the folder lock, so no other session sees it before it is in the index
+            with self._folder_lock():
+                os.replace(path + '.tmp', path)
+                self._index[key] = {'Function': function, 'Bytes': size, 'Seconds': round(seconds, 6),
+                                    'Last Used': dt.datetime.now().isoformat()}
+                self._removed.discard(key)
+                self._count(function, 'Writes')
+                self._save_index(keep=key)
+
+        return True
+
+    def _evict(self, keep):
+
+        """
+        Removes the least recently used entries until the cached results fit in the size cap.
+        """
+
+        total = sum(entry['Bytes'] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['Last Used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            if os.path.isfile(self._path(key)):
+                os.remove(self._path(key))
+            total -= entry['Bytes']
+            del self._index[key]
+            self._count(entry['Function'], 'Evictions')
+
+    def clear(self):
+
+        """
+        Removes every cached result from the folder.
+        """
+
+        with self._lock, self._folder_lock():
+            for key in set(self._index) | set(self._read_index()):
+                if os.path.isfile(self._path(key)):
+                    os.remove(self._path(key))
+            self._index = {}
+            self._save_index()
+
+    def summary(self):
+
+        """
+        Returns the statistics of the session and the cached entries and size of each function as a DataFrame.
+        """
+
+        functions = set(self.stats) | {entry['Function'] for entry in self._index.values()}
+        rows = []
+        for function in sorted(functions):
+            entries = [entry for entry in self._index.values() if entry['Function'] == function]
+            counts = self.stats.get(function, {'Hits': 0, 'Misses': 0, 'Writes': 0, 'Evictions': 0,
+                                               'Seconds Saved': 0.0})
+            calls = counts['Hits'] + counts['Misses']
+            rows.append({
+                'Function': function,
+                'Hits': counts['Hits'],
+                'Misses': counts['Misses'],
+                'Hit Rate': round(counts['Hits'] / calls, 4) if calls else None,
+                'Writes': counts['Writes'],
+                'Evictions': counts['Evictions'],
+                'Seconds Saved': round(counts['Seconds Saved'], 3),
+                'Entries': len(entries),
+                'Cached MB': round(sum(entry['Bytes'] for entry in entries) / (1024 ** 2), 3)
+            })
+
+        return pd.DataFrame(rows, columns=['Function', 'Hits', 'Misses', 'Hit Rate', 'Writes', 'Evictions',
+                                           'Seconds Saved', 'Entries', 'Cached MB'])
+
+
+def enable_result_cache(cache_folder, max_mb=512):
+
+    """
+    Enables the result cache of the decorated functions and sets the folder the results are kept in.
+
+    Args:
+        - cache_folder: String with the folder holding the cached results (created if missing).
+        - max_mb: Number with the maximum total size of the cached results in MB.
+
+    Returns:
+        - The ResultCache used by the decorated functions.
+    """
+
+    _RESULT_CACHE['cache'] = ResultCache(cache_folder, max_mb)
+
+    return _RESULT_CACHE['cache']
+
+
+def disable_result_cache():
+
+    """
+    Disables the result cache, the cached files are kept for the next session.
+    """
+
+    _RESULT_CACHE['cache'] = None
+
+
+def result_cache_summary():
+
+    """
+    Returns the hits, misses, hit rate, writes, evictions, seconds saved, entries and size of each cached function.
+    """
+
+    if _RESULT_CACHE['cache'] is None:
+        raise ValueError("The result cache is not enabled. Call enable_result_cache first.")
+
+    return _RESULT_CACHE['cache'].summary()
+
+
+def _helper_files(module):
+
+    """
+    Returns the source files of a module and of the modules of its folder it imports, directly or through each other.
+    """
+
+    folder = os.path.dirname(os.path.abspath(inspect.getsourcefile(module)))
+    files, pending, seen = set(), [module], set()
+    while pending:
+        current = pending.pop()
+        if current.__name__ in seen:
+            continue
+        seen.add(current.__name__)
+
+        path = inspect.getsourcefile(current)
+        if (path is None) or (os.path.dirname(os.path.abspath(path)) != folder):
+            continue
+        files.add(os.path.abspath(path))
+
+        # Imported modules and the functions and classes imported from them, e.g. PeriodTable
+        for value in vars(current).values():
+            imported = value if inspect.ismodule(value) else sys.modules.get(getattr(value, '__module__', None) or '')
+            if (imported is not None) and (imported.__name__ not in seen) and hasattr(imported, '__file__'):
+                pending.append(imported)
+
+    return sorted(files)
+
+
+def _source_hash(func):
+
+    """
+    Returns a hash of the source file defining a function and of the helper modules of its folder it imports, so a
+    code change in either invalidates its cached results.
+    """
+
+    module = inspect.getmodule(func)
+    if module.__name__ not in _SOURCE_HASHES:
+        digest = hashlib.sha1()
+        for path in _helper_files(module):
+            with open(path, 'rb') as source_file:
+                digest.update(source_file.read())
+        _SOURCE_HASHES[module.__name__] = digest.hexdigest()
+
+    return _SOURCE_HASHES[module.__name__]
+
+
+def frame_fingerprint(df_tmp, columns=None):
+
+    """
+    Returns a content fingerprint of the columns, dtypes, index and values of a DataFrame or Series.
+
+    Args:
+        - df_tmp: The DataFrame or Series to fingerprint.
+        - columns: List of the columns of a DataFrame to fingerprint (defaults to every column). Missing columns are
+          ignored.
+
+    Returns:
+        - String with the hexadecimal SHA-1 fingerprint.
+    """
+
+    if (columns is not None) and isinstance(df_tmp, pd.DataFrame):
+        df_tmp = df_tmp[[col for col in columns if col in df_tmp.columns]]
+
+    if isinstance(df_tmp, pd.DataFrame):
+        layout = [[str(col), str(dtype)] for col, dtype in df_tmp.dtypes.items()]
+    else:
+        layout = [str(df_tmp.name), str(df_tmp.dtype)]
+
+    digest = hashlib.sha1(json.dumps(layout).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df_tmp.index, index=False).to_numpy().tobytes())
+    if isinstance(df_tmp, pd.DataFrame):
+        for col in df_tmp.columns:
+            digest.update(pd.util.hash_pandas_object(df_tmp[col], index=False).to_numpy().tobytes())
+    else:
+        digest.update(pd.util.hash_pandas_object(df_tmp, index=False).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def call_fingerprint(func, args, kwargs, columns):
+
+    """
+    Returns the fingerprint of a call from the input columns, the other arguments and the source of the function.
+    """
+
+    used_columns = columns(*args, **kwargs) if columns is not None else None
+
+    values = []
+    for value in list(args) + [kwargs[name] for name in sorted(kwargs)]:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            values.append(frame_fingerprint(value, used_columns))
+        elif isinstance(value, np.ndarray):
+            values.append(hashlib.sha1(value.tobytes()).hexdigest() + str(value.dtype) + str(value.shape))
+        elif hasattr(value, 'cache_fingerprint'):
+            values.append(value.cache_fingerprint())
+        else:
+            values.append(value)
+
+    payload = json.dumps({'function': func.__qualname__, 'source': _source_hash(func), 'kwargs': sorted(kwargs),
+                          'values': values}, default=str)
+
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def cache_result(columns=None):
+
+    """
+    Decorator factory caching the DataFrame returned by a function while the result cache is enabled.
+
+    The result must only depend on the arguments, and the caller gets a fresh copy of the cached DataFrame on a hit.
+
+    Args:
+        - columns: Function taking the arguments of the call and returning the list of DataFrame columns the result
+          depends on, so adding unrelated columns (e.g. plot labels) to the input does not miss the cache. Defaults to
+          every column.
+
+    Returns:
+        - The decorator.
+    """
+
+    def decorator(func):
+
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            cache = _RESULT_CACHE['cache']
+
+            # Near zero overhead path when the cache is disabled
+            if cache is None:
+                return func(*args, **kwargs)
+
+            key = call_fingerprint(func, args, kwargs, columns)
+            df_result = cache.get(key, name)
+            if df_result is not None:
+                return df_result
+
+            start_time = time.perf_counter()
+            df_result = func(*args, **kwargs)
+            if isinstance(df_result, pd.DataFrame):
+                cache.put(key, name, df_result, time.perf_counter() - start_time)
+
+            return df_result
+
+        return wrapper
+
+    return decorator
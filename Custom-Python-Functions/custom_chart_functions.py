@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Plot data preparation and in-memory figure cache for the plotting functions in custom_python_functions.py.
+
+The period labels, tick texts and bar colours are derived with vectorized operations: the labels are built once per
+distinct period and indexed back to the rows, instead of formatting every row with a Python lambda. Plotting
+functions decorated with cache_figure return their figure instead of showing it, and the decorator keeps it by a
+fingerprint of the input columns and chart arguments, so displaying an unchanged chart again only shows the cached
+figure. When the figure cache is disabled the decorator only checks a flag before building and showing the figure.
+"""
+
+import math
+import time
+import calendar
+import functools
+import threading
+import collections
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from custom_cache_functions import call_fingerprint
+
+# Month abbreviations by month number, as formatted by strftime('%b')
+_MONTH_ABBR = np.array(list(calendar.month_abbr), dtype=object)
+
+# In-memory figure cache of the session, None while disabled
+_FIGURE_CACHE = {'cache': None}
+
+
+def _period_codes(df_tmp, period):
+
+    """
+    Returns the integer period key of each row and the period type of the key, with 'Date' used for 'Daily'.
+    """
+
+    if period == 'Daily':
+        return df_tmp['Date'].to_numpy()
+
+    year = df_tmp['Year'].to_numpy(dtype=np.int64)
+    if period == 'Quarter':
+        return year * 10 + df_tmp['Quarter'].to_numpy(dtype=np.int64)
+    if period == 'Month':
+        return year * 100 + df_tmp['Month'].to_numpy(dtype=np.int64)
+
+    return year
+
+
+def period_labels(df_tmp, period, month_format='number'):
+
+    """
+    Builds the x-axis label of each row for a period type, formatting each distinct period once.
+
+    Args:
+        - df_tmp: DataFrame with 'Year' and the 'Quarter' or 'Month' column of the period, or 'Date' for 'Daily'.
+        - period: A string representing the period type ('Year', 'Quarter', 'Month', or 'Daily').
+        - month_format: 'number' for '2024-03' or 'name' for 'Mar-2024' Month labels.
+
+    Returns:
+        - numpy object array with one label per row: '2024', '2024-Q1', '2024-03' or 'Mar-2024', or the Date as a
+          string for 'Daily'.
+    """
+
+    codes, uniques = pd.factorize(_period_codes(df_tmp, period))
+
+    if period == 'Daily':
+        labels = pd.Series(uniques).astype(str)
+    else:
+        years = pd.Series(uniques // {'Quarter': 10, 'Month': 100}.get(period, 1)).astype(str)
+        if period == 'Quarter':
+            labels = years + '-Q' + pd.Series(uniques % 10).astype(str)
+        elif period == 'Month' and month_format == 'name':
+            labels = pd.Series(_MONTH_ABBR[uniques % 100]) + '-' + years
+        elif period == 'Month':
+            labels = years + '-' + pd.Series(uniques % 100).astype(str).str.zfill(2)
+        else:
+            labels = years
+
+    return labels.to_numpy(dtype=object)[codes]
+
+
+def period_tick_text(df_tmp, period):
+
+    """
+    Builds the tick text of each 'Date' of a price chart, with the Year, Quarter or Month name of the period.
+
+    Args:
+        - df_tmp: DataFrame with 'Date' (and 'Quarter' for the 'Quarter' period).
+        - period: A string representing the period type ('Year', 'Quarter', 'Month', or 'Daily').
+
+    Returns:
+        - List of tick texts, e.g. '2024-03-28 (2024-Q1)'.
+    """
+
+    dates = df_tmp['Date']
+    tick_text = dates.dt.strftime('%Y-%m-%d')
+
+    if period == 'Year':
+        tick_text = tick_text + ' (' + dates.dt.strftime('%Y') + ')'
+    elif period == 'Quarter':
+        tick_text = tick_text + ' (' + dates.dt.strftime('%Y') + '-Q' + df_tmp['Quarter'].astype(str) + ')'
+    elif period == 'Month':
+        tick_text = tick_text + ' (' + dates.dt.strftime('%B') + ')'
+
+    return tick_text.tolist()
+
+
+def sign_colors(values, negative='red', positive='blue'):
+
+    """
+    Returns the bar colour of each value, negative for the values below 0 and positive otherwise.
+    """
+
+    return np.where(np.asarray(values, dtype=float) < 0, negative, positive).tolist()
+
+
+def subplot_grid(num_plots):
+
+    """
+    Returns the rows and columns of the smallest near-square grid holding a number of subplots.
+    """
+
+    cols = max(1, math.ceil(math.sqrt(num_plots)))
+
+    return max(1, math.ceil(num_plots / cols)), cols
+
+
+def show_figure(fig):
+
+    """
+    Shows a Plotly or Matplotlib figure. In a notebook a Matplotlib figure is displayed on its own, since plt.show()
+    would also show every other open figure, and is then closed in pyplot so the figure cache can display it again.
+    Outside a notebook it is shown with plt.show().
+    """
+
+    if not isinstance(fig, Figure):
+        fig.show()
+        return
+
+    # IPython is only installed with the notebook, plain Python runs show the figure with pyplot
+    try:
+        from IPython import get_ipython
+        from IPython.display import display
+    except ImportError:
+        get_ipython = None
+
+    if (get_ipython is None) or (get_ipython() is None):
+        plt.show()
+        return
+
+    display(fig)
+
+    # Closing the figure in pyplot keeps the notebook from showing it a second time at the end of the cell
+    plt.close(fig)
+
+
+class FigureCache:
+
+    """
+    In-memory LRU cache of the figures built by the decorated plotting functions, with hits, misses and the
+    seconds saved counted per function.
+    """
+
+    def __init__(self, max_entries=32):
+
+        """
+        Args:
+            - max_entries: Integer with the maximum number of figures kept.
+        """
+
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than 0")
+
+        self.max_entries = max_entries
+        self.stats = {}
+        self._figures = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, name, counter, value=1):
+
+        """
+        Adds a value to a statistic of a function.
+        """
+
+        stats = self.stats.setdefault(name, {'Hits': 0, 'Misses': 0, 'Evictions': 0, 'Seconds Saved': 0.0})
+        stats[counter] += value
+
+    def get(self, key, name):
+
+        """
+        Returns the cached figure of a fingerprint, or None on a miss.
+        """
+
+        with self._lock:
+            entry = self._figures.get(key)
+            if entry is None:
+                self._count(name, 'Misses')
+                return None
+
+            self._figures.move_to_end(key)
+            self._count(name, 'Hits')
+            self._count(name, 'Seconds Saved', entry['Seconds'])
+
+            return entry['Figure']
+
+    def put(self, key, name, fig, seconds):
+
+        """
+        Keeps a figure by fingerprint, evicting the least recently used figures over the cap.
+        """
+
+        with self._lock:
+            self._figures[key] = {'Function': name, 'Figure': fig, 'Seconds': seconds}
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.max_entries:
+                _, entry = self._figures.popitem(last=False)
+                self._count(entry['Function'], 'Evictions')
+                if isinstance(entry['Figure'], Figure):
+                    plt.close(entry['Figure'])
+
+    def clear(self):
+
+        """
+        Removes every cached figure.
+        """
+
+        with self._lock:
+            for entry in self._figures.values():
+                if isinstance(entry['Figure'], Figure):
+                    plt.close(entry['Figure'])
+            self._figures.clear()
+
+    def summary(self):
+
+        """
+        Returns the statistics of the session and the cached figures of each function as a DataFrame.
+        """
+
+        with self._lock:
+            rows = []
+            for function in sorted(self.stats):
+                counts = self.stats[function]
+                calls = counts['Hits'] + counts['Misses']
+                rows.append({
+                    'Function': function,
+                    'Hits': counts['Hits'],
+                    'Misses': counts['Misses'],
+                    'Hit Rate': round(counts['Hits'] / calls, 4) if calls else None,
+                    'Evictions': counts['Evictions'],
+                    'Seconds Saved': round(counts['Seconds Saved'], 3),
+                    'Entries': sum(1 for entry in self._figures.values() if entry['Function'] == function)
+                })
+
+        return pd.DataFrame(rows, columns=['Function', 'Hits', 'Misses', 'Hit Rate', 'Evictions', 'Seconds Saved',
+                                           'Entries'])
+
+
+def enable_figure_cache(max_entries=32):
+
+    """
+    Enables the figure cache of the decorated plotting functions.
+
+    Args:
+        - max_entries: Integer with the maximum number of figures kept in memory.
+
+    Returns:
+        - The FigureCache used by the decorated functions.
+    """
+
+    _FIGURE_CACHE['cache'] = FigureCache(max_entries)
+
+    return _FIGURE_CACHE['cache']
+
+
+def disable_figure_cache():
+
+    """
+    Disables the figure cache and releases the cached figures.
+    """
+
+    if _FIGURE_CACHE['cache'] is not None:
+        _FIGURE_CACHE['cache'].clear()
+
+    _FIGURE_CACHE['cache'] = None
+
+
+def figure_cache_summary():
+
+    """
+    Returns the hits, misses, hit rate, evictions, seconds saved and cached figures of each plotting function.
+    """
+
+    if _FIGURE_CACHE['cache'] is None:
+        raise ValueError("The figure cache is not enabled. Call enable_figure_cache first.")
+
+    return _FIGURE_CACHE['cache'].summary()
+
+
+def cache_figure(columns=None):
+
+    """
+    Decorator factory for plotting functions that build and return a figure: the decorator shows the figure, from the
+    figure cache when it is enabled and the same chart was built before.
+
+    Args:
+        - columns: Function taking the arguments of the call and returning the list of DataFrame columns the chart
+          depends on. Defaults to every column.
+
+    Returns:
+        - The decorator. The decorated function shows the figure and returns None.
+    """
+
+    def decorator(func):
+
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            cache = _FIGURE_CACHE['cache']
+
+            # Near zero overhead path when the cache is disabled
+            if cache is None:
+                fig = func(*args, **kwargs)
+                if fig is not None:
+                    show_figure(fig)
+                return None
+
+            key = call_fingerprint(func, args, kwargs, columns)
+            fig = cache.get(key, name)
+            if fig is None:
+                start_time = time.perf_counter()
+                fig = func(*args, **kwargs)
+                if fig is None:
+                    return None
+                cache.put(key, name, fig, time.perf_counter() - start_time)
+
+            show_figure(fig)
+
+            return None
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Return distribution engine used by the histogram plots.
+
+Histograms use Freedman-Diaconis bins and the smooth density line is a binned Gaussian KDE evaluated with an FFT
+convolution, which costs O(n + bins log bins) instead of O(n * points) for a direct KDE evaluation.
+"""
+
+import weakref
+import pandas as pd
+import numpy as np
+from scipy.signal import fftconvolve
+from custom_profiling_functions import profile_function
+
+
+# Cache of global moments per DataFrame and return column: (id, column) -> (weak reference, stamp, mean, std)
+_MOMENTS_CACHE = {}
+
+
+def _column_stamp(df_tmp, return_type):
+
+    """
+    Returns a cheap stamp (row count and data address) used to detect a replaced return column.
+    """
+
+    values = df_tmp[return_type].to_numpy()
+
+    return len(values), values.__array_interface__['data'][0] if isinstance(values, np.ndarray) else id(values)
+
+
+@profile_function
+def get_global_moments(df_tmp, return_type):
+
+    """
+    Returns the mean and standard deviation of a return column over all security class values, cached per
+    DataFrame and return column so repeated plots of the same frame do not rescan it.
+
+    Args:
+        - df_tmp: DataFrame containing return data for all security class type values.
+        - return_type: String representing the name of the column containing returns.
+
+    Returns:
+        - tuple: The mean and population standard deviation of the column.
+    """
+
+    key = (id(df_tmp), return_type)
+    stamp = _column_stamp(df_tmp, return_type)
+
+    cached = _MOMENTS_CACHE.get(key)
+    if cached is not None:
+        df_ref, cached_stamp, global_mean, global_std_dev = cached
+        if (df_ref() is df_tmp) and (cached_stamp == stamp):
+            return global_mean, global_std_dev
+
+    all_returns = df_tmp[return_type].to_numpy(dtype=float)
+    global_mean = np.mean(all_returns)
+    global_std_dev = np.std(all_returns)
+
+    # Drop the cache entry when the DataFrame is garbage collected
+    df_ref = weakref.ref(df_tmp, lambda ref, key=key: _MOMENTS_CACHE.pop(key, None))
+    _MOMENTS_CACHE[key] = (df_ref, stamp, global_mean, global_std_dev)
+
+    return global_mean, global_std_dev
+
+
+def calculate_freedman_diaconis_bins(values):
+
+    """
+    Calculates equal width histogram bin edges using the Freedman-Diaconis rule.
+
+    Args:
+        - values: numpy array of returns.
+
+    Returns:
+        - tuple: The bin edges array and the Freedman-Diaconis bin width.
+    """
+
+    values_min, values_max = values.min(), values.max()
+
+    # Calculate the interquartile range (IQR) and the Freedman-Diaconis bin width
+    IQR = np.percentile(values, 75) - np.percentile(values, 25)
+    bin_width = 2 * IQR / np.cbrt(len(values))
+
+    if (bin_width > 0) and (values_max > values_min):
+        num_bins = max(1, int((values_max - values_min) / bin_width))
+    else:
+        # Fall back to the square root rule when the IQR is zero
+        num_bins = max(1, int(np.sqrt(len(values))))
+        bin_width = (values_max - values_min) / num_bins if values_max > values_min else 1.0
+
+    if values_max == values_min:
+        values_min, values_max = values_min - 0.5, values_max + 0.5
+
+    return np.linspace(values_min, values_max, num_bins + 1), bin_width
+
+
+def calculate_binned_kde(values, grid_size=512, bw_method='scott'):
+
+    """
+    Evaluates a Gaussian kernel density estimate on a regular grid with linear binning and an FFT convolution.
+
+    Args:
+        - values: numpy array of returns.
+        - grid_size: Integer specifying the number of grid points between the minimum and maximum value.
+        - bw_method: 'scott', 'silverman' or a float bandwidth factor (same meaning as scipy.stats.gaussian_kde).
+
+    Returns:
+        - tuple: The grid points and the density values at those points.
+    """
+
+    n = len(values)
+    values_min, values_max = values.min(), values.max()
+    x_grid = np.linspace(values_min, values_max, grid_size)
+
+    std_dev = np.std(values, ddof=1) if n > 1 else 0.0
+    if (n < 2) or (std_dev == 0) or (values_max == values_min):
+        return x_grid, np.zeros(grid_size)
+
+    # Bandwidth factor as defined by scipy.stats.gaussian_kde
+    if bw_method == 'scott':
+        factor = n ** (-1.0 / 5)
+    elif bw_method == 'silverman':
+        factor = (n * 3.0 / 4.0) ** (-1.0 / 5)
+    else:
+        factor = float(bw_method)
+    bandwidth = std_dev * factor
+
+    # Linear binning: split each value between its two neighbouring grid points
+    delta = (values_max - values_min) / (grid_size - 1)
+    position = (values - values_min) / delta
+    lower = np.clip(np.floor(position).astype(np.int64), 0, grid_size - 2)
+    weight = position - lower
+    grid_counts = np.bincount(lower, weights=1.0 - weight, minlength=grid_size)
+    grid_counts += np.bincount(lower + 1, weights=weight, minlength=grid_size)
+
+    # Gaussian kernel sampled on the grid spacing, truncated at 4 bandwidths
+    half_width = int(min(grid_size - 1, np.ceil(4 * bandwidth / delta)))
+    offsets = np.arange(-half_width, half_width + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+
+    # Convolve the binned counts with the kernel using the FFT
+    density = fftconvolve(grid_counts, kernel, mode='same') / n
+
+    return x_grid, np.maximum(density, 0)
+
+
+@profile_function
+def calculate_return_distributions(df_tmp, return_type, security_class, security_class_vals=None, grid_size=512):
+
+    """
+    Calculates histograms and smooth KDE lines for every security class type value in one call.
+
+    Args:
+        - df_tmp: DataFrame containing return data for all security class type values.
+        - return_type: String representing the name of the column containing returns.
+        - security_class: A string representing the security class type column ('Sector', 'Industry Group', 'Industry',
+          'Sub_Industry', 'Ticker').
+        - security_class_vals: List of security class type values to calculate (defaults to all values).
+        - grid_size: Integer specifying the number of KDE grid points.
+
+    Returns:
+        - dict: Security class type value -> dict with 'counts', 'bin_edges', 'bin_width', 'x_kde', 'y_kde' and
+          'count' entries, plus a 'global' entry holding the 'mean' and 'std_dev' of all values.
+    """
+
+    if return_type not in df_tmp.columns:
+        raise ValueError(f"Required column '{return_type}' is missing.")
+
+    global_mean, global_std_dev = get_global_moments(df_tmp, return_type)
+    distributions = {'global': {'mean': global_mean, 'std_dev': global_std_dev}}
+
+    # Sort the returns by security class once and slice each group out of the sorted array
+    codes, uniques = pd.factorize(df_tmp[security_class], sort=True)
+    returns = df_tmp[return_type].to_numpy(dtype=float)
+    valid = (codes >= 0) & ~np.isnan(returns)
+    codes, returns = codes[valid], returns[valid]
+
+    order = np.argsort(codes, kind='stable')
+    sorted_returns = returns[order]
+    boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    if security_class_vals is None:
+        security_class_vals = list(uniques)
+
+    for security_class_val in security_class_vals:
+        code = uniques.get_indexer([security_class_val])[0]
+        if code < 0:
+            continue
+
+        values = sorted_returns[boundaries[code]:boundaries[code + 1]]
+        if len(values) == 0:
+            continue
+
+        bin_edges, bin_width = calculate_freedman_diaconis_bins(values)
+        counts, _ = np.histogram(values, bins=bin_edges)
+        x_kde, y_kde = calculate_binned_kde(values, grid_size)
+
+        distributions[security_class_val] = {
+            'count': len(values),
+            'counts': counts,
+            'bin_edges': bin_edges,
+            'bin_width': bin_width,
+            'x_kde': x_kde,
+            'y_kde': y_kde
+        }
+
+    return distributions
@@ -0,0 +1,1102 @@
+# -*- coding: utf-8 -*-
+"""
+ETL helpers for loading the Equities data warehouse.
+
+Dimension tables are synchronized with a hash diff: the target table is read once, each row's attributes are
+hashed and compared with the staged data in memory, and only the inserts, updates and deletes are sent to the
+database as batched statements.
+
+The price load runs as a pipeline: fetcher threads download tickers while a staging thread writes finished batches
+to Yahoo_Equity_Prices_STG and a merge thread merges them into Yahoo_Equity_Prices. Tickers are resolved to their
+Ticker_ID through a dictionary read once from the Equities table, so the staging table holds typed, narrow columns
+keyed by integers and the merge reads it without joining on ticker strings. The stages are connected by bounded
+queues so a slow stage holds back the faster ones instead of filling memory, and merged tickers are checkpointed to
+a JSON file so a failed run resumes where it stopped. The staged and merged rows can be verified against the tables
+with the aggregates of custom_verification_functions.py collected as the batches stream through.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+import datetime as dt
+import pandas as pd
+import numpy as np
+import sqlalchemy as sa
+from custom_profiling_functions import profile_function, profile_stage
+from custom_verification_functions import LoadVerifier, verify_load
+
+
+# Dimension tables in load order (parents first): name -> business key columns and attribute columns
+DIMENSION_SPECS = {
+    'Sectors': {'key': ['Sector_ID'], 'columns': ['Name']},
+    'Industry_Groups': {'key': ['Industry_Group_ID'], 'columns': ['Name', 'Sector_ID']},
+    'Industries': {'key': ['Industry_ID'], 'columns': ['Name', 'Industry_Group_ID']},
+    'Sub_Industries': {'key': ['Sub_Industry_ID'], 'columns': ['Name', 'Industry_ID']},
+    'Equities': {'key': ['Ticker'], 'columns': ['Name', 'Sub_Industry_ID']}
+}
+
+
+def _normalize_frame(df_tmp, cols):
+
+    """
+    Returns a copy of the columns as trimmed strings so values read from nchar columns, CSV files and
+    DataFrames compare equal (e.g. 'Energy   ' and 'Energy', 10 and 10.0).
+    """
+
+    df_norm = pd.DataFrame(index=df_tmp.index)
+
+    for col in cols:
+        ser = df_tmp[col]
+        numeric = pd.to_numeric(ser, errors='coerce')
+
+        if ser.notna().any() and numeric[ser.notna()].notna().all() and (numeric.dropna() % 1 == 0).all():
+            # Whole numbers compare as integers whatever their source type
+            df_norm[col] = numeric.astype('Int64').astype(str).replace('<NA>', '')
+        else:
+            df_norm[col] = ser.astype(str).str.strip().where(ser.notna(), '')
+
+    return df_norm
+
+
+def hash_rows(df_tmp, cols):
+
+    """
+    Hashes the normalized values of the given columns of each row.
+
+    Args:
+        - df_tmp: DataFrame containing the rows to hash.
+        - cols: List of column names to include in the hash.
+
+    Returns:
+        - A Series of unsigned 64 bit hashes with the same index as df_tmp.
+    """
+
+    return pd.util.hash_pandas_object(_normalize_frame(df_tmp, cols), index=False)
+
+
+@profile_function
+def diff_dimension(df_source, df_target, key_cols, attr_cols):
+
+    """
+    Compares staged dimension rows with the target table rows by business key and attribute hash.
+
+    Args:
+        - df_source: DataFrame with the staged rows (key and attribute columns).
+        - df_target: DataFrame with the current target table rows (key and attribute columns).
+        - key_cols: List of business key columns.
+        - attr_cols: List of attribute columns.
+
+    Returns:
+        - tuple: DataFrames of the rows to insert, the rows to update and the keys to delete, and the number of
+          unchanged rows.
+    """
+
+    df_src = df_source[key_cols + attr_cols].drop_duplicates(subset=key_cols, keep='last').copy()
+    df_tgt = df_target[key_cols + attr_cols].copy()
+
+    # Join on the normalized key and compare the attribute hashes
+    df_src['_key'] = hash_rows(df_src, key_cols).to_numpy()
+    df_src['_hash'] = hash_rows(df_src, attr_cols).to_numpy()
+    df_tgt['_key'] = hash_rows(df_tgt, key_cols).to_numpy()
+    df_tgt['_hash'] = hash_rows(df_tgt, attr_cols).to_numpy()
+
+    in_target = df_src['_key'].isin(df_tgt['_key'])
+    df_inserts = df_src.loc[~in_target, key_cols + attr_cols]
+
+    target_hashes = df_tgt.set_index('_key')['_hash']
+    changed = in_target & (df_src['_key'].map(target_hashes) != df_src['_hash'])
+    df_updates = df_src.loc[changed, key_cols + attr_cols]
+
+    # Use the target key values for deletes so they match the stored values exactly
+    df_deletes = df_tgt.loc[~df_tgt['_key'].isin(df_src['_key']), key_cols]
+
+    no_unchanged = int(in_target.sum() - changed.sum())
+
+    return df_inserts, df_updates, df_deletes, no_unchanged
+
+
+def _to_records(df_tmp):
+
+    """
+    Converts a DataFrame to a list of dictionaries with Python scalars (numpy types and NaN become int/float/None).
+    """
+
+    df_tmp = df_tmp.astype(object).where(df_tmp.notna(), None)
+
+    return [{col: (val.item() if isinstance(val, np.generic) else val) for col, val in row.items()}
+            for row in df_tmp.to_dict('records')]
+
+
+def _strip_strings(df_tmp):
+
+    """
+    Strips the padding that nchar columns add to string values.
+    """
+
+    for col in df_tmp.columns:
+        if df_tmp[col].dtype == object:
+            df_tmp[col] = df_tmp[col].map(lambda x: x.strip() if isinstance(x, str) else x)
+
+    return df_tmp
+
+
+def _dimension_columns(table_name, key_cols, attr_cols):
+
+    """
+    Returns the key and attribute columns of a dimension table, defaulting to DIMENSION_SPECS.
+    """
+
+    if key_cols is None or attr_cols is None:
+        if table_name not in DIMENSION_SPECS:
+            raise ValueError(f"No key and attribute columns defined for table '{table_name}'.")
+        key_cols = key_cols or DIMENSION_SPECS[table_name]['key']
+        attr_cols = attr_cols or DIMENSION_SPECS[table_name]['columns']
+
+    return key_cols, attr_cols
+
+
+def _plan_dimension(conn, table_name, df_source, key_cols, attr_cols, schema):
+
+    """
+    Reads the target table once and works out the inserts, updates and deletes for the staged rows.
+
+    Returns:
+        - dict: The table object, the key and attribute columns, the change DataFrames and the change report.
+    """
+
+    missing = [col for col in key_cols + attr_cols if col not in df_source.columns]
+    if missing:
+        raise ValueError(f"Columns {missing} do not exist in the staged DataFrame.")
+
+    start_time = time.perf_counter()
+
+    tbl = sa.table(table_name, *[sa.column(col) for col in key_cols + attr_cols], schema=schema)
+
+    result = conn.execute(sa.select(*[tbl.c[col] for col in key_cols + attr_cols]))
+    df_target = _strip_strings(pd.DataFrame(result.fetchall(), columns=key_cols + attr_cols))
+
+    df_inserts, df_updates, df_deletes, no_unchanged = diff_dimension(df_source, df_target, key_cols, attr_cols)
+
+    return {
+        'table': tbl,
+        'key_cols': key_cols,
+        'attr_cols': attr_cols,
+        'inserts': df_inserts,
+        'updates': df_updates,
+        'deletes': df_deletes,
+        'report': {
+            'Dimension': table_name,
+            'Source Rows': len(df_source),
+            'Target Rows': len(df_target),
+            'Inserts': len(df_inserts),
+            'Updates': len(df_updates),
+            'Deletes': len(df_deletes),
+            'Unchanged': no_unchanged,
+            'Seconds': time.perf_counter() - start_time
+        }
+    }
+
+
+def _key_records(df_tmp, key_cols):
+
+    """
+    Converts rows to statement parameters with the key columns renamed to 'key_<column>'.
+    """
+
+    records = _to_records(df_tmp)
+    for record in records:
+        for col in key_cols:
+            record['key_' + col] = record.pop(col)
+
+    return records
+
+
+def _apply_upserts(conn, plan):
+
+    """
+    Sends the planned inserts and updates of one table as one executemany statement each.
+    """
+
+    start_time = time.perf_counter()
+    tbl, key_cols, attr_cols = plan['table'], plan['key_cols'], plan['attr_cols']
+
+    if len(plan['inserts']) > 0:
+        conn.execute(sa.insert(tbl), _to_records(plan['inserts']))
+
+    if len(plan['updates']) > 0:
+        # Bind the key columns under different names so they are not confused with the SET values
+        stmt = sa.update(tbl).where(sa.and_(*[tbl.c[col] == sa.bindparam('key_' + col) for col in key_cols]))
+        stmt = stmt.values({col: sa.bindparam(col) for col in attr_cols})
+        conn.execute(stmt, _key_records(plan['updates'], key_cols))
+
+    plan['report']['Seconds'] += time.perf_counter() - start_time
+
+
+def _apply_deletes(conn, plan):
+
+    """
+    Sends the planned deletes of one table as one executemany statement.
+    """
+
+    start_time = time.perf_counter()
+    tbl, key_cols = plan['table'], plan['key_cols']
+
+    if len(plan['deletes']) > 0:
+        stmt = sa.delete(tbl).where(sa.and_(*[tbl.c[col] == sa.bindparam('key_' + col) for col in key_cols]))
+        conn.execute(stmt, _key_records(plan['deletes'], key_cols))
+
+    plan['report']['Seconds'] += time.perf_counter() - start_time
+
+
+@profile_function
+def sync_dimension(conn, table_name, df_source, key_cols=None, attr_cols=None, schema='Equities',
+                   delete_missing=True, dry_run=False):
+
+    """
+    Synchronizes a dimension table with the staged rows using a hash diff and batched statements.
+
+    The target table is read once, and only new, changed and removed rows are written with one executemany
+    statement each. The caller controls the transaction, e.g. with engine.begin() as conn.
+
+    Args:
+        - conn: SQLAlchemy Connection used for the read and the changes.
+        - table_name: String representing the table name (e.g. 'Sectors').
+        - df_source: DataFrame with the staged rows using the target column names.
+        - key_cols: List of business key columns (defaults to DIMENSION_SPECS).
+        - attr_cols: List of attribute columns (defaults to DIMENSION_SPECS).
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - delete_missing: Boolean indicating whether target rows missing from the staged rows are deleted.
+        - dry_run: Boolean indicating whether to only report the changes without applying them.
+
+    Returns:
+        - dict: The change report with 'Dimension', 'Source Rows', 'Target Rows', 'Inserts', 'Updates',
+          'Deletes', 'Unchanged' and 'Seconds' entries.
+    """
+
+    key_cols, attr_cols = _dimension_columns(table_name, key_cols, attr_cols)
+    plan = _plan_dimension(conn, table_name, df_source, key_cols, attr_cols, schema)
+
+    if not delete_missing:
+        plan['deletes'] = plan['deletes'].iloc[0:0]
+        plan['report']['Deletes'] = 0
+
+    if not dry_run:
+        _apply_upserts(conn, plan)
+        _apply_deletes(conn, plan)
+
+    plan['report']['Seconds'] = round(plan['report']['Seconds'], 4)
+
+    return plan['report']
+
+
+def build_gics_dimensions(df_gics):
+
+    """
+    Builds the staged rows of the Sectors, Industry_Groups, Industries, Sub_Industries and Equities tables from a
+    DataFrame with the SP500_GICS_Combined.csv columns.
+
+    Args:
+        - df_gics: DataFrame with 'Ticker', 'Name', '<level>_ID' and '<level>' columns for the four GICS levels.
+
+    Returns:
+        - dict: Table name -> DataFrame with the target column names, in load order.
+    """
+
+    return {
+        'Sectors': df_gics[['Sector_ID', 'Sector']].drop_duplicates()
+            .rename(columns={'Sector': 'Name'}),
+        'Industry_Groups': df_gics[['Industry_Group_ID', 'Industry_Group', 'Sector_ID']].drop_duplicates()
+            .rename(columns={'Industry_Group': 'Name'}),
+        'Industries': df_gics[['Industry_ID', 'Industry', 'Industry_Group_ID']].drop_duplicates()
+            .rename(columns={'Industry': 'Name'}),
+        'Sub_Industries': df_gics[['Sub_Industry_ID', 'Sub_Industry', 'Industry_ID']].drop_duplicates()
+            .rename(columns={'Sub_Industry': 'Name'}),
+        'Equities': df_gics[['Ticker', 'Name', 'Sub_Industry_ID']].drop_duplicates(subset='Ticker')
+    }
+
+
+@profile_function
+def sync_gics_dimensions(engine, df_gics, schema='Equities', delete_missing=True, dry_run=False):
+
+    """
+    Synchronizes the four GICS level tables and the Equities table in one transaction.
+
+    Inserts and updates run from the Sectors down to the Equities and deletes run from the Equities up to the
+    Sectors so foreign keys stay valid. Any error rolls back the changes of every table.
+
+    Args:
+        - engine: SQLAlchemy Engine of the data warehouse.
+        - df_gics: DataFrame with the SP500_GICS_Combined.csv columns.
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - delete_missing: Boolean indicating whether rows missing from df_gics are deleted.
+        - dry_run: Boolean indicating whether to only report the changes without applying them.
+
+    Returns:
+        - A DataFrame change report with one row per table.
+    """
+
+    df_dimensions = build_gics_dimensions(df_gics)
+
+    with engine.begin() as conn:
+        # Read every target table once and plan all the changes before writing anything
+        plans = {}
+        for table_name, df_source in df_dimensions.items():
+            key_cols, attr_cols = _dimension_columns(table_name, None, None)
+            plans[table_name] = _plan_dimension(conn, table_name, df_source, key_cols, attr_cols, schema)
+            if not delete_missing:
+                plans[table_name]['deletes'] = plans[table_name]['deletes'].iloc[0:0]
+                plans[table_name]['report']['Deletes'] = 0
+
+        if not dry_run:
+            # Insert and update parents first, then delete children first
+            for table_name in df_dimensions:
+                _apply_upserts(conn, plans[table_name])
+            for table_name in reversed(list(df_dimensions)):
+                _apply_deletes(conn, plans[table_name])
+
+    df_report = pd.DataFrame([plan['report'] for plan in plans.values()])
+    df_report['Seconds'] = df_report['Seconds'].round(4)
+
+    return df_report
+
+
+# Pricing columns of the typed Yahoo_Equity_Prices_STG staging table and of Yahoo_Equity_Prices
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Marks the end of a pipeline queue
+_END_OF_QUEUE = object()
+
+
+def adjust_yahoo_prices(df_tmp, ticker):
+
+    """
+    Applies the forward fill and split and dividend adjustment of Load-Yahoo_Equity_Prices_STG.ipynb to the
+    prices downloaded for one ticker.
+
+    Args:
+        - df_tmp: DataFrame indexed by Date with 'Open', 'High', 'Low', 'Close', 'Adj Close' and 'Volume' columns.
+        - ticker: String representing the ticker symbol.
+
+    Returns:
+        - A DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns sorted by Date.
+    """
+
+    df_tmp = df_tmp.reset_index()
+    df_tmp['Ticker'] = ticker
+    df_tmp['Date'] = pd.to_datetime(df_tmp['Date'], format='%Y-%m-%d')
+
+    # Fill missing values using forward fill method
+    df_tmp['Open'] = df_tmp['Open'].ffill()
+    df_tmp['High'] = df_tmp['High'].ffill()
+    df_tmp['Low'] = df_tmp['Low'].ffill()
+
+    # Adjust prices and calculate the factor for adjustments
+    df_tmp['Close'] = round(df_tmp['Adj Close'].ffill(), 2)
+    df_tmp['Factor'] = df_tmp['Close'] / df_tmp['Adj Close']
+    df_tmp['Open'] = round(df_tmp['Open'] / df_tmp['Factor'], 2)
+    df_tmp['High'] = round(df_tmp['High'] / df_tmp['Factor'], 2)
+    df_tmp['Low'] = round(df_tmp['Low'] / df_tmp['Factor'], 2)
+
+    df_tmp = df_tmp[['Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume']]
+
+    return df_tmp.sort_values(by=['Date']).reset_index(drop=True)
+
+
+def fetch_yahoo_prices(ticker, start_date, end_date):
+
+    """
+    Downloads the daily prices of one ticker from Yahoo Finance and adjusts them with adjust_yahoo_prices.
+
+    Args:
+        - ticker: String representing the ticker symbol (e.g. 'BRK.B').
+        - start_date: String representing the first date to download.
+        - end_date: String representing the last date to download.
+
+    Returns:
+        - A DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+    """
+
+    # yfinance is only needed when prices are actually downloaded
+    import yfinance as yf
+
+    stock_data = yf.download(ticker.replace(".", "-"), start=start_date, end=end_date, auto_adjust=False,
+                             progress=False)
+
+    # Newer yfinance versions return one column level per ticker
+    if isinstance(stock_data.columns, pd.MultiIndex):
+        stock_data.columns = stock_data.columns.get_level_values(0)
+
+    return adjust_yahoo_prices(stock_data, ticker)
+
+
+def _price_tables(schema):
+
+    """
+    Returns the lightweight table objects of the tables used by the price load.
+    """
+
+    return {
+        'Equities': sa.table('Equities', sa.column('Ticker_ID', sa.Integer), sa.column('Ticker', sa.String),
+                             sa.column('Name', sa.String), sa.column('Sub_Industry_ID', sa.Integer), schema=schema),
+        'Market_Calendar': sa.table('Market_Calendar', sa.column('Date', sa.Date), schema=schema),
+        'Yahoo_Equity_Prices_STG': sa.table('Yahoo_Equity_Prices_STG', sa.column('Ticker_ID', sa.Integer),
+                                            sa.column('Date', sa.Date),
+                                            *[sa.column(col, sa.Float) for col in PRICE_COLUMNS[:4]],
+                                            sa.column('Volume', sa.BigInteger), schema=schema),
+        'Yahoo_Equity_Prices': sa.table('Yahoo_Equity_Prices', sa.column('Date', sa.Date),
+                                        sa.column('Ticker_ID', sa.Integer),
+                                        *[sa.column(col, sa.Float) for col in PRICE_COLUMNS[:4]],
+                                        sa.column('Volume', sa.BigInteger), schema=schema)
+    }
+
+
+def create_price_tables(engine, schema=None):
+
+    """
+    Creates the Equities, Market_Calendar, Yahoo_Equity_Prices_STG and Yahoo_Equity_Prices tables with the columns
+    used by the price load when they do not exist, e.g. in a SQLite database used to test the pipeline.
+
+    Args:
+        - engine: SQLAlchemy Engine of the database.
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+    """
+
+    metadata = sa.MetaData(schema=schema)
+
+    sa.Table('Equities', metadata,
+             sa.Column('Ticker_ID', sa.Integer, primary_key=True),
+             sa.Column('Ticker', sa.String(10), nullable=False),
+             sa.Column('Name', sa.String(100)),
+             sa.Column('Sub_Industry_ID', sa.Integer))
+    sa.Table('Market_Calendar', metadata,
+             sa.Column('Country', sa.String(50), primary_key=True),
+             sa.Column('Date', sa.Date, primary_key=True),
+             sa.Column('Open_Time', sa.Time),
+             sa.Column('Close_Time', sa.Time))
+    sa.Table('Yahoo_Equity_Prices_STG', metadata,
+             sa.Column('Ticker_ID', sa.Integer, primary_key=True),
+             sa.Column('Date', sa.Date, primary_key=True),
+             *[sa.Column(col, sa.Float) for col in PRICE_COLUMNS[:4]],
+             sa.Column('Volume', sa.BigInteger))
+    sa.Table('Yahoo_Equity_Prices', metadata,
+             sa.Column('Date', sa.Date, primary_key=True),
+             sa.Column('Ticker_ID', sa.Integer, primary_key=True),
+             *[sa.Column(col, sa.Float) for col in PRICE_COLUMNS[:4]],
+             sa.Column('Volume', sa.BigInteger))
+
+    metadata.create_all(engine)
+
+
+class TickerIdCache:
+
+    """
+    Dictionary of Ticker -> Ticker_ID read once from the Equities table, so the price load resolves tickers to their
+    integer keys in Python before staging instead of joining on trimmed ticker strings in the database.
+
+    Args:
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+    """
+
+    def __init__(self, schema='Equities'):
+
+        self.schema = schema
+        self.ids = {}
+
+    def __contains__(self, ticker):
+
+        return ticker in self.ids
+
+    def __getitem__(self, ticker):
+
+        return self.ids[ticker]
+
+    def __len__(self):
+
+        return len(self.ids)
+
+    def tickers(self):
+
+        """
+        Returns the cached tickers in sorted order.
+        """
+
+        return sorted(self.ids)
+
+    def map(self, tickers):
+
+        """
+        Returns the Ticker_ID of each ticker of a Series, missing for tickers that are not cached.
+        """
+
+        return tickers.map(self.ids)
+
+    def refresh(self, conn, tickers=None):
+
+        """
+        Reads the Ticker_IDs of the given tickers (every ticker by default) from the Equities table into the cache.
+
+        Args:
+            - conn: SQLAlchemy Connection used for the read.
+            - tickers: List of tickers to read, or None for every ticker.
+
+        Returns:
+            - TickerIdCache: The cache itself.
+        """
+
+        tbl = _price_tables(self.schema)['Equities']
+        stmt = sa.select(tbl.c.Ticker_ID, tbl.c.Ticker)
+        if tickers is not None:
+            stmt = stmt.where(tbl.c.Ticker.in_(list(tickers)))
+
+        for ticker_id, ticker in conn.execute(stmt).fetchall():
+            self.ids[ticker.strip()] = int(ticker_id)
+
+        return self
+
+    def create_missing(self, conn, df_equities):
+
+        """
+        Inserts the tickers that are not in the Equities table yet with one executemany insert and reads their new
+        Ticker_IDs back with one query, so new tickers are created in one batch before their prices are staged.
+
+        Args:
+            - conn: SQLAlchemy Connection used for the changes.
+            - df_equities: DataFrame with 'Ticker', 'Name' and 'Sub_Industry_ID' columns (e.g. the
+              SP500_GICS_Combined.csv rows of the tickers to load).
+
+        Returns:
+            - List of the created tickers.
+        """
+
+        df_new = df_equities[['Ticker', 'Name', 'Sub_Industry_ID']].drop_duplicates(subset='Ticker')
+        df_new = df_new[~df_new['Ticker'].isin(self.ids)]
+        if len(df_new) == 0:
+            return []
+
+        conn.execute(sa.insert(_price_tables(self.schema)['Equities']), _to_records(df_new))
+
+        created = df_new['Ticker'].tolist()
+        self.refresh(conn, created)
+
+        return created
+
+
+@profile_function
+def stage_price_batch(conn, df_batch, ticker_ids, schema='Equities', verifier=None):
+
+    """
+    Writes the prices of a batch of tickers to Yahoo_Equity_Prices_STG with one executemany insert, replacing any
+    rows already staged for those tickers so a batch can be staged again after a failure. Tickers are resolved to
+    their Ticker_ID through the cache before writing, and tickers that are not cached are not staged.
+
+    Args:
+        - conn: SQLAlchemy Connection used for the changes.
+        - df_batch: DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+        - ticker_ids: TickerIdCache holding the Ticker_IDs of the tickers (from read_price_load_keys).
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - verifier: LoadVerifier keyed by 'Ticker_ID' that the staged rows are added to, or None.
+
+    Returns:
+        - Integer with the number of staged rows.
+    """
+
+    tbl = _price_tables(schema)['Yahoo_Equity_Prices_STG']
+
+    df_stg = df_batch[['Date'] + PRICE_COLUMNS].copy()
+    df_stg.insert(0, 'Ticker_ID', ticker_ids.map(df_batch['Ticker']).to_numpy())
+    df_stg = df_stg[df_stg['Ticker_ID'].notna()]
+    df_stg['Ticker_ID'] = df_stg['Ticker_ID'].astype(np.int64)
+
+    batch_ids = [int(ticker_id) for ticker_id in df_stg['Ticker_ID'].unique()]
+    if batch_ids:
+        conn.execute(sa.delete(tbl).where(tbl.c.Ticker_ID.in_(batch_ids)))
+
+    df_stg['Date'] = pd.to_datetime(df_stg['Date']).dt.date
+    df_stg['Volume'] = df_stg['Volume'].round().astype('Int64')
+
+    if len(df_stg) > 0:
+        conn.execute(sa.insert(tbl), _to_records(df_stg))
+
+    if verifier is not None:
+        verifier.update(df_stg)
+
+    return len(df_stg)
+
+
+def read_price_load_keys(conn, tickers=None, schema='Equities'):
+
+    """
+    Reads the Ticker_ID of each ticker and the market calendar dates once for the stage and merge steps.
+
+    Args:
+        - conn: SQLAlchemy Connection used for the reads.
+        - tickers: List of tickers to look up (defaults to every ticker in the Equities table).
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+
+    Returns:
+        - tuple: A TickerIdCache of the tickers and a sorted numpy datetime64 array of calendar dates.
+    """
+
+    ticker_ids = TickerIdCache(schema).refresh(conn)
+    if tickers is not None:
+        ticker_ids.ids = {ticker: ticker_ids[ticker] for ticker in tickers if ticker in ticker_ids}
+
+    tbl_calendar = _price_tables(schema)['Market_Calendar']
+    result = conn.execute(sa.select(tbl_calendar.c.Date).distinct())
+    calendar_dates = np.unique(pd.to_datetime([row[0] for row in result.fetchall()]).to_numpy())
+
+    return ticker_ids, calendar_dates
+
+
+@profile_function
+def merge_price_batch(conn, tickers, ticker_ids, calendar_dates, schema='Equities', verifier=None):
+
+    """
+    Merges the staged prices of a batch of tickers into Yahoo_Equity_Prices the way Load-Yahoo_Equity_Prices.ipynb
+    does: every market calendar date between the first and last staged date of a ticker gets a row, missing prices
+    are forward filled, and existing rows are updated while new rows are inserted with one executemany each. The
+    staged rows are read by their integer Ticker_ID and typed Date, so no join on ticker strings or date casts are
+    needed.
+
+    Args:
+        - conn: SQLAlchemy Connection used for the reads and the changes.
+        - tickers: List of tickers in the batch.
+        - ticker_ids: TickerIdCache holding the Ticker_IDs of the tickers (from read_price_load_keys).
+        - calendar_dates: Sorted numpy datetime64 array of market calendar dates (from read_price_load_keys).
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - verifier: LoadVerifier keyed by 'Ticker_ID' that the merged rows are added to, or None.
+
+    Returns:
+        - Integer with the number of merged rows.
+    """
+
+    tables = _price_tables(schema)
+    tbl_stg, tbl_prices = tables['Yahoo_Equity_Prices_STG'], tables['Yahoo_Equity_Prices']
+
+    # Only tickers in the Equities table are merged
+    batch_ids = [ticker_ids[ticker] for ticker in tickers if ticker in ticker_ids]
+    if not batch_ids:
+        return 0
+
+    result = conn.execute(sa.select(tbl_stg.c.Ticker_ID, tbl_stg.c.Date, *[tbl_stg.c[col] for col in PRICE_COLUMNS])
+                          .where(tbl_stg.c.Ticker_ID.in_(batch_ids)))
+    df_stg = pd.DataFrame(result.fetchall(), columns=['Ticker_ID', 'Date'] + PRICE_COLUMNS)
+    if len(df_stg) == 0:
+        return 0
+    df_stg['Date'] = pd.to_datetime(df_stg['Date'])
+    df_stg[PRICE_COLUMNS[:4]] = df_stg[PRICE_COLUMNS[:4]].astype(float).round(2)
+
+    # Calendar dates between the first and last staged date of each ticker
+    df_bounds = df_stg.groupby('Ticker_ID')['Date'].agg(['min', 'max'])
+    first = np.searchsorted(calendar_dates, df_bounds['min'].to_numpy(), side='left')
+    last = np.searchsorted(calendar_dates, df_bounds['max'].to_numpy(), side='right')
+    counts = np.maximum(last - first, 0)
+    positions = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    df_grid = pd.DataFrame({'Ticker_ID': np.repeat(df_bounds.index.to_numpy(), counts),
+                            'Date': calendar_dates[positions]})
+
+    df_merge = df_grid.merge(df_stg, on=['Ticker_ID', 'Date'], how='left')
+    df_merge.sort_values(by=['Ticker_ID', 'Date'], inplace=True)
+    df_merge[PRICE_COLUMNS[:4]] = df_merge.groupby('Ticker_ID')[PRICE_COLUMNS[:4]].ffill()
+    if len(df_merge) == 0:
+        return 0
+
+    df_merge['Date'] = df_merge['Date'].dt.date
+    df_merge['Volume'] = df_merge['Volume'].round().astype('Int64')
+    df_merge = df_merge[['Date', 'Ticker_ID'] + PRICE_COLUMNS]
+
+    # Read the existing keys of the batch once to split the rows into updates and inserts
+    result = conn.execute(sa.select(tbl_prices.c.Date, tbl_prices.c.Ticker_ID)
+                          .where(tbl_prices.c.Ticker_ID.in_(batch_ids),
+                                 tbl_prices.c.Date.between(df_merge['Date'].min(), df_merge['Date'].max())))
+    existing = set((pd.Timestamp(row[0]).date(), int(row[1])) for row in result.fetchall())
+    is_update = np.array([(key_date, key_id) in existing
+                          for key_date, key_id in zip(df_merge['Date'], df_merge['Ticker_ID'])], dtype=bool)
+
+    if (~is_update).any():
+        conn.execute(sa.insert(tbl_prices), _to_records(df_merge[~is_update]))
+
+    if is_update.any():
+        key_cols = ['Date', 'Ticker_ID']
+        stmt = sa.update(tbl_prices).where(sa.and_(*[tbl_prices.c[col] == sa.bindparam('key_' + col)
+                                                     for col in key_cols]))
+        stmt = stmt.values({col: sa.bindparam(col) for col in PRICE_COLUMNS})
+        conn.execute(stmt, _key_records(df_merge[is_update], key_cols))
+
+    if verifier is not None:
+        verifier.update(df_merge)
+
+    return len(df_merge)
+
+
+def load_pipeline_checkpoint(checkpoint_path, start_date=None, end_date=None):
+
+    """
+    Loads the tickers already merged by an earlier run of run_price_pipeline.
+
+    A checkpoint written for a different date range is ignored so the tickers are loaded again.
+
+    Args:
+        - checkpoint_path: String with the path of the JSON checkpoint file.
+        - start_date: String representing the first date of the current run.
+        - end_date: String representing the last date of the current run.
+
+    Returns:
+        - A set of tickers that do not need to be loaded again.
+    """
+
+    if (checkpoint_path is None) or (not os.path.isfile(checkpoint_path)):
+        return set()
+
+    with open(checkpoint_path, 'r') as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+
+    if (checkpoint.get('start_date'), checkpoint.get('end_date')) != (start_date, end_date):
+        return set()
+
+    return set(checkpoint.get('completed', []))
+
+
+def _save_checkpoint(checkpoint_path, completed, start_date, end_date):
+
+    """
+    Writes the merged tickers to the checkpoint file, replacing it in one step so a crash never leaves a partial file.
+    """
+
+    checkpoint = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'updated': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'completed': sorted(completed)
+    }
+
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=1)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _new_stage_metrics(stage):
+
+    """
+    Returns an empty metrics record for one pipeline stage worker.
+    """
+
+    return {'Stage': stage, 'Workers': 1, 'Items': 0, 'Rows': 0, 'Busy Seconds': 0.0, 'Wait Seconds': 0.0,
+            'Errors': 0}
+
+
+def _queue_put(queue_tmp, item, stop_event, metrics):
+
+    """
+    Puts an item on a bounded queue, waiting while it is full unless the pipeline is stopping.
+    """
+
+    start_time = time.perf_counter()
+    try:
+        while not stop_event.is_set():
+            try:
+                queue_tmp.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        metrics['Wait Seconds'] += time.perf_counter() - start_time
+
+
+def _queue_get(queue_tmp, stop_event, metrics):
+
+    """
+    Gets an item from a queue, waiting while it is empty unless the pipeline is stopping.
+    """
+
+    start_time = time.perf_counter()
+    try:
+        while not stop_event.is_set():
+            try:
+                return queue_tmp.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END_OF_QUEUE
+    finally:
+        metrics['Wait Seconds'] += time.perf_counter() - start_time
+
+
+def _fetch_worker(fetcher, ticker_queue, start_date, end_date, pause, state, metrics):
+
+    """
+    Downloads tickers until the ticker queue is empty and passes each price DataFrame to the staging stage.
+    Download errors are recorded per ticker and do not stop the pipeline.
+    """
+
+    while not state['stop'].is_set():
+        try:
+            ticker = ticker_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        start_time = time.perf_counter()
+        try:
+            with profile_stage('Pipeline fetch', rows_in=1) as stage:
+                df_tmp = fetcher(ticker, start_date, end_date)
+                stage['rows_out'] = len(df_tmp)
+        except Exception as err:
+            metrics['Errors'] += 1
+            state['failed'][ticker] = f"Fetch failed: {err}"
+            continue
+        finally:
+            metrics['Busy Seconds'] += time.perf_counter() - start_time
+
+        metrics['Items'] += 1
+        if len(df_tmp) == 0:
+            state['failed'][ticker] = "No pricing data returned"
+        else:
+            metrics['Rows'] += len(df_tmp)
+            if not _queue_put(state['fetched'], df_tmp, state['stop'], metrics):
+                break
+
+        # Sleep to avoid hitting API rate limits
+        if pause > 0:
+            time.sleep(pause)
+
+    _queue_put(state['fetched'], _END_OF_QUEUE, state['stop'], metrics)
+
+
+def _stage_worker(engine, ticker_ids, n_fetch_workers, batch_size, schema, state, metrics):
+
+    """
+    Collects fetched tickers into batches, writes each batch to Yahoo_Equity_Prices_STG in its own transaction and
+    passes the staged tickers to the merge stage. Tickers that are not in the Equities table are not staged and are
+    recorded as failed.
+    """
+
+    def _flush(frames):
+        start_time = time.perf_counter()
+        df_batch = pd.concat(frames, ignore_index=True)
+        with profile_stage('Pipeline stage', rows_in=len(df_batch)) as stage:
+            with engine.begin() as conn:
+                stage['rows_out'] = stage_price_batch(conn, df_batch, ticker_ids, schema, state['stage_verifier'])
+        metrics['Busy Seconds'] += time.perf_counter() - start_time
+        metrics['Items'] += 1
+        metrics['Rows'] += stage['rows_out']
+
+        # Only the tickers resolved by the cache were staged, so only those are merged
+        staged = []
+        for ticker in df_batch['Ticker'].drop_duplicates():
+            if ticker in ticker_ids:
+                staged.append(ticker)
+            else:
+                state['failed'][ticker] = "Ticker is not in the Equities table"
+
+        return (not staged) or _queue_put(state['staged'], staged, state['stop'], metrics)
+
+    try:
+        frames = []
+        finished_fetchers = 0
+        while finished_fetchers < n_fetch_workers:
+            item = _queue_get(state['fetched'], state['stop'], metrics)
+            if state['stop'].is_set():
+                return
+            if item is _END_OF_QUEUE:
+                finished_fetchers += 1
+                continue
+
+            frames.append(item)
+            if len(frames) >= batch_size:
+                if not _flush(frames):
+                    return
+                frames = []
+
+        if frames and not _flush(frames):
+            return
+
+    except Exception as err:
+        metrics['Errors'] += 1
+        state['errors'].append(err)
+        state['stop'].set()
+        return
+
+    _queue_put(state['staged'], _END_OF_QUEUE, state['stop'], metrics)
+
+
+def _merge_worker(engine, ticker_ids, calendar_dates, schema, checkpoint, state, metrics):
+
+    """
+    Merges each staged batch into Yahoo_Equity_Prices in its own transaction and checkpoints the merged tickers.
+    """
+
+    try:
+        while True:
+            tickers = _queue_get(state['staged'], state['stop'], metrics)
+            if tickers is _END_OF_QUEUE:
+                return
+
+            start_time = time.perf_counter()
+            with profile_stage('Pipeline merge', rows_in=len(tickers)) as stage:
+                with engine.begin() as conn:
+                    stage['rows_out'] = merge_price_batch(conn, tickers, ticker_ids, calendar_dates, schema,
+                                                          state['merge_verifier'])
+            metrics['Busy Seconds'] += time.perf_counter() - start_time
+            metrics['Items'] += 1
+            metrics['Rows'] += stage['rows_out']
+
+            state['merged'].extend(tickers)
+
+            if checkpoint['path'] is not None:
+                checkpoint['completed'].update(state['merged'])
+                _save_checkpoint(checkpoint['path'], checkpoint['completed'], checkpoint['start_date'],
+                                 checkpoint['end_date'])
+
+    except Exception as err:
+        metrics['Errors'] += 1
+        state['errors'].append(err)
+        state['stop'].set()
+
+
+@profile_function
+def run_price_pipeline(engine, start_date, end_date, tickers=None, fetcher=None, schema='Equities', batch_size=25,
+                       queue_size=4, n_fetch_workers=1, pause=1.0, checkpoint_path=None, clear_staging=True,
+                       verify=False, df_new_equities=None):
+
+    """
+    Loads daily prices into Yahoo_Equity_Prices with overlapping fetch, stage and merge stages.
+
+    Fetcher threads download tickers while the staging thread writes every batch_size tickers to
+    Yahoo_Equity_Prices_STG and the merge thread merges the staged batches into Yahoo_Equity_Prices. The stages are
+    connected by bounded queues, so at most about queue_size batches are held in memory. Each batch is staged and merged in its own transaction and
+    the merged tickers are written to the checkpoint file, so after a failure the same call loads only the tickers
+    that were not merged yet. Download errors are reported per ticker, while database errors stop the pipeline and
+    are raised once the threads have stopped.
+
+    Args:
+        - engine: SQLAlchemy Engine of the data warehouse.
+        - start_date: String representing the first date to load.
+        - end_date: String representing the last date to load.
+        - tickers: List of tickers to load (defaults to every ticker in the Equities table).
+        - fetcher: Function (ticker, start_date, end_date) -> DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low',
+          'Close' and 'Volume' columns (defaults to fetch_yahoo_prices).
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - batch_size: Integer specifying the number of tickers staged and merged per transaction.
+        - queue_size: Integer specifying the number of batches each queue can hold before the stage before it waits.
+        - n_fetch_workers: Integer specifying the number of fetcher threads.
+        - pause: Float with the seconds each fetcher waits between downloads to avoid hitting API rate limits.
+        - checkpoint_path: String with the path of the JSON checkpoint file, or None to disable resuming.
+        - clear_staging: Boolean indicating whether Yahoo_Equity_Prices_STG is cleared when a run starts without a
+          checkpoint.
+        - verify: Boolean indicating whether to verify the staged and merged rows of this run against
+          Yahoo_Equity_Prices_STG and Yahoo_Equity_Prices with verify_load once the pipeline has finished.
+        - df_new_equities: DataFrame with 'Ticker', 'Name' and 'Sub_Industry_ID' columns of tickers to create in the
+          Equities table in one batch before the load when they are missing (e.g. SP500_GICS_Combined.csv), or None.
+
+    Returns:
+        - dict: The load report with 'Tickers', 'Resumed', 'Created', 'Merged', 'Failed', 'Rows Staged', 'Rows Merged'
+          and 'Seconds' entries, a 'Stages' DataFrame with the items, rows, busy and queue wait seconds and rows per
+          second of each stage, and with verify a 'Verification' dictionary of table name -> verify_load result.
+    """
+
+    if batch_size < 1 or queue_size < 1 or n_fetch_workers < 1:
+        raise ValueError("batch_size, queue_size and n_fetch_workers must be at least 1.")
+
+    start_time = time.perf_counter()
+    fetcher = fetcher or fetch_yahoo_prices
+
+    with engine.connect() as conn:
+        ticker_ids, calendar_dates = read_price_load_keys(conn, None, schema)
+
+    # Create the missing tickers in one batch up front so every staged row has its Ticker_ID
+    created = []
+    if df_new_equities is not None:
+        if tickers is not None:
+            df_new_equities = df_new_equities[df_new_equities['Ticker'].isin(tickers)]
+        with engine.begin() as conn:
+            created = ticker_ids.create_missing(conn, df_new_equities)
+    if tickers is None:
+        tickers = ticker_ids.tickers()
+
+    completed = load_pipeline_checkpoint(checkpoint_path, start_date, end_date)
+    pending = [ticker for ticker in dict.fromkeys(tickers) if ticker not in completed]
+
+    if clear_staging and not completed:
+        with engine.begin() as conn:
+            conn.execute(sa.delete(_price_tables(schema)['Yahoo_Equity_Prices_STG']))
+
+    # Tickers without a Ticker_ID are reported instead of downloaded
+    failed = {ticker: "Ticker is not in the Equities table" for ticker in pending if ticker not in ticker_ids}
+
+    ticker_queue = queue.Queue()
+    for ticker in pending:
+        if ticker not in failed:
+            ticker_queue.put(ticker)
+
+    state = {
+        'stop': threading.Event(),
+        'fetched': queue.Queue(maxsize=batch_size * queue_size),
+        'staged': queue.Queue(maxsize=queue_size),
+        'merged': [],
+        'failed': failed,
+        'errors': [],
+        'stage_verifier': LoadVerifier('Ticker_ID') if verify else None,
+        'merge_verifier': LoadVerifier('Ticker_ID') if verify else None
+    }
+    checkpoint = {'path': checkpoint_path, 'completed': completed, 'start_date': start_date, 'end_date': end_date}
+
+    fetch_metrics = [_new_stage_metrics('Fetch') for _ in range(n_fetch_workers)]
+    stage_metrics = _new_stage_metrics('Stage')
+    merge_metrics = _new_stage_metrics('Merge')
+
+    threads = [threading.Thread(target=_fetch_worker, name=f'pipeline-fetch-{worker}',
+                                args=(fetcher, ticker_queue, start_date, end_date, pause, state, metrics))
+               for worker, metrics in enumerate(fetch_metrics)]
+    threads.append(threading.Thread(target=_stage_worker, name='pipeline-stage',
+                                    args=(engine, ticker_ids, n_fetch_workers, batch_size, schema, state,
+                                          stage_metrics)))
+    threads.append(threading.Thread(target=_merge_worker, name='pipeline-merge',
+                                    args=(engine, ticker_ids, calendar_dates, schema, checkpoint, state,
+                                          merge_metrics)))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Combine the fetcher metrics into one row per stage
+    df_fetch = pd.DataFrame(fetch_metrics)
+    df_stages = pd.DataFrame([
+        {'Stage': 'Fetch', 'Workers': n_fetch_workers, **df_fetch.drop(columns=['Stage', 'Workers']).sum().to_dict()},
+        stage_metrics,
+        merge_metrics
+    ])
+    df_stages = df_stages.astype({'Workers': int, 'Items': int, 'Rows': int, 'Errors': int})
+    df_stages['Rows per Second'] = np.where(df_stages['Busy Seconds'] > 0,
+                                            df_stages['Rows'] / df_stages['Busy Seconds'], np.nan)
+    df_stages = df_stages.round({'Busy Seconds': 4, 'Wait Seconds': 4, 'Rows per Second': 1})
+
+    if state['errors']:
+        raise state['errors'][0]
+
+    report = {
+        'Tickers': len(tickers),
+        'Resumed': len(tickers) - len(pending),
+        'Created': created,
+        'Merged': state['merged'],
+        'Failed': state['failed'],
+        'Rows Staged': int(stage_metrics['Rows']),
+        'Rows Merged': int(merge_metrics['Rows']),
+        'Seconds': round(time.perf_counter() - start_time, 4),
+        'Stages': df_stages
+    }
+
+    # Compare the aggregates collected while the rows streamed through the stages with one grouped query per table
+    if verify:
+        with engine.connect() as conn:
+            report['Verification'] = {
+                'Yahoo_Equity_Prices_STG': verify_load(conn, state['stage_verifier'], 'Yahoo_Equity_Prices_STG',
+                                                       schema=schema),
+                'Yahoo_Equity_Prices': verify_load(conn, state['merge_verifier'], 'Yahoo_Equity_Prices',
+                                                   schema=schema)
+            }
+
+    return report
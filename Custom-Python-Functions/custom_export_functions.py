@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-aggregated export of the Year, Quarter and Month tables used by the Power BI data model.
+
+The period bars, returns and statistics of every Ticker and GICS level are calculated once in Python and written as
+Parquet or CSV files, one file per table and Year, and optionally to data warehouse tables, so Power BI imports them
+directly instead of rebuilding them with SUMMARIZE tables and Python visual scripts on every refresh. A manifest keeps
+a hash of every written partition and the last exported Date: the next export only regenerates the periods from that
+Date onwards and only rewrites the partitions whose content changed.
+"""
+
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import sqlalchemy as sa
+from custom_profiling_functions import profile_function
+from custom_python_functions import get_pricing_data, calculate_return_columns, calculate_stats
+from custom_rollup_functions import GICS_LEVELS, calculate_gics_rollup
+from custom_period_functions import PeriodTable
+from custom_arrow_functions import (prices_to_arrow, arrow_to_pandas, get_arrow_pricing_data,
+                                    calculate_arrow_return_columns)
+
+
+# Period types exported, from the longest to the shortest
+PERIODS = ('Year', 'Quarter', 'Month')
+
+# Compute paths of the period bars and return columns
+COMPUTE_PATHS = ('pandas', 'arrow')
+
+# Name of the manifest file written in the output folder
+MANIFEST_FILE = '_export_manifest.json'
+
+# Pandas period frequency of each period type
+_PERIOD_FREQ = {'Year': 'Y', 'Quarter': 'Q', 'Month': 'M'}
+
+# Columns of the period bars built by get_pricing_data
+_BAR_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def _period_start(date, period):
+
+    """
+    Returns the first day of the period containing a date.
+    """
+
+    return pd.Timestamp(date).to_period(_PERIOD_FREQ[period]).start_time
+
+
+def _aggregate_bars(prices, period, start=None):
+
+    """
+    Aggregates the daily prices from a start Date into period bars, with pandas or Arrow depending on the prices type.
+    """
+
+    if isinstance(prices, pd.DataFrame):
+        return get_pricing_data(prices if start is None else prices[prices['Date'] >= start], period)
+
+    if start is not None:
+        start = pa.scalar(start, type=prices.schema.field('Date').type)
+        prices = prices.filter(pc.greater_equal(prices['Date'], start))
+
+    return arrow_to_pandas(get_arrow_pricing_data(prices, period))
+
+
+def build_period_bars(df_pricing, period, df_previous=None, since_date=None):
+
+    """
+    Aggregates the daily prices into period bars, optionally regenerating only the periods touched by new prices.
+
+    Args:
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Year', 'Open', 'High', 'Low', 'Close' and 'Volume' columns,
+          or a pyarrow Table of the same columns sorted by 'Ticker' and 'Date' to aggregate with Arrow.
+        - period: String specifying the period type ('Year', 'Quarter', or 'Month').
+        - df_previous: DataFrame of previously exported bars of the same period, or None to aggregate every Date.
+        - since_date: First Date with new or changed prices. The bars of the periods before the period containing
+          since_date are kept from df_previous.
+
+    Returns:
+        - A DataFrame of period bars sorted by 'Ticker' and 'Date', with the columns of get_pricing_data.
+    """
+
+    if (df_previous is None) or (since_date is None):
+        return _aggregate_bars(df_pricing, period)
+
+    # Only the daily rows of the touched periods are aggregated again
+    start = _period_start(since_date, period)
+    df_new = _aggregate_bars(df_pricing, period, start)
+    df_kept = df_previous.loc[df_previous['Date'] < start, df_new.columns]
+
+    return pd.concat([df_kept, df_new], ignore_index=True).sort_values(by=['Ticker', 'Date'], ignore_index=True)
+
+
+def _period_stats(df_ret, df_year, key, period):
+
+    """
+    Calculates the statistics of a period table, grouping the Quarter and Month returns by their Year row.
+    """
+
+    if period == 'Year':
+        return calculate_stats(df_ret, key, period)
+
+    return calculate_stats(PeriodTable({'Year': df_year, period: df_ret}, key), key, period)
+
+
+@profile_function
+def build_export_tables(df_pricing, df_membership=None, periods=PERIODS, previous_bars=None, since_date=None,
+                        compute='pandas'):
+
+    """
+    Builds the period tables of the Power BI data model.
+
+    For each period the tables are:
+        - Equity_Returns_by_<period>: the period bars of every Ticker with the return columns of calculate_return.
+        - Equity_Statistics_by_<period>: calculate_stats by Ticker (by Ticker and Year for Quarter and Month).
+        - <level>_Returns_by_<period> and <level>_Statistics_by_<period> for each GICS level, with the returns
+          rolled up by calculate_gics_rollup, when df_membership is given.
+
+    A 'Ticker_ID' column is added next to 'Ticker' when df_pricing has one, so the tables relate to the Equities
+    table of the data model.
+
+    Args:
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Year', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+        - df_membership: DataFrame with 'Ticker' and the GICS level columns (see load_gics_membership), or None.
+        - periods: List of period types to build ('Year', 'Quarter', 'Month').
+        - previous_bars: Dictionary of period -> previously exported bars, used with since_date.
+        - since_date: First Date with new or changed prices, or None to aggregate every Date.
+        - compute: 'pandas', or 'arrow' to build the period bars and return columns with the Arrow compute kernels
+          of custom_arrow_functions.py (df_pricing must then be sorted by 'Ticker' and 'Date').
+
+    Returns:
+        - dict: Table name -> DataFrame.
+    """
+
+    missing = [col for col in ['Ticker', 'Year'] + _BAR_COLUMNS if col not in df_pricing.columns]
+    if missing:
+        raise ValueError(f"Required columns {missing} are missing.")
+
+    unknown = [period for period in periods if period not in PERIODS]
+    if unknown:
+        raise ValueError(f"Unknown periods {unknown}, expected {list(PERIODS)}.")
+
+    if compute not in COMPUTE_PATHS:
+        raise ValueError(f"Invalid compute path: {compute}. Must be one of {', '.join(COMPUTE_PATHS)}.")
+
+    previous_bars = previous_bars or {}
+    ticker_ids = None
+    if 'Ticker_ID' in df_pricing.columns:
+        ticker_ids = df_pricing.drop_duplicates(subset='Ticker').set_index('Ticker')['Ticker_ID']
+
+    # The Year returns are always built because the Quarter and Month statistics group by 'Year % Return'
+    # The Arrow path converts the daily prices once and hands the return columns to pandas without copying them
+    prices = df_pricing if compute == 'pandas' else prices_to_arrow(df_pricing[['Ticker', 'Year'] + _BAR_COLUMNS])
+    returns = {}
+    for period in [period for period in PERIODS if (period in periods) or (period == 'Year')]:
+        df_bars = build_period_bars(prices, period, previous_bars.get(period), since_date)
+        if compute == 'pandas':
+            df_cols = calculate_return_columns(df_bars, period)
+        else:
+            df_cols = arrow_to_pandas(calculate_arrow_return_columns(df_bars, period, log_returns=False))
+        returns[period] = df_bars.join(df_cols)
+
+    tables = {}
+    for period in [period for period in PERIODS if period in periods]:
+        tables['Equity_Returns_by_' + period] = returns[period]
+        tables['Equity_Statistics_by_' + period] = _period_stats(returns[period], returns['Year'], 'Ticker', period)
+
+    if df_membership is not None:
+        rollups = {period: calculate_gics_rollup(returns[period], df_membership, period) for period in returns}
+        for level in GICS_LEVELS:
+            for period in [period for period in PERIODS if period in periods]:
+                df_level = rollups[period][level]
+                tables[f'{level}_Returns_by_{period}'] = df_level
+                tables[f'{level}_Statistics_by_{period}'] = _period_stats(df_level, rollups['Year'][level], level,
+                                                                          period)
+
+    if ticker_ids is not None:
+        for df_tmp in tables.values():
+            if 'Ticker' in df_tmp.columns:
+                df_tmp.insert(int(df_tmp.columns.get_loc('Ticker')) + 1, 'Ticker_ID',
+                              ticker_ids.reindex(df_tmp['Ticker']).to_numpy())
+
+    return tables
+
+
+def _partition_hash(df_tmp):
+
+    """
+    Returns a hash of the column names and values of a partition.
+    """
+
+    digest = hashlib.sha1('\x1f'.join(map(str, df_tmp.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df_tmp, index=False).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def _split_partitions(df_tmp):
+
+    """
+    Splits a table into its Year partitions, or one partition named 'All' when it has no 'Year' column.
+    """
+
+    if 'Year' not in df_tmp.columns:
+        return {'All': df_tmp}
+
+    return {str(year): df_part.reset_index(drop=True) for year, df_part in df_tmp.groupby('Year', sort=True)}
+
+
+def _partition_path(output_folder, table, partition, file_format):
+
+    """
+    Returns the file path of one partition of a table.
+    """
+
+    name = table if partition == 'All' else f'{table}_{partition}'
+
+    return os.path.join(output_folder, table, f'{name}.{file_format}')
+
+
+def _write_partition(df_part, path, file_format):
+
+    """
+    Writes one partition file, replacing it in one step so a crash never leaves a partial file.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if file_format == 'parquet':
+        df_part.to_parquet(tmp_path, index=False)
+    else:
+        df_part.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _replace_warehouse_partition(conn, df_part, table, partition, schema):
+
+    """
+    Replaces the rows of one partition of a warehouse table, creating the table on its first write.
+    """
+
+    if sa.inspect(conn).has_table(table, schema=schema):
+        target = sa.table(table, sa.column('Year'), schema=schema)
+        statement = target.delete()
+        if partition != 'All':
+            statement = statement.where(target.c.Year == int(partition))
+        conn.execute(statement)
+
+    df_part.to_sql(table, conn, schema=schema, if_exists='append', index=False)
+
+
+def load_export_manifest(output_folder):
+
+    """
+    Loads the export manifest of an output folder.
+
+    Args:
+        - output_folder: String with the folder the tables are exported to.
+
+    Returns:
+        - dict: 'Last Date' and the partition hashes of each destination, or an empty dictionary.
+    """
+
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path, 'r') as manifest_file:
+        return json.load(manifest_file)
+
+
+def read_export_table(output_folder, table, file_format='parquet'):
+
+    """
+    Reads all the partitions of an exported table.
+
+    Args:
+        - output_folder: String with the folder the tables are exported to.
+        - table: String with the table name (e.g. 'Equity_Returns_by_Month').
+        - file_format: 'parquet' or 'csv'.
+
+    Returns:
+        - A DataFrame, or None when the table was not exported.
+    """
+
+    table_folder = os.path.join(output_folder, table)
+    if not os.path.isdir(table_folder):
+        return None
+
+    paths = sorted(os.path.join(table_folder, name) for name in os.listdir(table_folder)
+                   if name.endswith('.' + file_format))
+    if not paths:
+        return None
+
+    if file_format == 'parquet':
+        parts = [pd.read_parquet(path) for path in paths]
+    else:
+        parts = [pd.read_csv(path) for path in paths]
+
+    df_tmp = pd.concat(parts, ignore_index=True)
+    if 'Date' in df_tmp.columns:
+        df_tmp['Date'] = pd.to_datetime(df_tmp['Date'])
+
+    return df_tmp
+
+
+@profile_function
+def export_period_tables(df_pricing, output_folder, df_membership=None, periods=PERIODS, file_format='parquet',
+                         since_date=None, full=False, engine=None, schema=None, compute='pandas'):
+
+    """
+    Exports the period tables of the Power BI data model, regenerating and rewriting only what new prices changed.
+
+    Every table is written to <output_folder>/<table>/<table>_<Year>.<file_format>, one file per Year (a single
+    <table>.<file_format> file when the table has no 'Year' column), so Power BI can import each table folder. When
+    an engine is given, the same partitions are replaced in warehouse tables of the same names.
+
+    Unless full is True, the bars of the periods before the period containing since_date (by default the last Date
+    of the previous export, whose period may have been incomplete) are read back from the previous export instead
+    of being aggregated again. Only the partitions whose hash differs from the manifest are written, and the
+    partitions that no longer exist are removed.
+
+    Args:
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Year', 'Open', 'High', 'Low', 'Close' and 'Volume' columns,
+          and optionally 'Ticker_ID'.
+        - output_folder: String with the folder to export the tables to.
+        - df_membership: DataFrame with 'Ticker' and the GICS level columns, or None to skip the GICS tables.
+        - periods: List of period types to export ('Year', 'Quarter', 'Month').
+        - file_format: 'parquet' or 'csv'.
+        - since_date: First Date with new or changed prices (defaults to the last Date of the previous export).
+        - full: Boolean indicating whether to aggregate every Date again, e.g. after historical prices changed.
+        - engine: SQLAlchemy engine of a data warehouse to also write the tables to, or None.
+        - schema: Schema name of the warehouse tables.
+        - compute: 'pandas' or 'arrow', see build_export_tables.
+
+    Returns:
+        - A DataFrame report with one row per table and 'Table', 'Rows', 'Partitions', 'Written' and 'Removed'
+          columns.
+    """
+
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError("file_format must be 'parquet' or 'csv'.")
+
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_export_manifest(output_folder)
+    destinations = [file_format] + (['warehouse'] if engine is not None else [])
+    for destination in destinations:
+        manifest.setdefault(destination, {})
+
+    if full:
+        since_date = None
+    elif since_date is None:
+        since_date = manifest.get('Last Date')
+
+    # Previously exported bars of each period, needed to keep the periods before since_date
+    previous_bars = {}
+    if since_date is not None:
+        for period in [period for period in PERIODS if (period in periods) or (period == 'Year')]:
+            df_previous = read_export_table(output_folder, 'Equity_Returns_by_' + period, file_format)
+            if df_previous is None:
+                since_date = None
+                break
+            previous_bars[period] = df_previous
+
+    tables = build_export_tables(df_pricing, df_membership, periods, previous_bars, since_date, compute)
+
+    records = []
+    for table, df_tmp in tables.items():
+        partitions = _split_partitions(df_tmp)
+        hashes = {partition: _partition_hash(df_part) for partition, df_part in partitions.items()}
+        written = set()
+        removed = set()
+
+        for destination in destinations:
+            previous_hashes = manifest[destination].get(table, {})
+            changed = [partition for partition in partitions if previous_hashes.get(partition) != hashes[partition]]
+            dropped = [partition for partition in previous_hashes if partition not in partitions]
+
+            if destination == 'warehouse':
+                with engine.begin() as conn:
+                    for partition in changed:
+                        _replace_warehouse_partition(conn, partitions[partition], table, partition, schema)
+                    for partition in dropped:
+                        _replace_warehouse_partition(conn, df_tmp.iloc[:0], table, partition, schema)
+            else:
+                for partition in changed:
+                    _write_partition(partitions[partition], _partition_path(output_folder, table, partition,
+                                                                            file_format), file_format)
+                for partition in dropped:
+                    path = _partition_path(output_folder, table, partition, file_format)
+                    if os.path.isfile(path):
+                        os.remove(path)
+
+            manifest[destination][table] = hashes
+            written.update(changed)
+            removed.update(dropped)
+
+        records.append({'Table': table, 'Rows': len(df_tmp), 'Partitions': len(partitions), 'Written': len(written),
+                        'Removed': len(removed)})
+
+    # Save the manifest last, so an interrupted export writes its partitions again on the next run
+    manifest['Last Date'] = str(pd.Timestamp(df_pricing['Date'].max()).date())
+    tmp_path = os.path.join(output_folder, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(output_folder, MANIFEST_FILE))
+
+    return pd.DataFrame(records, columns=['Table', 'Rows', 'Partitions', 'Written', 'Removed'])
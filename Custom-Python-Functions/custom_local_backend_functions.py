@@ -0,0 +1,705 @@
+# -*- coding: utf-8 -*-
+"""
+Embedded local copy of the Equities data warehouse.
+
+The Sectors, Industry_Groups, Industries, Sub_Industries, Equities and Yahoo_Equity_Prices tables are mirrored into
+an embedded SQLite database (or DuckDB when it is installed) from the warehouse itself, from a Parquet or CSV price
+file with SP500_GICS_Combined.csv, or from DataFrames. The VW_Yahoo_Equity_Year_Prices and
+VW_Yahoo_Equity_Quarter_Prices views are created with the same window definitions as the SQL Server views, and the
+FN_Yahoo_Ticker_* table functions and the ranking, percentile and cumulative return rank queries of
+SQL-Equity-Performance-Analysis are run as parameterized queries, so the analyses run offline without the network
+round trips of the Azure server. check_backend_parity compares every query with the Python calculations.
+"""
+
+import os
+import re
+import math
+import sqlite3
+import pandas as pd
+import numpy as np
+import sqlalchemy as sa
+from custom_profiling_functions import profile_function
+from custom_python_functions import get_pricing_data, calculate_return_columns, calculate_stats
+from custom_ranking_functions import calculate_ranks
+from custom_etl_functions import DIMENSION_SPECS, build_gics_dimensions
+from custom_period_functions import PeriodTable
+
+
+# Embedded engines supported by LocalWarehouse
+BACKENDS = ('sqlite', 'duckdb')
+
+# Tables of the Equities schema mirrored locally, in load order (parents first)
+WAREHOUSE_TABLES = list(DIMENSION_SPECS) + ['Yahoo_Equity_Prices']
+
+# Dialect specific expressions substituted into the view and query definitions
+_DIALECT_SQL = {
+    'sqlite': {
+        'year': 'CAST(SUBSTR("Date", 1, 4) AS INTEGER)',
+        'quarter': '((CAST(SUBSTR("Date", 6, 2) AS INTEGER) + 2) / 3)',
+        'ln': 'LN',
+        'stdevp': 'STDEVP'
+    },
+    'duckdb': {
+        'year': 'YEAR("Date")',
+        'quarter': 'QUARTER("Date")',
+        'ln': 'LN',
+        'stdevp': 'STDDEV_POP'
+    }
+}
+
+# Year and Quarter bars of every Ticker, see Create-VW_Yahoo_Equity_*_Prices-View.sql. The full-frame FIRST_VALUE and
+# LAST_VALUE windows are replaced by one grouped aggregate joined back to the first and last day of each period, which
+# gives the same bars without evaluating a window frame for every daily row.
+_PERIOD_VIEW_SQL = """CREATE VIEW VW_Yahoo_Equity_{period}_Prices AS
+WITH q2 AS
+(SELECT
+    Ticker_ID,
+    {period_keys},
+    MIN("Date") AS First_Date,
+    MAX("Date") AS "Date",
+    MAX("High") AS "High",
+    MIN("Low") AS "Low"
+FROM Yahoo_Equity_Prices
+GROUP BY Ticker_ID, {period_groups})
+SELECT
+    q2.Ticker_ID,
+    TRIM(q3.Ticker) AS Ticker,
+    {period_columns},
+    q2."Date",
+    ROUND(q4."Open", 2) AS "Open",
+    ROUND(q2."High", 2) AS "High",
+    ROUND(q2."Low", 2) AS "Low",
+    ROUND(q5."Close", 2) AS "Close",
+    q5.Volume
+FROM q2
+INNER JOIN Equities q3
+ON q2.Ticker_ID = q3.Ticker_ID
+INNER JOIN Yahoo_Equity_Prices q4
+ON q2.Ticker_ID = q4.Ticker_ID
+AND q2.First_Date = q4."Date"
+INNER JOIN Yahoo_Equity_Prices q5
+ON q2.Ticker_ID = q5.Ticker_ID
+AND q2."Date" = q5."Date"
+"""
+
+# % Return of each period bar, the first bar of a Ticker is based on its 'Close' and 'Open'
+_RETURN_SQL = """CASE
+        WHEN COALESCE(LAG("Close", 1) OVER (PARTITION BY Ticker_ID ORDER BY "Date"), 0) = 0 THEN ("Close" / "Open") - 1.0
+        ELSE ("Close" / LAG("Close", 1) OVER (PARTITION BY Ticker_ID ORDER BY "Date")) - 1.0
+    END"""
+
+# Local versions of the FN_Yahoo_Ticker_* functions (:ticker, None for every Ticker) and analysis queries
+LOCAL_QUERIES = {
+    'FN_Yahoo_Ticker_Year_Prices': """SELECT
+    Ticker,
+    "Year",
+    "Date",
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    Volume
+FROM VW_Yahoo_Equity_Year_Prices
+WHERE (:ticker IS NULL OR Ticker = :ticker)
+ORDER BY Ticker, "Date"
+""",
+
+    'FN_Yahoo_Ticker_Year_Returns': f"""SELECT
+    Ticker,
+    "Year",
+    "Date",
+    ROUND(({_RETURN_SQL}) * 100, 2) AS "% Return"
+FROM VW_Yahoo_Equity_Year_Prices
+WHERE (:ticker IS NULL OR Ticker = :ticker)
+ORDER BY Ticker, "Date"
+""",
+
+    'FN_Yahoo_Ticker_Quarter_Returns': f"""SELECT
+    Ticker,
+    "Year",
+    "Quarter",
+    "Date",
+    ROUND(({_RETURN_SQL}) * 100, 2) AS "% Return"
+FROM VW_Yahoo_Equity_Quarter_Prices
+WHERE (:ticker IS NULL OR Ticker = :ticker)
+ORDER BY Ticker, "Date"
+""",
+
+    'FN_Yahoo_Ticker_Quarter_Returns_by_Year_Statistics': f"""WITH q1 AS
+(SELECT
+    Ticker_ID,
+    Ticker,
+    "Year",
+    {_RETURN_SQL} AS "% Return"
+FROM VW_Yahoo_Equity_Year_Prices
+WHERE (:ticker IS NULL OR Ticker = :ticker)),
+q2 AS
+(SELECT
+    Ticker_ID,
+    Ticker,
+    "Year",
+    "Quarter",
+    {_RETURN_SQL} AS "% Return"
+FROM VW_Yahoo_Equity_Quarter_Prices
+WHERE (:ticker IS NULL OR Ticker = :ticker)),
+q3 AS
+(SELECT
+    q2.Ticker_ID,
+    q2."Year",
+    q2."% Return",
+    ROW_NUMBER() OVER (PARTITION BY q2.Ticker_ID, q2."Year" ORDER BY q2."% Return") AS Row_Num,
+    COUNT(*) OVER (PARTITION BY q2.Ticker_ID, q2."Year") AS Cnt
+FROM q2),
+q4 AS
+(SELECT
+    q3.Ticker_ID,
+    q3."Year",
+    AVG(q3."% Return") AS "Median % Return"
+FROM q3
+WHERE 2 * q3.Row_Num BETWEEN q3.Cnt AND q3.Cnt + 2
+GROUP BY q3.Ticker_ID, q3."Year")
+SELECT
+    q1.Ticker,
+    q1."Year",
+    ROUND(q1."% Return" * 100, 2) AS "Yearly % Return",
+    ROUND(MIN(q2."% Return") * 100, 2) AS "Lowest Quarterly % Return",
+    ROUND(MAX(q2."% Return") * 100, 2) AS "Highest Quarterly % Return",
+    ROUND(AVG(q2."% Return") * 100, 2) AS "Avg Quarterly % Return",
+    ROUND(q4."Median % Return" * 100, 2) AS "Median Quarterly % Return",
+    ROUND({{stdevp}}(q2."% Return") * 100, 2) AS "Quarterly % Variance"
+FROM q1
+INNER JOIN q2
+ON q1.Ticker_ID = q2.Ticker_ID
+AND q1."Year" = q2."Year"
+INNER JOIN q4
+ON q1.Ticker_ID = q4.Ticker_ID
+AND q1."Year" = q4."Year"
+GROUP BY
+    q1.Ticker,
+    q1."Year",
+    q1."% Return",
+    q4."Median % Return"
+ORDER BY q1.Ticker, q1."Year"
+""",
+
+    'Yearly_Equity_Return_Ranking': f"""WITH q1 AS
+(SELECT
+    Ticker_ID,
+    Ticker,
+    "Year",
+    ROUND(({_RETURN_SQL}) * 100, 2) AS "% Return"
+FROM VW_Yahoo_Equity_Year_Prices),
+q2 AS
+(SELECT
+    q1.Ticker,
+    q1."Year",
+    q1."% Return",
+    DENSE_RANK() OVER (PARTITION BY q1."Year" ORDER BY q1."% Return" DESC) AS "% Return Rank"
+FROM q1)
+SELECT
+    q2."Year",
+    q2.Ticker,
+    q2."% Return",
+    q2."% Return Rank"
+FROM q2
+WHERE q2."% Return Rank" <= :top_n
+ORDER BY q2."Year", q2."% Return Rank", q2.Ticker""",
+
+    'Yearly_Equity_Return_Percentile': f"""WITH q1 AS
+(SELECT
+    Ticker_ID,
+    Ticker,
+    "Year",
+    ROUND(({_RETURN_SQL}) * 100, 2) AS "% Return"
+FROM VW_Yahoo_Equity_Year_Prices),
+q2 AS
+(SELECT
+    q1.Ticker,
+    q1."Year",
+    q1."% Return",
+    NTILE(100) OVER (PARTITION BY q1."Year" ORDER BY q1."% Return" ASC) AS "% Return Percentile"
+FROM q1)
+SELECT
+    q2."Year",
+    q2.Ticker,
+    q2."% Return",
+    q2."% Return Percentile"
+FROM q2
+WHERE q2."% Return Percentile" >= :percentile
+ORDER BY q2."Year", q2."% Return" DESC, q2.Ticker""",
+
+    'Equity_Cumulative_Return_Rank': """WITH q1 AS
+(SELECT
+    q2.Ticker_ID,
+    TRIM(q3.Ticker) AS Ticker,
+    CASE
+        WHEN COALESCE(LAG(q2."Close", 1) OVER (PARTITION BY q2.Ticker_ID ORDER BY q2."Date"), 0) = 0
+        THEN {ln}(q2."Close" / q2."Open")
+        ELSE {ln}(q2."Close" / LAG(q2."Close", 1) OVER (PARTITION BY q2.Ticker_ID ORDER BY q2."Date"))
+    END AS "Log % Return"
+FROM Yahoo_Equity_Prices q2
+INNER JOIN Equities q3
+ON q2.Ticker_ID = q3.Ticker_ID),
+q4 AS
+(SELECT
+    q1.Ticker,
+    ROUND((EXP(SUM(q1."Log % Return")) - 1.0) * 100, 2) AS "Cumulative % Return"
+FROM q1
+GROUP BY q1.Ticker_ID, q1.Ticker),
+q5 AS
+(SELECT
+    q4.Ticker,
+    q4."Cumulative % Return",
+    DENSE_RANK() OVER (ORDER BY q4."Cumulative % Return" DESC) AS "Cumulative % Return Rank"
+FROM q4)
+SELECT
+    q5.Ticker,
+    q5."Cumulative % Return",
+    q5."Cumulative % Return Rank"
+FROM q5
+WHERE q5."Cumulative % Return Rank" <= :top_n
+ORDER BY q5."Cumulative % Return Rank", q5.Ticker"""
+}
+
+# Default parameters of each local query
+QUERY_PARAMETERS = {
+    'FN_Yahoo_Ticker_Year_Prices': {'ticker': None},
+    'FN_Yahoo_Ticker_Year_Returns': {'ticker': None},
+    'FN_Yahoo_Ticker_Quarter_Returns': {'ticker': None},
+    'FN_Yahoo_Ticker_Quarter_Returns_by_Year_Statistics': {'ticker': None},
+    'Yearly_Equity_Return_Ranking': {'top_n': 5},
+    'Yearly_Equity_Return_Percentile': {'percentile': 100},
+    'Equity_Cumulative_Return_Rank': {'top_n': 10}
+}
+
+
+class _PopulationStdev:
+
+    """
+    SQLite aggregate matching STDEVP, using Welford's running mean and sum of squares.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        return math.sqrt(self.m2 / self.count) if self.count > 0 else None
+
+
+def _connect_sqlite(path):
+
+    """
+    Opens a SQLite database with the LN, EXP and STDEVP functions used by the views and queries.
+    """
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+
+    # LN and EXP are built in only when SQLite is compiled with its math functions
+    for name, func in (('LN', math.log), ('EXP', math.exp)):
+        try:
+            conn.execute(f'SELECT {name}(1.0)')
+        except sqlite3.OperationalError:
+            conn.create_function(name, 1, func, deterministic=True)
+
+    conn.create_aggregate('STDEVP', 1, _PopulationStdev)
+
+    return conn
+
+
+class LocalWarehouse:
+
+    """
+    Embedded database holding a local copy of the Equities schema with its views.
+
+    Tables are created without a schema prefix (SQLite has no schemas), so the views and queries reference
+    Yahoo_Equity_Prices instead of [Financial_Securities].[Equities].[Yahoo_Equity_Prices].
+
+    Args:
+        - path: String with the database file path, or ':memory:' for an in-memory database.
+        - backend: String with the embedded engine ('sqlite' or 'duckdb').
+    """
+
+    def __init__(self, path=':memory:', backend='sqlite'):
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Invalid backend: {backend}. Must be one of {', '.join(BACKENDS)}.")
+
+        self.path = path
+        self.backend = backend
+
+        if backend == 'duckdb':
+            # duckdb is optional and only needed for the DuckDB backend
+            import duckdb
+            self.conn = duckdb.connect(path)
+        else:
+            self.conn = _connect_sqlite(path)
+
+    def _sql(self, sql_stat):
+
+        """
+        Substitutes the dialect specific expressions and parameter markers of a view or query definition.
+        """
+
+        sql_stat = sql_stat.format(**_DIALECT_SQL[self.backend])
+        if self.backend == 'duckdb':
+            sql_stat = re.sub(r'(?<!:):(\w+)', r'$\1', sql_stat)
+
+        return sql_stat
+
+    def execute(self, sql_stat):
+
+        """
+        Executes a statement without results.
+        """
+
+        self.conn.execute(sql_stat)
+        if self.backend == 'sqlite':
+            self.conn.commit()
+
+    def write_table(self, table_name, df_tmp):
+
+        """
+        Replaces a table with the rows of a DataFrame, storing 'Date' as a date.
+        """
+
+        df_tmp = df_tmp.copy()
+        if 'Date' in df_tmp.columns:
+            dates = pd.to_datetime(df_tmp['Date'])
+            df_tmp['Date'] = dates.dt.strftime('%Y-%m-%d') if self.backend == 'sqlite' else dates.dt.date
+
+        if self.backend == 'duckdb':
+            self.conn.register('_df_tmp', df_tmp)
+            self.conn.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM _df_tmp')
+            self.conn.unregister('_df_tmp')
+        else:
+            df_tmp.to_sql(table_name, self.conn, if_exists='replace', index=False)
+
+    def query(self, sql_stat, params=None):
+
+        """
+        Runs a query and returns its rows as a DataFrame with 'Date' parsed.
+        """
+
+        sql_stat = self._sql(sql_stat)
+
+        if self.backend == 'duckdb':
+            df_tmp = self.conn.execute(sql_stat, params or {}).df()
+        else:
+            df_tmp = pd.read_sql(sql_stat, self.conn, params=params)
+
+        if 'Date' in df_tmp.columns:
+            df_tmp['Date'] = pd.to_datetime(df_tmp['Date'])
+
+        return df_tmp
+
+    def close(self):
+
+        """
+        Closes the database connection.
+        """
+
+        self.conn.close()
+
+
+@profile_function
+def build_local_tables(df_gics, df_pricing):
+
+    """
+    Builds the rows of the mirrored Equities schema tables from the GICS classification and daily prices.
+
+    Ticker_ID is taken from df_pricing when present, as read from the warehouse, and otherwise numbered in Ticker
+    order like the identity column of the Equities table.
+
+    Args:
+        - df_gics: DataFrame with the SP500_GICS_Combined.csv columns.
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume' and optionally
+          'Ticker_ID' columns.
+
+    Returns:
+        - dict: Table name -> DataFrame, in load order.
+    """
+
+    tables = build_gics_dimensions(df_gics)
+
+    missing = sorted(set(df_pricing['Ticker']) - set(tables['Equities']['Ticker']))
+    if missing:
+        raise ValueError(f"{len(missing)} priced Tickers are missing from the GICS classification: "
+                         f"{', '.join(missing[:10])}")
+
+    df_equities = tables['Equities'].sort_values('Ticker').reset_index(drop=True)
+    if 'Ticker_ID' in df_pricing.columns:
+        ticker_ids = df_pricing.drop_duplicates('Ticker').set_index('Ticker')['Ticker_ID']
+        df_equities.insert(0, 'Ticker_ID', df_equities['Ticker'].map(ticker_ids))
+        unpriced = df_equities['Ticker_ID'].isna()
+        df_equities.loc[unpriced, 'Ticker_ID'] = ticker_ids.max() + np.arange(1, unpriced.sum() + 1)
+        df_equities['Ticker_ID'] = df_equities['Ticker_ID'].astype(np.int64)
+    else:
+        df_equities.insert(0, 'Ticker_ID', np.arange(1, len(df_equities) + 1, dtype=np.int64))
+    tables['Equities'] = df_equities
+
+    df_prices = df_pricing[['Date', 'Ticker', 'Open', 'High', 'Low', 'Close', 'Volume']].merge(
+        df_equities[['Ticker', 'Ticker_ID']], on='Ticker')
+    tables['Yahoo_Equity_Prices'] = df_prices[['Date', 'Ticker_ID', 'Open', 'High', 'Low', 'Close', 'Volume']]
+
+    return tables
+
+
+def read_price_file(prices_file):
+
+    """
+    Reads daily prices from a Parquet or CSV file with 'Ticker', 'Date' and price columns.
+
+    Args:
+        - prices_file: String with the path of a .parquet or .csv file.
+
+    Returns:
+        - A DataFrame sorted by 'Ticker' and 'Date' with 'Date' parsed.
+    """
+
+    if not os.path.isfile(prices_file):
+        raise FileNotFoundError(f"Price file not found: {prices_file}")
+
+    if prices_file.lower().endswith('.parquet'):
+        df_pricing = pd.read_parquet(prices_file)
+    elif prices_file.lower().endswith('.csv'):
+        df_pricing = pd.read_csv(prices_file)
+    else:
+        raise ValueError(f"Invalid price file: {prices_file}. Must be a .parquet or .csv file.")
+
+    df_pricing['Date'] = pd.to_datetime(df_pricing['Date'])
+
+    return df_pricing.sort_values(['Ticker', 'Date']).reset_index(drop=True)
+
+
+def read_warehouse_tables(engine, schema='Equities'):
+
+    """
+    Reads the mirrored tables from the data warehouse.
+
+    Args:
+        - engine: SQLAlchemy Engine of the data warehouse.
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+
+    Returns:
+        - dict: Table name -> DataFrame, in load order.
+    """
+
+    tables = {}
+    with engine.connect() as conn:
+        for table_name in WAREHOUSE_TABLES:
+            tables[table_name] = pd.read_sql(sa.select(sa.text('*')).select_from(
+                sa.table(table_name, schema=schema)), conn)
+
+    return tables
+
+
+@profile_function
+def create_local_warehouse(tables, path=':memory:', backend='sqlite'):
+
+    """
+    Creates the local copy of the Equities schema: writes the tables, indexes the prices by Ticker_ID and Date and
+    creates the Year and Quarter price views.
+
+    Args:
+        - tables: dict of Table name -> DataFrame, as returned by build_local_tables or read_warehouse_tables.
+        - path: String with the database file path, or ':memory:' for an in-memory database.
+        - backend: String with the embedded engine ('sqlite' or 'duckdb').
+
+    Returns:
+        - LocalWarehouse: The loaded database.
+    """
+
+    missing = [table_name for table_name in WAREHOUSE_TABLES if table_name not in tables]
+    if missing:
+        raise ValueError(f"Missing tables: {', '.join(missing)}")
+
+    warehouse = LocalWarehouse(path, backend)
+
+    for view_name in ('VW_Yahoo_Equity_Year_Prices', 'VW_Yahoo_Equity_Quarter_Prices'):
+        warehouse.execute(f'DROP VIEW IF EXISTS {view_name}')
+
+    for table_name in WAREHOUSE_TABLES:
+        warehouse.write_table(table_name, tables[table_name])
+
+    warehouse.execute('CREATE UNIQUE INDEX IF NOT EXISTS IX_Yahoo_Equity_Prices ON Yahoo_Equity_Prices '
+                      '(Ticker_ID, "Date")')
+
+    dialect = _DIALECT_SQL[backend]
+    for period, keys in (('Year', ['Year']), ('Quarter', ['Year', 'Quarter'])):
+        warehouse.execute(_PERIOD_VIEW_SQL.format(
+            period=period,
+            period_keys=',\n    '.join(f'{dialect[key.lower()]} AS "{key}"' for key in keys),
+            period_groups=', '.join(dialect[key.lower()] for key in keys),
+            period_columns=',\n    '.join(f'q2."{key}"' for key in keys)))
+
+    return warehouse
+
+
+@profile_function
+def run_local_query(warehouse, query_name, **params):
+
+    """
+    Runs a local version of a SQL-Equity-Performance-Analysis function or query.
+
+    Args:
+        - warehouse: LocalWarehouse returned by create_local_warehouse.
+        - query_name: String with a LOCAL_QUERIES name (e.g. 'FN_Yahoo_Ticker_Quarter_Returns').
+        - params: Query parameters overriding QUERY_PARAMETERS, e.g. ticker='AAPL' or top_n=5.
+
+    Returns:
+        - A DataFrame with the query results.
+    """
+
+    if query_name not in LOCAL_QUERIES:
+        raise ValueError(f"Invalid query: {query_name}. Must be one of {', '.join(LOCAL_QUERIES)}.")
+
+    unknown = set(params) - set(QUERY_PARAMETERS[query_name])
+    if unknown:
+        raise ValueError(f"Invalid parameters for {query_name}: {', '.join(sorted(unknown))}")
+
+    return warehouse.query(LOCAL_QUERIES[query_name], {**QUERY_PARAMETERS[query_name], **params})
+
+
+def _compare_frames(query_name, df_expected, df_actual, keys, columns, tolerance):
+
+    """
+    Compares a query result with the Python result on the key columns and returns one parity report row.
+    """
+
+    df_merged = df_expected[keys + columns].merge(df_actual[keys + columns], on=keys, how='outer',
+                                                  suffixes=(' Python', ' SQL'), indicator=True)
+    both = df_merged['_merge'] == 'both'
+
+    mismatched = np.zeros(len(df_merged), dtype=bool)
+    max_difference = 0.0
+    for col in columns:
+        expected = df_merged[col + ' Python']
+        actual = df_merged[col + ' SQL']
+        if pd.api.types.is_numeric_dtype(expected) and pd.api.types.is_numeric_dtype(actual):
+            difference = (expected.astype(float) - actual.astype(float)).abs()
+            max_difference = max(max_difference, float(difference[both].max()) if both.any() else 0.0)
+            mismatched |= (difference > tolerance + 1e-9).to_numpy()
+        else:
+            mismatched |= (expected != actual).to_numpy()
+
+    mismatches = int((mismatched & both.to_numpy()).sum())
+    missing = int((df_merged['_merge'] == 'left_only').sum())
+    unexpected = int((df_merged['_merge'] == 'right_only').sum())
+
+    return {
+        'Query': query_name,
+        'Rows': len(df_actual),
+        'Missing': missing,
+        'Unexpected': unexpected,
+        'Mismatches': mismatches,
+        'Max Difference': round(max_difference, 4),
+        'Passed': missing == 0 and unexpected == 0 and mismatches == 0
+    }
+
+
+@profile_function
+def check_backend_parity(warehouse, df_pricing, tolerance=0.01):
+
+    """
+    Compares every local view and query with the same calculation in Python: get_pricing_data for the views,
+    calculate_return_columns for the returns, calculate_stats for the quarterly statistics and calculate_ranks for
+    the rankings and percentiles.
+
+    The SQL statistics are calculated from unrounded quarterly returns and rounded once, while calculate_stats uses
+    the rounded '% Return' columns, so statistics can differ by up to the tolerance.
+
+    Args:
+        - warehouse: LocalWarehouse returned by create_local_warehouse.
+        - df_pricing: DataFrame with the daily prices loaded into the warehouse ('Ticker', 'Date', 'Open', 'High',
+          'Low', 'Close', 'Volume').
+        - tolerance: Float with the largest accepted difference of the rounded percentages.
+
+    Returns:
+        - A DataFrame with the 'Query', 'Rows', 'Missing', 'Unexpected', 'Mismatches', 'Max Difference' and 'Passed'
+          columns, one row per query.
+    """
+
+    price_cols = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+    df_daily = df_pricing[['Ticker'] + price_cols].sort_values(['Ticker', 'Date']).reset_index(drop=True)
+    df_daily['Date'] = pd.to_datetime(df_daily['Date'])
+    df_daily['Year'] = df_daily['Date'].dt.year
+
+    # Period bars rounded to cents like the views
+    bars = {}
+    for period in ('Year', 'Quarter'):
+        df_bars = get_pricing_data(df_daily, period).round({'Open': 2, 'High': 2, 'Low': 2, 'Close': 2})
+        df_bars = pd.concat([df_bars, calculate_return_columns(df_bars, period)], axis=1)
+        bars[period] = df_bars
+
+    report = [
+        _compare_frames('VW_Yahoo_Equity_Year_Prices', bars['Year'],
+                        warehouse.query('SELECT * FROM VW_Yahoo_Equity_Year_Prices'), ['Ticker', 'Year'],
+                        price_cols, tolerance),
+        _compare_frames('VW_Yahoo_Equity_Quarter_Prices', bars['Quarter'],
+                        warehouse.query('SELECT * FROM VW_Yahoo_Equity_Quarter_Prices'),
+                        ['Ticker', 'Year', 'Quarter'], price_cols, tolerance),
+        _compare_frames('FN_Yahoo_Ticker_Year_Prices', bars['Year'],
+                        run_local_query(warehouse, 'FN_Yahoo_Ticker_Year_Prices'), ['Ticker', 'Year'],
+                        price_cols, tolerance),
+        _compare_frames('FN_Yahoo_Ticker_Year_Returns', bars['Year'].rename(columns={'Year % Return': '% Return'}),
+                        run_local_query(warehouse, 'FN_Yahoo_Ticker_Year_Returns'), ['Ticker', 'Year'],
+                        ['Date', '% Return'], tolerance),
+        _compare_frames('FN_Yahoo_Ticker_Quarter_Returns',
+                        bars['Quarter'].rename(columns={'Quarter % Return': '% Return'}),
+                        run_local_query(warehouse, 'FN_Yahoo_Ticker_Quarter_Returns'), ['Ticker', 'Year', 'Quarter'],
+                        ['Date', '% Return'], tolerance)
+    ]
+
+    # Quarterly return statistics of each Year
+    period_table = PeriodTable({'Year': bars['Year'], 'Quarter': bars['Quarter']}, 'Ticker')
+    df_stats = calculate_stats(period_table, 'Ticker', 'Quarter').rename(columns={
+        'Year % Return': 'Yearly % Return',
+        'Lowest Quarter % Return': 'Lowest Quarterly % Return',
+        'Highest Quarter % Return': 'Highest Quarterly % Return',
+        'Average Quarter % Return': 'Avg Quarterly % Return',
+        'Median Quarter % Return': 'Median Quarterly % Return',
+        'Quarter % Variance': 'Quarterly % Variance'
+    })
+    stat_cols = ['Yearly % Return', 'Lowest Quarterly % Return', 'Highest Quarterly % Return',
+                 'Avg Quarterly % Return', 'Median Quarterly % Return', 'Quarterly % Variance']
+    report.append(_compare_frames('FN_Yahoo_Ticker_Quarter_Returns_by_Year_Statistics', df_stats,
+                                  run_local_query(warehouse, 'FN_Yahoo_Ticker_Quarter_Returns_by_Year_Statistics'),
+                                  ['Ticker', 'Year'], stat_cols, tolerance))
+
+    # Top Yearly returns by dense rank and by percentile
+    df_ranks = calculate_ranks(bars['Year'], 'Year % Return', ['Year']).rename(columns={
+        'Year % Return': '% Return',
+        'Year % Return Rank': '% Return Rank',
+        'Year % Return Percentile': '% Return Percentile'
+    })
+    top_n = QUERY_PARAMETERS['Yearly_Equity_Return_Ranking']['top_n']
+    report.append(_compare_frames('Yearly_Equity_Return_Ranking', df_ranks[df_ranks['% Return Rank'] <= top_n],
+                                  run_local_query(warehouse, 'Yearly_Equity_Return_Ranking'), ['Year', 'Ticker'],
+                                  ['% Return', '% Return Rank'], tolerance))
+    percentile = QUERY_PARAMETERS['Yearly_Equity_Return_Percentile']['percentile']
+    report.append(_compare_frames('Yearly_Equity_Return_Percentile',
+                                  df_ranks[df_ranks['% Return Percentile'] >= percentile],
+                                  run_local_query(warehouse, 'Yearly_Equity_Return_Percentile'), ['Year', 'Ticker'],
+                                  ['% Return'], tolerance))
+
+    # Cumulative return of the unrounded daily prices over the whole history
+    df_cumulative = calculate_return_columns(df_daily, 'Daily')[['Cumulative % Return']]
+    df_cumulative = df_cumulative.groupby(df_daily['Ticker']).last().reset_index()
+    df_cumulative = calculate_ranks(df_cumulative, 'Cumulative % Return')
+    top_n = QUERY_PARAMETERS['Equity_Cumulative_Return_Rank']['top_n']
+    report.append(_compare_frames('Equity_Cumulative_Return_Rank',
+                                  df_cumulative[df_cumulative['Cumulative % Return Rank'] <= top_n],
+                                  run_local_query(warehouse, 'Equity_Cumulative_Return_Rank'), ['Ticker'],
+                                  ['Cumulative % Return', 'Cumulative % Return Rank'], tolerance))
+
+    return pd.DataFrame(report)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Long-only portfolio optimizer and random portfolio evaluator.
+
+The annualized mean vector and covariance matrix are built once from the return panel. Random portfolios are
+evaluated a chunk of weight vectors at a time with one matrix multiply per chunk, and the minimum variance, maximum
+Sharpe and efficient frontier portfolios are solved with an accelerated projected gradient method (FISTA). Each
+iteration costs one matrix multiply and a projection onto the long-only weights, and all frontier points are solved
+together in one batch, so 500 Tickers solve in seconds without a general purpose solver.
+"""
+
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+from custom_profiling_functions import profile_function
+from custom_simulation_functions import build_return_matrix
+
+
+@profile_function
+def calculate_return_moments(df_tmp, tickers=None, period='Daily'):
+
+    """
+    Calculates the annualized mean return vector and covariance matrix of the Tickers from the price panel.
+
+    Args:
+        - df_tmp: DataFrame with 'Ticker', 'Date' and 'Close' columns (e.g. df_pricing).
+        - tickers: List of Tickers to include (defaults to every Ticker).
+        - period: A string representing the period type of the rows ('Year', 'Quarter', 'Month', or 'Daily').
+
+    Returns:
+        - tuple: A Series of annualized decimal mean returns and a DataFrame covariance matrix, both by Ticker.
+    """
+
+    no_of_periods = {'Year': 1, 'Quarter': 4, 'Month': 12}.get(period, 252)
+
+    df_returns = build_return_matrix(df_tmp, tickers)
+    if len(df_returns) < 2:
+        raise ValueError("At least 2 Dates with returns for every Ticker are needed.")
+
+    mean = df_returns.mean() * no_of_periods
+    cov = df_returns.cov() * no_of_periods
+
+    return mean, cov
+
+
+def _portfolio_stats(weights, mean, cov, risk_free_rate):
+
+    """
+    Returns the annualized % return, volatility and Sharpe ratio of each row of a weight matrix.
+    """
+
+    ret = weights @ mean * 100
+    vol = np.sqrt(np.maximum(np.einsum('ij,ij->i', weights @ cov, weights), 0)) * 100
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sharpe = np.where(vol > 0, (ret - risk_free_rate) / vol, 0)
+
+    return ret, vol, sharpe
+
+
+@profile_function
+def evaluate_random_portfolios(mean, cov, n_portfolios=100000, risk_free_rate=0.0, alpha=1.0, chunk_size=20000,
+                               seed=42):
+
+    """
+    Evaluates random long-only portfolios, one matrix multiply per chunk of weight vectors.
+
+    Weights are drawn from a Dirichlet distribution. With alpha=1 every weight vector is equally likely, while a
+    small alpha (e.g. 0.05) puts most of the weight in a few Tickers.
+
+    Args:
+        - mean: Series of annualized decimal mean returns by Ticker.
+        - cov: DataFrame annualized covariance matrix by Ticker.
+        - n_portfolios: Integer specifying the number of random portfolios.
+        - risk_free_rate: Float with the annual risk free rate in percent (e.g. 2.5).
+        - alpha: Float concentration of the Dirichlet distribution.
+        - chunk_size: Integer specifying the number of weight vectors evaluated at a time.
+        - seed: Integer seed of the random number generator.
+
+    Returns:
+        - tuple: A DataFrame with 'Annualized % Return', 'Annualized Volatility' and 'Sharpe Ratio' of each
+          portfolio, and a Series with the weights of the portfolio with the highest Sharpe ratio.
+    """
+
+    mean_values = mean.to_numpy(dtype=float)
+    cov_values = cov.loc[mean.index, mean.index].to_numpy(dtype=float)
+    rng = np.random.default_rng(seed)
+
+    ret = np.empty(n_portfolios)
+    vol = np.empty(n_portfolios)
+    sharpe = np.empty(n_portfolios)
+    best_sharpe, best_weights = -np.inf, None
+
+    for first in range(0, n_portfolios, chunk_size):
+        n_chunk = min(chunk_size, n_portfolios - first)
+        weights = rng.gamma(alpha, size=(n_chunk, len(mean_values)))
+        weights /= weights.sum(axis=1, keepdims=True)
+
+        chunk_slice = slice(first, first + n_chunk)
+        ret[chunk_slice], vol[chunk_slice], sharpe[chunk_slice] = _portfolio_stats(weights, mean_values, cov_values,
+                                                                                   risk_free_rate)
+
+        # Keep only the weights of the best portfolio so memory stays bounded by the chunk size
+        best = np.argmax(sharpe[chunk_slice])
+        if sharpe[chunk_slice][best] > best_sharpe:
+            best_sharpe, best_weights = sharpe[chunk_slice][best], weights[best].copy()
+
+    df_portfolios = pd.DataFrame({
+        'Annualized % Return': np.round(ret, 2),
+        'Annualized Volatility': np.round(vol, 2),
+        'Sharpe Ratio': np.round(sharpe, 3)
+    })
+
+    return df_portfolios, pd.Series(best_weights, index=mean.index, name='Weight')
+
+
+def _project_simplex(values):
+
+    """
+    Projects each row onto the long-only weights that sum to 1 (the probability simplex).
+    """
+
+    n = values.shape[1]
+    sorted_values = -np.sort(-values, axis=1)
+    cum_values = np.cumsum(sorted_values, axis=1) - 1.0
+    is_support = sorted_values - cum_values / np.arange(1, n + 1) > 0
+    support_size = n - np.argmax(is_support[:, ::-1], axis=1)
+    theta = cum_values[np.arange(len(values)), support_size - 1] / support_size
+
+    return np.maximum(values - theta[:, None], 0)
+
+
+def _project_excess(values, excess):
+
+    """
+    Projects each row onto the non-negative vectors y with excess·y = 1, bisecting on the multiplier.
+    """
+
+    def _level(theta):
+        return np.maximum(values - theta[:, None] * excess, 0) @ excess
+
+    # The level falls as theta grows, so widen the bracket until it contains 1
+    low = np.full(len(values), -1.0)
+    high = np.full(len(values), 1.0)
+    while (_level(low) < 1).any():
+        low *= 2
+    while (_level(high) > 1).any():
+        high *= 2
+
+    for _ in range(100):
+        middle = (low + high) / 2
+        is_high = _level(middle) > 1
+        low = np.where(is_high, middle, low)
+        high = np.where(is_high, high, middle)
+
+    return np.maximum(values - ((low + high) / 2)[:, None] * excess, 0)
+
+
+def _solve_fista(cov, linear, project, start, max_iter=20000, tol=1e-12):
+
+    """
+    Minimizes w'Σw - linear·w for each row of linear over a convex set with FISTA and adaptive restarts.
+
+    Args:
+        - cov: numpy covariance matrix.
+        - linear: numpy array with one linear term per problem (rows).
+        - project: Function projecting a matrix of rows onto the feasible set.
+        - start: numpy array of feasible starting rows.
+        - max_iter: Integer specifying the maximum number of iterations.
+        - tol: Float with the stopping tolerance on the change of the weights.
+
+    Returns:
+        - A numpy array with the solution of each problem.
+    """
+
+    step = 1.0 / (2 * np.linalg.eigvalsh(cov)[-1])
+    weights = start.copy()
+    momentum = weights.copy()
+    t = np.ones(len(weights))
+
+    for _ in range(max_iter):
+        gradient = 2 * momentum @ cov - linear
+        new_weights = project(momentum - step * gradient)
+        change = new_weights - weights
+
+        # Restart the momentum of rows moving against their gradient
+        restart = np.einsum('ij,ij->i', gradient, change) > 0
+        t_new = np.where(restart, 1.0, (1 + np.sqrt(1 + 4 * t ** 2)) / 2)
+        beta = np.where(restart, 0.0, (t - 1) / t_new)
+        momentum = new_weights + beta[:, None] * change
+
+        weights, t = new_weights, t_new
+        if np.abs(change).max() < tol:
+            break
+
+    return weights
+
+
+def _portfolio_result(weights, mean, cov, risk_free_rate):
+
+    """
+    Returns the weights and the annualized statistics of a solved portfolio.
+    """
+
+    weights = np.where(weights > 1e-8, weights, 0)
+    weights = weights / weights.sum()
+    ret, vol, sharpe = _portfolio_stats(weights[None, :], mean.to_numpy(), cov.to_numpy(), risk_free_rate)
+
+    return {
+        'Weights': pd.Series(weights, index=mean.index, name='Weight'),
+        'Annualized % Return': round(float(ret[0]), 2),
+        'Annualized Volatility': round(float(vol[0]), 2),
+        'Sharpe Ratio': round(float(sharpe[0]), 3)
+    }
+
+
+@profile_function
+def solve_min_variance(mean, cov, risk_free_rate=0.0):
+
+    """
+    Solves the long-only minimum variance portfolio.
+
+    Args:
+        - mean: Series of annualized decimal mean returns by Ticker.
+        - cov: DataFrame annualized covariance matrix by Ticker.
+        - risk_free_rate: Float with the annual risk free rate in percent, used for the reported Sharpe ratio.
+
+    Returns:
+        - dict: 'Weights' (Series by Ticker), 'Annualized % Return', 'Annualized Volatility' and 'Sharpe Ratio'.
+    """
+
+    cov = cov.loc[mean.index, mean.index]
+    cov_values = cov.to_numpy(dtype=float)
+    n = len(mean)
+
+    weights = _solve_fista(cov_values, np.zeros((1, n)), _project_simplex, np.full((1, n), 1.0 / n))[0]
+
+    return _portfolio_result(weights, mean, cov, risk_free_rate)
+
+
+@profile_function
+def solve_max_sharpe(mean, cov, risk_free_rate=0.0):
+
+    """
+    Solves the long-only portfolio with the highest Sharpe ratio.
+
+    The ratio is maximized exactly through the equivalent convex problem: minimize y'Σy subject to
+    (mean - risk_free_rate)·y = 1 and y >= 0, then scale y to weights summing to 1.
+
+    Args:
+        - mean: Series of annualized decimal mean returns by Ticker.
+        - cov: DataFrame annualized covariance matrix by Ticker.
+        - risk_free_rate: Float with the annual risk free rate in percent (e.g. 2.5).
+
+    Returns:
+        - dict: 'Weights' (Series by Ticker), 'Annualized % Return', 'Annualized Volatility' and 'Sharpe Ratio'.
+    """
+
+    cov = cov.loc[mean.index, mean.index]
+    excess = mean.to_numpy(dtype=float) - risk_free_rate / 100
+
+    if (excess <= 0).all():
+        raise ValueError("No Ticker has a mean return above the risk free rate.")
+
+    # Start from the Tickers with a positive excess return, scaled onto the constraint
+    start = np.where(excess > 0, excess, 0)
+    start = start / (start @ excess)
+
+    project = lambda values: _project_excess(values, excess)
+    y = _solve_fista(cov.to_numpy(dtype=float), np.zeros((1, len(excess))), project, start[None, :])[0]
+
+    return _portfolio_result(y / y.sum(), mean, cov, risk_free_rate)
+
+
+@profile_function
+def calculate_efficient_frontier(mean, cov, n_points=50, risk_free_rate=0.0):
+
+    """
+    Calculates long-only efficient frontier portfolios, solving all of them together in one batch.
+
+    Each point minimizes w'Σw - λ·mean·w for a risk aversion λ spread from 0 (the minimum variance portfolio) to
+    values where the portfolio holds the highest return Ticker.
+
+    Args:
+        - mean: Series of annualized decimal mean returns by Ticker.
+        - cov: DataFrame annualized covariance matrix by Ticker.
+        - n_points: Integer specifying the number of frontier portfolios.
+        - risk_free_rate: Float with the annual risk free rate in percent, used for the Sharpe ratios.
+
+    Returns:
+        - tuple: A DataFrame with 'Annualized % Return', 'Annualized Volatility' and 'Sharpe Ratio' of each distinct
+          frontier portfolio sorted by volatility, and a DataFrame with their weights (one row per portfolio).
+    """
+
+    cov = cov.loc[mean.index, mean.index]
+    mean_values = mean.to_numpy(dtype=float)
+    cov_values = cov.to_numpy(dtype=float)
+    n = len(mean_values)
+
+    # Scale λ so the return term ranges from negligible to dominant against the variance term
+    spread = max(mean_values.max() - mean_values.min(), 1e-12)
+    scale = 2 * np.diag(cov_values).mean() / spread
+    lambdas = np.r_[0.0, scale * np.logspace(-3, 2, n_points - 1)]
+
+    weights = _solve_fista(cov_values, lambdas[:, None] * mean_values[None, :], _project_simplex,
+                           np.full((n_points, n), 1.0 / n))
+    weights = np.where(weights > 1e-8, weights, 0)
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    ret, vol, sharpe = _portfolio_stats(weights, mean_values, cov_values, risk_free_rate)
+    df_frontier = pd.DataFrame({
+        'Annualized % Return': np.round(ret, 2),
+        'Annualized Volatility': np.round(vol, 2),
+        'Sharpe Ratio': np.round(sharpe, 3)
+    })
+    df_weights = pd.DataFrame(weights, columns=mean.index)
+
+    # Large λ values end on the same single Ticker portfolio, keep one of each
+    keep = ~df_frontier.duplicated(subset=['Annualized % Return', 'Annualized Volatility']).to_numpy()
+    order = np.argsort(vol[keep], kind='stable')
+
+    return (df_frontier[keep].iloc[order].reset_index(drop=True),
+            df_weights[keep].iloc[order].reset_index(drop=True))
+
+
+@profile_function
+def plot_efficient_frontier(df_portfolios, df_frontier, min_variance=None, max_sharpe=None):
+
+    """
+    Plots the random portfolios colored by Sharpe ratio with the efficient frontier and the optimal portfolios.
+
+    Args:
+        - df_portfolios: DataFrame from evaluate_random_portfolios.
+        - df_frontier: DataFrame from calculate_efficient_frontier.
+        - min_variance: Result of solve_min_variance to mark on the chart.
+        - max_sharpe: Result of solve_max_sharpe to mark on the chart.
+    """
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Scattergl(
+        x=df_portfolios['Annualized Volatility'],
+        y=df_portfolios['Annualized % Return'],
+        mode='markers',
+        marker=dict(size=3, color=df_portfolios['Sharpe Ratio'], colorscale='Viridis', showscale=True,
+                    colorbar=dict(title='Sharpe Ratio')),
+        name='Random Portfolios'
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=df_frontier['Annualized Volatility'],
+        y=df_frontier['Annualized % Return'],
+        mode='lines',
+        line=dict(color='black', width=2),
+        name='Efficient Frontier'
+    ))
+
+    for result, name, color in [(min_variance, 'Minimum Variance', 'blue'), (max_sharpe, 'Maximum Sharpe', 'red')]:
+        if result is not None:
+            fig.add_trace(go.Scatter(
+                x=[result['Annualized Volatility']],
+                y=[result['Annualized % Return']],
+                mode='markers',
+                marker=dict(size=14, color=color, symbol='star'),
+                name=name
+            ))
+
+    # Customize chart appearance
+    fig.update_layout(
+        title='Random Portfolios and Efficient Frontier',
+        xaxis_title='Annualized Volatility',
+        yaxis_title='Annualized % Return',
+        plot_bgcolor='lightgrey'
+    )
+
+    fig.show()
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel execution helpers for the per-ticker functions in custom_python_functions.py.
+
+The pricing panel is split by Ticker into balanced shards, the columns are placed in shared
+memory once and each worker process rebuilds only the rows of its own shard. check_sharded_parity compares the
+serial and parallel results of a function, e.g. on a frame with missing keys or attributes.
+"""
+
+import os
+import time
+import heapq
+import concurrent.futures as cf
+from multiprocessing import shared_memory
+import pandas as pd
+import numpy as np
+from custom_profiling_functions import profile_function
+
+
+@profile_function
+def split_into_shards(df_tmp, key, n_shards):
+
+    """
+    Splits the rows of a DataFrame into shards of whole key values (e.g. whole Tickers) with balanced row counts.
+
+    Args:
+        - df_tmp: DataFrame containing the panel data.
+        - key: A string representing the column used to keep rows together ('Ticker', 'Sector', etc.).
+        - n_shards: Integer specifying the number of shards to create.
+
+    Returns:
+        - A list of numpy arrays with the row positions of each shard, in the original row order.
+    """
+
+    # Encode the key values in order of first appearance and count the rows of each key value
+    codes, uniques = pd.factorize(df_tmp[key], use_na_sentinel=False)
+    row_counts = np.bincount(codes, minlength=len(uniques))
+
+    n_shards = max(1, min(n_shards, len(uniques)))
+
+    # Assign the largest key values first to the shard with the fewest rows (longest processing time rule)
+    shard_heap = [(0, shard) for shard in range(n_shards)]
+    key_to_shard = np.zeros(len(uniques), dtype=np.int64)
+    for code in np.argsort(-row_counts, kind='stable'):
+        rows, shard = heapq.heappop(shard_heap)
+        key_to_shard[code] = shard
+        heapq.heappush(shard_heap, (rows + row_counts[code], shard))
+
+    # Map every row to its shard and collect the row positions of each shard in their original order
+    row_shards = key_to_shard[codes]
+    shards = [np.flatnonzero(row_shards == shard) for shard in range(n_shards)]
+
+    return [positions for positions in shards if len(positions) > 0]
+
+
+def _share_frame(df_tmp):
+
+    """
+    Copies the index and columns of a DataFrame into shared memory blocks.
+
+    Numeric, boolean and datetime columns are copied as is. Any other column is factorized and only its integer
+    codes are shared, the (small) list of unique values travels with the specification.
+
+    Args:
+        - df_tmp: DataFrame to share.
+
+    Returns:
+        - tuple: The frame specification used by _attach_frame and the list of SharedMemory blocks to release.
+    """
+
+    spec = []
+    blocks = []
+
+    # The index is shared as the first entry so the worker can rebuild the original row labels
+    series_list = [('__index__', pd.Series(df_tmp.index))] + [(col, df_tmp[col]) for col in df_tmp.columns]
+
+    for col, ser in series_list:
+        if isinstance(ser.dtype, np.dtype) and ser.dtype.kind in 'biufcmM':
+            values = np.ascontiguousarray(ser.to_numpy())
+            uniques = None
+        else:
+            # Missing values get their own code, a -1 sentinel would be read back as the last unique value
+            codes, uniques = pd.factorize(ser, use_na_sentinel=False)
+            values = np.ascontiguousarray(codes)
+
+        # Shared memory blocks cannot be empty
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+        blocks.append(shm)
+        spec.append((col, shm.name, values.dtype.str, values.shape, uniques))
+
+    return spec, blocks
+
+
+def _attach_frame(spec, positions):
+
+    """
+    Rebuilds the rows of a shared DataFrame at the given positions.
+
+    Args:
+        - spec: The frame specification returned by _share_frame.
+        - positions: A numpy array with the row positions to take.
+
+    Returns:
+        - A DataFrame holding a private copy of the requested rows.
+    """
+
+    data = {}
+    for col, shm_name, dtype_str, shape, uniques in spec:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            # Taking the positions copies the values out of the shared block
+            values = np.ndarray(shape, dtype=np.dtype(dtype_str), buffer=shm.buf).take(positions)
+        finally:
+            shm.close()
+
+        if uniques is not None:
+            values = uniques.take(values)
+        data[col] = values
+
+    index = pd.Index(data.pop('__index__'))
+
+    return pd.DataFrame(data, index=index)
+
+
+def _run_shard(func, spec, positions, shard_id, func_args, func_kwargs):
+
+    """
+    Runs a function on one shard inside a worker process.
+
+    Args:
+        - func: The function to apply to the shard DataFrame.
+        - spec: The frame specification returned by _share_frame.
+        - positions: A numpy array with the row positions of the shard.
+        - shard_id: Integer identifying the shard.
+        - func_args: Tuple of extra positional arguments for func.
+        - func_kwargs: Dictionary of extra keyword arguments for func.
+
+    Returns:
+        - tuple: The shard id, the function result, elapsed seconds and process id.
+    """
+
+    start_time = time.perf_counter()
+    df_shard = _attach_frame(spec, positions)
+    result = func(df_shard, *func_args, **func_kwargs)
+    elapsed = time.perf_counter() - start_time
+
+    return shard_id, result, elapsed, os.getpid()
+
+
+def _restore_order(df_result, df_tmp, key):
+
+    """
+    Puts the concatenated shard results back into the order of the input DataFrame.
+
+    Row level results (same index labels as the input) are ordered by input row position. Aggregated results are
+    ordered by the first appearance of their key value in the input.
+
+    Args:
+        - df_result: DataFrame with the concatenated shard results.
+        - df_tmp: The input DataFrame.
+        - key: A string representing the shard key column.
+
+    Returns:
+        - The reordered DataFrame.
+    """
+
+    if df_tmp.index.is_unique and df_result.index.is_unique and df_result.index.isin(df_tmp.index).all():
+        row_positions = df_tmp.index.get_indexer(df_result.index)
+        return df_result.iloc[np.argsort(row_positions, kind='stable')]
+
+    if key in df_result.columns:
+        key_order = pd.Index(pd.unique(df_tmp[key]))
+        return df_result.iloc[np.argsort(key_order.get_indexer(df_result[key]), kind='stable')].reset_index(drop=True)
+
+    return df_result
+
+
+@profile_function
+def run_sharded(func, df_tmp, func_args=(), func_kwargs=None, key='Ticker', n_workers=None, min_rows=100000):
+
+    """
+    Runs a per-ticker function (e.g. calculate_return, calculate_drawdowns, calculate_stats) over a process pool.
+
+    The panel is split by key into shards of balanced row counts, shared with the workers through shared memory and
+    the results are concatenated back in the original order. Small inputs run serially in the current process.
+    The input DataFrame is never modified.
+
+    Args:
+        - func: The function to run. Its first argument must be the DataFrame, e.g. calculate_return.
+        - df_tmp: DataFrame containing the panel data.
+        - func_args: Tuple of extra positional arguments for func, e.g. ('Daily',) or ('Ticker', 'Daily').
+        - func_kwargs: Dictionary of extra keyword arguments for func.
+        - key: A string representing the column that must not be split across shards ('Ticker', 'Sector', etc.).
+        - n_workers: Integer specifying the number of worker processes (defaults to the number of CPUs).
+        - min_rows: Integer specifying the minimum number of rows required to use the process pool.
+
+    Returns:
+        - tuple: A DataFrame with the combined results and a DataFrame with the per-shard timings.
+    """
+
+    if func_kwargs is None:
+        func_kwargs = {}
+
+    if key not in df_tmp.columns:
+        raise ValueError(f"Column '{key}' does not exist in the DataFrame.")
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    shards = split_into_shards(df_tmp, key, n_workers)
+
+    # Fall back to a serial run for small inputs or when there is nothing to split
+    if (len(df_tmp) < min_rows) or (n_workers <= 1) or (len(shards) <= 1):
+        start_time = time.perf_counter()
+        df_result = func(df_tmp.copy(), *func_args, **func_kwargs)
+        elapsed = time.perf_counter() - start_time
+
+        # Same order as a parallel run, since func may sort its result (e.g. calculate_return sorts by Ticker and Date)
+        df_result = _restore_order(df_result, df_tmp, key)
+
+        df_timings = pd.DataFrame({
+            'Shard': [0],
+            '# of Keys': [df_tmp[key].nunique()],
+            'Rows': [len(df_tmp)],
+            'Seconds': [round(elapsed, 4)],
+            'Rows per Second': [round(len(df_tmp) / elapsed, 0) if elapsed > 0 else np.nan],
+            'Process ID': [os.getpid()],
+            'Mode': ['Serial']
+        })
+        return df_result, df_timings
+
+    spec, blocks = _share_frame(df_tmp)
+    results = {}
+    timings = []
+
+    try:
+        with cf.ProcessPoolExecutor(max_workers=min(n_workers, len(shards))) as executor:
+            futures = [executor.submit(_run_shard, func, spec, positions, shard_id, tuple(func_args), func_kwargs)
+                       for shard_id, positions in enumerate(shards)]
+
+            for future in cf.as_completed(futures):
+                shard_id, result, elapsed, pid = future.result()
+                results[shard_id] = result
+                rows = len(shards[shard_id])
+                timings.append({
+                    'Shard': shard_id,
+                    '# of Keys': df_tmp[key].iloc[shards[shard_id]].nunique(),
+                    'Rows': rows,
+                    'Seconds': round(elapsed, 4),
+                    'Rows per Second': round(rows / elapsed, 0) if elapsed > 0 else np.nan,
+                    'Process ID': pid,
+                    'Mode': 'Parallel'
+                })
+    finally:
+        # Release the shared memory blocks even if a worker failed
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    # Concatenate the shard results and restore the original order
+    df_result = pd.concat([results[shard_id] for shard_id in sorted(results)])
+    df_result = _restore_order(df_result, df_tmp, key)
+
+    df_timings = pd.DataFrame(timings).sort_values(by='Shard').reset_index(drop=True)
+
+    return df_result, df_timings
+
+
+@profile_function
+def check_sharded_parity(func, df_tmp, func_args=(), func_kwargs=None, key='Ticker', n_workers=2):
+
+    """
+    Runs a function with run_sharded serially and in parallel and compares the two results, e.g. on a frame with
+    missing keys or attributes to check that the shared memory round trip keeps every value.
+
+    Args:
+        - func: The function to run. Its first argument must be the DataFrame, e.g. calculate_return.
+        - df_tmp: DataFrame containing the panel data.
+        - func_args: Tuple of extra positional arguments for func.
+        - func_kwargs: Dictionary of extra keyword arguments for func.
+        - key: A string representing the column that must not be split across shards.
+        - n_workers: Integer specifying the number of worker processes of the parallel run (at least 2).
+
+    Returns:
+        - A DataFrame with the 'Function', 'Rows', 'Same Index', 'Mismatched Columns' and 'Passed' columns.
+    """
+
+    if n_workers < 2:
+        raise ValueError("n_workers must be at least 2 to run in parallel.")
+
+    df_serial, _ = run_sharded(func, df_tmp, func_args, func_kwargs, key, n_workers=1)
+    df_parallel, df_timings = run_sharded(func, df_tmp, func_args, func_kwargs, key, n_workers=n_workers, min_rows=0)
+
+    same_index = df_serial.index.equals(df_parallel.index) and df_serial.columns.equals(df_parallel.columns)
+    mismatched = []
+    if same_index:
+        # Series.equals treats missing values in the same positions as equal, whatever their type
+        mismatched = [col for col in df_serial.columns
+                      if not df_serial[col].astype(object).equals(df_parallel[col].astype(object))]
+
+    return pd.DataFrame([{
+        'Function': getattr(func, '__name__', str(func)),
+        'Rows': len(df_tmp),
+        'Same Index': same_index,
+        'Mismatched Columns': mismatched,
+        'Passed': same_index and not mismatched and (df_timings['Mode'] == 'Parallel').all()
+    }])
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Hierarchy of the Year, Quarter, Month and Daily return tables of one security class.
+
+Each row of a child period table carries the integer position of its parent period row, e.g. the 'Year Code' of a
+Quarter row is the row of the same Ticker and Year in the Year table. The codes are found once with a binary search
+over the parent keys, and parent metrics such as 'Year % Return' are then attached to the child rows by indexing the
+parent column with the codes, instead of merging the tables on the security class and 'Year' for every use.
+"""
+
+import hashlib
+import numpy as np
+import pandas as pd
+from custom_profiling_functions import profile_function
+from custom_cache_functions import frame_fingerprint
+
+# Period types from the parent to the child periods
+PERIOD_LEVELS = ('Year', 'Quarter', 'Month', 'Daily')
+
+
+def _period_ordinal(df_tmp, period):
+
+    """
+    Returns the integer ordinal of the period of each row (e.g. Year * 4 + Quarter - 1), from the 'Year' column and
+    the 'Quarter', 'Month' or 'Date' columns.
+    """
+
+    year = (df_tmp['Year'] if 'Year' in df_tmp.columns else df_tmp['Date'].dt.year).to_numpy(dtype=np.int64)
+
+    if period == 'Year':
+        return year
+    if period == 'Quarter':
+        quarter = df_tmp['Quarter'] if 'Quarter' in df_tmp.columns else df_tmp['Date'].dt.quarter
+        return year * 4 + quarter.to_numpy(dtype=np.int64) - 1
+    if period == 'Month':
+        month = df_tmp['Month'] if 'Month' in df_tmp.columns else df_tmp['Date'].dt.month
+        return year * 12 + month.to_numpy(dtype=np.int64) - 1
+
+    return df_tmp['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+@profile_function
+def period_parent_codes(df_child, df_parent, key, parent_period):
+
+    """
+    Finds the row of the parent period table of each row of a child period table.
+
+    Args:
+        - df_child: DataFrame of the child period with the key column and the period columns ('Year', 'Quarter',
+          'Month' or 'Date').
+        - df_parent: DataFrame of the parent period with one row per key and parent period.
+        - key: String with the security class column shared by both tables (e.g. 'Ticker' or 'Sector').
+        - parent_period: String with the period type of df_parent ('Year', 'Quarter' or 'Month').
+
+    Returns:
+        - numpy int64 array with the position of the parent row of each child row, or -1 when there is none.
+    """
+
+    if parent_period not in PERIOD_LEVELS[:-1]:
+        raise ValueError(f"Invalid parent period: {parent_period}. Must be one of {', '.join(PERIOD_LEVELS[:-1])}.")
+
+    # Both tables are keyed by the key code and the parent period ordinal, combined in one sortable integer
+    parent_keys, uniques = pd.factorize(df_parent[key])
+    child_keys = uniques.get_indexer(df_child[key])
+    parent_ordinal = _period_ordinal(df_parent, parent_period)
+    child_ordinal = _period_ordinal(df_child, parent_period)
+
+    if len(df_parent) == 0:
+        return np.full(len(df_child), -1, dtype=np.int64)
+
+    low = parent_ordinal.min()
+    span = parent_ordinal.max() - low + 1
+    parent_combined = parent_keys * span + (parent_ordinal - low)
+    child_combined = child_keys * span + np.clip(child_ordinal - low, 0, span - 1)
+
+    order = np.argsort(parent_combined, kind='stable')
+    sorted_combined = parent_combined[order]
+    position = np.minimum(np.searchsorted(sorted_combined, child_combined), len(order) - 1)
+
+    found = (child_keys >= 0) & (child_ordinal >= low) & (child_ordinal < low + span) & \
+            (sorted_combined[position] == child_combined)
+
+    return np.where(found, order[position], -1).astype(np.int64)
+
+
+def attach_parent_columns(df_child, df_parent, codes, columns):
+
+    """
+    Adds columns of the parent period rows to the child period rows by indexing them with the parent codes.
+
+    Args:
+        - df_child: DataFrame of the child period.
+        - df_parent: DataFrame of the parent period.
+        - codes: Array of parent row positions from period_parent_codes (-1 for a missing parent).
+        - columns: List of parent columns to add (e.g. ['Year % Return']).
+
+    Returns:
+        - A new DataFrame with the child columns followed by the parent columns (missing for a missing parent).
+    """
+
+    df_tmp = df_child.copy(deep=False)
+    for col in columns:
+        df_tmp[col] = pd.api.extensions.take(df_parent[col].to_numpy(), codes, allow_fill=True)
+
+    return df_tmp
+
+
+class PeriodTable:
+
+    """
+    Return tables of the Year, Quarter, Month and Daily periods of one security class, with the parent codes of
+    every child period. The tables must not be modified after the PeriodTable is built.
+
+    Args:
+        - returns: Dictionary of period type -> DataFrame of the period returns (e.g. the bars of get_pricing_data
+          joined with calculate_return_columns). Any subset of the periods can be given.
+        - key: String with the security class column of the tables (e.g. 'Ticker' or 'Sector').
+    """
+
+    def __init__(self, returns, key='Ticker'):
+
+        unknown = [period for period in returns if period not in PERIOD_LEVELS]
+        if unknown:
+            raise ValueError(f"Unknown periods {unknown}, expected {list(PERIOD_LEVELS)}.")
+
+        self.key = key
+        self.periods = [period for period in PERIOD_LEVELS if period in returns]
+        self.tables = {period: returns[period] for period in self.periods}
+        self.codes = {}
+        self._fingerprint = None
+
+        for number, period in enumerate(self.periods):
+            for parent in self.periods[:number]:
+                self.codes[(period, parent)] = period_parent_codes(self.tables[period], self.tables[parent], key,
+                                                                   parent)
+
+    def table(self, period):
+
+        """
+        Returns the return table of a period.
+        """
+
+        if period not in self.tables:
+            raise ValueError(f"Period {period} is not in the table, expected one of {', '.join(self.periods)}.")
+
+        return self.tables[period]
+
+    def parent_codes(self, period, parent='Year'):
+
+        """
+        Returns the position of the parent period row of each row of a period table, or -1 when there is none.
+        """
+
+        if (period, parent) not in self.codes:
+            raise ValueError(f"{parent} is not a parent period of {period} in the table.")
+
+        return self.codes[(period, parent)]
+
+    def frame(self, period, parent_columns=None, parent='Year'):
+
+        """
+        Returns the return table of a period with columns of its parent period attached.
+
+        Args:
+            - period: String with the period type of the rows.
+            - parent_columns: List of parent columns to add, defaults to ['<parent> % Return'].
+            - parent: String with the parent period type.
+
+        Returns:
+            - A DataFrame with one row per row of the period table.
+        """
+
+        if parent_columns is None:
+            parent_columns = [parent + ' % Return']
+
+        return attach_parent_columns(self.table(period), self.table(parent), self.parent_codes(period, parent),
+                                     parent_columns)
+
+    def cache_fingerprint(self):
+
+        """
+        Returns a fingerprint of the tables, used by the result cache.
+        """
+
+        if self._fingerprint is None:
+            digest = hashlib.sha1(self.key.encode('utf-8'))
+            for period in self.periods:
+                digest.update((period + frame_fingerprint(self.tables[period])).encode('utf-8'))
+            self._fingerprint = digest.hexdigest()
+
+        return self._fingerprint
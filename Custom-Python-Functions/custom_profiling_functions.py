@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing and memory instrumentation for the custom function library and the ETL stages.
+
+Functions decorated with profile_function and blocks wrapped in profile_stage write one JSON line per call to a
+log file while profiling is enabled. When profiling is disabled the decorator only checks a flag before calling
+the original function.
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+import tracemalloc
+import contextlib
+import datetime as dt
+import pandas as pd
+import numpy as np
+
+
+# Global profiling settings shared by every decorated function
+_PROFILING = {'enabled': False, 'log_path': None, 'trace_memory': False}
+
+# Serializes writes to the log file and tracks the call depth of each thread
+_LOG_LOCK = threading.Lock()
+_CALL_STATE = threading.local()
+
+# Top-level stages running in any thread, and those that overlapped another one. tracemalloc keeps one peak for the
+# whole process, so the peak memory of overlapping stages cannot be told apart.
+_TOP_LEVEL_LOCK = threading.Lock()
+_TOP_LEVEL_STAGES = {'active': set(), 'overlapped': set()}
+
+
+def enable_profiling(log_path, trace_memory=True):
+
+    """
+    Enables profiling and sets the JSON-lines log file that records are appended to.
+
+    Args:
+        - log_path: String with the path of the JSON-lines log file.
+        - trace_memory: Boolean indicating whether to trace peak memory with tracemalloc (adds overhead).
+    """
+
+    log_dir = os.path.dirname(os.path.abspath(log_path))
+    os.makedirs(log_dir, exist_ok=True)
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    _PROFILING['log_path'] = log_path
+    _PROFILING['trace_memory'] = trace_memory
+    _PROFILING['enabled'] = True
+
+
+def disable_profiling():
+
+    """
+    Disables profiling and stops memory tracing if it was started by enable_profiling.
+    """
+
+    if _PROFILING['trace_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    _PROFILING['enabled'] = False
+    _PROFILING['trace_memory'] = False
+
+
+def is_profiling_enabled():
+
+    """
+    Returns True when profiling is enabled.
+    """
+
+    return _PROFILING['enabled']
+
+
+def _count_rows(obj):
+
+    """
+    Returns the number of rows of a DataFrame, Series or array (or of the first one in a tuple), otherwise None.
+    """
+
+    if isinstance(obj, tuple) and len(obj) > 0:
+        obj = obj[0]
+
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return int(len(obj))
+
+    return None
+
+
+def _write_record(record):
+
+    """
+    Appends a profiling record to the JSON-lines log file.
+    """
+
+    line = json.dumps(record, default=str)
+    with _LOG_LOCK:
+        with open(_PROFILING['log_path'], 'a') as log_file:
+            log_file.write(line + '\n')
+
+
+@contextlib.contextmanager
+def profile_stage(name, rows_in=None, kind='stage'):
+
+    """
+    Context manager that records wall time, rows and peak memory of a block of code (e.g. an ETL stage).
+
+    The yielded dictionary can be updated inside the block, e.g. record['rows_out'] = len(df_pricing).
+    When profiling is disabled nothing is measured or written. Peak memory is only recorded for a top-level stage
+    that ran alone, since the peak traced by tracemalloc is shared by all threads; it is None for nested calls and
+    for top-level stages that overlapped another one (e.g. the concurrent stages of run_price_pipeline).
+
+    Args:
+        - name: String with the name of the stage or function.
+        - rows_in: Integer with the number of input rows, if known.
+        - kind: String describing the record type ('stage' or 'function').
+
+    Yields:
+        - dict: The record that will be written to the log.
+    """
+
+    record = {'name': name, 'kind': kind, 'rows_in': rows_in, 'rows_out': None}
+
+    if not _PROFILING['enabled']:
+        yield record
+        return
+
+    record['start'] = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    depth = getattr(_CALL_STATE, 'depth', 0)
+    _CALL_STATE.depth = depth + 1
+
+    # Only the outermost call resets the peak so nested calls do not distort the outer measurement, and only when no
+    # other top-level stage is running, whose measurement would be lost
+    trace_memory = _PROFILING['trace_memory'] and tracemalloc.is_tracing() and depth == 0
+    if trace_memory:
+        stage_id = object()
+        with _TOP_LEVEL_LOCK:
+            active = _TOP_LEVEL_STAGES['active']
+            if active:
+                _TOP_LEVEL_STAGES['overlapped'].update(active | {stage_id})
+            else:
+                tracemalloc.reset_peak()
+            active.add(stage_id)
+            mem_start = tracemalloc.get_traced_memory()[0]
+
+    start_time = time.perf_counter()
+    status = 'ok'
+    try:
+        yield record
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start_time
+        _CALL_STATE.depth = depth
+
+        record['seconds'] = round(elapsed, 6)
+        record['depth'] = depth
+        record['status'] = status
+        record['thread'] = threading.current_thread().name
+        record['pid'] = os.getpid()
+
+        rows = record['rows_in'] if record['rows_in'] is not None else record['rows_out']
+        record['rows_per_second'] = round(rows / elapsed, 1) if (rows and elapsed > 0) else None
+
+        record['peak_memory_delta_mb'] = None
+        if trace_memory:
+            with _TOP_LEVEL_LOCK:
+                _TOP_LEVEL_STAGES['active'].discard(stage_id)
+                if stage_id in _TOP_LEVEL_STAGES['overlapped']:
+                    _TOP_LEVEL_STAGES['overlapped'].discard(stage_id)
+                else:
+                    record['peak_memory_delta_mb'] = round(
+                        (tracemalloc.get_traced_memory()[1] - mem_start) / (1024 ** 2), 3)
+
+        _write_record(record)
+
+
+def profile_function(func):
+
+    """
+    Decorator that records a profiling entry for every call of a function while profiling is enabled.
+
+    Rows in are taken from the first DataFrame, Series or array argument and rows out from the returned value.
+
+    Args:
+        - func: The function to instrument.
+
+    Returns:
+        - The wrapped function.
+    """
+
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        # Near zero overhead path when profiling is disabled
+        if not _PROFILING['enabled']:
+            return func(*args, **kwargs)
+
+        rows_in = next((rows for rows in map(_count_rows, args) if rows is not None), None)
+        with profile_stage(name, rows_in=rows_in, kind='function') as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = _count_rows(result)
+
+        return result
+
+    return wrapper
+
+
+def load_profile_log(log_path=None):
+
+    """
+    Loads a JSON-lines profiling log into a DataFrame.
+
+    Args:
+        - log_path: String with the path of the log file (defaults to the current log file).
+
+    Returns:
+        - A DataFrame with one row per profiling record.
+    """
+
+    if log_path is None:
+        log_path = _PROFILING['log_path']
+
+    if (log_path is None) or (not os.path.isfile(log_path)):
+        raise FileNotFoundError(f"Profiling log not found: {log_path}")
+
+    with open(log_path, 'r') as log_file:
+        records = [json.loads(line) for line in log_file if line.strip()]
+
+    return pd.DataFrame(records)
+
+
+def profile_summary(log_path=None):
+
+    """
+    Summarizes a profiling log by function or stage name, sorted by total time.
+
+    Args:
+        - log_path: String with the path of the log file (defaults to the current log file).
+
+    Returns:
+        - A DataFrame with call counts, total, average and maximum seconds, rows and peak memory per name.
+    """
+
+    df_log = load_profile_log(log_path)
+
+    df_tmp = df_log.groupby(['kind', 'name']).agg(
+        Calls=('seconds', 'size'),
+        Total_Seconds=('seconds', 'sum'),
+        Average_Seconds=('seconds', 'mean'),
+        Max_Seconds=('seconds', 'max'),
+        Rows_In=('rows_in', 'sum'),
+        Rows_Out=('rows_out', 'sum'),
+        Max_Peak_Memory_Delta_MB=('peak_memory_delta_mb', 'max'),
+        Errors=('status', lambda x: (x == 'error').sum())
+    ).reset_index()
+
+    # Throughput based on the rows processed over the total time spent in the function
+    rows = np.where(df_tmp['Rows_In'] > 0, df_tmp['Rows_In'], df_tmp['Rows_Out'])
+    df_tmp['Rows_per_Second'] = np.where(df_tmp['Total_Seconds'] > 0, rows / df_tmp['Total_Seconds'], np.nan)
+
+    df_tmp = df_tmp.round({'Total_Seconds': 4, 'Average_Seconds': 4, 'Max_Seconds': 4, 'Rows_per_Second': 1})
+    df_tmp.sort_values(by='Total_Seconds', ascending=False, inplace=True)
+
+    df_tmp.rename(columns={
+        'kind': 'Kind',
+        'name': 'Name',
+        'Total_Seconds': 'Total Seconds',
+        'Average_Seconds': 'Average Seconds',
+        'Max_Seconds': 'Max Seconds',
+        'Rows_In': 'Rows In',
+        'Rows_Out': 'Rows Out',
+        'Max_Peak_Memory_Delta_MB': 'Max Peak Memory Delta MB',
+        'Rows_per_Second': 'Rows per Second'
+    }, inplace=True)
+
+    return df_tmp.reset_index(drop=True)
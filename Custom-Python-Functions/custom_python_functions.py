@@ -19,11 +19,17 @@ from plotly.subplots import make_subplots
 pio.renderers.default='notebook_connected'
 import matplotlib.pyplot as plt
 import seaborn as sns
-import math
-from scipy.stats import norm, gaussian_kde
+from scipy.stats import norm
 from sklearn.linear_model import LinearRegression
+from custom_profiling_functions import profile_function
+from custom_cache_functions import cache_result
+from custom_period_functions import PeriodTable
+from custom_chart_functions import cache_figure, period_labels, period_tick_text, sign_colors, subplot_grid
+from custom_distribution_functions import calculate_return_distributions
+from custom_ranking_functions import calculate_ranks, select_top_k
 
 
+@profile_function
 def write_key(path, key_file):
     
     """
@@ -45,6 +51,7 @@ def write_key(path, key_file):
     key_file.close()
 
 
+@profile_function
 def load_key(path, key_file):
     
     """
@@ -63,6 +70,7 @@ def load_key(path, key_file):
         return key_file.read()
 
 
+@profile_function
 def encrypt(path, filename, key):
     
     """
@@ -91,6 +99,7 @@ def encrypt(path, filename, key):
         file.write(encrypted_data)
 
 
+@profile_function
 def decrypt(path, filename, key):
     
     """
@@ -120,7 +129,8 @@ def decrypt(path, filename, key):
     return str(decrypted_data, 'utf-8')
 
 
-def create_connection(serv, dbase, uid, passwd):
+@profile_function
+def create_connection(serv, dbase, uid, passwd, **engine_options):
     
     """
     Creates a connection to a SQL Server database using SQLAlchemy and returns a session and engine.
@@ -130,6 +140,8 @@ def create_connection(serv, dbase, uid, passwd):
         dbase: String specifying the name of the database to connect to.
         uid  String specifying the username for database authentication (leave empty for trusted connection).
         passwd: String specifying the password for database authentication (needed if uid is provided).
+        engine_options: Optional keyword arguments of sa.create_engine for the connection pool (e.g. pool_size, 
+        pool_pre_ping and pool_recycle for a long running service).
 
     Returns:
         tuple: A tuple containing the sessionmaker class and the SQLAlchemy engine.
@@ -150,7 +162,7 @@ def create_connection(serv, dbase, uid, passwd):
                            "PWD=" + passwd + ";")  # Password
     
     # Create an SQLAlchemy engine instance with the connection parameters
-    e = sa.create_engine("mssql+pyodbc:///?odbc_connect={}".format(params))
+    e = sa.create_engine("mssql+pyodbc:///?odbc_connect={}".format(params), **engine_options)
     
     # Create a sessionmaker class bound to the engine for managing sessions
     s = sessionmaker(bind=e)
@@ -159,6 +171,7 @@ def create_connection(serv, dbase, uid, passwd):
     return s, e
 
 
+@profile_function
 def clear_table(s1, t):
     
     """
@@ -174,6 +187,7 @@ def clear_table(s1, t):
     s1.commit()  # Commit the transaction to make the changes permanent
     
  
+@profile_function
 def get_dates_for_years(yrs_back, yrs_forward):
     
     """
@@ -203,6 +217,7 @@ def get_dates_for_years(yrs_back, yrs_forward):
     return start_date, end_date
 
 
+@profile_function
 def get_pricing_data(df_tmp, period):
     
         """
@@ -217,15 +232,13 @@ def get_pricing_data(df_tmp, period):
         """
     
       
-        # Conditionally add the period column based on the specified period
+        # Conditionally build the period key based on the specified period (the input DataFrame is not modified)
         if period == 'Quarter':
-            df_tmp['Quarter'] = df_tmp['Date'].dt.quarter
-            required_cols = ['Ticker', 'Year', 'Quarter']
+            required_cols = [df_tmp['Ticker'], df_tmp['Year'], df_tmp['Date'].dt.quarter.rename('Quarter')]
         elif period == 'Month':
-            df_tmp['Month'] = df_tmp['Date'].dt.month
-            required_cols = ['Ticker', 'Year', 'Month']
+            required_cols = [df_tmp['Ticker'], df_tmp['Year'], df_tmp['Date'].dt.month.rename('Month')]
         else:  # Default to 'Year'
-            required_cols = ['Ticker', 'Year']
+            required_cols = [df_tmp['Ticker'], df_tmp['Year']]
         
         # Group data by required_cols, aggregating relevant columns
         df_tmp2 = df_tmp.groupby(required_cols).agg(
@@ -243,6 +256,31 @@ def get_pricing_data(df_tmp, period):
         return df_tmp2
     
 
+@profile_function
+def build_period_table(df_pricing, periods=('Year', 'Quarter', 'Month')):
+
+    """
+    Builds the period bars and return columns of every Ticker for each period type, with the parent period codes.
+
+    Args:
+        - df_pricing: DataFrame containing the daily pricing data, sorted by 'Ticker' and 'Date'.
+        - periods: List of period types to build ('Year', 'Quarter', 'Month', 'Daily').
+
+    Returns:
+        - A PeriodTable keyed by 'Ticker'. PeriodTable.frame('Quarter') gives the Quarter returns with the
+          'Year % Return' of the same Ticker and Year, and calculate_stats accepts the PeriodTable directly.
+    """
+
+    returns = {}
+    for period in periods:
+        df_bars = df_pricing if period == 'Daily' else get_pricing_data(df_pricing, period)
+        returns[period] = df_bars.join(calculate_return_columns(df_bars, period))
+
+    return PeriodTable(returns, 'Ticker')
+
+
+@profile_function
+@cache_figure()
 def plot_pricing_candlestick(df_tmp, ticker, period):
     
         """
@@ -252,18 +290,13 @@ def plot_pricing_candlestick(df_tmp, ticker, period):
             - df_tmp: DataFrame containing pricing data with 'Date', 'Open', 'High', 'Low', 'Close'.
             - ticker: String representing the stock ticker symbol.
             - period: String specifying the period type for the x-axis ticks ('Year', 'Quarter', 'Month, or 'Daily').
+
+        Returns:
+            - The Plotly figure, which cache_figure shows.
         """
     
         # Generate tick_text based on the period
-        if period == 'Year':
-            tick_text = [date.strftime('%Y-%m-%d') + " (" + date.strftime('%Y') + ")" for date in df_tmp['Date']]
-        elif period == 'Quarter':
-            tick_text = [date.strftime('%Y-%m-%d') + " (" + date.strftime('%Y') + "-Q" + str(quarter) + ")" 
-                     for date, quarter in zip(df_tmp['Date'], df_tmp['Quarter'])]
-        elif period == 'Month':
-            tick_text = [date.strftime('%Y-%m-%d') + " (" + date.strftime('%B') + ")" for date in df_tmp['Date']]
-        else:
-            tick_text = [date.strftime('%Y-%m-%d') for date in df_tmp['Date']]
+        tick_text = period_tick_text(df_tmp, period)
         
         if period == 'Daily':
             period = ''
@@ -295,9 +328,11 @@ def plot_pricing_candlestick(df_tmp, ticker, period):
             width=width_size,
             height=height_size
         )
-        fig.show() 
+        
+        return fig
         
        
+@profile_function
 def plot_pricing_line(df_tmp, ticker, period, price):
 
     """
@@ -339,18 +374,66 @@ def plot_pricing_line(df_tmp, ticker, period, price):
     plt.show()
     
     
-def calculate_return(df_tmp, period):
+def _expanding_std_by_group(values, groups, include=None):
     
     """
-    Calculate the return percentage based on the 'Close' and 'Open' prices for a given period type.
+    Calculates the expanding sample standard deviation of values within each group, in row order.
+    
+    Running sums of values centered on their group mean replace an expanding apply with a Python lambda.
     
     Args:
-        - df_tmp: The DataFrame containing the historical data.
+        - values: numpy array of values (missing values are ignored).
+        - groups: numpy array of group codes, one per value.
+        - include: Optional boolean numpy array marking the values to include (e.g. only negative returns).
+    
+    Returns:
+        - tuple: numpy arrays with the expanding standard deviation (NaN with fewer than 2 values) and the 
+          expanding count of included values.
+    """
+    
+    ser = pd.Series(values, dtype=float)
+    is_included = ser.notna() if include is None else (ser.notna() & include)
+    ser = ser.where(is_included)
+    
+    count = is_included.astype(np.int64).groupby(groups).cumsum()
+    
+    # Center each group before the running sums to limit cancellation in the variance formula
+    centered = (ser - ser.groupby(groups).transform('mean')).fillna(0)
+    sum1 = centered.groupby(groups).cumsum()
+    sum2 = (centered ** 2).groupby(groups).cumsum()
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = ((sum2 - sum1 ** 2 / count) / (count - 1)).to_numpy()
+    
+    std = np.sqrt(np.maximum(variance, 0))
+    std[count.to_numpy() < 2] = np.nan
+    
+    return std, count.to_numpy()
+
+
+def _return_input_columns(df_tmp, period):
+
+    """
+    Returns the columns read by calculate_return_columns, for the result cache fingerprint.
+    """
+
+    return ['Ticker', 'Open', 'Close']
+
+
+@profile_function
+@cache_result(columns=_return_input_columns)
+def calculate_return_columns(df_tmp, period):
+    
+    """
+    Calculate the return columns of calculate_return without modifying or copying the input DataFrame.
+    
+    Args:
+        - df_tmp: The DataFrame containing the historical data ('Ticker', 'Open' and 'Close' columns, sorted by 'Ticker' and 'Date').
         - period: A string representing the period type column ('Year', 'Quarter', 'Month', or 'Daily').
 
     Returns:
-        - A DataFrame with new columns: '% Return','Cumulative % Return','Annualized % Return','Annualized Volatility', 
-        - 'Annualized Downside Volatility', or None if not applicable.
+        - A DataFrame aligned to the input index with only the new columns: '% Return', 'Cumulative % Return', 'Annualized % Return', 
+          'Annualized Volatility' and 'Annualized Downside Volatility' (prefixed with the period when it is not 'Daily').
     """
     
     # Assign the number of periods based on period type
@@ -362,73 +445,86 @@ def calculate_return(df_tmp, period):
         no_of_periods = 12
     else:
         no_of_periods = 252
+        
+    label = '' if period == 'Daily' else period + ' '
+    
+    tickers = df_tmp['Ticker']
+    groups = pd.factorize(tickers)[0]
+    close = df_tmp['Close'].to_numpy(dtype=float)
+    open_ = df_tmp['Open'].to_numpy(dtype=float)
+    
+    # Previous close of the same Ticker, the first period of a Ticker has no previous close
+    prev_close = df_tmp['Close'].groupby(groups).shift(1).to_numpy(dtype=float)
+    is_first_period = np.isnan(prev_close)
+    same_ticker = (tickers == tickers.shift(1)).to_numpy()
+    is_next_period = ~is_first_period & same_ticker
+    
+    # The first period return is based on 'Close' and 'Open', subsequent periods on the previous close
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret = np.zeros(len(df_tmp))
+        ret[is_first_period] = close[is_first_period] / open_[is_first_period] - 1.0
+        ret[is_next_period] = close[is_next_period] / prev_close[is_next_period] - 1.0
+        
+        log_ret = np.full(len(df_tmp), np.nan)
+        log_ret[is_first_period] = np.log(close[is_first_period] / open_[is_first_period])
+        log_ret[is_next_period] = np.log(close[is_next_period] / prev_close[is_next_period])
     
-    # Shift the 'Close' prices by 1 for the entire DataFrame
-    df_tmp['Prev Close'] = df_tmp.groupby('Ticker')['Close'].shift(1)
-    
-    # Create a condition for the first period where Prev_Close is NaN
-    is_first_period = df_tmp['Prev Close'].isna()
+    ret_ser = pd.Series(ret)
     
-    # Initialize the return column
-    df_tmp['% Return'] = 0
+    # De-normalize the cumulative log return and calculate the cumulative simple return
+    cum_ret = np.exp(pd.Series(log_ret).groupby(groups).cumsum().to_numpy()) - 1.0
+    cum_simple_ret = (1 + ret_ser).groupby(groups).cumprod().to_numpy() - 1
     
-    # Calculate % Return for the first period where 'Prev_Close' is NaN
-    # Assuming the return is calculated based on 'Close' and 'Open' for these rows
-    df_tmp.loc[is_first_period, '% Return'] = ((df_tmp['Close'] / df_tmp['Open']) - 1.0)
+    # Expanding standard deviation of all returns and of negative returns by Ticker
+    vol, ret_count = _expanding_std_by_group(ret, groups)
+    downside_vol, neg_count = _expanding_std_by_group(ret, groups, include=(ret_ser < 0))
     
-    # Calculate the return for subsequent periods based on the previous close price
-    same_ticker = df_tmp['Ticker'] == df_tmp['Ticker'].shift(1)
-    df_tmp.loc[~is_first_period & same_ticker, '% Return'] = ((df_tmp['Close'] / df_tmp['Prev Close']) - 1.0)
+    # Annualized % Return based on the cumulative simple return and the count of returns so far
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ann_ret = (1 + cum_simple_ret) ** (no_of_periods / np.where(ret_count > 0, ret_count, np.nan)) - 1.0
     
-    # Calculate the log return for the first period based on 'Open' and 'Close'
-    df_tmp.loc[is_first_period, 'Log Return'] = np.log(df_tmp['Close'] / df_tmp['Open']) 
-        
-    # Calculate the log return for subsequent periods based on the previous close price
-    df_tmp.loc[~is_first_period & same_ticker, 'Log Return'] = np.log(df_tmp['Close'] / df_tmp['Prev Close'])
+    # Volatility is 0 for the first period of a Ticker and downside volatility is 0 until the first negative return
+    position = ret_ser.groupby(groups).cumcount().to_numpy()
+    vol = np.where(position > 0, vol * np.sqrt(no_of_periods), 0)
+    downside_vol = np.where(neg_count > 0, downside_vol * np.sqrt(no_of_periods), 0)
     
-    # Calculate the cumulative log return
-    df_tmp['Cumulative Log Return'] = df_tmp.groupby('Ticker')['Log Return'].cumsum()
+    # Convert Returns to percentages
+    return pd.DataFrame({
+        label + '% Return': np.round(ret * 100, 2),
+        label + 'Cumulative % Return': np.round(cum_ret * 100, 2),
+        label + 'Annualized % Return': np.round(ann_ret * 100, 2),
+        label + 'Annualized Volatility': np.round(vol * 100, 2),
+        label + 'Annualized Downside Volatility': np.round(downside_vol * 100, 2)
+    }, index=df_tmp.index)
+
+
+@profile_function
+def calculate_return(df_tmp, period):
     
-    # De-nomralize cumulative log returns
-    df_tmp['Cumulative % Return'] = (np.exp(df_tmp['Cumulative Log Return']) - 1.0)
+    """
+    Calculate the return percentage based on the 'Close' and 'Open' prices for a given period type.
     
-    # Calculate the Cumulative Simple Return
-    df_tmp['Cumulative Simple % Return'] = (1 + df_tmp['% Return']).groupby(df_tmp['Ticker']).cumprod() - 1
+    The columns are added to df_tmp in place. Use calculate_return_columns to get only the new columns without modifying the input.
     
-    # Calculate the rolling count of returns by Ticker for each date using groupby and rolling together
-    df_tmp['Rolling Return Count'] = df_tmp.groupby('Ticker')['% Return'].expanding(min_periods=1).count().reset_index(level=0, drop=True)
+    Args:
+        - df_tmp: The DataFrame containing the historical data.
+        - period: A string representing the period type column ('Year', 'Quarter', 'Month', or 'Daily').
 
-    # Calculate the rolling Annualized % Return based on Cumulative Simple Return and using no_of_periods and Rolling Return Count
-    df_tmp['Annualized % Return'] = ((1 + df_tmp['Cumulative Simple % Return'])**(no_of_periods / df_tmp['Rolling Return Count']) - 1.0)
-    
-    # Calculate the rolling Annualized Volatility based on Simple Return and using no_of_periods
-    df_tmp['Annualized Volatility'] = (df_tmp.groupby('Ticker')['% Return'].expanding(min_periods=1).apply(lambda x: x.std() * np.sqrt(no_of_periods) if len(x) > 1 else 0).reset_index(level=0, drop=True))
+    Returns:
+        - A DataFrame with new columns: '% Return','Cumulative % Return','Annualized % Return','Annualized Volatility', 
+        - 'Annualized Downside Volatility', or None if not applicable.
+    """
     
-    # Calculate the rolling Downside Annualized Volatility based on Negative Simple Return and using no_of_periods
-    df_tmp['Annualized Downside Volatility'] = (df_tmp.groupby('Ticker')['% Return'].expanding(min_periods=1).apply(lambda x: x[x < 0].std() * np.sqrt(no_of_periods) if not x[x < 0].empty else 0).reset_index(level=0, drop=True))
-       
-    # Drop the 'Prev_Close', 'Log Return', 'Cumulative Log Return', 'Cumulative Simple % Return' and 'Rolling Return Count' 
-    # columns after calculation
-    df_tmp.drop(columns=['Prev Close', 'Log Return', 'Cumulative Log Return', 'Cumulative Simple % Return', 'Rolling Return Count'], inplace=True)
-
-    # Convert Returns to percentages
-    df_tmp['% Return'] = round(df_tmp['% Return'] * 100, 2)
-    df_tmp['Cumulative % Return'] = round(df_tmp['Cumulative % Return'] * 100, 2)
-    df_tmp['Annualized % Return'] = round(df_tmp['Annualized % Return'] * 100, 2)
-    df_tmp['Annualized Volatility'] = round(df_tmp['Annualized Volatility'] * 100, 2)
-    df_tmp['Annualized Downside Volatility'] = round(df_tmp['Annualized Downside Volatility'] * 100, 2)
+    df_cols = calculate_return_columns(df_tmp, period)
     
-    # Rename the Return column based on period type
-    if period != 'Daily':
-        df_tmp.rename(columns={'% Return': period + ' % Return'}, inplace=True)    
-        df_tmp.rename(columns={'Cumulative % Return': period + ' Cumulative % Return'}, inplace=True)
-        df_tmp.rename(columns={'Annualized % Return': period + ' Annualized % Return'}, inplace=True)
-        df_tmp.rename(columns={'Annualized Volatility': period + ' Annualized Volatility'}, inplace=True)
-        df_tmp.rename(columns={'Annualized Downside Volatility': period + ' Annualized Downside Volatility'}, inplace=True)
+    for col in df_cols.columns:
+        df_tmp[col] = df_cols[col].to_numpy()
         
     return df_tmp
 
         
+@profile_function
+@cache_figure()
 def plot_returns_bar_chart(df_tmp, security_class_val, period, return_type):
 
     """
@@ -440,37 +536,45 @@ def plot_returns_bar_chart(df_tmp, security_class_val, period, return_type):
           'Sub_Industry', 'Ticker').
         - period: A string indicating the period type for x-axis labeling ('Year', 'Quarter', 'Month', etc.).
         - return_type: A string representing the return type column ('% Return', 'Cumulative % Return'). 
+
+    Returns:
+        - The Matplotlib figure, which cache_figure shows.
     """
 
-    # Create a Label column based on the period
-    if period == 'Year':
-        df_tmp['Label'] = df_tmp['Year'].astype(str)
-    elif period == 'Quarter':
-        df_tmp['Label'] = df_tmp['Year'].astype(str) + "-Q" + df_tmp['Quarter'].astype(str)
-    elif period == 'Month':
-        # Ensure month is zero-padded if needed
-        df_tmp['Label'] = df_tmp['Year'].astype(str) + "-" + df_tmp['Month'].apply(lambda x: str(x).zfill(2))
-    else:
-        df_tmp['Label'] = df_tmp['Date']
-    
+    # Build the labels of the periods without adding a Label column to df_tmp
+    labels = df_tmp['Date'] if period == 'Daily' else period_labels(df_tmp, period)
 
     # Check if return_type exists in df_tmp
     if return_type not in df_tmp.columns:
         raise ValueError(f"Column '{return_type}' does not exist in the DataFrame.")
 
     # Plot returns as a bar chart
-    colors = ['red' if x < 0 else 'blue' for x in df_tmp[return_type]]
-    plt.figure(figsize=(10, 8))
+    colors = sign_colors(df_tmp[return_type])
+    fig = plt.figure(figsize=(10, 8))
     plt.axhline(0, color='red', linestyle='--', linewidth=2.0)
-    plt.bar(df_tmp['Label'], df_tmp[return_type], color=colors, edgecolor='black')
+    plt.bar(labels, df_tmp[return_type], color=colors, edgecolor='black')
     plt.title(f'{security_class_val} {return_type}')
     plt.xlabel(period)
     plt.ylabel(return_type)
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.xticks(rotation=45)  # Rotate labels if needed for readability
-    plt.show()    
+
+    return fig    
     
 
+def _stats_input_columns(df_ret, security_class, period):
+
+    """
+    Returns the columns read by calculate_stats, for the result cache fingerprint.
+    """
+
+    label = '' if period == 'Daily' else period + ' '
+
+    return [security_class, 'Year', 'Year % Return', label + '% Return']
+
+
+@profile_function
+@cache_result(columns=_stats_input_columns)
 def calculate_stats(df_ret, security_class, period):
     
     """
@@ -478,7 +582,8 @@ def calculate_stats(df_ret, security_class, period):
     and Return Variance for the given period.
 
     Args:
-        - df_ret: DataFrame containing return data.
+        - df_ret: DataFrame containing return data (with 'Year % Return' for the periods shorter than a Year), or a PeriodTable 
+          keyed by security_class, whose returns are grouped by the code of their Year row instead.
         - security_class: A string representing the security class type column ('Sector', 'Industry Group', 'Industry', 'Sub_Industry', 
           'Ticker').
         - period: A string representing the period type for x-axis labeling ('Year', 'Quarter', 'Month', etc.).
@@ -495,6 +600,21 @@ def calculate_stats(df_ret, security_class, period):
         # Default to 'Year' only if the period is not specified as 'Quarter', 'Month', or 'Daily'
         required_cols = [security_class]
     
+    # A PeriodTable is grouped by the integer code of the Year row of each return, the keys are taken from the Year rows
+    df_keys = None
+    if isinstance(df_ret, PeriodTable):
+        if df_ret.key != security_class:
+            raise ValueError(f"The PeriodTable is keyed by {df_ret.key}, not {security_class}.")
+        if len(required_cols) == 1:
+            df_ret = df_ret.table('Year')
+        else:
+            df_year = df_ret.table('Year')
+            codes = df_ret.parent_codes(period, 'Year')
+            has_year = (codes >= 0) & pd.notna(df_year['Year % Return'].to_numpy()[codes])
+            df_keys = df_year[required_cols]
+            df_ret = df_ret.table(period).loc[has_year]
+            required_cols = codes[has_year]
+
     # Adjust period string for daily returns (no prefix) or for non-daily periods (add space after period)
     if period == 'Daily':
         period = ''  # No period prefix for daily returns
@@ -508,7 +628,14 @@ def calculate_stats(df_ret, security_class, period):
         Average_Return=(period + '% Return', 'mean'),    # Mean (average) return for the period
         Median_Return=(period + '% Return', 'median'),   # Median return for the period
         Return_Variance=(period + '% Return', lambda x: x.std(ddof=0))  # Variance (standard deviation) of returns
-    ).reset_index()  # Reset index to return a DataFrame with a flat structure
+    )
+    
+    # Reset index to return a DataFrame with a flat structure, with the Year row keys for a PeriodTable
+    if df_keys is None:
+        df_tmp = df_tmp.reset_index()
+    else:
+        df_tmp = pd.concat([df_keys.iloc[df_tmp.index.to_numpy()].reset_index(drop=True), 
+                            df_tmp.reset_index(drop=True)], axis=1)
 
     # Round the calculated statistics to 2 decimal places for better readability
     df_tmp = df_tmp.round({
@@ -532,6 +659,8 @@ def calculate_stats(df_ret, security_class, period):
     return df_tmp
 
 
+@profile_function
+@cache_figure()
 def plot_period_stats_by_year_bar_charts(df_stats, security_class, security_class_val):
     
     """
@@ -543,6 +672,9 @@ def plot_period_stats_by_year_bar_charts(df_stats, security_class, security_clas
           'Ticker').
         - security_class_val: A string indicating the value for security class type column ('Sector', 'Industry Group', 'Industry', 
           'Sub_Industry', 'Ticker')
+
+    Returns:
+        - The Matplotlib figure, which cache_figure shows.
     """
     
     # Determine the columns to plot by excluding 'security_class' and 'Year'
@@ -595,7 +727,7 @@ def plot_period_stats_by_year_bar_charts(df_stats, security_class, security_clas
         # Plot each statistic
         for i, col in enumerate(columns_to_plot):
             # Determine the color based on the return values
-            colors = ['red' if x < 0 else 'blue' for x in df_stats[col]]
+            colors = sign_colors(df_stats[col])
             
             # Plot the bar chart
             ax[i].bar(df_stats['Year'], df_stats[col], color=colors, edgecolor='black')
@@ -616,10 +748,11 @@ def plot_period_stats_by_year_bar_charts(df_stats, security_class, security_clas
         # Adjust layout of subplots
         plt.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1, wspace=0.3, hspace=0.5)
 
-    # Show the plot
-    plt.show()
+    return fig
 
     
+@profile_function
+@cache_figure()
 def plot_period_returns_by_year_box_plot(df_ret, security_class_val, period):
     
     """
@@ -630,6 +763,9 @@ def plot_period_returns_by_year_box_plot(df_ret, security_class_val, period):
         - security_class_val: A string representing the value for security class type column ('Sector', 'Industry Group', 'Industry', 
           'Sub_Industry', 'Ticker').
         - period: A string representing the period type column ('Year', 'Quarter', 'Month', etc.).
+
+    Returns:
+        - The Matplotlib figure, which cache_figure shows.
     """
     
     # Define properties for outliers in the box plot
@@ -640,7 +776,7 @@ def plot_period_returns_by_year_box_plot(df_ret, security_class_val, period):
     flierprops = dict(marker='o', color='red', alpha=0.5, markersize=8)
 
     # Create a figure with a specified size for the plot
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     
     # If the period is 'Daily', treat it as an empty string for labeling purposes
     # Otherwise, append a space after the period string for readability in the title
@@ -670,11 +806,12 @@ def plot_period_returns_by_year_box_plot(df_ret, security_class_val, period):
     # Rotate the x-axis labels by 45 degrees for better readability, especially if there are many years
     plt.xticks(rotation=45)
     
-    # Display the plot
-    plt.show()
+    return fig
     
     
-def plot_top_returns_bar_chart(df_tmp, security_class, period):
+@profile_function
+@cache_figure()
+def plot_top_returns_bar_chart(df_tmp, security_class, period, top_val=None):
     
     """
     Plots a bar chart of returns based on the specified period for multiple security classes.
@@ -684,6 +821,10 @@ def plot_top_returns_bar_chart(df_tmp, security_class, period):
         - security_class: A string representing the security class type column ('Sector', 'Industry Group', 'Industry', 'Sub_Industry', 
           'Ticker').
         - period: A string representing the period type column ('Year', 'Quarter', 'Month', etc.).
+        - top_val: Integer representing N for the top N security class type values per period (defaults to all values).
+
+    Returns:
+        - The Plotly figure, which cache_figure shows.
     """
     
     if period == 'Daily':
@@ -691,21 +832,19 @@ def plot_top_returns_bar_chart(df_tmp, security_class, period):
         
     security_classes = df_tmp[security_class].unique()
 
-    # Create a Label column based on the period
+    # Create a Label based on the period and the period sort keys (the input DataFrame is not modified)
     if period == 'Year':
-        df_tmp['Year'] = df_tmp['Year'].astype(int)
-        df_tmp['Label'] = df_tmp['Year']
-        df_tmp.sort_values(by='Year', inplace=True)
+        label = df_tmp['Year'].astype(int)
+        sort_keys = [df_tmp['Year'].astype(int)]
     elif period == 'Quarter':
-        df_tmp['Label'] = df_tmp['Year'].astype(str) + "-Q" + df_tmp['Quarter'].astype(str)
-        df_tmp['Quarter'] = df_tmp['Quarter'].astype(int)
-        df_tmp.sort_values(by=['Year', 'Quarter'], inplace=True)
+        label = period_labels(df_tmp, period)
+        sort_keys = [df_tmp['Year'], df_tmp['Quarter'].astype(int)]
     elif period == 'Month':
-        df_tmp['Label'] = df_tmp['Month'].apply(lambda x: pd.Timestamp(f'2024-{x}-01').strftime('%b')) + "-" + df_tmp['Year'].astype(str)
-        df_tmp['Month'] = df_tmp['Month'].astype(int)
-        df_tmp.sort_values(by=['Year', 'Month'], inplace=True)
+        label = period_labels(df_tmp, period, month_format='name')
+        sort_keys = [df_tmp['Year'], df_tmp['Month'].astype(int)]
     else:
-        df_tmp['Label'] = df_tmp['Date'].astype(str)
+        label = period_labels(df_tmp, period)
+        sort_keys = [df_tmp['Date']]
     
     return_type = period + ' % Return'
     
@@ -713,16 +852,20 @@ def plot_top_returns_bar_chart(df_tmp, security_class, period):
     if return_type not in df_tmp.columns:
         raise ValueError(f"Column '{return_type}' does not exist in the DataFrame.")
 
-    unique_periods = df_tmp['Label'].unique()
+    # Lightweight frame with only the columns needed for the chart
+    df_plot = pd.DataFrame({security_class: df_tmp[security_class].to_numpy(), return_type: df_tmp[return_type].to_numpy(),
+                            'Label': np.asarray(label)})
+    
+    # Periods in chronological order
+    period_order = np.lexsort([key.to_numpy() for key in reversed(sort_keys)])
+    unique_periods = df_plot['Label'].iloc[period_order].unique()
     num_periods = len(unique_periods)
 
-    # Determine the grid size based on the number of periods
-    plots = int(math.sqrt(num_periods)) + (1 if (math.sqrt(num_periods) % 1 != 0) else 0)
-    
     if num_periods > 48:
         raise ValueError("Number of periods exceeds the supported grid size.")    
     
-    rows, cols = plots, plots
+    # Determine the grid size based on the number of periods, without empty rows of subplots
+    rows, cols = subplot_grid(num_periods)
     
     if period == 'Year':
         width_size = 800
@@ -740,36 +883,43 @@ def plot_top_returns_bar_chart(df_tmp, security_class, period):
     # Generate a color scale from dark to light blue
     num_security_classes = len(security_classes)
     color_scale = px.colors.sequential.Blues
-    colors = color_scale[:num_tickers] if num_security_classes <= len(color_scale) else color_scale * (num_security_classes // len(color_scale) + 1)
+    colors = color_scale[:num_security_classes] if num_security_classes <= len(color_scale) else color_scale * (num_security_classes // len(color_scale) + 1)
     
-    num_top_security_classes = round(len(df_tmp) / num_periods)
+    # Select the leaders of every period in one pass, ordered by period and then by descending return. Without top_val
+    # every security class type of every period is kept, so the largest period sets the number of bars.
+    if top_val is None:
+        top_val = int(df_plot.groupby('Label', sort=False).size().max())
+    df_ranks = calculate_ranks(df_plot, return_type, group_cols=['Label'])
+    df_top = select_top_k(df_ranks, return_type, top_val, group_cols=['Label'])
+    num_top_security_classes = top_val
     
-    # Loop through each period and plot the returns for all security class types
+    period_groups = {period_val: df_period for period_val, df_period in df_top.groupby('Label', sort=False)}
+    
+    # Build the bars of the top security class types of every period and add them to the subplots in one call
+    traces, trace_rows, trace_cols = [], [], []
     for i, period_val in enumerate(unique_periods):
-        df_period = df_tmp[df_tmp['Label'] == period_val]
-        
-        # Create a pivot table dataframe to shift returns under 'Label' column for security class types
-        df_pivot = df_period.pivot(index=security_class, columns='Label', values=return_type)
-        
-        # Sort by the first column (the only column in this case) in descending order
-        df_pivot = df_pivot.sort_values(by=df_pivot.columns[0], ascending=False)
+        df_period = period_groups.get(period_val)
+        if df_period is None:
+            continue
         
-        # Create a bar chart for each period, showing returns of all security class types
-        # Add traces for each security class type with distinct colors
-        for j, sec in enumerate(df_pivot.index):
-            y_values = df_pivot.loc[sec].values
-            fig.add_trace(
+        # Add a bar for each security class type with distinct colors
+        for j, (sec, y_value, rank, percentile) in enumerate(zip(df_period[security_class], df_period[return_type], 
+                                                                  df_period[return_type + ' Rank'], df_period[return_type + ' Percentile'])):
+            traces.append(
                 pltly.graph_objects.Bar(
                     x=[period_val],  # Use the period value as x-tick for that subplot
-                    y=y_values,  # Use the pivoted values
+                    y=[y_value],  # Use the ranked values
                     name=sec,
                     marker_color=colors[j % len(colors)],  # Apply color
                     text=sec,  # Display secuirty class type on bars
-                    textposition='inside'  # Label on bars
-                ),
-                row=(i // cols) + 1,
-                col=(i % cols) + 1
+                    textposition='inside',  # Label on bars
+                    hovertext=f'{sec}<br>Rank: {int(rank)}<br>Percentile: {int(percentile)}'  # Dense rank and percentile in period
+                )
             )
+            trace_rows.append((i // cols) + 1)
+            trace_cols.append((i % cols) + 1)
+    
+    fig.add_traces(traces, rows=trace_rows, cols=trace_cols)
     
     fig.update_layout(
         height=height_size * rows,  # Adjust height based on number of rows
@@ -784,10 +934,12 @@ def plot_top_returns_bar_chart(df_tmp, security_class, period):
     for i, label in enumerate(unique_periods):
         fig.update_yaxes(title_text=return_type, row=(i // cols) + 1, col=(i % cols) + 1)
     
-    fig.show()
+    return fig
 
 
 
+@profile_function
+@cache_figure()
 def plot_returns_line_chart(df_tmp, period, return_type, security_class):
     
     """
@@ -799,18 +951,13 @@ def plot_returns_line_chart(df_tmp, period, return_type, security_class):
         - return_type: A string representing the return type column ('% Return', 'Cumulative % Return')
         - security_class: A string representing the security class type column ('Sector', 'Industry Group', 'Industry', 'Sub_Industry', 
           'Ticker').
+
+    Returns:
+        - The Plotly figure, which cache_figure shows.
     """
     
-    # Create a Label column based on the period
-    if period == 'Year':
-        df_tmp['Label'] = df_tmp['Year'].astype(str)
-    elif period == 'Quarter':
-        df_tmp['Label'] = df_tmp['Year'].astype(str) + "-Q" + df_tmp['Quarter'].astype(str)
-    elif period == 'Month':
-        # Ensure month is zero-padded if needed
-        df_tmp['Label'] = df_tmp['Year'].astype(str) + "-" + df_tmp['Month'].apply(lambda x: str(x).zfill(2))
-    else:
-        df_tmp['Label'] = df_tmp['Date'].astype(str)
+    # Build the labels of the periods without adding a Label column to df_tmp
+    labels = period_labels(df_tmp, period)
         
     if period == 'Daily':
         label = 'Date'
@@ -835,20 +982,18 @@ def plot_returns_line_chart(df_tmp, period, return_type, security_class):
     
     fig = pltly.graph_objects.Figure()
     
-    for sec in security_classes:
-        df_security_class = df_tmp[df_tmp[security_class] == sec]
-        if df_security_class.empty:
-            print(f"No data found for {sec}.")
-            continue
-        
-        fig.add_trace(
+    # Split the rows of every security class in one pass instead of filtering df_tmp for each of them
+    traces = []
+    for sec, rows in df_tmp.groupby(security_class, sort=False, observed=True).indices.items():
+        traces.append(
             pltly.graph_objects.Scatter(
-                x=df_security_class['Label'],
-                y=df_security_class[return_type],
+                x=labels[rows],
+                y=df_tmp[return_type].to_numpy()[rows],
                 mode='lines',
                 name=sec
             )
         )
+    fig.add_traces(traces)
 
     fig.update_layout(
         title=f'{return_type} for {security_class_label}',
@@ -860,13 +1005,27 @@ def plot_returns_line_chart(df_tmp, period, return_type, security_class):
     )
     
     fig.update_xaxes(tickangle=45)  # Rotate x-axis labels for better readability if necessary
-    fig.show()
     
+    return fig
     
-def calculate_drawdowns(df_tmp, security_class, period):
     
+def _drawdown_input_columns(df_tmp, security_class, period):
+
     """
-    Calculate drawdowns and maximum drawdown based on cumulative returns.
+    Returns the columns read by calculate_drawdown_columns, for the result cache fingerprint.
+    """
+
+    label = '' if period == 'Daily' else period + ' '
+
+    return [security_class, 'Date', label + 'Cumulative % Return']
+
+
+@profile_function
+@cache_result(columns=_drawdown_input_columns)
+def calculate_drawdown_columns(df_tmp, security_class, period):
+    
+    """
+    Calculate the drawdown columns of calculate_drawdowns without modifying, sorting or copying the input DataFrame.
     
     Args:
         - df_tmp: The DataFrame containing the cumulative return data.
@@ -875,7 +1034,8 @@ def calculate_drawdowns(df_tmp, security_class, period):
         - period: A string representing the period type column ('Year', 'Quarter', 'Month', 'Daily').
 
     Returns:
-        - A DataFrame with new columns for drawdown and maximum drawdown.
+        - A DataFrame aligned to the input index with only the new columns: 'Peak', 'Drawdown', '% Drawdown', 'Cumulative Max % Drawdown', 
+          'Max % Drawdown', 'Is_Max_Drawdown' and 'Max Drawdown Date' (prefixed with the period when it is not 'Daily').
     """
     
     # Determine the label for the columns based on the period type
@@ -883,58 +1043,95 @@ def calculate_drawdowns(df_tmp, security_class, period):
         label = ''
     else:
         label = period + ' '
-    
-    # Ensure the DataFrame is sorted by Date for proper calculations
-    df_tmp.sort_values(by=[security_class, 'Date'], inplace=True)
-
+        
     # Check for 'Cumulative % Return' presence
     if label + 'Cumulative % Return' not in df_tmp.columns:
         raise ValueError(f"{label}Cumulative % Return column is missing. Please calculate returns first.")
     
+    # Row positions in security class type and Date order, used instead of sorting the DataFrame
+    groups = pd.factorize(df_tmp[security_class], sort=True)[0]
+    order = np.lexsort((df_tmp['Date'].to_numpy(), groups))
+    groups = groups[order]
+    
+    cum_ret = pd.Series(df_tmp[label + 'Cumulative % Return'].to_numpy(dtype=float)[order])
+    dates = pd.Series(df_tmp['Date'].to_numpy()[order])
+    
     # Calculate Peak for each security class type
-    df_tmp['Peak'] = df_tmp.groupby(security_class)[label + 'Cumulative % Return'].cummax()
+    peak = cum_ret.groupby(groups).cummax()
     
-    df_tmp['Drawdown'] = np.where(
-        df_tmp[label + 'Cumulative % Return'] >= 0,  # If cumulative return is positive or zero
-        df_tmp['Peak'] - df_tmp[label + 'Cumulative % Return'],  # Calculate drawdown normally
-        df_tmp['Peak'] + abs(df_tmp[label + 'Cumulative % Return'])  # Account for negative cumulative return
+    drawdown = np.where(
+        cum_ret >= 0,  # If cumulative return is positive or zero
+        peak - cum_ret,  # Calculate drawdown normally
+        peak + abs(cum_ret)  # Account for negative cumulative return
         )
-   
+    
     # Calculate % Drawdown
-    df_tmp['% Drawdown'] = np.where(
-        df_tmp['Peak'] != 0,
-        round((df_tmp['Drawdown'] / df_tmp['Peak']) * 100, 2),
-        0
-    )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct_drawdown = pd.Series(np.where(peak != 0, np.round((drawdown / peak) * 100, 2), 0))
     
-    # Calculate Cumulative Max % Drawdown for each security class type (worst drawdown observed up to each date)
-    df_tmp['Cumulative Max % Drawdown'] = df_tmp.groupby(security_class)['% Drawdown'].cummax()
+    # Cumulative Max % Drawdown (worst drawdown observed up to each date) and Max % Drawdown of all dates
+    cum_max_drawdown = pct_drawdown.groupby(groups).cummax()
+    max_drawdown = pct_drawdown.groupby(groups).transform('max')
+    is_max_drawdown = pct_drawdown == max_drawdown
     
-    # Max % Drawdown column represents max drawdown of all dates
-    df_tmp['Max % Drawdown'] = df_tmp.groupby(security_class)['% Drawdown'].transform('max')
-    # Create a mask where % Drawdown equals Max % Drawdown
-    df_tmp['Is_Max_Drawdown'] = df_tmp['% Drawdown'] == df_tmp['Max % Drawdown']
     # Extract the last date where the Max % Drawdown occurs
-    df_tmp['Max Drawdown Date'] = df_tmp['Date'].where(df_tmp['Is_Max_Drawdown']).groupby(df_tmp[security_class]).transform('last')
+    max_drawdown_date = dates.where(is_max_drawdown).groupby(groups).transform('last')
+    
+    # Put the results back in the input row order
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order))
+    
+    return pd.DataFrame({
+        label + 'Peak': peak.to_numpy()[positions],
+        label + 'Drawdown': drawdown[positions],
+        label + '% Drawdown': pct_drawdown.to_numpy()[positions],
+        label + 'Cumulative Max % Drawdown': cum_max_drawdown.to_numpy()[positions],
+        label + 'Max % Drawdown': max_drawdown.to_numpy()[positions],
+        'Is_Max_Drawdown': is_max_drawdown.to_numpy()[positions],
+        label + 'Max Drawdown Date': max_drawdown_date.to_numpy()[positions]
+    }, index=df_tmp.index)
 
-    # If the period is not 'Daily', rename the columns with the period label prefix
-    if period != 'Daily':
-        df_tmp.rename(columns={'Peak': label + 'Peak'}, inplace=True)
-        df_tmp.rename(columns={'Drawdown': label + 'Drawdown'}, inplace=True)
-        df_tmp.rename(columns={'% Drawdown': label + '% Drawdown'}, inplace=True)
-        df_tmp.rename(columns={'Cumulative Max % Drawdown': label + 'Cumulative Max % Drawdown'}, inplace=True)
-        df_tmp.rename(columns={'Max % Drawdown': label + 'Max % Drawdown'}, inplace=True)
-        df_tmp.rename(columns={'Max Drawdown Date': label + 'Max Drawdown Date'}, inplace=True)
+
+@profile_function
+def calculate_drawdowns(df_tmp, security_class, period):
+    
+    """
+    Calculate drawdowns and maximum drawdown based on cumulative returns.
+    
+    df_tmp is sorted and the columns are added in place. Use calculate_drawdown_columns to get only the new columns without modifying 
+    the input.
+    
+    Args:
+        - df_tmp: The DataFrame containing the cumulative return data.
+        - security_class: A string representing the security class type column ('Sector', 'Industry Group', 'Industry', 'Sub_Industry', 
+          'Ticker').
+        - period: A string representing the period type column ('Year', 'Quarter', 'Month', 'Daily').
+
+    Returns:
+        - A DataFrame with new columns for drawdown and maximum drawdown.
+    """
+    
+    # Ensure the DataFrame is sorted by Date for proper calculations
+    df_tmp.sort_values(by=[security_class, 'Date'], inplace=True)
+    
+    df_cols = calculate_drawdown_columns(df_tmp, security_class, period)
+    
+    for col in df_cols.columns:
+        df_tmp[col] = df_cols[col].to_numpy()
         
     return df_tmp
 
 
 
+@profile_function
+@cache_result()
 def calculate_portfolio_return(df_tmp, security_class_list, period):
     
     """
     Calculate the returns of a portfolio of security class types using an average of log returns.
     
+    The input DataFrame is not modified, only the remaining key columns (e.g. 'Date' and 'Year') are carried to the result.
+    
     Args:
         - df_tmp: The DataFrame containing the historical data.
         - security_class_list: A list of strings representing the security class type columns ('Sector', 'Industry Group', 'Industry', 
@@ -961,76 +1158,65 @@ def calculate_portfolio_return(df_tmp, security_class_list, period):
     else:
         label = period + ' '
 
-    # Drop unnecessary columns from the DataFrame to simplify calculations
+    # Columns that are not carried to the portfolio result (the input DataFrame is not modified)
     columns_to_drop = security_class_list + ['Open', 'High', 'Low', 'Close', 'Volume', 
                                               label + 'Annualized % Return', label + 'Annualized Volatility', 
-                                              label + 'Annualized Downside Volatility']
-
-    # Keep only those columns that exist in df_tmp
-    columns_to_drop = [col for col in columns_to_drop if col in df_tmp.columns]
-    
-    df_tmp.drop(columns=columns_to_drop, inplace=True)
+                                              label + 'Annualized Downside Volatility',
+                                              label + '% Return', label + 'Cumulative % Return']
+    key_cols = [col for col in df_tmp.columns if col not in columns_to_drop]
 
     # Calculate log returns based on cumulative percentage returns
-    df_tmp['Log Return'] = np.log(1 + (df_tmp[label + 'Cumulative % Return'] / 100))
-
-    # Calculate the average log return for each date
-    df_tmp['Avg Log Return'] = df_tmp.groupby('Date')['Log Return'].transform('mean')
-
-    # Calculate the average percentage return for each date and convert to decimal
-    df_tmp['Avg % Return'] = df_tmp.groupby('Date')[label + '% Return'].transform('mean') / 100
-
-    # Drop columns that are no longer needed after calculating averages
-    df_tmp.drop(columns=['Log Return', label + '% Return', label + 'Cumulative % Return'], inplace=True)
-
-    # Calculate cumulative percentage return from average log return
-    df_tmp['Cumulative % Return'] = np.exp(df_tmp['Avg Log Return']) - 1
+    log_ret = np.log(1 + (df_tmp[label + 'Cumulative % Return'] / 100))
 
-    # Drop the average log return column as it is no longer needed
-    df_tmp.drop(columns=['Avg Log Return'], inplace=True)
-
-    # Rename the average percentage return column to '% Return' for clarity
-    df_tmp.rename(columns={'Avg % Return': '% Return'}, inplace=True)
-
-    # Remove duplicate entries in the DataFrame
-    df_tmp.drop_duplicates(inplace=True)
+    # Calculate the average log return and the average percentage return (as a decimal) for each date
+    avg_log_ret = log_ret.groupby(df_tmp['Date']).mean()
+    avg_ret = df_tmp[label + '% Return'].groupby(df_tmp['Date']).mean() / 100
 
+    # Keep one row per date with the remaining columns, in order of first appearance
+    df_port = df_tmp[key_cols].drop_duplicates()
+    
+    # Rename the average percentage return column to '% Return' and calculate cumulative percentage return from average log return
+    df_port['% Return'] = df_port['Date'].map(avg_ret)
+    df_port['Cumulative % Return'] = np.exp(df_port['Date'].map(avg_log_ret)) - 1
+    
+    ret = df_port['% Return'].to_numpy(dtype=float)
+    groups = np.zeros(len(df_port), dtype=np.int64)
+    
     # Count the number of returns in a rolling manner, starting from the first entry
-    df_tmp['Rolling Return Count'] = df_tmp['% Return'].expanding(min_periods=1).count()
+    vol, ret_count = _expanding_std_by_group(ret, groups)
+    downside_vol, neg_count = _expanding_std_by_group(ret, groups, include=(ret < 0))
     
     # Calculate annualized return based on cumulative return and the number of returns
-    df_tmp['Annualized % Return'] = ((1 + df_tmp['Cumulative % Return']) ** (no_of_periods / df_tmp['Rolling Return Count']) - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df_port['Annualized % Return'] = ((1 + df_port['Cumulative % Return']) ** (no_of_periods / np.where(ret_count > 0, ret_count, np.nan)) - 1)
 
     # Calculate annualized volatility based on the standard deviation of percentage returns
-    df_tmp['Annualized Volatility'] = df_tmp['% Return'].expanding().std() * np.sqrt(no_of_periods)
+    df_port['Annualized Volatility'] = vol * np.sqrt(no_of_periods)
 
     # Calculate annualized downside volatility (only for negative returns)
-    df_tmp['Annualized Downside Volatility'] = df_tmp['% Return'].expanding().apply(
-        lambda x: x[x < 0].std() * np.sqrt(no_of_periods) if len(x[x < 0]) > 0 else 0)
-
-    # Drop the rolling return count column after its use
-    df_tmp.drop(columns=['Rolling Return Count'], inplace=True)
+    df_port['Annualized Downside Volatility'] = np.where(neg_count > 0, downside_vol * np.sqrt(no_of_periods), 0)
 
     # Round the values for presentation to two decimal places
-    df_tmp['% Return'] = round(df_tmp['% Return'] * 100, 2)
-    df_tmp['Cumulative % Return'] = round(df_tmp['Cumulative % Return'] * 100, 2)
-    df_tmp['Annualized % Return'] = round(df_tmp['Annualized % Return'] * 100, 2)
-    df_tmp['Annualized Volatility'] = round(df_tmp['Annualized Volatility'] * 100, 2)
-    df_tmp['Annualized Downside Volatility'] = round(df_tmp['Annualized Downside Volatility'] * 100, 2)
+    df_port['% Return'] = round(df_port['% Return'] * 100, 2)
+    df_port['Cumulative % Return'] = round(df_port['Cumulative % Return'] * 100, 2)
+    df_port['Annualized % Return'] = round(df_port['Annualized % Return'] * 100, 2)
+    df_port['Annualized Volatility'] = round(df_port['Annualized Volatility'] * 100, 2)
+    df_port['Annualized Downside Volatility'] = round(df_port['Annualized Downside Volatility'] * 100, 2)
     
     # Rename return columns based on the specified period type, if not daily
     if period != 'Daily':
-        df_tmp.rename(columns={'% Return': period + ' % Return'}, inplace=True)    
-        df_tmp.rename(columns={'Cumulative % Return': period + ' Cumulative % Return'}, inplace=True)
-        df_tmp.rename(columns={'Annualized % Return': period + ' Annualized % Return'}, inplace=True)
-        df_tmp.rename(columns={'Annualized Volatility': period + ' Annualized Volatility'}, inplace=True)
-        df_tmp.rename(columns={'Annualized Downside Volatility': period + ' Annualized Downside Volatility'}, inplace=True)
+        df_port.rename(columns={'% Return': period + ' % Return'}, inplace=True)    
+        df_port.rename(columns={'Cumulative % Return': period + ' Cumulative % Return'}, inplace=True)
+        df_port.rename(columns={'Annualized % Return': period + ' Annualized % Return'}, inplace=True)
+        df_port.rename(columns={'Annualized Volatility': period + ' Annualized Volatility'}, inplace=True)
+        df_port.rename(columns={'Annualized Downside Volatility': period + ' Annualized Downside Volatility'}, inplace=True)
         
-    return df_tmp  # Return the modified DataFrame
+    return df_port
 
 
 
-def plot_return_histogram(df_tmp, return_type, security_class, security_class_val):
+@profile_function
+def plot_return_histogram(df_tmp, return_type, security_class, security_class_val, distributions=None):
     
     """
     Plot a histogram of '% Return' for a specific security class type value with a normal distribution curve based on all security class 
@@ -1043,48 +1229,42 @@ def plot_return_histogram(df_tmp, return_type, security_class, security_class_va
         'Ticker').
         - security_class_val: A string representing the value for security class type column ('Sector', 'Industry Group', 'Industry',  
         'Sub_Industry', 'Ticker').
+        - distributions: Optional dictionary returned by calculate_return_distributions for the same DataFrame, return type and 
+        security class. Pass it when plotting several values so the histograms and KDE lines are calculated in one batch.
     """
     
-    # Filter rows for the specific security class value
-    df_security_class = df_tmp[df_tmp[security_class] == security_class_val]
-    
     # Ensure the DataFrame contains the required columns
     if return_type not in df_tmp.columns:
         raise ValueError(f"Required column '{return_type}' is missing.")
     
-    # Compute global mean and standard deviation from all tickers
-    all_returns = df_tmp[return_type]
-    global_mean = np.mean(all_returns)
-    global_std_dev = np.std(all_returns)
-    
-    # Compute histogram for the specific security class value
-    security_class_returns = df_security_class[return_type]
+    # Calculate the histogram and binned KDE for the specific security class value unless they were precomputed
+    if (distributions is None) or (security_class_val not in distributions):
+        distributions = calculate_return_distributions(df_tmp, return_type, security_class, [security_class_val])
     
-    # Calculate the interquartile range (IQR)
-    IQR = np.percentile(security_class_returns, 75) - np.percentile(security_class_returns, 25)
+    if security_class_val not in distributions:
+        raise ValueError(f"No {return_type} values found for {security_class_val}.")
     
-    # Calculate the bin width using the Freedman-Diaconis rule
-    bin_width = 2 * IQR / np.cbrt(len(security_class_returns))
+    # Global mean and standard deviation from all tickers (cached per DataFrame and return column)
+    global_mean = distributions['global']['mean']
+    global_std_dev = distributions['global']['std_dev']
     
-    # Calculate the optimal bin width using Freedman-Diaconis rule
-    num_bins = int((security_class_returns.max() - security_class_returns.min()) / bin_width)
+    distribution = distributions[security_class_val]
+    bins = distribution['bin_edges']
+    count = distribution['counts']
+    total_count = np.sum(count)
     
     plt.figure(figsize=(12, 8))
     
-    # Compute histogram and keep counts (not densities)
-    count, bins, _ = plt.hist(security_class_returns, bins=num_bins, alpha=0.6, density=False, edgecolor='black', label=f'Frequency for {security_class_val}')
-    total_count = np.sum(count)
-    
-    # Compute KDE for a smooth line
-    kde = gaussian_kde(security_class_returns, bw_method='scott')  # 'scott' method automatically chooses bandwidth
-    x_kde = np.linspace(security_class_returns.min(), security_class_returns.max(), 1000)  # Generate points for smooth line
-    y_kde = kde(x_kde)  # KDE values
-    y_kde_normalized = y_kde * len(security_class_returns) * bin_width  # Normalize KDE to match histogram counts   
-    plt.plot(x_kde, y_kde_normalized, 'g-', linewidth=2, label=f'KDE (Smooth Line) for {security_class_val}')
+    # Plot the precomputed histogram counts (not densities)
+    plt.hist(bins[:-1], bins=bins, weights=count, alpha=0.6, density=False, edgecolor='black', label=f'Frequency for {security_class_val}')
     
-    # Calculate bin width for scaling the normal distribution
+    # Calculate bin width for scaling the KDE and the normal distribution
     actual_bin_width = bins[1] - bins[0]  # Use the actual bin width from the histogram calculation
     
+    # Plot the binned KDE as a smooth line normalized to match histogram counts
+    y_kde_normalized = distribution['y_kde'] * distribution['count'] * actual_bin_width
+    plt.plot(distribution['x_kde'], y_kde_normalized, 'g-', linewidth=2, label=f'KDE (Smooth Line) for {security_class_val}')
+    
     # Plot the normal distribution curve based on all security class type values and scale to match histogram
     x = np.linspace(min(bins), max(bins), 100)
     p = norm.pdf(x, global_mean, global_std_dev)  # PDF of the normal distribution
@@ -1108,6 +1288,8 @@ def plot_return_histogram(df_tmp, return_type, security_class, security_class_va
 
         
 
+@profile_function
+@cache_figure()
 def plot_returns_bubble_chart(df_tmp, return_type, size_type, security_class, is_top, top_val):
     
     """
@@ -1124,14 +1306,17 @@ def plot_returns_bubble_chart(df_tmp, return_type, size_type, security_class, is
           'Industry', 'Sub_Industry', 'Ticker').
         - is_top: Boolean value indicating whether we want to show top vlaues in the legend.
         - top_val: Integer representing N for top N values.      
+
+    Returns:
+        - The Plotly figure, which cache_figure shows.
     """
     
     # Filter out rows where size_type has negative or zero values
     df_tmp2 = df_tmp[df_tmp[size_type] > 0].copy()
    
     if is_top:
-        # Sort by the size_type and get the top top_val security class type values
-        top_security_classes = df_tmp2.nlargest(top_val, size_type)[[security_class, return_type, size_type]]
+        # Select the top top_val security class type values by size_type without sorting the whole frame
+        top_security_classes = select_top_k(df_tmp2, size_type, top_val)[[security_class, return_type, size_type]]
     else:
         top_security_classes = df_tmp2[[security_class, return_type, size_type]]
     
@@ -1154,18 +1339,20 @@ def plot_returns_bubble_chart(df_tmp, return_type, size_type, security_class, is
         plot_bgcolor="lightgrey"  # Set background color
     )
     
+    # Look up the first y value of every security class type once instead of filtering df_tmp2 for each annotation
+    first_y = df_tmp2.drop_duplicates(security_class).set_index(security_class)[return_type]
+    y_values = first_y.reindex(top_security_classes[security_class]).to_numpy()
+    
     # Add an annotation for the top 10 tickers
     annotations = []
-    for i, row in top_security_classes.iterrows():
-        # Get the corresponding y value
-        y_value = df_tmp2.loc[df_tmp2[security_class] == row[security_class], return_type].values[0]
+    for sec, y_value in zip(top_security_classes[security_class], y_values):
         annotations.append(
             dict(
-                x=row[security_class],
+                x=sec,
                 y=y_value,
                 xref="x",
                 yref="y",
-                text=row[security_class],  # Show security name
+                text=sec,  # Show security name
                 showarrow=True,
                 arrowhead=2,
                 ax=50,  # Move the annotation right
@@ -1179,7 +1366,8 @@ def plot_returns_bubble_chart(df_tmp, return_type, size_type, security_class, is
 
     if is_top:
         # Create a separate legend box on the right for the top top_val security class type
-        legend_text = '<br>'.join([f"{row[security_class]}, {row[size_type]}" for _, row in top_security_classes.iterrows()])
+        legend_text = '<br>'.join([f"{sec}, {size}" for sec, size in zip(top_security_classes[security_class], 
+                                                                          top_security_classes[size_type])])
     
         # Add a text box to display the top 10 tickers legend
         fig.add_annotation(
@@ -1199,10 +1387,11 @@ def plot_returns_bubble_chart(df_tmp, return_type, size_type, security_class, is
             )
         )
 
-    # Show the figure
-    fig.show()
+    return fig
     
     
+@profile_function
+@cache_figure()
 def plot_period_returns_by_security_class_box_plot(df_tmp, period, security_class):
     
     """
@@ -1213,6 +1402,9 @@ def plot_period_returns_by_security_class_box_plot(df_tmp, period, security_clas
         - period: A string representing the period type column ('Year', 'Quarter', 'Month', or 'Daily').
         - security_class: A string representing the security class type column ('Sector', 'Industry Group', 
           'Industry', 'Sub_Industry', 'Ticker').
+
+    Returns:
+        - The Matplotlib figure, which cache_figure shows.
     """
     
     # Define properties for outliers in the box plot
@@ -1223,7 +1415,7 @@ def plot_period_returns_by_security_class_box_plot(df_tmp, period, security_clas
     flierprops = dict(marker='o', color='red', alpha=0.5, markersize=8)
 
     # Create a figure with a specified size for the plot
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     
     # If the period is 'Daily', treat it as an empty string for labeling purposes
     # Otherwise, append a space after the period string for readability in the title
@@ -1241,11 +1433,11 @@ def plot_period_returns_by_security_class_box_plot(df_tmp, period, security_clas
     # Rotate the x-axis labels by 45 degrees for better readability, especially if there are many years
     plt.xticks(rotation=45)
     
-    # Display the plot
-    plt.show()
+    return fig
     
 
     
+@profile_function
 def calculate_information_ratio(df_tmp, security_class, security_class_val1, security_class_val2):
     
     """
@@ -1292,6 +1484,7 @@ def calculate_information_ratio(df_tmp, security_class, security_class_val1, sec
     return information_ratio
 
 
+@profile_function
 def plot_security_class_correlations(df_tmp, return_type, security_class):
     
     """
@@ -1324,6 +1517,8 @@ def plot_security_class_correlations(df_tmp, return_type, security_class):
     return corr_matrix
 
 
+@profile_function
+@cache_figure()
 def scatter_plot(df_tmp, return_type):
     
     """
@@ -1332,10 +1527,13 @@ def scatter_plot(df_tmp, return_type):
     Args:
         - df_tmp: DataFrame containing return data.
         - return_type: A string representing the column name containing the returns.
+
+    Returns:
+        - The Matplotlib figure, which cache_figure shows.
     """
 
     # Create a scatter plot
-    plt.figure(figsize=(10, 6))
+    fig = plt.figure(figsize=(10, 6))
     sns.scatterplot(x='Date', y=return_type, data=df_tmp)
 
     # Fit a linear regression model
@@ -1353,7 +1551,8 @@ def scatter_plot(df_tmp, return_type):
     plt.xlabel('Date')
     plt.ylabel(f'{return_type}')
     plt.legend()
-    plt.show()
+    
+    return fig
  
     
     
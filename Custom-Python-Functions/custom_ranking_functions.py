@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Ranking engine for the top and bottom return charts.
+
+Ranks are calculated for every group (Year, Quarter, Sector, etc.) in one vectorized pass over a single sort, the
+same way DENSE_RANK and NTILE(100) are used in the SQL ranking queries. Top and bottom k selection per group uses
+numpy argpartition so only the k selected values of each group are sorted.
+"""
+
+import pandas as pd
+import numpy as np
+from custom_profiling_functions import profile_function
+
+
+def _group_codes(df_tmp, group_cols):
+
+    """
+    Returns one integer code per row for the combination of the group columns (all zeros when there are none).
+    """
+
+    if not group_cols:
+        return np.zeros(len(df_tmp), dtype=np.int64), 1
+
+    if len(group_cols) == 1:
+        codes, uniques = pd.factorize(df_tmp[group_cols[0]], sort=True)
+        return codes.astype(np.int64), len(uniques)
+
+    codes = df_tmp.groupby(group_cols, sort=True, dropna=False).ngroup().to_numpy(dtype=np.int64)
+
+    return codes, int(codes.max()) + 1 if len(codes) > 0 else 0
+
+
+@profile_function
+def calculate_ranks(df_tmp, value_col, group_cols=None, ascending=False):
+
+    """
+    Calculates the dense rank and percentile of a value column within each group.
+
+    The rank matches DENSE_RANK() OVER(PARTITION BY group_cols ORDER BY value_col DESC) and the percentile matches
+    NTILE(100) OVER(PARTITION BY group_cols ORDER BY value_col ASC), so the top values have a percentile of 100.
+    Rows with missing values get missing ranks and percentiles. The input DataFrame is not modified.
+
+    Args:
+        - df_tmp: DataFrame containing the values to rank.
+        - value_col: String representing the column to rank (e.g. 'Year % Return').
+        - group_cols: List of columns to rank within (e.g. ['Year']). None ranks over all rows.
+        - ascending: Boolean indicating whether rank 1 is the smallest value instead of the largest.
+
+    Returns:
+        - A copy of the DataFrame with '<value_col> Rank' and '<value_col> Percentile' columns added.
+    """
+
+    if value_col not in df_tmp.columns:
+        raise ValueError(f"Column '{value_col}' does not exist in the DataFrame.")
+
+    if isinstance(group_cols, str):
+        group_cols = [group_cols]
+
+    codes, n_groups = _group_codes(df_tmp, group_cols)
+    values = df_tmp[value_col].to_numpy(dtype=float)
+
+    ranks = np.full(len(values), np.nan)
+    percentiles = np.full(len(values), np.nan)
+
+    valid = np.flatnonzero(~np.isnan(values) & (codes >= 0))
+    if len(valid) > 0:
+        valid_codes = codes[valid]
+        valid_values = values[valid]
+
+        # One sort by group and value orders every group for the rank
+        rank_values = valid_values if ascending else -valid_values
+        order = np.lexsort((rank_values, valid_codes))
+        sorted_codes = valid_codes[order]
+        sorted_values = rank_values[order]
+
+        # Dense rank: count the value changes since the start of the group
+        group_start = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+        new_value = group_start | np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+        change_count = np.cumsum(new_value)
+        start_count = np.maximum.accumulate(np.where(group_start, change_count, 0))
+        ranks[valid[order]] = change_count - start_count + 1
+
+        # NTILE(100) on the ascending order: the first (size % 100) tiles hold one extra row
+        group_sizes = np.bincount(sorted_codes, minlength=n_groups)
+        group_first = np.cumsum(group_sizes) - group_sizes
+        position = np.arange(len(sorted_codes)) - group_first[sorted_codes]
+        if not ascending:
+            position = group_sizes[sorted_codes] - 1 - position
+        tile_size, remainder = np.divmod(group_sizes[sorted_codes], 100)
+        large_rows = remainder * (tile_size + 1)
+        tiles = np.where(position < large_rows,
+                         position // (tile_size + 1),
+                         remainder + (position - large_rows) // np.maximum(tile_size, 1))
+        percentiles[valid[order]] = tiles + 1
+
+    df_ranks = df_tmp.copy()
+    df_ranks[value_col + ' Rank'] = ranks
+    df_ranks[value_col + ' Percentile'] = percentiles
+
+    return df_ranks
+
+
+@profile_function
+def select_top_k(df_tmp, value_col, k, group_cols=None, largest=True):
+
+    """
+    Selects the k largest (or smallest) rows of each group with argpartition instead of sorting whole groups.
+
+    Ties at the boundary are resolved by row order like DataFrame.nlargest(keep='first') when no group
+    columns are passed. Rows with missing values are ignored.
+
+    Args:
+        - df_tmp: DataFrame containing the values to select from.
+        - value_col: String representing the column to select on (e.g. 'Cumulative % Return').
+        - k: Integer specifying the number of rows to keep per group.
+        - group_cols: List of columns to select within (e.g. ['Year']). None selects over all rows.
+        - largest: Boolean indicating whether to keep the largest values (top) or the smallest values (bottom).
+
+    Returns:
+        - A DataFrame with the selected rows ordered by group and then by value, with a 'Rank' column (1 to k).
+    """
+
+    if value_col not in df_tmp.columns:
+        raise ValueError(f"Column '{value_col}' does not exist in the DataFrame.")
+
+    if k < 1:
+        raise ValueError("k must be at least 1.")
+
+    if isinstance(group_cols, str):
+        group_cols = [group_cols]
+
+    codes, n_groups = _group_codes(df_tmp, group_cols)
+    values = df_tmp[value_col].to_numpy(dtype=float)
+
+    valid = np.flatnonzero(~np.isnan(values) & (codes >= 0))
+    key_values = values[valid] if not largest else -values[valid]
+
+    # Bring the rows of each group together (stable, so row order is kept within a group)
+    group_order = np.argsort(codes[valid], kind='stable')
+    boundaries = np.searchsorted(codes[valid][group_order], np.arange(n_groups + 1))
+
+    selected = []
+    for group in range(n_groups):
+        members = group_order[boundaries[group]:boundaries[group + 1]]
+        if len(members) == 0:
+            continue
+
+        if len(members) > k:
+            # Partition around the k-th value, then keep every row up to the boundary value in row order
+            member_values = key_values[members]
+            boundary_value = member_values[np.argpartition(member_values, k - 1)[k - 1]]
+            members = members[key_values[members] <= boundary_value]
+            if len(members) > k:
+                below = members[key_values[members] < boundary_value]
+                equal = members[key_values[members] == boundary_value]
+                members = np.concatenate([below, equal[:k - len(below)]])
+
+        # Only the k selected rows are sorted
+        members = members[np.lexsort((members, key_values[members]))]
+        selected.append(valid[members])
+
+    positions = np.concatenate(selected) if selected else np.array([], dtype=np.int64)
+
+    df_top = df_tmp.iloc[positions].copy()
+    df_top['Rank'] = df_top.groupby(group_cols, sort=False, dropna=False).cumcount().to_numpy() + 1 if group_cols \
+        else np.arange(1, len(df_top) + 1)
+
+    return df_top
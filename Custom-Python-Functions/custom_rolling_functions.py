@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling-window risk metrics engine.
+
+Trailing annualized return, volatility, downside volatility, Sharpe and Sortino ratios and beta are calculated from
+running sums: the sum over a window is the difference of two cumulative sums, so every window length costs O(n)
+whatever its size. The max drawdown of each window is exact: the running peaks of every window are calculated on
+strided views of the Closes, in chunks of rows to bound the memory. All Tickers are processed together in one sorted
+array instead of one rolling apply per Ticker.
+"""
+
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from custom_profiling_functions import profile_function
+
+
+# Default trailing windows in trading days: about 3, 6 and 12 months
+DEFAULT_WINDOWS = (63, 126, 252)
+
+# Number of values of the window views processed at once by _window_max_drawdown
+_DRAWDOWN_CHUNK = 2 ** 20
+
+
+def _periods_per_year(period):
+
+    """
+    Returns the number of periods per year of a period type ('Year', 'Quarter', 'Month' or 'Daily').
+    """
+
+    return {'Year': 1, 'Quarter': 4, 'Month': 12}.get(period, 252)
+
+
+def _rolling_sum(values, position, window):
+
+    """
+    Returns the sum of the last window values of each group from a cumulative sum, NaN where the group has fewer
+    than window values so far.
+
+    Args:
+        - values: numpy array of values sorted by group (missing values must already be replaced by 0).
+        - position: numpy array with the position of each value within its group.
+        - window: Integer specifying the window length.
+    """
+
+    cum_sum = np.concatenate([[0.0], np.cumsum(values)])
+    index = np.arange(len(values))
+    start = np.maximum(index + 1 - window, 0)
+
+    return np.where(position >= window - 1, cum_sum[index + 1] - cum_sum[start], np.nan)
+
+
+def _window_max_drawdown(values, window):
+
+    """
+    Returns the largest fall below the running peak within the last window values ending at each position, as a
+    fraction of the peak, NaN for the first window - 1 positions. Windows reaching into the previous group must be
+    masked by the caller.
+    """
+
+    max_drawdown = np.full(len(values), np.nan)
+    if len(values) < window:
+        return max_drawdown
+
+    views = sliding_window_view(values, window)
+    chunk_rows = max(_DRAWDOWN_CHUNK // window, 1)
+    for start in range(0, len(views), chunk_rows):
+        block = views[start:start + chunk_rows]
+
+        # The largest drawdown is the smallest ratio of a value to its running peak, computed in place
+        ratio = np.maximum.accumulate(block, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(block, ratio, out=ratio)
+        max_drawdown[window - 1 + start:window - 1 + start + len(block)] = 1.0 - ratio.min(axis=1)
+
+    return max_drawdown
+
+
+def get_benchmark_returns(df_tmp, benchmark=None):
+
+    """
+    Returns the benchmark return of every row's Date.
+
+    Args:
+        - df_tmp: DataFrame with 'Ticker', 'Date' and 'Close' columns.
+        - benchmark: None for the equal weighted average return of all Tickers on each Date, a Ticker in df_tmp
+          (e.g. 'SPY'), or a Series of decimal returns indexed by Date.
+
+    Returns:
+        - A numpy array of decimal benchmark returns aligned with the rows of df_tmp.
+    """
+
+    if isinstance(benchmark, pd.Series):
+        return df_tmp['Date'].map(benchmark).to_numpy(dtype=float)
+
+    # Returns from the previous Close of the same Ticker in Date order
+    tickers = df_tmp['Ticker'].to_numpy()
+    dates = df_tmp['Date'].to_numpy()
+    order = np.lexsort((dates, pd.factorize(tickers)[0]))
+    returns = pd.Series(df_tmp['Close'].to_numpy(dtype=float)[order])
+    returns = returns.groupby(tickers[order]).pct_change(fill_method=None)
+
+    if benchmark is None:
+        market = returns.groupby(dates[order]).mean()
+    else:
+        is_benchmark = tickers[order] == benchmark
+        if not is_benchmark.any():
+            raise ValueError(f"Benchmark Ticker '{benchmark}' does not exist in the DataFrame.")
+        market = pd.Series(returns.to_numpy()[is_benchmark], index=dates[order][is_benchmark])
+
+    return df_tmp['Date'].map(market).to_numpy(dtype=float)
+
+
+@profile_function
+def calculate_rolling_metrics(df_tmp, windows=DEFAULT_WINDOWS, benchmark=None, risk_free_rate=0.0, period='Daily'):
+
+    """
+    Calculates trailing risk metrics for several window lengths at once, without modifying or copying the input.
+
+    For each window of w periods ending on a row, the metrics use the w returns of the same Ticker in that window
+    (NaN until a Ticker has w returns):
+        - Annualized % Return: the compounded return of the window annualized with the periods per year.
+        - Annualized Volatility and Annualized Downside Volatility: the sample standard deviation of all returns
+          and of the negative returns, annualized like in calculate_return.
+        - Sharpe Ratio and Sortino Ratio: (Annualized % Return - risk_free_rate) divided by the volatility and the
+          downside volatility, 0 when the volatility is 0, like the ratios in Equity-Performance-Analysis.ipynb.
+        - Max % Drawdown: the largest fall of a Close below the highest earlier Close, both within the w + 1 Closes
+          of the window (its returns and its start).
+        - Beta: the covariance of the returns with the benchmark returns divided by the benchmark variance.
+
+    Args:
+        - df_tmp: DataFrame with 'Ticker', 'Date' and 'Close' columns (e.g. df_pricing).
+        - windows: List of window lengths in periods (default 63, 126 and 252 trading days).
+        - benchmark: None for the equal weighted average of all Tickers, a Ticker in df_tmp, or a Series of decimal
+          returns indexed by Date.
+        - risk_free_rate: Float with the annual risk free rate in percent (e.g. 2.5).
+        - period: A string representing the period type of the rows ('Year', 'Quarter', 'Month', or 'Daily').
+
+    Returns:
+        - A DataFrame aligned to the input index with '<w>D Annualized % Return', '<w>D Annualized Volatility',
+          '<w>D Annualized Downside Volatility', '<w>D Sharpe Ratio', '<w>D Sortino Ratio', '<w>D Max % Drawdown'
+          and '<w>D Beta' columns for each window w.
+    """
+
+    missing = [col for col in ['Ticker', 'Date', 'Close'] if col not in df_tmp.columns]
+    if missing:
+        raise ValueError(f"Required columns {missing} are missing.")
+
+    if any(window < 2 for window in windows):
+        raise ValueError("Every window must be at least 2 periods long.")
+
+    no_of_periods = _periods_per_year(period)
+
+    # Row positions in Ticker and Date order, used instead of sorting the DataFrame
+    groups = pd.factorize(df_tmp['Ticker'], sort=True)[0]
+    order = np.lexsort((df_tmp['Date'].to_numpy(), groups))
+    groups = groups[order]
+    close = df_tmp['Close'].to_numpy(dtype=float)[order]
+    market = get_benchmark_returns(df_tmp, benchmark)[order]
+
+    group_start = np.r_[True, groups[1:] != groups[:-1]]
+    position = np.arange(len(groups)) - np.maximum.accumulate(np.where(group_start, np.arange(len(groups)), 0))
+
+    # Returns from the previous Close of the same Ticker, the first row of a Ticker has no return
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret = np.where(group_start, np.nan, close / np.r_[np.nan, close[:-1]] - 1.0)
+    has_ret = ~np.isnan(ret)
+    has_pair = has_ret & ~np.isnan(market)
+    is_negative = has_ret & (ret < 0)
+
+    # Center the returns on their Ticker mean to limit cancellation in the variance formulas
+    ret_mean = pd.Series(ret).groupby(groups).transform('mean').to_numpy()
+    centered = np.where(has_ret, ret - ret_mean, 0.0)
+    log_growth = np.where(has_ret, np.log1p(np.where(has_ret, ret, 0.0)), 0.0)
+    market_paired = np.where(has_pair, market, 0.0)
+    ret_paired = np.where(has_pair, centered, 0.0)
+    market_mean = market_paired.sum() / max(has_pair.sum(), 1)
+    market_centered = np.where(has_pair, market_paired - market_mean, 0.0)
+
+    # The return of the first row of a Ticker is missing, so a window of w returns ends w rows into the Ticker
+    ret_position = position - 1
+
+    results = {}
+    for window in windows:
+        label = f'{window}D '
+
+        count = _rolling_sum(has_ret.astype(float), ret_position, window)
+        complete = count == window
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Annualized compounded return of the window
+            growth = np.exp(_rolling_sum(log_growth, ret_position, window))
+            ann_ret = np.where(complete, growth ** (no_of_periods / window) - 1.0, np.nan)
+
+            # Sample standard deviation of all returns and of the negative returns in the window
+            sum1 = _rolling_sum(centered, ret_position, window)
+            sum2 = _rolling_sum(centered ** 2, ret_position, window)
+            vol = np.sqrt(np.maximum((sum2 - sum1 ** 2 / window) / (window - 1), 0)) * np.sqrt(no_of_periods)
+
+            neg_count = _rolling_sum(is_negative.astype(float), ret_position, window)
+            neg_sum1 = _rolling_sum(np.where(is_negative, centered, 0.0), ret_position, window)
+            neg_sum2 = _rolling_sum(np.where(is_negative, centered ** 2, 0.0), ret_position, window)
+            downside_var = (neg_sum2 - neg_sum1 ** 2 / neg_count) / (neg_count - 1)
+            downside_vol = np.where(neg_count > 1, np.sqrt(np.maximum(downside_var, 0)), np.nan)
+            downside_vol = np.where(neg_count == 0, 0.0, downside_vol) * np.sqrt(no_of_periods)
+
+            # Beta from the running sums of the paired returns
+            pair_count = _rolling_sum(has_pair.astype(float), ret_position, window)
+            sum_r = _rolling_sum(ret_paired, ret_position, window)
+            sum_m = _rolling_sum(market_centered, ret_position, window)
+            sum_rm = _rolling_sum(ret_paired * market_centered, ret_position, window)
+            sum_mm = _rolling_sum(market_centered ** 2, ret_position, window)
+            covariance = sum_rm - sum_r * sum_m / pair_count
+            market_variance = sum_mm - sum_m ** 2 / pair_count
+            beta = np.where((pair_count == window) & (market_variance > 0), covariance / market_variance, np.nan)
+
+            # Largest drawdown within the last w + 1 Closes (the window's returns and its start), only kept for
+            # complete windows, which never reach into the previous Ticker
+            max_drawdown = _window_max_drawdown(close, window + 1)
+
+        ann_ret_pct = ann_ret * 100
+        vol_pct = np.where(complete, vol * 100, np.nan)
+        downside_vol_pct = np.where(complete, downside_vol * 100, np.nan)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = np.where(vol_pct == 0, 0, (ann_ret_pct - risk_free_rate) / vol_pct)
+            sortino = np.where(downside_vol_pct == 0, 0, (ann_ret_pct - risk_free_rate) / downside_vol_pct)
+
+        results[label + 'Annualized % Return'] = np.round(ann_ret_pct, 2)
+        results[label + 'Annualized Volatility'] = np.round(vol_pct, 2)
+        results[label + 'Annualized Downside Volatility'] = np.round(downside_vol_pct, 2)
+        results[label + 'Sharpe Ratio'] = np.where(complete, np.round(sharpe, 2), np.nan)
+        results[label + 'Sortino Ratio'] = np.where(complete, np.round(sortino, 2), np.nan)
+        results[label + 'Max % Drawdown'] = np.where(complete, np.round(max_drawdown * 100, 2), np.nan)
+        results[label + 'Beta'] = np.round(beta, 2)
+
+    # Put the results back in the input row order
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order))
+
+    return pd.DataFrame({col: values[positions] for col, values in results.items()}, index=df_tmp.index)
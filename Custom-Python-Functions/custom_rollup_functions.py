@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+GICS hierarchy rollup of ticker returns (Sector -> Industry_Group -> Industry -> Sub_Industry).
+
+The ticker returns are pivoted once into Date x Ticker matrices and every GICS level is described by a sparse
+Group x Ticker membership matrix. Stacking the membership matrices of all levels lets one sparse matrix product
+return the average returns of every group at every level, with the same definitions as calculate_portfolio_return.
+"""
+
+import os
+import hashlib
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from custom_profiling_functions import profile_function
+
+
+# GICS levels from the top of the hierarchy to the bottom
+GICS_LEVELS = ['Sector', 'Industry_Group', 'Industry', 'Sub_Industry']
+
+# Default location of the GICS source file relative to this folder
+GICS_COMBINED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data-Source-Files',
+                                  'SP500_GICS_Combined.csv')
+
+
+def load_gics_membership(gics_file=None):
+
+    """
+    Loads the Ticker to GICS level membership from SP500_GICS_Combined.csv.
+
+    The same columns can be read from the Equities dimension by joining Equities to Sub_Industries, Industries,
+    Industry_Groups and Sectors, as done in the Sector/Sub_Industry analysis query.
+
+    Args:
+        - gics_file: String with the path of SP500_GICS_Combined.csv (defaults to the Data-Source-Files folder).
+
+    Returns:
+        - A DataFrame with 'Ticker', 'Sector', 'Industry_Group', 'Industry' and 'Sub_Industry' columns.
+    """
+
+    if gics_file is None:
+        gics_file = GICS_COMBINED_FILE
+
+    if not os.path.isfile(gics_file):
+        raise FileNotFoundError(f"GICS file not found: {gics_file}")
+
+    df_gics = pd.read_csv(gics_file, encoding='utf-8-sig')
+
+    return df_gics[['Ticker'] + GICS_LEVELS].drop_duplicates(subset='Ticker').reset_index(drop=True)
+
+
+def _no_of_periods(period):
+
+    """
+    Returns the number of periods in a year for the period type, as used by calculate_portfolio_return.
+    """
+
+    return {'Year': 1, 'Quarter': 4, 'Month': 12}.get(period, 252)
+
+
+def _expanding_std(values, present):
+
+    """
+    Calculates the expanding sample standard deviation down each column of a Date x Group matrix.
+
+    Args:
+        - values: 2D numpy array of values (missing entries are ignored).
+        - present: 2D boolean numpy array marking the entries to include.
+
+    Returns:
+        - tuple: The expanding standard deviation (NaN with fewer than 2 values) and the expanding count.
+    """
+
+    count = np.cumsum(present, axis=0)
+
+    # Center each column before the running sums to limit cancellation in the variance formula
+    filled = np.where(present, values, 0.0)
+    center = filled.sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+    centered = np.where(present, values - center, 0.0)
+
+    sum1 = np.cumsum(centered, axis=0)
+    sum2 = np.cumsum(centered ** 2, axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (sum2 - sum1 ** 2 / count) / (count - 1)
+
+    std = np.sqrt(np.maximum(variance, 0))
+    std[count < 2] = np.nan
+
+    return std, count
+
+
+def _parent_levels(level, columns):
+
+    """
+    Returns the parent GICS levels of a level that are among the columns, from the top of the hierarchy.
+    """
+
+    parents = GICS_LEVELS[:GICS_LEVELS.index(level)] if level in GICS_LEVELS else []
+
+    return [parent for parent in parents if parent in columns]
+
+
+def _membership_fingerprint(df_membership, level):
+
+    """
+    Returns a hash of the Ticker to group mapping of one GICS level and of its parent levels, since the rolled up
+    returns of the level carry the parent groups.
+    """
+
+    columns = ['Ticker'] + _parent_levels(level, df_membership.columns) + [level]
+    rows = df_membership[columns].sort_values(by='Ticker').to_numpy().astype(str)
+    digest = hashlib.sha1()
+    digest.update('\x1f'.join('\x1e'.join(row) for row in rows).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+class GICSRollup:
+
+    """
+    Rolls ticker returns up the GICS hierarchy with sparse membership matrices.
+
+    The Date x Ticker return matrices are built once. update_membership only rebuilds the membership matrices and
+    recalculates the levels whose Ticker to group mapping or parent groups changed, the other levels keep their
+    previous results.
+
+    Args:
+        - df_ret: DataFrame with 'Ticker', 'Date', '<period> % Return' and '<period> Cumulative % Return' columns
+          (the output of calculate_return).
+        - df_membership: DataFrame with 'Ticker' and the GICS level columns (see load_gics_membership).
+        - period: A string representing the period type ('Year', 'Quarter', 'Month', or 'Daily').
+        - weights: Optional Series of weights indexed by Ticker (e.g. market capitalization). Equal weights when None.
+        - levels: List of GICS level columns to roll up (defaults to all four levels).
+    """
+
+    def __init__(self, df_ret, df_membership, period='Daily', weights=None, levels=None):
+
+        self.period = period
+        self.label = '' if period == 'Daily' else period + ' '
+        self.levels = list(GICS_LEVELS if levels is None else levels)
+        self.no_of_periods = _no_of_periods(period)
+
+        return_col = self.label + '% Return'
+        cum_return_col = self.label + 'Cumulative % Return'
+        for col in ['Ticker', 'Date', return_col, cum_return_col]:
+            if col not in df_ret.columns:
+                raise ValueError(f"Column '{col}' does not exist in the DataFrame.")
+
+        # Pivot the returns once into Date x Ticker matrices
+        date_codes, self.dates = pd.factorize(df_ret['Date'], sort=True)
+        ticker_codes, self.tickers = pd.factorize(df_ret['Ticker'], sort=True)
+        shape = (len(self.dates), len(self.tickers))
+
+        self.returns = np.full(shape, np.nan)
+        self.log_cum_returns = np.full(shape, np.nan)
+        self.returns[date_codes, ticker_codes] = df_ret[return_col].to_numpy(dtype=float) / 100
+        self.log_cum_returns[date_codes, ticker_codes] = np.log(1 + df_ret[cum_return_col].to_numpy(dtype=float) / 100)
+
+        # A ticker only counts towards a date when both of its values are present
+        present = ~np.isnan(self.returns) & ~np.isnan(self.log_cum_returns)
+        self.present = present.astype(float)
+        self.returns_filled = np.where(present, self.returns, 0.0)
+        self.log_cum_filled = np.where(present, self.log_cum_returns, 0.0)
+
+        # Period columns (Year, Quarter, Month) of each date
+        period_cols = [col for col in ['Year', 'Quarter', 'Month'] if col in df_ret.columns]
+        self.df_dates = (df_ret[['Date'] + period_cols].drop_duplicates(subset='Date')
+                         .set_index('Date').reindex(self.dates).rename_axis('Date').reset_index())
+
+        self.weights = weights
+        self.results = {}
+        self.fingerprints = {}
+        self.df_membership = None
+
+        self.update_membership(df_membership)
+
+    def _membership_matrix(self, df_membership, level):
+
+        """
+        Builds the sparse Group x Ticker membership matrix of one GICS level.
+        """
+
+        df_tmp = df_membership[['Ticker', level]].dropna()
+        ticker_positions = self.tickers.get_indexer(df_tmp['Ticker'])
+        keep = ticker_positions >= 0
+        group_codes, groups = pd.factorize(df_tmp[level][keep], sort=True)
+        ticker_positions = ticker_positions[keep]
+
+        if self.weights is None:
+            data = np.ones(len(ticker_positions))
+        else:
+            data = self.weights.reindex(self.tickers[ticker_positions]).fillna(0).to_numpy(dtype=float)
+
+        matrix = sparse.csr_matrix((data, (group_codes, ticker_positions)), shape=(len(groups), len(self.tickers)))
+
+        return matrix, groups
+
+    @profile_function
+    def update_membership(self, df_membership):
+
+        """
+        Sets the GICS membership and recalculates the levels whose Ticker to group mapping or parent groups changed.
+
+        Args:
+            - df_membership: DataFrame with 'Ticker' and the GICS level columns.
+
+        Returns:
+            - list: The GICS levels that were recalculated.
+        """
+
+        missing = [col for col in ['Ticker'] + self.levels if col not in df_membership.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} do not exist in the membership DataFrame.")
+
+        df_membership = df_membership.drop_duplicates(subset='Ticker')
+        changed = [level for level in self.levels
+                   if self.fingerprints.get(level) != _membership_fingerprint(df_membership, level)]
+
+        self.df_membership = df_membership
+
+        if not changed:
+            return changed
+
+        # Stack the membership matrices of the changed levels so one product covers all of them
+        matrices = []
+        level_groups = []
+        for level in changed:
+            matrix, groups = self._membership_matrix(df_membership, level)
+            matrices.append(matrix)
+            level_groups.append((level, groups))
+
+        membership = sparse.vstack(matrices).tocsr()
+
+        # Weighted sums and weight totals per Group x Date in one pass over the return matrices
+        weight_totals = membership @ self.present.T
+        return_sums = membership @ self.returns_filled.T
+        log_cum_sums = membership @ self.log_cum_filled.T
+
+        row = 0
+        for level, groups in level_groups:
+            rows = slice(row, row + len(groups))
+            row += len(groups)
+            self.results[level] = self._level_frame(level, groups, weight_totals[rows].T,
+                                                    return_sums[rows].T, log_cum_sums[rows].T)
+            self.fingerprints[level] = _membership_fingerprint(df_membership, level)
+
+        return changed
+
+    def _level_frame(self, level, groups, weight_totals, return_sums, log_cum_sums):
+
+        """
+        Calculates the rolled up returns of one GICS level from its Date x Group sums.
+        """
+
+        present = weight_totals > 0
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_return = np.where(present, return_sums / weight_totals, np.nan)
+            cum_return = np.where(present, np.exp(log_cum_sums / weight_totals) - 1, np.nan)
+
+        # Annualized return from the number of dates with a return so far
+        volatility, count = _expanding_std(avg_return, present)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            annualized_return = (1 + cum_return) ** (self.no_of_periods / count) - 1
+        volatility = volatility * np.sqrt(self.no_of_periods)
+
+        # Downside volatility only uses the negative returns (0 until the first negative return)
+        negative = present & (avg_return < 0)
+        downside_volatility, negative_count = _expanding_std(avg_return, negative)
+        downside_volatility = np.where(negative_count == 0, 0.0, downside_volatility * np.sqrt(self.no_of_periods))
+
+        # Flatten the Date x Group matrices to one row per group and date
+        date_positions, group_positions = np.nonzero(present)
+        order = np.lexsort((date_positions, group_positions))
+        date_positions, group_positions = date_positions[order], group_positions[order]
+
+        df_tmp = pd.DataFrame({level: groups[group_positions]})
+
+        # Parent GICS levels of each group
+        parents = _parent_levels(level, self.df_membership.columns)
+        if parents:
+            df_parents = self.df_membership[parents + [level]].drop_duplicates(subset=level).set_index(level)
+            for parent in parents:
+                df_tmp[parent] = df_parents[parent].reindex(df_tmp[level]).to_numpy()
+            df_tmp = df_tmp[parents + [level]]
+
+        df_dates = self.df_dates.iloc[date_positions].reset_index(drop=True)
+        df_tmp = pd.concat([df_tmp, df_dates], axis=1)
+
+        label = self.label
+        df_tmp[label + '% Return'] = np.round(avg_return[date_positions, group_positions] * 100, 2)
+        df_tmp[label + 'Cumulative % Return'] = np.round(cum_return[date_positions, group_positions] * 100, 2)
+        df_tmp[label + 'Annualized % Return'] = np.round(annualized_return[date_positions, group_positions] * 100, 2)
+        df_tmp[label + 'Annualized Volatility'] = np.round(volatility[date_positions, group_positions] * 100, 2)
+        df_tmp[label + 'Annualized Downside Volatility'] = np.round(
+            downside_volatility[date_positions, group_positions] * 100, 2)
+
+        return df_tmp
+
+    def get_level(self, level):
+
+        """
+        Returns the rolled up returns of one GICS level.
+
+        Args:
+            - level: A string representing the GICS level column ('Sector', 'Industry_Group', 'Industry', 'Sub_Industry').
+
+        Returns:
+            - A DataFrame with one row per group and date, with the parent GICS level columns, the period columns and
+              the '% Return', 'Cumulative % Return', 'Annualized % Return', 'Annualized Volatility' and
+              'Annualized Downside Volatility' columns (prefixed with the period when it is not Daily).
+        """
+
+        if level not in self.results:
+            raise ValueError(f"GICS level '{level}' was not rolled up.")
+
+        return self.results[level].copy()
+
+
+@profile_function
+def calculate_gics_rollup(df_ret, df_membership, period='Daily', weights=None, levels=None):
+
+    """
+    Calculates the portfolio returns of every group of every GICS level in one pass.
+
+    Each group return matches calculate_portfolio_return on the tickers of the group: the average of the ticker
+    returns and the geometric average of the ticker cumulative returns per date.
+
+    Args:
+        - df_ret: DataFrame with 'Ticker', 'Date', '<period> % Return' and '<period> Cumulative % Return' columns.
+        - df_membership: DataFrame with 'Ticker' and the GICS level columns (see load_gics_membership).
+        - period: A string representing the period type ('Year', 'Quarter', 'Month', or 'Daily').
+        - weights: Optional Series of weights indexed by Ticker (e.g. market capitalization). Equal weights when None.
+        - levels: List of GICS level columns to roll up (defaults to all four levels).
+
+    Returns:
+        - dict: GICS level -> DataFrame of rolled up returns (see GICSRollup.get_level).
+    """
+
+    rollup = GICSRollup(df_ret, df_membership, period, weights, levels)
+
+    return {level: rollup.get_level(level) for level in rollup.levels}
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency scheduler for the ETL loads.
+
+Tasks are registered with the tasks they depend on and the inputs they read (files or values such as a load date).
+The scheduler runs every task whose dependencies have finished on a thread pool, so independent loads run at the
+same time, and skips a task when the fingerprint of its inputs and of its dependencies matches the last successful
+run recorded in a JSON state file. The run report marks the critical path, the chain of dependent tasks that sets
+the minimum wall time of the run.
+"""
+
+import os
+import json
+import time
+import hashlib
+import datetime as dt
+import concurrent.futures as cf
+import pandas as pd
+from custom_profiling_functions import profile_function, profile_stage
+
+
+def add_task(tasks, name, func, depends_on=None, inputs=None):
+
+    """
+    Registers a task in a task graph.
+
+    Args:
+        - tasks: Dictionary of tasks (name -> task) the task is added to.
+        - name: String with the unique name of the task.
+        - func: Function called without arguments to run the task.
+        - depends_on: List of task names that must finish before the task starts.
+        - inputs: List of file paths, or functions returning a JSON serializable value, whose changes make the
+          task run again.
+
+    Returns:
+        - The tasks dictionary.
+    """
+
+    if name in tasks:
+        raise ValueError(f"Task '{name}' is already registered.")
+
+    tasks[name] = {
+        'func': func,
+        'depends_on': list(depends_on or []),
+        'inputs': list(inputs or [])
+    }
+
+    return tasks
+
+
+def validate_task_graph(tasks):
+
+    """
+    Checks that every dependency is registered and that the dependencies do not form a cycle.
+
+    Args:
+        - tasks: Dictionary of tasks built with add_task.
+
+    Returns:
+        - A list of the task names in dependency order (registration order among independent tasks).
+    """
+
+    for name, task in tasks.items():
+        unknown = [dep for dep in task['depends_on'] if dep not in tasks]
+        if unknown:
+            raise ValueError(f"Task '{name}' depends on unknown tasks {unknown}.")
+
+    # Kahn's algorithm, taking ready tasks in registration order
+    remaining = {name: len(set(task['depends_on'])) for name, task in tasks.items()}
+    dependents = _task_dependents(tasks)
+    ready = [name for name in tasks if remaining[name] == 0]
+    order = []
+
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for child in dependents[name]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+
+    if len(order) < len(tasks):
+        cycle = [name for name in tasks if name not in order]
+        raise ValueError(f"The dependencies of tasks {cycle} form a cycle.")
+
+    return order
+
+
+def _task_dependents(tasks):
+
+    """
+    Returns the tasks that depend directly on each task, in registration order.
+    """
+
+    dependents = {name: [] for name in tasks}
+    for name, task in tasks.items():
+        for dep in dict.fromkeys(task['depends_on']):
+            dependents[dep].append(name)
+
+    return dependents
+
+
+def file_fingerprint(path):
+
+    """
+    Returns the SHA-256 hash of a file's content, or 'missing' when the file does not exist.
+
+    Args:
+        - path: String with the path of the file.
+
+    Returns:
+        - A hex digest string.
+    """
+
+    if not os.path.isfile(path):
+        return 'missing'
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _task_fingerprint(task, dep_fingerprints):
+
+    """
+    Hashes the fingerprints of a task's inputs together with the fingerprints of its dependencies, so a change
+    upstream also changes the fingerprint of every task downstream.
+    """
+
+    input_values = []
+    for task_input in task['inputs']:
+        if callable(task_input):
+            input_values.append(json.dumps(task_input(), default=str, sort_keys=True))
+        else:
+            input_values.append(file_fingerprint(task_input))
+
+    payload = json.dumps({'inputs': input_values, 'depends_on': dep_fingerprints}, sort_keys=True)
+
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_task_state(state_path):
+
+    """
+    Loads the fingerprints of the last successful run of each task.
+
+    Args:
+        - state_path: String with the path of the JSON state file, or None.
+
+    Returns:
+        - dict: Task name -> dict with 'fingerprint', 'finished' and 'seconds' entries.
+    """
+
+    if (state_path is None) or (not os.path.isfile(state_path)):
+        return {}
+
+    with open(state_path, 'r') as state_file:
+        return json.load(state_file)
+
+
+def _save_task_state(state_path, state):
+
+    """
+    Writes the task state file, replacing it in one step so a crash never leaves a partial file.
+    """
+
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as state_file:
+        json.dump(state, state_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+
+def _run_task(name, func, run_start):
+
+    """
+    Runs one task and returns its start and finish times in seconds since the start of the run and the error
+    raised by the task, if any.
+    """
+
+    start_time = time.perf_counter()
+    error = None
+    try:
+        with profile_stage('ETL task ' + name):
+            func()
+    except Exception as err:
+        error = err
+
+    return start_time - run_start, time.perf_counter() - run_start, error
+
+
+def _critical_path(tasks, order, seconds):
+
+    """
+    Returns the chain of dependent tasks with the largest total run time.
+    """
+
+    path_seconds = {}
+    previous = {}
+    for name in order:
+        deps = tasks[name]['depends_on']
+        best = max(deps, key=lambda dep: path_seconds[dep]) if deps else None
+        path_seconds[name] = seconds[name] + (path_seconds[best] if best else 0.0)
+        previous[name] = best
+
+    if not order:
+        return []
+
+    name = max(order, key=lambda task_name: path_seconds[task_name])
+    path = []
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+
+    return path[::-1]
+
+
+@profile_function
+def run_task_graph(tasks, max_workers=4, state_path=None, force=False):
+
+    """
+    Runs a task graph, starting each task as soon as its dependencies have finished.
+
+    A task is skipped when its fingerprint (its inputs and the fingerprints of its dependencies) matches the last
+    successful run in the state file. When a task fails, the tasks that depend on it are blocked while the
+    independent tasks keep running.
+
+    Args:
+        - tasks: Dictionary of tasks built with add_task.
+        - max_workers: Integer specifying the number of tasks that can run at the same time.
+        - state_path: String with the path of the JSON state file, or None to always run every task.
+        - force: Boolean indicating whether to run every task even when its inputs have not changed.
+
+    Returns:
+        - A DataFrame report with one row per task in dependency order and 'Task', 'Status' ('Ran', 'Skipped',
+          'Failed' or 'Blocked'), 'Start', 'Finish', 'Seconds', 'Critical Path' and 'Error' columns. Start and
+          Finish are seconds since the start of the run.
+    """
+
+    order = validate_task_graph(tasks)
+    dependents = _task_dependents(tasks)
+    state = load_task_state(state_path)
+
+    remaining = {name: set(task['depends_on']) for name, task in tasks.items()}
+    records = {name: {'Task': name, 'Status': 'Blocked', 'Start': None, 'Finish': None, 'Seconds': 0.0,
+                      'Error': None} for name in order}
+    fingerprints = {}
+    blocked = set()
+
+    def _release(name):
+        for child in dependents[name]:
+            remaining[child].discard(name)
+            if not remaining[child] and child not in blocked:
+                ready.append(child)
+
+    def _block(name):
+        for child in dependents[name]:
+            if child not in blocked:
+                blocked.add(child)
+                _block(child)
+
+    run_start = time.perf_counter()
+    ready = [name for name in order if not remaining[name]]
+    running = {}
+
+    with cf.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while ready or running:
+            while ready:
+                name = ready.pop(0)
+                task = tasks[name]
+                fingerprints[name] = _task_fingerprint(task, [fingerprints[dep] for dep in task['depends_on']])
+
+                if (not force) and (state.get(name, {}).get('fingerprint') == fingerprints[name]):
+                    elapsed = time.perf_counter() - run_start
+                    records[name].update({'Status': 'Skipped', 'Start': elapsed, 'Finish': elapsed})
+                    _release(name)
+                    continue
+
+                running[executor.submit(_run_task, name, task['func'], run_start)] = name
+
+            if not running:
+                break
+
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                start, finish, error = future.result()
+                if error is not None:
+                    records[name].update({'Status': 'Failed', 'Start': start, 'Finish': finish,
+                                          'Seconds': finish - start, 'Error': f"{type(error).__name__}: {error}"})
+                    _block(name)
+                    continue
+
+                records[name].update({'Status': 'Ran', 'Start': start, 'Finish': finish, 'Seconds': finish - start})
+                state[name] = {
+                    'fingerprint': fingerprints[name],
+                    'finished': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'seconds': round(finish - start, 4)
+                }
+                if state_path is not None:
+                    _save_task_state(state_path, state)
+                _release(name)
+
+    df_report = pd.DataFrame([records[name] for name in order])
+    path = _critical_path(tasks, order, dict(zip(df_report['Task'], df_report['Seconds'])))
+    df_report['Critical Path'] = df_report['Task'].isin(path)
+    df_report = df_report.round({'Start': 4, 'Finish': 4, 'Seconds': 4})
+
+    return df_report[['Task', 'Status', 'Start', 'Finish', 'Seconds', 'Critical Path', 'Error']]
+
+
+def run_notebook(path, timeout=None):
+
+    """
+    Executes every cell of a notebook in its own kernel, with the notebook's folder as the working directory, so
+    a notebook can be used as a task.
+
+    Args:
+        - path: String with the path of the notebook.
+        - timeout: Integer with the maximum seconds per cell, or None for no limit.
+    """
+
+    # nbformat and nbclient are installed with the notebook package and only needed to run notebook tasks
+    import nbformat
+    from nbclient import NotebookClient
+
+    nb = nbformat.read(path, as_version=4)
+    client = NotebookClient(nb, timeout=timeout, kernel_name='python3',
+                            resources={'metadata': {'path': os.path.dirname(os.path.abspath(path))}})
+    client.execute()
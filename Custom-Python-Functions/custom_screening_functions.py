@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-sectional factor screening engine over the whole universe of tickers.
+
+The daily prices are pivoted once into Date x Ticker matrices and every factor signal is calculated for every ticker
+on every date in one vectorized pass over the matrices: trailing windows are differences of cumulative sums down the
+Date axis and trailing peaks use scipy's maximum_filter1d. The cross-sectional z-scores are calculated across each
+Date row, and the GICS-neutralized percentiles sort each GICS group's columns of the matrices once, instead of
+ranking the tickers date by date. Composite screens select the top N tickers of every date with one argpartition
+over the Date x Ticker matrix of scores.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.ndimage import maximum_filter1d
+from custom_profiling_functions import profile_function
+
+# Trailing windows of the factor signals in trading days: Momentum skips the last month of the 12 months
+FACTOR_WINDOWS = {'Momentum': (252, 21), 'Reversal': 21, 'Volatility': 63, 'Drawdown': 252, 'Volume Trend': (21, 126)}
+
+# Factor signals in the order of the output columns
+FACTORS = list(FACTOR_WINDOWS)
+
+
+def _shift_rows(values, periods):
+
+    """
+    Shifts a Date x Ticker matrix down by a number of Dates, filling the first Dates with NaN.
+    """
+
+    shifted = np.full(values.shape, np.nan)
+    if periods < len(values):
+        shifted[periods:] = values[:len(values) - periods]
+
+    return shifted
+
+
+def _window_sum(values, window):
+
+    """
+    Returns the sum of the last window Dates of each Ticker from a cumulative sum down the Date axis, NaN for the
+    first window - 1 Dates (missing values must already be replaced by 0).
+    """
+
+    cum_sum = np.concatenate([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    sums = np.full(values.shape, np.nan)
+    if window <= len(values):
+        sums[window - 1:] = cum_sum[window:] - cum_sum[:len(values) - window + 1]
+
+    return sums
+
+
+def _window_mean(values, window):
+
+    """
+    Returns the mean of the last window Dates of each Ticker, NaN unless all window values are present.
+    """
+
+    present = ~np.isnan(values)
+    count = _window_sum(present.astype(float), window)
+    total = _window_sum(np.where(present, values, 0.0), window)
+
+    return np.where(count == window, total / window, np.nan)
+
+
+def _trailing_max(values, window):
+
+    """
+    Returns the maximum of the last window Dates (or fewer at the start) of each Ticker.
+    """
+
+    values = np.where(np.isnan(values), -np.inf, values)
+
+    # Shift the window so it ends at each Date instead of being centered on it
+    return maximum_filter1d(values, size=window, axis=0, mode='constant', cval=-np.inf, origin=(window - 1) // 2)
+
+
+def _cross_sectional_zscores(values):
+
+    """
+    Returns the z-scores of a Date x Ticker matrix across the Tickers of each Date (NaN with fewer than 2 values).
+    """
+
+    present = ~np.isnan(values)
+    count = present.sum(axis=1, keepdims=True)
+    filled = np.where(present, values, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=1, keepdims=True) / count
+        centered = np.where(present, values - mean, 0.0)
+        std = np.sqrt((centered ** 2).sum(axis=1, keepdims=True) / (count - 1))
+        zscores = np.where(present & (count > 1) & (std > 0), centered / std, np.nan)
+
+    return zscores
+
+
+def _group_percentiles(values, group_codes):
+
+    """
+    Returns the percentile of each value among the Tickers of its group on the same Date, with 100 for the largest
+    value of the group. Ties are ordered by Ticker.
+
+    Args:
+        - values: Date x Ticker matrix of factor values.
+        - group_codes: numpy array with the group code of each Ticker column.
+    """
+
+    percentiles = np.full(values.shape, np.nan)
+    rows = np.arange(values.shape[0])[:, None]
+
+    for group in np.unique(group_codes):
+        columns = np.flatnonzero(group_codes == group)
+        sub = values[:, columns]
+
+        # One row-wise sort of the group's columns ranks it on every Date, with the missing values sorted last
+        order = np.argsort(sub, axis=1, kind='stable')
+        ranks = np.empty(sub.shape)
+        ranks[rows, order] = np.arange(1, len(columns) + 1)
+        count = (~np.isnan(sub)).sum(axis=1, keepdims=True)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percentiles[:, columns] = np.where(np.isnan(sub), np.nan, ranks / count * 100)
+
+    return percentiles
+
+
+class FactorScreen:
+
+    """
+    Factor signals, cross-sectional z-scores and GICS-neutralized percentiles of every Ticker on every Date.
+
+    The factor signals are calculated from the Date x Ticker matrices of the Close prices and Volumes (NaN when a
+    Ticker has no price on a Date or too short a history):
+        - Momentum: the % return from 12 months (252 Dates) to 1 month (21 Dates) before the Date.
+        - Reversal: minus the % return of the last month, so the recent losers score highest.
+        - Volatility: the annualized volatility of the daily returns of the last 63 Dates.
+        - Drawdown: the % fall of the Close below its highest Close of the last 252 Dates (0 at a new high).
+        - Volume Trend: the % change of the average Volume of the last 21 Dates over the last 126 Dates.
+
+    Args:
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Close' and 'Volume' columns (e.g. df_pricing).
+        - df_membership: Optional DataFrame with 'Ticker' and the GICS level column to neutralize the ranks by (see
+          load_gics_membership). Without it the percentiles are ranked over all Tickers.
+        - level: A string representing the GICS level column ('Sector', 'Industry_Group', 'Industry', 'Sub_Industry').
+        - windows: Dictionary of factor -> trailing window(s) in Dates, overriding FACTOR_WINDOWS.
+    """
+
+    def __init__(self, df_pricing, df_membership=None, level='Sector', windows=None):
+
+        missing = [col for col in ['Ticker', 'Date', 'Close', 'Volume'] if col not in df_pricing.columns]
+        if missing:
+            raise ValueError(f"Required columns {missing} are missing.")
+
+        self.windows = dict(FACTOR_WINDOWS, **(windows or {}))
+        self.level = level if df_membership is not None else None
+
+        # Pivot the prices once into Date x Ticker matrices
+        date_codes, self.dates = pd.factorize(df_pricing['Date'], sort=True)
+        ticker_codes, self.tickers = pd.factorize(df_pricing['Ticker'], sort=True)
+        shape = (len(self.dates), len(self.tickers))
+
+        close = np.full(shape, np.nan)
+        volume = np.full(shape, np.nan)
+        close[date_codes, ticker_codes] = df_pricing['Close'].to_numpy(dtype=float)
+        volume[date_codes, ticker_codes] = df_pricing['Volume'].to_numpy(dtype=float)
+        self.present = ~np.isnan(close)
+
+        # GICS group of each Ticker column, the Tickers without a group are ranked together
+        if df_membership is None:
+            self.groups = None
+            self.group_codes = np.zeros(len(self.tickers), dtype=np.int64)
+        else:
+            if level not in df_membership.columns:
+                raise ValueError(f"Column '{level}' does not exist in the membership DataFrame.")
+            df_groups = df_membership.drop_duplicates(subset='Ticker').set_index('Ticker')[level]
+            self.groups = df_groups.reindex(self.tickers).to_numpy()
+            self.group_codes = pd.factorize(self.groups, sort=True, use_na_sentinel=True)[0].astype(np.int64)
+
+        self.factors = self._factor_signals(close, volume)
+        self._zscores = {}
+        self._percentiles = {}
+
+    def _factor_signals(self, close, volume):
+
+        """
+        Calculates the Date x Ticker matrix of every factor signal in percent.
+        """
+
+        long_window, skip_window = self.windows['Momentum']
+        short_volume, long_volume = self.windows['Volume Trend']
+        vol_window = self.windows['Volatility']
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            momentum = _shift_rows(close, skip_window) / _shift_rows(close, long_window) - 1
+            reversal = 1 - close / _shift_rows(close, self.windows['Reversal'])
+
+            # Center the returns on their Ticker mean to limit cancellation in the variance formula
+            returns = close / _shift_rows(close, 1) - 1
+            present = ~np.isnan(returns)
+            centered = np.where(present, returns - np.nanmean(np.where(present, returns, np.nan), axis=0), 0.0)
+            count = _window_sum(present.astype(float), vol_window)
+            sum1 = _window_sum(centered, vol_window)
+            sum2 = _window_sum(centered ** 2, vol_window)
+            variance = np.maximum((sum2 - sum1 ** 2 / vol_window) / (vol_window - 1), 0)
+            volatility = np.where(count == vol_window, np.sqrt(variance) * np.sqrt(252), np.nan)
+
+            peak = _trailing_max(close, self.windows['Drawdown'])
+            drawdown = np.where(self.present & (peak > 0), close / peak - 1, np.nan)
+
+            volume_trend = _window_mean(volume, short_volume) / _window_mean(volume, long_volume) - 1
+
+        factors = {'Momentum': momentum, 'Reversal': reversal, 'Volatility': volatility, 'Drawdown': drawdown,
+                   'Volume Trend': volume_trend}
+
+        # Only the Dates a Ticker has a price on are screened
+        return {factor: np.where(self.present, values * 100, np.nan) for factor, values in factors.items()}
+
+    def _check_factor(self, factor):
+
+        """
+        Raises a ValueError for an unknown factor.
+        """
+
+        if factor not in self.factors:
+            raise ValueError(f"Unknown factor '{factor}', expected one of {', '.join(FACTORS)}.")
+
+    def zscores(self, factor):
+
+        """
+        Returns the Date x Ticker matrix of the cross-sectional z-scores of a factor over all Tickers of each Date.
+        """
+
+        self._check_factor(factor)
+        if factor not in self._zscores:
+            self._zscores[factor] = _cross_sectional_zscores(self.factors[factor])
+
+        return self._zscores[factor]
+
+    def percentiles(self, factor):
+
+        """
+        Returns the Date x Ticker matrix of the percentiles of a factor within the GICS group of each Ticker on each
+        Date (100 for the largest value of the group).
+        """
+
+        self._check_factor(factor)
+        if factor not in self._percentiles:
+            self._percentiles[factor] = _group_percentiles(self.factors[factor], self.group_codes)
+
+        return self._percentiles[factor]
+
+    def _flatten(self, columns):
+
+        """
+        Flattens Date x Ticker matrices to one row per Ticker and Date with a price, sorted by Ticker and Date.
+        """
+
+        ticker_positions, date_positions = np.nonzero(self.present.T)
+
+        df_tmp = pd.DataFrame({'Ticker': self.tickers[ticker_positions], 'Date': self.dates[date_positions]})
+        if self.level is not None:
+            df_tmp[self.level] = self.groups[ticker_positions]
+        for col, values in columns.items():
+            df_tmp[col] = values[date_positions, ticker_positions]
+
+        return df_tmp
+
+    def frame(self, factors=None):
+
+        """
+        Returns the factor signals, z-scores and percentiles in one row per Ticker and Date.
+
+        Args:
+            - factors: List of factors to include (defaults to all of them).
+
+        Returns:
+            - A DataFrame with 'Ticker', 'Date', the GICS level column when there is a membership, and '<factor>',
+              '<factor> Z-Score' and '<factor> Percentile' columns for each factor.
+        """
+
+        factors = FACTORS if factors is None else factors
+
+        columns = {}
+        for factor in factors:
+            self._check_factor(factor)
+            columns[factor] = np.round(self.factors[factor], 2)
+            columns[factor + ' Z-Score'] = np.round(self.zscores(factor), 2)
+            columns[factor + ' Percentile'] = np.round(self.percentiles(factor), 2)
+
+        return self._flatten(columns)
+
+    def scores(self, weights, neutralize=True):
+
+        """
+        Returns the Date x Ticker matrix of the composite scores of a screen.
+
+        Args:
+            - weights: Dictionary of factor -> weight (e.g. {'Momentum': 1, 'Volatility': -0.5}).
+            - neutralize: Boolean indicating whether to combine the GICS-neutralized percentiles, centered on 0,
+              instead of the cross-sectional z-scores.
+
+        Returns:
+            - A Date x Ticker numpy array, NaN where a weighted factor is missing.
+        """
+
+        if not weights:
+            raise ValueError("At least one factor weight is required.")
+
+        score = np.zeros((len(self.dates), len(self.tickers)))
+        for factor, weight in weights.items():
+            self._check_factor(factor)
+            values = (self.percentiles(factor) - 50) / 100 if neutralize else self.zscores(factor)
+            score = score + weight * values
+
+        return score
+
+    def screen(self, weights, top_n=20, neutralize=True):
+
+        """
+        Selects the top N Tickers of every Date by the composite score of the weighted factors.
+
+        Args:
+            - weights: Dictionary of factor -> weight (e.g. {'Momentum': 1, 'Volatility': -0.5}).
+            - top_n: Integer specifying the number of Tickers to keep per Date.
+            - neutralize: Boolean indicating whether to combine the GICS-neutralized percentiles instead of the
+              cross-sectional z-scores.
+
+        Returns:
+            - A DataFrame with one row per selected Ticker and Date ordered by 'Date' and 'Rank' (1 to top_n), with
+              'Date', 'Ticker', the GICS level column, 'Composite Score' and the weighted factor columns.
+        """
+
+        if top_n < 1:
+            raise ValueError("top_n must be at least 1.")
+
+        score = self.scores(weights, neutralize)
+        top_n = min(top_n, len(self.tickers))
+
+        # Partition every Date row around its top_n-th score, then sort only the selected Tickers of each Date
+        keys = np.where(np.isnan(score), np.inf, -score)
+        selected = np.argpartition(keys, top_n - 1, axis=1)[:, :top_n] if top_n < len(self.tickers) else \
+            np.tile(np.arange(len(self.tickers)), (len(self.dates), 1))
+        rows = np.arange(len(self.dates))[:, None]
+        selected = selected[rows, np.lexsort((selected, keys[rows, selected]), axis=1)]
+
+        date_positions = np.repeat(np.arange(len(self.dates)), top_n)
+        ticker_positions = selected.ravel()
+        ranks = np.tile(np.arange(1, top_n + 1), len(self.dates))
+        keep = ~np.isnan(score[date_positions, ticker_positions])
+        date_positions, ticker_positions, ranks = date_positions[keep], ticker_positions[keep], ranks[keep]
+
+        df_top = pd.DataFrame({'Date': self.dates[date_positions], 'Ticker': self.tickers[ticker_positions]})
+        if self.level is not None:
+            df_top[self.level] = self.groups[ticker_positions]
+        df_top['Composite Score'] = np.round(score[date_positions, ticker_positions], 4)
+        df_top['Rank'] = ranks
+        for factor in weights:
+            df_top[factor] = np.round(self.factors[factor][date_positions, ticker_positions], 2)
+
+        return df_top
+
+
+@profile_function
+def calculate_factor_screen(df_pricing, weights, top_n=20, df_membership=None, level='Sector', neutralize=True):
+
+    """
+    Calculates the factor signals of every Ticker on every Date and selects the top N Tickers of each Date.
+
+    Args:
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Close' and 'Volume' columns.
+        - weights: Dictionary of factor -> weight of the composite score (see FactorScreen for the factors).
+        - top_n: Integer specifying the number of Tickers to keep per Date.
+        - df_membership: Optional DataFrame with 'Ticker' and the GICS level column to neutralize the ranks by.
+        - level: A string representing the GICS level column ('Sector', 'Industry_Group', 'Industry', 'Sub_Industry').
+        - neutralize: Boolean indicating whether to combine the GICS-neutralized percentiles instead of the
+          cross-sectional z-scores.
+
+    Returns:
+        - A DataFrame with the top N Tickers of each Date (see FactorScreen.screen).
+    """
+
+    return FactorScreen(df_pricing, df_membership, level).screen(weights, top_n, neutralize)
@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP service answering the bars, returns, statistics, drawdowns and rankings of the Tickers and GICS groups.
+
+A MetricsStore keeps the daily price panel in memory and calculates the period bars, returns and the other metrics of
+a period and level with the function library the first time they are asked for, then keeps them. Every response is
+cached by the data version (a fingerprint of the prices and the GICS membership) and the normalized request, so a
+repeated request is answered from the cache until new prices are loaded. The server uses HTTP/1.1 keep-alive so a
+client reuses its connection, and run_load_test measures the requests per second and latency percentiles.
+"""
+
+import json
+import time
+import hashlib
+import threading
+import collections
+import urllib.parse
+import http.client
+import http.server
+import concurrent.futures
+import pandas as pd
+import numpy as np
+import sqlalchemy as sa
+from custom_profiling_functions import profile_function
+from custom_python_functions import get_pricing_data, calculate_return_columns, calculate_stats
+from custom_python_functions import calculate_drawdown_columns
+from custom_ranking_functions import calculate_ranks
+from custom_rollup_functions import GICS_LEVELS, calculate_gics_rollup
+from custom_cache_functions import frame_fingerprint
+from custom_period_functions import PeriodTable
+
+
+# Period types served
+SERVICE_PERIODS = ('Year', 'Quarter', 'Month', 'Daily')
+
+# Endpoints answered by the service
+ENDPOINTS = ('bars', 'returns', 'stats', 'drawdowns', 'rankings')
+
+# Query parameters accepted by every endpoint
+QUERY_PARAMETERS = ('period', 'level', 'name', 'ticker', 'start', 'end', 'metric', 'top', 'limit')
+
+# Maximum number of rows returned when the request has no limit
+DEFAULT_LIMIT = 10000
+
+# Period columns that the rankings are calculated within
+_RANK_GROUPS = {'Year': ['Year'], 'Quarter': ['Year', 'Quarter'], 'Month': ['Year', 'Month'], 'Daily': ['Date']}
+
+
+def read_service_prices(engine, schema='Equities'):
+
+    """
+    Reads the daily prices of every Ticker from Yahoo_Equity_Prices joined with Equities.
+
+    Args:
+        - engine: SQLAlchemy Engine of the data warehouse.
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+
+    Returns:
+        - A DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+    """
+
+    prices = sa.table('Yahoo_Equity_Prices', sa.column('Ticker_ID'), sa.column('Date'), sa.column('Open'),
+                      sa.column('High'), sa.column('Low'), sa.column('Close'), sa.column('Volume'), schema=schema)
+    equities = sa.table('Equities', sa.column('Ticker_ID'), sa.column('Ticker'), schema=schema)
+
+    stmt = (sa.select(sa.func.trim(equities.c.Ticker).label('Ticker'), prices.c.Date, prices.c.Open, prices.c.High,
+                      prices.c.Low, prices.c.Close, prices.c.Volume)
+            .select_from(prices.join(equities, prices.c.Ticker_ID == equities.c.Ticker_ID)))
+
+    with engine.connect() as conn:
+        return pd.read_sql(stmt, conn)
+
+
+class MetricsStore:
+
+    """
+    In-memory price panel with the derived metrics of every period and level calculated on first use.
+
+    Args:
+        - df_pricing: DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+        - df_membership: DataFrame with 'Ticker' and the GICS level columns (see load_gics_membership), or None to
+          only serve the Ticker level.
+        - cache_size: Integer with the number of responses kept in the response cache.
+    """
+
+    def __init__(self, df_pricing, df_membership=None, cache_size=1024):
+
+        self.cache_size = cache_size
+        self.responses = collections.OrderedDict()
+        self.cache_stats = {'Hits': 0, 'Misses': 0, 'Evictions': 0}
+        self._lock = threading.RLock()
+        self._response_lock = threading.Lock()
+
+        self.load(df_pricing, df_membership)
+
+    @profile_function
+    def load(self, df_pricing, df_membership=None):
+
+        """
+        Replaces the price panel and the membership. The derived metrics and cached responses are dropped when the
+        data version changes.
+
+        Args:
+            - df_pricing: DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+            - df_membership: DataFrame with 'Ticker' and the GICS level columns, or None.
+
+        Returns:
+            - String with the data version.
+        """
+
+        missing = [col for col in ['Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+                   if col not in df_pricing.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} do not exist in the pricing DataFrame.")
+
+        df_pricing = df_pricing.copy()
+        df_pricing['Date'] = pd.to_datetime(df_pricing['Date'])
+        df_pricing['Year'] = df_pricing['Date'].dt.year
+        df_pricing = df_pricing.sort_values(by=['Ticker', 'Date'], ignore_index=True)
+
+        digest = hashlib.sha1(frame_fingerprint(df_pricing).encode('utf-8'))
+        if df_membership is not None:
+            df_membership = df_membership.drop_duplicates(subset='Ticker').reset_index(drop=True)
+            digest.update(frame_fingerprint(df_membership).encode('utf-8'))
+        version = digest.hexdigest()[:16]
+
+        with self._lock:
+            if getattr(self, 'version', None) == version:
+                return version
+
+            self.df_pricing = df_pricing
+            self.df_membership = df_membership
+            self.levels = ['Ticker'] + ([level for level in GICS_LEVELS if level in df_membership.columns]
+                                        if df_membership is not None else [])
+            self.derived = {}
+            self.version = version
+
+        # Responses of the previous version can no longer be hit, drop them to free the memory
+        with self._response_lock:
+            self.responses.clear()
+
+        return version
+
+    def _derive(self, key, calculate):
+
+        """
+        Returns a derived DataFrame of the current version, calculating it once.
+        """
+
+        with self._lock:
+            if key not in self.derived:
+                self.derived[key] = calculate()
+
+            return self.derived[key]
+
+    def bars(self, period):
+
+        """
+        Returns the price bars of every Ticker for a period ('Daily' returns the daily prices).
+        """
+
+        if period == 'Daily':
+            return self.df_pricing
+
+        return self._derive(('bars', period), lambda: get_pricing_data(self.df_pricing, period))
+
+    def returns(self, period, level='Ticker'):
+
+        """
+        Returns the period returns of every Ticker, or of every group of a GICS level rolled up from the Tickers.
+        """
+
+        def calculate():
+            if level == 'Ticker':
+                df_bars = self.bars(period)
+                return pd.concat([df_bars, calculate_return_columns(df_bars, period)], axis=1)
+            return calculate_gics_rollup(self.returns(period), self.df_membership, period, levels=[level])[level]
+
+        return self._derive(('returns', period, level), calculate)
+
+    def stats(self, period, level='Ticker'):
+
+        """
+        Returns the return statistics of every Ticker or GICS group (by Year for the periods shorter than a Year).
+        """
+
+        def calculate():
+            returns = {'Year': self.returns('Year', level), period: self.returns(period, level)}
+            return calculate_stats(PeriodTable(returns, level), level, period)
+
+        return self._derive(('stats', period, level), calculate)
+
+    def drawdowns(self, period, level='Ticker'):
+
+        """
+        Returns the drawdowns of the cumulative returns of every Ticker or GICS group.
+        """
+
+        def calculate():
+            df_ret = self.returns(period, level)
+            keys = [col for col in [level, 'Date', 'Year', 'Quarter', 'Month'] if col in df_ret.columns]
+            return pd.concat([df_ret[keys], calculate_drawdown_columns(df_ret, level, period)], axis=1)
+
+        return self._derive(('drawdowns', period, level), calculate)
+
+    def rankings(self, period, level='Ticker', metric='% Return'):
+
+        """
+        Returns the dense rank and percentile of a return metric of every Ticker or GICS group within each period.
+        """
+
+        label = '' if period == 'Daily' else period + ' '
+
+        def calculate():
+            df_ret = self.returns(period, level)
+            if label + metric not in df_ret.columns:
+                raise ValueError(f"Invalid metric: {metric}.")
+            keys = [col for col in [level, 'Date', 'Year', 'Quarter', 'Month'] if col in df_ret.columns]
+            return calculate_ranks(df_ret[keys + [label + metric]], label + metric, _RANK_GROUPS[period])
+
+        return self._derive(('rankings', period, level, metric), calculate)
+
+    def _normalize(self, endpoint, params):
+
+        """
+        Validates the query parameters of a request and fills in the defaults.
+        """
+
+        if endpoint not in ENDPOINTS:
+            raise KeyError(endpoint)
+
+        unknown = [name for name in params if name not in QUERY_PARAMETERS]
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+        request = {
+            'period': params.get('period', 'Year'),
+            'level': params.get('level', 'Ticker'),
+            'name': params.get('name', params.get('ticker')),
+            'start': params.get('start'),
+            'end': params.get('end'),
+            'metric': params.get('metric', '% Return'),
+            'top': params.get('top'),
+            'limit': params.get('limit', str(DEFAULT_LIMIT))
+        }
+
+        if request['period'] not in SERVICE_PERIODS:
+            raise ValueError(f"Invalid period: {request['period']}. Must be one of {', '.join(SERVICE_PERIODS)}.")
+        if request['level'] not in self.levels:
+            raise ValueError(f"Invalid level: {request['level']}. Must be one of {', '.join(self.levels)}.")
+        if ('ticker' in params) and (request['level'] != 'Ticker'):
+            raise ValueError("The ticker parameter only applies to the Ticker level, use name for GICS groups.")
+        if (endpoint == 'bars') and (request['level'] != 'Ticker'):
+            raise ValueError("Bars are only available for the Ticker level.")
+
+        for name in ['top', 'limit']:
+            if request[name] is not None:
+                if not request[name].isdigit() or int(request[name]) < 1:
+                    raise ValueError(f"Invalid {name}: {request[name]}. Must be a positive integer.")
+                request[name] = int(request[name])
+
+        for name in ['start', 'end']:
+            if request[name] is not None:
+                try:
+                    request[name] = pd.Timestamp(request[name]).strftime('%Y-%m-%d')
+                except ValueError:
+                    raise ValueError(f"Invalid {name} date: {request[name]}.")
+
+        if request['name'] is not None:
+            request['name'] = ','.join(sorted(set(request['name'].split(','))))
+
+        if endpoint != 'rankings':
+            request['metric'] = None
+            request['top'] = None
+
+        return request
+
+    def query(self, endpoint, request):
+
+        """
+        Returns the rows of an endpoint selected by a normalized request.
+
+        Args:
+            - endpoint: String with the endpoint ('bars', 'returns', 'stats', 'drawdowns' or 'rankings').
+            - request: dict of normalized query parameters (see handle).
+
+        Returns:
+            - A DataFrame of the selected rows.
+        """
+
+        period, level = request['period'], request['level']
+
+        if endpoint == 'bars':
+            df_tmp = self.bars(period)
+        elif endpoint == 'rankings':
+            df_tmp = self.rankings(period, level, request['metric'])
+        else:
+            df_tmp = getattr(self, endpoint)(period, level)
+
+        keep = np.ones(len(df_tmp), dtype=bool)
+        if request['name'] is not None:
+            keep &= df_tmp[level].isin(request['name'].split(',')).to_numpy()
+        if ('Date' in df_tmp.columns) and (request['start'] is not None):
+            keep &= (df_tmp['Date'] >= request['start']).to_numpy()
+        if ('Date' in df_tmp.columns) and (request['end'] is not None):
+            keep &= (df_tmp['Date'] <= request['end']).to_numpy()
+        if (endpoint == 'rankings') and (request['top'] is not None):
+            label = '' if period == 'Daily' else period + ' '
+            keep &= (df_tmp[label + request['metric'] + ' Rank'] <= request['top']).to_numpy()
+
+        return df_tmp[keep]
+
+    def handle(self, path):
+
+        """
+        Answers a request path with its query string, from the response cache when the same request was answered
+        for the current data version.
+
+        Args:
+            - path: String with the request path, e.g. '/returns?period=Year&ticker=MSFT'.
+
+        Returns:
+            - tuple: HTTP status code, JSON response body as bytes and the data version.
+        """
+
+        url = urllib.parse.urlsplit(path)
+        endpoint = url.path.strip('/')
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        if endpoint in ('', 'version'):
+            return 200, self._status_body(), self.version
+        if endpoint == 'cache':
+            return 200, json.dumps(self.cache_summary()).encode('utf-8'), self.version
+
+        try:
+            request = self._normalize(endpoint, params)
+        except KeyError:
+            return 404, json.dumps({'error': f"Unknown endpoint: {endpoint}"}).encode('utf-8'), self.version
+        except ValueError as err:
+            return 400, json.dumps({'error': str(err)}).encode('utf-8'), self.version
+
+        version = self.version
+        key = (version, endpoint) + tuple(sorted(request.items()))
+        with self._response_lock:
+            body = self.responses.get(key)
+            if body is not None:
+                self.responses.move_to_end(key)
+                self.cache_stats['Hits'] += 1
+                return 200, body, version
+            self.cache_stats['Misses'] += 1
+
+        try:
+            df_tmp = self.query(endpoint, request)
+        except ValueError as err:
+            return 400, json.dumps({'error': str(err)}).encode('utf-8'), version
+
+        truncated = len(df_tmp) > request['limit']
+        df_tmp = df_tmp.iloc[:request['limit']]
+        header = json.dumps({'version': version, 'endpoint': endpoint, 'request': request, 'rows': len(df_tmp),
+                             'truncated': truncated})
+        body = (header[:-1] + ', "data": ' + df_tmp.to_json(orient='records', date_format='iso') + '}').encode('utf-8')
+
+        with self._response_lock:
+            # Only cache the response when no new prices were loaded while it was calculated
+            if version == self.version:
+                self.responses[key] = body
+                if len(self.responses) > self.cache_size:
+                    self.responses.popitem(last=False)
+                    self.cache_stats['Evictions'] += 1
+
+        return 200, body, version
+
+    def _status_body(self):
+
+        """
+        Returns the data version, the size of the panel and the served levels as a JSON body.
+        """
+
+        return json.dumps({
+            'version': self.version,
+            'tickers': int(self.df_pricing['Ticker'].nunique()),
+            'rows': int(len(self.df_pricing)),
+            'first_date': self.df_pricing['Date'].min().strftime('%Y-%m-%d'),
+            'last_date': self.df_pricing['Date'].max().strftime('%Y-%m-%d'),
+            'levels': self.levels,
+            'periods': list(SERVICE_PERIODS),
+            'endpoints': list(ENDPOINTS)
+        }).encode('utf-8')
+
+    def cache_summary(self):
+
+        """
+        Returns the hits, misses, evictions, entries and size of the response cache and the derived metrics held.
+        """
+
+        with self._response_lock:
+            calls = self.cache_stats['Hits'] + self.cache_stats['Misses']
+            return {
+                'Version': self.version,
+                'Hits': self.cache_stats['Hits'],
+                'Misses': self.cache_stats['Misses'],
+                'Hit Rate': round(self.cache_stats['Hits'] / calls, 4) if calls else None,
+                'Evictions': self.cache_stats['Evictions'],
+                'Entries': len(self.responses),
+                'Cached MB': round(sum(len(body) for body in self.responses.values()) / (1024 ** 2), 3),
+                'Derived': len(self.derived)
+            }
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    """
+    Answers GET requests from the MetricsStore of the server, keeping the connection open between requests.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # The headers and the body are written separately, without TCP_NODELAY every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+
+        status, body, version = self.server.store.handle(self.path)
+
+        # The data version identifies the content of a response, so an unchanged response is not sent again
+        etag = '"' + version + '-' + hashlib.sha1(self.path.encode('utf-8')).hexdigest()[:12] + '"'
+        if (status == 200) and (self.headers.get('If-None-Match') == etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_metrics_server(store, host='localhost', port=8050, verbose=False):
+
+    """
+    Creates a threaded HTTP server answering the requests from a MetricsStore.
+
+    Args:
+        - store: The MetricsStore to serve.
+        - host: String with the host name to bind to.
+        - port: Integer with the port number (0 picks a free port).
+        - verbose: Boolean indicating whether to log every request.
+
+    Returns:
+        - ThreadingHTTPServer: Call serve_forever() to start answering requests and shutdown() to stop.
+    """
+
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    server.verbose = verbose
+
+    return server
+
+
+def _load_test_worker(host, port, paths, n_requests, timeout):
+
+    """
+    Sends requests over one keep-alive connection and returns the latency of each and the number of errors.
+    """
+
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        for number in range(n_requests):
+            path = paths[number % len(paths)]
+            start_time = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=timeout)
+            latencies.append(time.perf_counter() - start_time)
+    finally:
+        conn.close()
+
+    return latencies, errors
+
+
+def run_load_test(base_url, paths, n_requests=1000, concurrency=8, timeout=30):
+
+    """
+    Sends requests to the metrics service from concurrent clients, each reusing one keep-alive connection.
+
+    Args:
+        - base_url: String with the URL of the service, e.g. 'http://localhost:8050'.
+        - paths: List of request paths sent in turn by every client.
+        - n_requests: Integer with the total number of requests.
+        - concurrency: Integer with the number of concurrent clients.
+        - timeout: Number of seconds to wait for a response.
+
+    Returns:
+        - dict: 'Requests', 'Errors', 'Seconds', 'Requests per Second' and the 'p50 ms', 'p95 ms', 'p99 ms' and
+          'Max ms' latencies.
+    """
+
+    if not paths:
+        raise ValueError("At least one path is required.")
+
+    url = urllib.parse.urlsplit(base_url)
+    requests_per_client = [n_requests // concurrency + (1 if client < n_requests % concurrency else 0)
+                           for client in range(concurrency)]
+
+    start_time = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Every client starts at a different path so the mix is the same at any moment
+        futures = [executor.submit(_load_test_worker, url.hostname, url.port, paths[client % len(paths):] +
+                                   paths[:client % len(paths)], count, timeout)
+                   for client, count in enumerate(requests_per_client) if count > 0]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start_time
+
+    latencies = np.concatenate([np.asarray(result[0]) for result in results]) * 1000
+
+    return {
+        'Requests': int(len(latencies)),
+        'Errors': int(sum(result[1] for result in results)),
+        'Seconds': round(elapsed, 3),
+        'Requests per Second': round(len(latencies) / elapsed, 1),
+        'p50 ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95 ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99 ms': round(float(np.percentile(latencies, 99)), 3),
+        'Max ms': round(float(latencies.max()), 3)
+    }
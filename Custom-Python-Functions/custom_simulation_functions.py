@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo simulation of forward-looking portfolio outcomes.
+
+Daily portfolio returns are either block bootstrapped from the historical returns of the price panel, which keeps
+the correlation between Tickers and the short term autocorrelation of each block, or drawn from a normal
+distribution with the mean and covariance matrix of the Ticker returns. Paths are simulated in chunks of NumPy
+arrays so memory is bounded by the chunk size, and only the terminal value and the maximum drawdown of each path
+are kept to calculate percentiles, drawdown probabilities, VaR and CVaR.
+"""
+
+import pandas as pd
+import numpy as np
+from custom_profiling_functions import profile_function
+
+
+def build_return_matrix(df_tmp, tickers=None):
+
+    """
+    Builds the matrix of daily decimal returns of each Ticker on the Dates where every Ticker has a return.
+
+    Args:
+        - df_tmp: DataFrame with 'Ticker', 'Date' and 'Close' columns (e.g. df_pricing).
+        - tickers: List of Tickers to include (defaults to every Ticker).
+
+    Returns:
+        - A DataFrame of returns indexed by Date with one column per Ticker.
+    """
+
+    missing = [col for col in ['Ticker', 'Date', 'Close'] if col not in df_tmp.columns]
+    if missing:
+        raise ValueError(f"Required columns {missing} are missing.")
+
+    df_close = df_tmp.pivot_table(index='Date', columns='Ticker', values='Close', aggfunc='last').sort_index()
+    if tickers is not None:
+        unknown = [ticker for ticker in tickers if ticker not in df_close.columns]
+        if unknown:
+            raise ValueError(f"Tickers {unknown} do not exist in the DataFrame.")
+        df_close = df_close[list(tickers)]
+
+    # Only Dates where every Ticker has a return keep the correlation between Tickers consistent
+    return df_close.pct_change(fill_method=None).iloc[1:].dropna()
+
+
+def _normalize_weights(weights, tickers):
+
+    """
+    Returns the weights of the Tickers as a numpy array summing to 1 (equal weights when weights is None).
+    """
+
+    if weights is None:
+        return np.full(len(tickers), 1.0 / len(tickers))
+
+    weight_values = np.array([weights.get(ticker, 0.0) for ticker in tickers], dtype=float)
+    if weight_values.sum() <= 0:
+        raise ValueError("The portfolio weights must sum to a positive value.")
+
+    return weight_values / weight_values.sum()
+
+
+def _draw_bootstrap(rng, history, n_paths, horizon, block_size):
+
+    """
+    Draws paths of daily returns by joining randomly chosen blocks of consecutive historical returns.
+    """
+
+    block_size = min(block_size, len(history))
+    n_blocks = -(-horizon // block_size)
+    starts = rng.integers(0, len(history) - block_size + 1, size=(n_paths, n_blocks))
+    index = (starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)[:, :horizon]
+
+    return history[index]
+
+
+def _draw_normal(rng, mean, std_dev, n_paths, horizon):
+
+    """
+    Draws paths of daily returns from a normal distribution.
+    """
+
+    return rng.normal(mean, std_dev, size=(n_paths, horizon))
+
+
+@profile_function
+def simulate_portfolio(df_tmp, weights=None, n_paths=10000, horizon=252, method='bootstrap', block_size=21,
+                       chunk_size=2000, seed=42, initial_value=1.0, percentiles=(5, 25, 50, 75, 95),
+                       drawdown_thresholds=(10, 20, 30), confidence_levels=(95, 99), return_samples=False):
+
+    """
+    Simulates the value of a daily rebalanced portfolio over a horizon and summarizes the outcomes.
+
+    With the 'bootstrap' method each path joins randomly chosen blocks of block_size consecutive historical days of
+    portfolio returns. Because all Tickers of a block come from the same Dates, the correlation between Tickers is
+    kept. With the 'normal' method the daily Ticker returns are correlated normals with the historical mean and
+    covariance matrix. For fixed weights their weighted sum is itself normal with mean w·mean and variance w'Σw, so
+    one draw per day gives the same portfolio distribution as one draw per Ticker.
+
+    Paths are generated chunk_size at a time so memory stays around chunk_size x horizon values. The same seed and
+    chunk_size always give the same results.
+
+    Args:
+        - df_tmp: DataFrame with 'Ticker', 'Date' and 'Close' columns, or a portfolio DataFrame from
+          calculate_portfolio_return with 'Date' and '% Return' columns.
+        - weights: Dictionary of Ticker -> weight (defaults to equal weights like calculate_portfolio_return).
+        - n_paths: Integer specifying the number of paths to simulate.
+        - horizon: Integer specifying the number of trading days of each path.
+        - method: 'bootstrap' or 'normal'.
+        - block_size: Integer specifying the number of consecutive days in each bootstrap block.
+        - chunk_size: Integer specifying the number of paths simulated at a time.
+        - seed: Integer seed of the random number generator.
+        - initial_value: Float with the starting value of the portfolio.
+        - percentiles: List of terminal value percentiles to report.
+        - drawdown_thresholds: List of drawdowns in percent; the probability of a drawdown at least this deep
+          during the horizon is reported.
+        - confidence_levels: List of VaR and CVaR confidence levels in percent.
+        - return_samples: Boolean indicating whether to include the terminal value and maximum drawdown of every
+          path.
+
+    Returns:
+        - dict: 'Method', 'Paths', 'Horizon', 'Mean Terminal Value', 'Terminal Value Percentiles' (Series by
+          percentile), 'Drawdown Probabilities' (Series by threshold), 'VaR %' and 'CVaR %' (Series by confidence
+          level, as positive losses in percent of the initial value), and with return_samples 'Terminal Values' and
+          'Max % Drawdowns' arrays.
+    """
+
+    if method not in ('bootstrap', 'normal'):
+        raise ValueError("method must be 'bootstrap' or 'normal'.")
+
+    if (n_paths < 1) or (horizon < 1) or (block_size < 1) or (chunk_size < 1):
+        raise ValueError("n_paths, horizon, block_size and chunk_size must be at least 1.")
+
+    # Historical daily portfolio returns, or the mean and variance of the weighted Ticker returns
+    if 'Ticker' in df_tmp.columns:
+        df_returns = build_return_matrix(df_tmp, None if weights is None else list(weights))
+        weight_values = _normalize_weights(weights, df_returns.columns)
+        returns = df_returns.to_numpy()
+        history = returns @ weight_values
+        mean = float(returns.mean(axis=0) @ weight_values)
+        covariance = np.atleast_2d(np.cov(returns, rowvar=False, ddof=1))
+        std_dev = float(np.sqrt(weight_values @ covariance @ weight_values))
+    else:
+        if '% Return' not in df_tmp.columns:
+            raise ValueError("The DataFrame needs 'Ticker', 'Date' and 'Close' columns or a '% Return' column.")
+        history = (df_tmp.sort_values(by='Date')['% Return'].dropna().to_numpy(dtype=float) / 100)
+        mean, std_dev = float(history.mean()), float(history.std(ddof=1))
+
+    if len(history) < 2:
+        raise ValueError("At least 2 historical returns are needed to simulate paths.")
+
+    terminal_values = np.empty(n_paths)
+    max_drawdowns = np.empty(n_paths)
+
+    # One child seed per chunk makes the draws independent of how many chunks were simulated before
+    chunk_seeds = np.random.SeedSequence(seed).spawn(-(-n_paths // chunk_size))
+
+    for chunk, chunk_seed in enumerate(chunk_seeds):
+        rng = np.random.default_rng(chunk_seed)
+        first = chunk * chunk_size
+        n_chunk = min(chunk_size, n_paths - first)
+
+        if method == 'bootstrap':
+            paths = _draw_bootstrap(rng, history, n_chunk, horizon, block_size)
+        else:
+            paths = _draw_normal(rng, mean, std_dev, n_chunk, horizon)
+
+        # Compound the returns in place into portfolio values
+        np.add(paths, 1.0, out=paths)
+        np.cumprod(paths, axis=1, out=paths)
+        paths *= initial_value
+
+        # The initial value counts as the first peak
+        peaks = np.maximum.accumulate(np.maximum(paths, initial_value), axis=1)
+        max_drawdowns[first:first + n_chunk] = (1.0 - paths / peaks).max(axis=1) * 100
+        terminal_values[first:first + n_chunk] = paths[:, -1]
+
+    # VaR and CVaR of the horizon return as losses in percent of the initial value
+    horizon_returns = (terminal_values / initial_value - 1.0) * 100
+    var = {}
+    cvar = {}
+    for level in confidence_levels:
+        cutoff = np.percentile(horizon_returns, 100 - level)
+        var[level] = -cutoff
+        cvar[level] = -horizon_returns[horizon_returns <= cutoff].mean()
+
+    result = {
+        'Method': method,
+        'Paths': n_paths,
+        'Horizon': horizon,
+        'Mean Terminal Value': float(terminal_values.mean()),
+        'Terminal Value Percentiles': pd.Series(np.percentile(terminal_values, percentiles), index=list(percentiles),
+                                                name='Terminal Value'),
+        'Drawdown Probabilities': pd.Series([(max_drawdowns >= threshold).mean() for threshold in drawdown_thresholds],
+                                            index=list(drawdown_thresholds), name='Probability'),
+        'VaR %': pd.Series(var, name='VaR %'),
+        'CVaR %': pd.Series(cvar, name='CVaR %')
+    }
+
+    if return_samples:
+        result['Terminal Values'] = terminal_values
+        result['Max % Drawdowns'] = max_drawdowns
+
+    return result
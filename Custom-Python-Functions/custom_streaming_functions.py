@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming ingestion of the whole-universe price snapshots downloaded from Barchart (SP500_Equities_Prices.csv).
+
+A SnapshotBook keeps the latest price of every Ticker in numpy arrays together with running sums per GICS group and
+a sorted order of the intraday returns. Each snapshot only touches the tickers whose values changed: their previous
+contributions are subtracted from the group sums and the new ones added, and only their positions in the return
+order are moved, so the intraday returns, group aggregates and top and bottom rankings are current after every
+snapshot without recalculating the universe. Snapshots arrive as files dropped in a folder or as CSV text on a local
+socket.
+"""
+
+import os
+import io
+import time
+import socket
+import pandas as pd
+import numpy as np
+from custom_profiling_functions import profile_function
+
+
+# Columns of a Barchart snapshot file
+SNAPSHOT_COLUMNS = ['Symbol', 'Name', 'Last', 'Change', '%Chg', 'High', 'Low', 'Volume', 'Time']
+
+# Values of a Ticker compared to detect a change between snapshots
+_VALUE_FIELDS = ['Last', 'Change', 'High', 'Low', 'Volume']
+
+
+def parse_snapshot(source):
+
+    """
+    Reads a Barchart snapshot into a DataFrame of numeric values by Ticker.
+
+    The comment row Barchart appends at the end of the download (and any other row without a price) is dropped.
+
+    Args:
+        - source: String with the path of a snapshot file, or with the CSV text of a snapshot.
+
+    Returns:
+        - A DataFrame with 'Ticker', 'Last', 'Change', '% Change', 'High', 'Low', 'Volume' and 'Time' columns.
+    """
+
+    if '\n' in source:
+        source = io.StringIO(source)
+
+    df_tmp = pd.read_csv(source, usecols=lambda col: col in SNAPSHOT_COLUMNS, dtype={'Symbol': str, 'Time': str})
+
+    missing = [col for col in SNAPSHOT_COLUMNS if (col != 'Name') and (col not in df_tmp.columns)]
+    if missing:
+        raise ValueError(f"Columns {missing} do not exist in the snapshot.")
+
+    for col in ['Last', 'Change', 'High', 'Low', 'Volume']:
+        df_tmp[col] = pd.to_numeric(df_tmp[col], errors='coerce')
+    df_tmp['% Change'] = pd.to_numeric(df_tmp['%Chg'].astype(str).str.rstrip('%'), errors='coerce')
+
+    df_tmp = df_tmp[df_tmp['Last'].notna()].rename(columns={'Symbol': 'Ticker'})
+
+    return df_tmp[['Ticker', 'Last', 'Change', '% Change', 'High', 'Low', 'Volume', 'Time']].reset_index(drop=True)
+
+
+class SnapshotBook:
+
+    """
+    In-memory latest-price table of the universe with incrementally maintained group aggregates and rankings.
+
+    The intraday % Change of a Ticker is the %Chg of the snapshot, or its Last price against the previous close
+    (Last - Change) when %Chg is missing. Every GICS level keeps the count, % Change sum, advancers, decliners and
+    volume of its groups, and the tickers are kept sorted by % Change so the top and bottom tickers are read from the
+    two ends of the order.
+
+    Args:
+        - df_membership: DataFrame with 'Ticker' and the GICS level columns (see load_gics_membership).
+        - levels: List of GICS level columns to aggregate (defaults to 'Sector').
+    """
+
+    def __init__(self, df_membership, levels=None):
+
+        self.levels = list(['Sector'] if levels is None else levels)
+
+        missing = [col for col in ['Ticker'] + self.levels if col not in df_membership.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} do not exist in the membership DataFrame.")
+
+        df_membership = df_membership.drop_duplicates(subset='Ticker').reset_index(drop=True)
+        self.tickers = pd.Index(df_membership['Ticker'])
+        n_tickers = len(self.tickers)
+
+        self.values = {field: np.full(n_tickers, np.nan) for field in _VALUE_FIELDS}
+        self.pct_change = np.full(n_tickers, np.nan)
+        self.times = np.full(n_tickers, None, dtype=object)
+        self.seen = np.zeros(n_tickers, dtype=bool)
+
+        # Group code of every Ticker and the running sums of every group for each level
+        self.group_codes = {}
+        self.groups = {}
+        self.group_sums = {}
+        for level in self.levels:
+            codes, groups = pd.factorize(df_membership[level], sort=True)
+            self.group_codes[level] = codes
+            self.groups[level] = groups
+            self.group_sums[level] = {stat: np.zeros(len(groups))
+                                      for stat in ['Tickers', '% Change', 'Advancers', 'Decliners', 'Volume']}
+
+        # Positions of the seen tickers in ascending % Change order
+        self.order = np.empty(0, dtype=np.int64)
+        self.snapshots = 0
+
+    def _add_to_groups(self, positions, sign):
+
+        """
+        Adds (sign=1) or subtracts (sign=-1) the contributions of the tickers at the positions to the group sums.
+        """
+
+        pct_change = self.pct_change[positions]
+        contributions = {
+            'Tickers': np.ones(len(positions)),
+            '% Change': np.nan_to_num(pct_change),
+            'Advancers': (pct_change > 0).astype(float),
+            'Decliners': (pct_change < 0).astype(float),
+            'Volume': np.nan_to_num(self.values['Volume'][positions])
+        }
+
+        for level in self.levels:
+            codes = self.group_codes[level][positions]
+            keep = codes >= 0
+            for stat, values in contributions.items():
+                np.add.at(self.group_sums[level][stat], codes[keep], sign * values[keep])
+
+    def _reorder(self, positions):
+
+        """
+        Moves the tickers at the positions to their new place in the % Change order.
+        """
+
+        # Every other ticker keeps its relative order, the changed ones are sorted among themselves and merged in
+        kept = self.order[~np.isin(self.order, positions)]
+        moved = positions[np.argsort(self.pct_change[positions], kind='stable')]
+        slots = np.searchsorted(self.pct_change[kept], self.pct_change[moved], side='right')
+
+        self.order = np.insert(kept, slots, moved)
+
+    @profile_function
+    def apply(self, df_snapshot):
+
+        """
+        Applies a snapshot to the latest-price table, updating only the tickers whose values changed.
+
+        Args:
+            - df_snapshot: DataFrame returned by parse_snapshot (a full or partial universe).
+
+        Returns:
+            - dict: 'Rows', 'Changed' and 'Unknown' (tickers not in the membership) counts and 'Milliseconds'.
+        """
+
+        start_time = time.perf_counter()
+
+        positions = self.tickers.get_indexer(df_snapshot['Ticker'])
+        known = positions >= 0
+        positions = positions[known]
+        new_values = {field: df_snapshot[field].to_numpy(dtype=float)[known] for field in _VALUE_FIELDS}
+        new_pct_change = df_snapshot['% Change'].to_numpy(dtype=float)[known]
+
+        # A ticker changed when it was not seen before or any of its values differ
+        changed = ~self.seen[positions]
+        for field, values in new_values.items():
+            old_values = self.values[field][positions]
+            changed |= ~((old_values == values) | (np.isnan(old_values) & np.isnan(values)))
+
+        # Keep the last row of a ticker listed twice
+        changed_positions, last_rows = np.unique(positions[changed][::-1], return_index=True)
+        rows = np.flatnonzero(changed)[::-1][last_rows]
+
+        if len(changed_positions) > 0:
+            was_seen = changed_positions[self.seen[changed_positions]]
+            self._add_to_groups(was_seen, -1)
+
+            for field in _VALUE_FIELDS:
+                self.values[field][changed_positions] = new_values[field][rows]
+            self.times[changed_positions] = df_snapshot['Time'].to_numpy()[known][rows]
+
+            pct_change = new_pct_change[rows]
+            previous_close = self.values['Last'][changed_positions] - self.values['Change'][changed_positions]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                calculated = np.round(self.values['Change'][changed_positions] / previous_close * 100, 2)
+            self.pct_change[changed_positions] = np.where(np.isnan(pct_change) & (previous_close > 0), calculated,
+                                                          pct_change)
+            self.seen[changed_positions] = True
+
+            self._add_to_groups(changed_positions, 1)
+            self._reorder(changed_positions)
+
+        self.snapshots += 1
+
+        return {
+            'Rows': int(len(df_snapshot)),
+            'Changed': int(len(changed_positions)),
+            'Unknown': int((~known).sum()),
+            'Milliseconds': round((time.perf_counter() - start_time) * 1000, 3)
+        }
+
+    def latest(self):
+
+        """
+        Returns the latest values of every seen Ticker with its GICS groups.
+        """
+
+        positions = np.flatnonzero(self.seen)
+        df_tmp = pd.DataFrame({'Ticker': self.tickers[positions]})
+        for field in _VALUE_FIELDS:
+            df_tmp[field] = self.values[field][positions]
+        df_tmp['% Change'] = self.pct_change[positions]
+        df_tmp['Time'] = self.times[positions]
+        for level in self.levels:
+            codes = self.group_codes[level][positions]
+            df_tmp[level] = np.where(codes >= 0, self.groups[level].to_numpy()[np.maximum(codes, 0)], None)
+
+        return df_tmp
+
+    def group_summary(self, level=None):
+
+        """
+        Returns the current aggregates of every group of a GICS level.
+
+        Args:
+            - level: String with the GICS level column (defaults to the first level of the book).
+
+        Returns:
+            - A DataFrame with the level column, 'Tickers', 'Average % Change', 'Advancers', 'Decliners' and 'Volume',
+              sorted by 'Average % Change' descending.
+        """
+
+        level = self.levels[0] if level is None else level
+        if level not in self.group_sums:
+            raise ValueError(f"Level '{level}' is not aggregated by the SnapshotBook.")
+
+        sums = self.group_sums[level]
+        counts = np.round(sums['Tickers']).astype(np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = np.round(np.where(counts > 0, sums['% Change'] / np.maximum(counts, 1), np.nan), 2)
+
+        df_tmp = pd.DataFrame({
+            level: self.groups[level],
+            'Tickers': counts,
+            'Average % Change': average,
+            'Advancers': np.round(sums['Advancers']).astype(np.int64),
+            'Decliners': np.round(sums['Decliners']).astype(np.int64),
+            'Volume': np.round(sums['Volume']).astype(np.int64)
+        })
+
+        return df_tmp[df_tmp['Tickers'] > 0].sort_values(by='Average % Change', ascending=False, ignore_index=True)
+
+    def top(self, n=10, largest=True):
+
+        """
+        Returns the n tickers with the highest (or lowest) intraday % Change, read from the ends of the sorted order.
+
+        Args:
+            - n: Integer with the number of tickers to return.
+            - largest: Boolean, True for the top tickers and False for the bottom tickers.
+
+        Returns:
+            - A DataFrame with 'Rank', 'Ticker', 'Last', '% Change' and the first GICS level column.
+        """
+
+        # Tickers without a previous close sort last and are never ranked
+        ranked = self.order[~np.isnan(self.pct_change[self.order])]
+        positions = ranked[::-1][:n] if largest else ranked[:n]
+
+        df_tmp = pd.DataFrame({
+            'Rank': np.arange(1, len(positions) + 1),
+            'Ticker': self.tickers[positions],
+            'Last': self.values['Last'][positions],
+            '% Change': self.pct_change[positions]
+        })
+        if self.levels:
+            codes = self.group_codes[self.levels[0]][positions]
+            df_tmp[self.levels[0]] = np.where(codes >= 0, self.groups[self.levels[0]].to_numpy()[np.maximum(codes, 0)],
+                                              None)
+
+        return df_tmp
+
+
+def iter_snapshot_folder(folder, poll_seconds=1.0, idle_timeout=None):
+
+    """
+    Yields the snapshot files dropped in a folder in the order they were written, each file once.
+
+    Args:
+        - folder: String with the drop folder.
+        - poll_seconds: Number of seconds between two scans of the folder.
+        - idle_timeout: Number of seconds without a new file after which the generator stops, or None to wait forever.
+
+    Yields:
+        - tuple: The path of the file and its DataFrame from parse_snapshot.
+    """
+
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"Snapshot folder not found: {folder}")
+
+    processed = set()
+    last_file_time = time.monotonic()
+    while True:
+        entries = [entry for entry in os.scandir(folder)
+                   if entry.is_file() and entry.name.lower().endswith('.csv') and entry.path not in processed]
+
+        for entry in sorted(entries, key=lambda entry: (entry.stat().st_mtime, entry.name)):
+            processed.add(entry.path)
+            last_file_time = time.monotonic()
+            yield entry.path, parse_snapshot(entry.path)
+
+        if (idle_timeout is not None) and (time.monotonic() - last_file_time >= idle_timeout):
+            return
+
+        time.sleep(poll_seconds)
+
+
+def iter_snapshot_stream(stream):
+
+    """
+    Yields the snapshots of a text stream of concatenated snapshot files, each starting with its header row.
+
+    Args:
+        - stream: Text file object, e.g. socket.makefile('r') of a local socket.
+
+    Yields:
+        - DataFrame: Each snapshot from parse_snapshot.
+    """
+
+    lines = []
+    for line in stream:
+        if line.startswith('Symbol,') and lines:
+            yield parse_snapshot(''.join(lines))
+            lines = []
+        if line.strip():
+            lines.append(line)
+
+    if lines:
+        yield parse_snapshot(''.join(lines))
+
+
+def iter_snapshot_socket(host, port, timeout=None):
+
+    """
+    Connects to a local socket and yields the snapshots it sends until the sender closes the connection.
+
+    Args:
+        - host: String with the host name (e.g. 'localhost').
+        - port: Integer with the port number.
+        - timeout: Number of seconds to wait for data before failing, or None to wait forever.
+
+    Yields:
+        - DataFrame: Each snapshot from parse_snapshot.
+    """
+
+    with socket.create_connection((host, port), timeout=timeout) as conn:
+        with conn.makefile('r', encoding='utf-8-sig') as stream:
+            yield from iter_snapshot_stream(stream)
+
+
+def run_snapshot_stream(book, snapshots, on_update=None):
+
+    """
+    Applies a sequence of snapshots to a SnapshotBook and reports the processing time of each snapshot.
+
+    Args:
+        - book: The SnapshotBook to update.
+        - snapshots: Iterable of DataFrames, or of (name, DataFrame) tuples (e.g. iter_snapshot_folder).
+        - on_update: Optional function called with the book and the update report after every snapshot.
+
+    Returns:
+        - A DataFrame with 'Snapshot', 'Rows', 'Changed', 'Unknown' and 'Milliseconds' columns.
+    """
+
+    reports = []
+    for number, snapshot in enumerate(snapshots, start=1):
+        name, df_snapshot = snapshot if isinstance(snapshot, tuple) else (number, snapshot)
+        report = book.apply(df_snapshot)
+        report = {'Snapshot': name, **report}
+        reports.append(report)
+
+        if on_update is not None:
+            on_update(book, report)
+
+    return pd.DataFrame(reports, columns=['Snapshot', 'Rows', 'Changed', 'Unknown', 'Milliseconds'])
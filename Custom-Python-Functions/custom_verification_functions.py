@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+In-stream verification of the price loads.
+
+While the loader writes the prices, LoadVerifier accumulates for every Ticker the row count, the first and last Date,
+the sums of the prices in cents and of the volumes, and two checksums weighting the values by their Date, so a value
+moved to another Date is also caught. The sums are order independent and use only integer arithmetic, so the same
+aggregates are calculated server-side by one grouped query and compared exactly, instead of counting the rows of the
+staging and target tables. Tickers whose aggregates differ are checked row by row against a hash of every loaded row
+to report the exact Dates that are missing, unexpected or different.
+"""
+
+import pandas as pd
+import numpy as np
+import sqlalchemy as sa
+from custom_profiling_functions import profile_function
+
+
+# Columns holding the price values, in the order used by the checksums
+VALUE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Aggregates compared for every Ticker
+SUMMARY_COLUMNS = ['Rows', 'First Date', 'Last Date', 'Open Sum', 'High Sum', 'Low Sum', 'Close Sum', 'Volume Sum',
+                   'Price Checksum', 'Volume Checksum']
+
+# Weights of Open, High, Low and Close in the price checksum, so values swapped between columns change it
+_PRICE_WEIGHTS = (1, 3, 5, 7)
+
+# Dates are weighted by their day number modulo a prime to keep the checksums well inside 64-bit integers
+_DAY_MODULUS = 997
+
+# Maximum number of keys per IN list, below the parameter limit of SQL Server
+_KEYS_PER_QUERY = 1000
+
+
+def _round_half_away(values):
+
+    """
+    Rounds to whole numbers with halves away from zero, like SQL ROUND.
+    """
+
+    return np.trunc(values + np.copysign(0.5, values))
+
+
+def _scaled_values(df_tmp, scale):
+
+    """
+    Returns the day numbers, the prices in 1/scale units and the volumes of each row as 64-bit integers, with
+    missing values counted as 0.
+    """
+
+    days = pd.to_datetime(df_tmp['Date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+    values = {}
+    for col in VALUE_COLUMNS[:4]:
+        prices = pd.to_numeric(df_tmp[col], errors='coerce').to_numpy(dtype=float)
+        values[col] = np.nan_to_num(_round_half_away(prices * scale)).astype(np.int64)
+    volumes = pd.to_numeric(df_tmp['Volume'], errors='coerce').to_numpy(dtype=float)
+    values['Volume'] = np.nan_to_num(_round_half_away(volumes)).astype(np.int64)
+
+    return days, values
+
+
+def _summarize_rows(keys, days, values):
+
+    """
+    Returns the aggregates of SUMMARY_COLUMNS by key for rows of scaled values.
+    """
+
+    weights = days % _DAY_MODULUS + 1
+    price_total = sum(weight * values[col] for weight, col in zip(_PRICE_WEIGHTS, VALUE_COLUMNS[:4]))
+    df_rows = pd.DataFrame({
+        'Key': keys,
+        'Rows': 1,
+        'First Date': days,
+        'Last Date': days,
+        **{col + ' Sum': values[col] for col in VALUE_COLUMNS},
+        'Price Checksum': weights * price_total,
+        'Volume Checksum': weights * values['Volume']
+    })
+
+    aggregations = {col: 'sum' for col in SUMMARY_COLUMNS}
+    aggregations.update({'First Date': 'min', 'Last Date': 'max'})
+
+    return df_rows.groupby('Key', sort=True).agg(aggregations)
+
+
+def _row_hashes(keys, days, values):
+
+    """
+    Returns the key, day number and a hash of the scaled values of every row.
+    """
+
+    df_values = pd.DataFrame({col: values[col] for col in VALUE_COLUMNS})
+
+    return pd.DataFrame({'Key': keys, 'Day': days,
+                         'Row Hash': pd.util.hash_pandas_object(df_values, index=False).to_numpy()})
+
+
+class LoadVerifier:
+
+    """
+    Accumulates the aggregates of the rows a loader writes, one batch at a time.
+
+    Args:
+        - key: String with the column identifying the Ticker in the batches (e.g. 'Ticker' or 'Ticker_ID').
+        - scale: Integer the prices are multiplied by before rounding (100 compares prices to the cent).
+        - keep_row_hashes: Boolean indicating whether to keep a hash of every row to report diverged Dates.
+    """
+
+    def __init__(self, key='Ticker', scale=100, keep_row_hashes=True):
+
+        self.key = key
+        self.scale = scale
+        self.keep_row_hashes = keep_row_hashes
+        self.df_summary = pd.DataFrame(columns=SUMMARY_COLUMNS, dtype=np.int64).rename_axis('Key')
+        self.hash_frames = []
+
+    def update(self, df_batch):
+
+        """
+        Adds a batch of rows to the aggregates.
+
+        Args:
+            - df_batch: DataFrame with the key, 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns.
+        """
+
+        missing = [col for col in [self.key, 'Date'] + VALUE_COLUMNS if col not in df_batch.columns]
+        if missing:
+            raise ValueError(f"Required columns {missing} are missing.")
+
+        if len(df_batch) == 0:
+            return
+
+        keys = df_batch[self.key].to_numpy()
+        days, values = _scaled_values(df_batch, self.scale)
+        df_batch_summary = _summarize_rows(keys, days, values)
+
+        # Combine with the aggregates of earlier batches of the same keys
+        df_both = pd.concat([self.df_summary, df_batch_summary])
+        aggregations = {col: 'sum' for col in SUMMARY_COLUMNS}
+        aggregations.update({'First Date': 'min', 'Last Date': 'max'})
+        self.df_summary = df_both.groupby(level=0, sort=True).agg(aggregations).astype(np.int64)
+
+        if self.keep_row_hashes:
+            self.hash_frames.append(_row_hashes(keys, days, values))
+
+    def summary(self):
+
+        """
+        Returns the aggregates of the rows added so far.
+
+        Returns:
+            - A DataFrame indexed by key with the SUMMARY_COLUMNS, with 'First Date' and 'Last Date' as dates.
+        """
+
+        df_tmp = self.df_summary.copy()
+        for col in ['First Date', 'Last Date']:
+            df_tmp[col] = pd.to_datetime(df_tmp[col].to_numpy().astype('datetime64[D]'))
+
+        return df_tmp.rename_axis(self.key)
+
+    def row_hashes(self):
+
+        """
+        Returns the key, day number and value hash of every row added so far.
+        """
+
+        if not self.hash_frames:
+            return pd.DataFrame(columns=['Key', 'Day', 'Row Hash'])
+
+        return pd.concat(self.hash_frames, ignore_index=True)
+
+
+def _day_number(conn, column):
+
+    """
+    Returns a SQL expression with the number of days between 1970-01-01 and a date column for the dialect.
+    """
+
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        return sa.cast(sa.func.julianday(sa.func.date(column)) - 2440587.5, sa.BigInteger)
+    if dialect == 'mssql':
+        return sa.func.datediff(sa.literal_column('day'), sa.literal('1970-01-01'), column)
+    if dialect == 'postgresql':
+        return sa.cast(column, sa.Date) - sa.cast(sa.literal('1970-01-01'), sa.Date)
+    if dialect in ('mysql', 'mariadb'):
+        return sa.func.datediff(column, sa.literal('1970-01-01'))
+
+    raise ValueError(f"Dialect '{dialect}' is not supported.")
+
+
+def _verification_table(table, key, column_map, schema):
+
+    """
+    Returns the lightweight table object and the table column of the key, Date and every value column.
+    """
+
+    column_map = {col: (column_map or {}).get(col, col) for col in [key, 'Date'] + VALUE_COLUMNS}
+    tbl = sa.table(table, *[sa.column(name) for name in dict.fromkeys(column_map.values())], schema=schema)
+
+    return tbl, {col: tbl.c[name] for col, name in column_map.items()}
+
+
+def _key_chunks(keys):
+
+    """
+    Splits the keys into lists that fit in one IN list.
+    """
+
+    keys = [key.item() if isinstance(key, np.generic) else key for key in keys]
+
+    return [keys[first:first + _KEYS_PER_QUERY] for first in range(0, len(keys), _KEYS_PER_QUERY)]
+
+
+@profile_function
+def query_load_summary(conn, table, key, keys, first_date, last_date, column_map=None, schema='Equities',
+                       scale=100):
+
+    """
+    Calculates the aggregates of LoadVerifier server-side with one grouped query per 1000 keys.
+
+    Args:
+        - conn: SQLAlchemy Connection used for the query.
+        - table: String with the table name (e.g. 'Yahoo_Equity_Prices_STG' or 'Yahoo_Equity_Prices').
+        - key: String with the key column name used by the verifier (e.g. 'Ticker_ID').
+        - keys: List of keys to aggregate.
+        - first_date: First Date to include.
+        - last_date: Last Date to include.
+        - column_map: Dictionary of verifier column -> table column for the columns named differently in the table,
+          or None when they are named as in the verifier (e.g. Yahoo_Equity_Prices_STG keyed by 'Ticker_ID').
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - scale: Integer the prices are multiplied by before rounding, as in the verifier.
+
+    Returns:
+        - A DataFrame indexed by key with the SUMMARY_COLUMNS as integers (Dates as day numbers).
+    """
+
+    tbl, cols = _verification_table(table, key, column_map, schema)
+
+    day = _day_number(conn, cols['Date'])
+    weight = day % _DAY_MODULUS + 1
+    values = {col: sa.func.coalesce(sa.cast(sa.func.round(cols[col] * scale, 0), sa.BigInteger), 0)
+              for col in VALUE_COLUMNS[:4]}
+    values['Volume'] = sa.func.coalesce(sa.cast(cols['Volume'], sa.BigInteger), 0)
+    price_total = sum(weight_tmp * values[col] for weight_tmp, col in zip(_PRICE_WEIGHTS, VALUE_COLUMNS[:4]))
+
+    aggregates = [
+        sa.func.count().label('Rows'),
+        sa.func.min(day).label('First Date'),
+        sa.func.max(day).label('Last Date'),
+        *[sa.func.sum(values[col]).label(col + ' Sum') for col in VALUE_COLUMNS],
+        sa.func.sum(weight * price_total).label('Price Checksum'),
+        sa.func.sum(weight * values['Volume']).label('Volume Checksum')
+    ]
+
+    rows = []
+    for chunk in _key_chunks(keys):
+        stmt = (sa.select(cols[key], *aggregates)
+                .where(cols[key].in_(chunk),
+                       cols['Date'].between(pd.Timestamp(first_date).date(), pd.Timestamp(last_date).date()))
+                .group_by(cols[key]))
+        rows.extend(conn.execute(stmt).fetchall())
+
+    df_tmp = pd.DataFrame(rows, columns=['Key'] + SUMMARY_COLUMNS)
+    if df_tmp['Key'].dtype == object:
+        df_tmp['Key'] = df_tmp['Key'].str.strip()
+
+    return df_tmp.set_index('Key').astype(np.int64)
+
+
+def _query_row_hashes(conn, table, key, keys, first_date, last_date, column_map, schema, scale):
+
+    """
+    Reads the rows of some keys and returns their key, day number and value hash like LoadVerifier.row_hashes.
+    """
+
+    tbl, cols = _verification_table(table, key, column_map, schema)
+
+    frames = []
+    for chunk in _key_chunks(keys):
+        stmt = (sa.select(cols[key], cols['Date'], *[cols[col] for col in VALUE_COLUMNS])
+                .where(cols[key].in_(chunk),
+                       cols['Date'].between(pd.Timestamp(first_date).date(), pd.Timestamp(last_date).date())))
+        frames.append(pd.DataFrame(conn.execute(stmt).fetchall(), columns=['Key', 'Date'] + VALUE_COLUMNS))
+
+    df_rows = pd.concat(frames, ignore_index=True)
+    if df_rows['Key'].dtype == object:
+        df_rows['Key'] = df_rows['Key'].str.strip()
+    days, values = _scaled_values(df_rows, scale)
+
+    return _row_hashes(df_rows['Key'].to_numpy(), days, values)
+
+
+def _diverged_dates(df_expected, df_actual, df_bounds):
+
+    """
+    Compares the row hashes of the loaded and the stored rows and returns the Dates that differ, ignoring stored
+    rows outside the first and last loaded Date of each key.
+    """
+
+    df_both = df_expected.merge(df_actual, on=['Key', 'Day'], how='outer', suffixes=(' Expected', ' Actual'),
+                                indicator=True)
+
+    first = df_bounds['First Date'].reindex(df_both['Key']).to_numpy()
+    last = df_bounds['Last Date'].reindex(df_both['Key']).to_numpy()
+    in_range = (df_both['Day'].to_numpy() >= first) & (df_both['Day'].to_numpy() <= last)
+
+    issue = np.select([df_both['_merge'] == 'left_only', df_both['_merge'] == 'right_only',
+                       df_both['Row Hash Expected'] != df_both['Row Hash Actual']],
+                      ['Missing', 'Unexpected', 'Different'], default='')
+    keep = (issue != '') & in_range
+
+    return pd.DataFrame({
+        'Key': df_both['Key'].to_numpy()[keep],
+        'Date': pd.to_datetime(df_both['Day'].to_numpy()[keep].astype('datetime64[D]')),
+        'Issue': issue[keep]
+    }).sort_values(by=['Key', 'Date'], ignore_index=True)
+
+
+@profile_function
+def verify_load(conn, verifier, table, column_map=None, schema='Equities'):
+
+    """
+    Compares the aggregates accumulated by a LoadVerifier with the same aggregates calculated server-side.
+
+    One grouped query aggregates the rows of the loaded keys between the first and last loaded Date. The keys whose
+    row count, Dates, sums or checksums differ are then read row by row and compared with the hashes of the loaded
+    rows, which reports the exact Dates that are missing from the table, unexpected in the table (between the first
+    and last loaded Date of the key) or stored with different values. A key whose only differences are stored rows
+    outside its own loaded Dates is not reported.
+
+    Args:
+        - conn: SQLAlchemy Connection used for the queries.
+        - verifier: LoadVerifier holding the aggregates of the loaded rows.
+        - table: String with the table name (e.g. 'Yahoo_Equity_Prices_STG' or 'Yahoo_Equity_Prices').
+        - column_map: Dictionary of verifier column -> table column for the columns named differently in the table,
+          or None when they are named as in the verifier (e.g. Yahoo_Equity_Prices_STG keyed by 'Ticker_ID').
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+
+    Returns:
+        - dict: 'Table', 'Verified' (True when nothing diverged), 'Keys' and 'Rows' loaded, a 'Diverged' DataFrame
+          with the key, 'Issue' ('Missing' or 'Different') and the aggregate 'Columns' that differ, and a 'Dates'
+          DataFrame with the key, 'Date' and 'Issue' ('Missing', 'Unexpected' or 'Different') of every diverged row
+          (empty when the verifier does not keep row hashes).
+    """
+
+    key = verifier.key
+    df_expected = verifier.df_summary
+    empty_dates = pd.DataFrame(columns=[key, 'Date', 'Issue'])
+
+    if len(df_expected) == 0:
+        return {'Table': table, 'Verified': True, 'Keys': 0, 'Rows': 0,
+                'Diverged': pd.DataFrame(columns=[key, 'Issue', 'Columns']), 'Dates': empty_dates}
+
+    first_date = pd.Timestamp(np.datetime64(int(df_expected['First Date'].min()), 'D'))
+    last_date = pd.Timestamp(np.datetime64(int(df_expected['Last Date'].max()), 'D'))
+    df_actual = query_load_summary(conn, table, key, df_expected.index.tolist(), first_date, last_date, column_map,
+                                   schema, verifier.scale)
+    df_actual = df_actual.reindex(df_expected.index)
+
+    # Aggregates that differ for each key
+    is_missing = df_actual['Rows'].isna().to_numpy()
+    differs = (df_expected[SUMMARY_COLUMNS] != df_actual[SUMMARY_COLUMNS]).to_numpy() & ~is_missing[:, None]
+    diverged_keys = df_expected.index[differs.any(axis=1)]
+
+    # Confirm the differing keys row by row, dropping keys that only differ outside their own loaded Dates
+    df_dates = empty_dates
+    if verifier.keep_row_hashes and len(diverged_keys) > 0:
+        df_loaded = verifier.row_hashes()
+        df_loaded = df_loaded[df_loaded['Key'].isin(diverged_keys)]
+        df_stored = _query_row_hashes(conn, table, key, diverged_keys.tolist(), first_date, last_date, column_map,
+                                      schema, verifier.scale)
+        df_dates = _diverged_dates(df_loaded, df_stored, df_expected).rename(columns={'Key': key})
+        confirmed = df_expected.index.isin(df_dates[key])
+        differs = differs & confirmed[:, None]
+
+    columns = [', '.join(col for col, flag in zip(SUMMARY_COLUMNS, row) if flag) for row in differs]
+    df_diverged = pd.DataFrame({key: df_expected.index, 'Issue': np.where(is_missing, 'Missing', 'Different'),
+                                'Columns': np.where(is_missing, '', columns)})
+    df_diverged = df_diverged[is_missing | differs.any(axis=1)].reset_index(drop=True)
+
+    return {
+        'Table': table,
+        'Verified': len(df_diverged) == 0,
+        'Keys': len(df_expected),
+        'Rows': int(df_expected['Rows'].sum()),
+        'Diverged': df_diverged,
+        'Dates': df_dates
+    }
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel partitioned reads of the daily prices from the data warehouse.
+
+A single pd.read_sql over the Yahoo_Equity_Prices join is bound by the bandwidth of one connection and by one thread
+decoding the rows. The read is split into partitions of Ticker_ID ranges or Year ranges holding about the same number
+of rows, planned from the row counts of the prices table. The partitions are read concurrently on a small pool of
+connections of the engine, each worker decoding its rows into typed columns while the other connections wait on the
+server, and the partitions are then put back in Ticker and Date order with one sort of integer codes. The latency and
+rows per second of every partition are reported so skewed partitions or a saturated server are visible.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from concurrent.futures import ThreadPoolExecutor
+from custom_profiling_functions import profile_function
+
+# Ways of splitting the price reads into partitions
+PARTITION_KEYS = ('ticker', 'year')
+
+# Columns of the price reads, in the order of the partition queries
+PRICE_COLUMNS = ['Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def _price_tables(schema):
+
+    """
+    Returns the lightweight Yahoo_Equity_Prices and Equities tables used to build the partition queries.
+    """
+
+    prices = sa.table('Yahoo_Equity_Prices', sa.column('Ticker_ID'), sa.column('Date'), sa.column('Open'),
+                      sa.column('High'), sa.column('Low'), sa.column('Close'), sa.column('Volume'), schema=schema)
+    equities = sa.table('Equities', sa.column('Ticker_ID'), sa.column('Ticker'), schema=schema)
+
+    return prices, equities
+
+
+def _balanced_ranges(keys, counts, partitions):
+
+    """
+    Splits sorted keys into at most partitions contiguous ranges holding about the same total count.
+
+    Returns:
+        - list: (low key, high key, count) of each range.
+    """
+
+    cum_counts = np.cumsum(counts)
+    targets = cum_counts[-1] * np.arange(1, partitions) / partitions
+    bounds = np.unique(np.r_[0, np.searchsorted(cum_counts, targets, side='right'), len(keys)])
+
+    return [(keys[start], keys[end - 1], int(counts[start:end].sum())) for start, end in zip(bounds[:-1], bounds[1:])
+            if end > start]
+
+
+@profile_function
+def plan_price_partitions(engine, schema='Equities', by='ticker', partitions=8):
+
+    """
+    Plans the partitions of a price read from the row counts of Yahoo_Equity_Prices.
+
+    Args:
+        - engine: SQLAlchemy Engine of the data warehouse.
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - by: String with the partition key, 'ticker' for Ticker_ID ranges or 'year' for Year ranges.
+        - partitions: Integer with the maximum number of partitions.
+
+    Returns:
+        - A DataFrame with 'Partition', 'Low', 'High' and 'Rows' columns, one row per partition. 'Low' and 'High' are
+          the first and last Ticker_ID or Year of the partition.
+    """
+
+    if by not in PARTITION_KEYS:
+        raise ValueError(f"Invalid partition key: {by}. Must be one of {', '.join(PARTITION_KEYS)}.")
+
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1.")
+
+    prices, _ = _price_tables(schema)
+    key = prices.c.Ticker_ID if by == 'ticker' else sa.extract('year', prices.c.Date)
+    stmt = sa.select(key.label('Key'), sa.func.count().label('Rows')).group_by(key).order_by(key)
+
+    with engine.connect() as conn:
+        df_counts = pd.read_sql(stmt, conn)
+
+    if df_counts.empty:
+        raise ValueError("Yahoo_Equity_Prices is empty.")
+
+    keys = df_counts['Key'].astype(np.int64).to_numpy()
+    ranges = _balanced_ranges(keys, df_counts['Rows'].to_numpy(dtype=np.int64), partitions)
+
+    return pd.DataFrame([{'Partition': number, 'Low': int(low), 'High': int(high), 'Rows': rows}
+                         for number, (low, high, rows) in enumerate(ranges)])
+
+
+def _partition_statement(schema, by, low, high):
+
+    """
+    Returns the query of the prices of one partition, filtered on the indexed Ticker_ID or Date columns.
+    """
+
+    prices, equities = _price_tables(schema)
+
+    stmt = (sa.select(sa.func.trim(equities.c.Ticker).label('Ticker'), prices.c.Date, prices.c.Open, prices.c.High,
+                      prices.c.Low, prices.c.Close, prices.c.Volume)
+            .select_from(prices.join(equities, prices.c.Ticker_ID == equities.c.Ticker_ID)))
+
+    if by == 'ticker':
+        return stmt.where(prices.c.Ticker_ID.between(int(low), int(high)))
+
+    # ISO date ranges instead of YEAR("Date") so the server can seek the Date index
+    return stmt.where(prices.c.Date >= f'{int(low)}-01-01', prices.c.Date < f'{int(high) + 1}-01-01')
+
+
+def _decode_rows(rows):
+
+    """
+    Decodes the fetched rows of a partition into typed numpy columns.
+    """
+
+    columns = list(zip(*rows)) if rows else [()] * len(PRICE_COLUMNS)
+    decoded = {'Ticker': np.array(columns[0], dtype=object)}
+
+    # numpy parses ISO date strings and date objects directly, pandas handles the other formats
+    try:
+        decoded['Date'] = np.array(columns[1], dtype='datetime64[ns]')
+    except (ValueError, TypeError):
+        decoded['Date'] = pd.to_datetime(pd.Series(columns[1], dtype=object)).to_numpy()
+
+    for name, values in zip(PRICE_COLUMNS[2:], columns[2:]):
+        decoded[name] = np.array(values, dtype=float)
+
+    # Volume is an integer column unless some Volumes are missing, as with pd.read_sql
+    if not np.isnan(decoded['Volume']).any():
+        decoded['Volume'] = decoded['Volume'].astype(np.int64)
+
+    return decoded
+
+
+def _read_partition(engine, schema, by, partition):
+
+    """
+    Reads and decodes the prices of one partition on its own connection, timing the read.
+    """
+
+    start_time = time.perf_counter()
+
+    # The rows are fetched from the DBAPI cursor and decoded per column instead of through pd.read_sql row objects.
+    # The bounds are integers from the partition plan, so they are rendered into the statement as literals.
+    with engine.connect() as conn:
+        sql_stat = str(_partition_statement(schema, by, partition['Low'], partition['High'])
+                       .compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(sql_stat)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    decoded = _decode_rows(rows)
+    seconds = time.perf_counter() - start_time
+
+    report = {'Partition': partition['Partition'], 'Low': partition['Low'], 'High': partition['High'],
+              'Rows': len(rows), 'Seconds': round(seconds, 3),
+              'Rows per Second': round(len(rows) / seconds) if seconds > 0 else None}
+
+    return decoded, report
+
+
+@profile_function
+def read_partitioned_prices(engine, schema='Equities', by='ticker', partitions=8, connections=4):
+
+    """
+    Reads the daily prices of every Ticker with concurrent partitioned queries, like read_service_prices.
+
+    Args:
+        - engine: SQLAlchemy Engine of the data warehouse. Its pool should allow the number of connections (the
+          default QueuePool allows 15).
+        - schema: String representing the schema name, or None for databases without schemas (e.g. SQLite).
+        - by: String with the partition key, 'ticker' for Ticker_ID ranges or 'year' for Year ranges.
+        - partitions: Integer with the maximum number of partitions.
+        - connections: Integer with the number of partitions read at the same time.
+
+    Returns:
+        - tuple: A DataFrame with 'Ticker', 'Date', 'Open', 'High', 'Low', 'Close' and 'Volume' columns sorted by
+          'Ticker' and 'Date', and a DataFrame with the 'Partition', 'Low', 'High', 'Rows', 'Seconds' and
+          'Rows per Second' of every partition.
+    """
+
+    if connections < 1:
+        raise ValueError("connections must be at least 1.")
+
+    df_plan = plan_price_partitions(engine, schema, by, partitions)
+
+    with ThreadPoolExecutor(max_workers=min(connections, len(df_plan)), thread_name_prefix='partition') as executor:
+        results = list(executor.map(lambda partition: _read_partition(engine, schema, by, partition),
+                                    df_plan.to_dict('records')))
+
+    df_report = pd.DataFrame([report for _, report in results])
+
+    # Put the partitions back in Ticker and Date order with one sort of the integer codes of the joined columns
+    columns = {}
+    for name in PRICE_COLUMNS:
+        values = [decoded[name] for decoded, _ in results]
+        columns[name] = np.concatenate(values) if name != 'Volume' or len({v.dtype for v in values}) == 1 else \
+            np.concatenate([v.astype(float) for v in values])
+    ticker_codes = pd.factorize(columns['Ticker'], sort=True)[0]
+    order = np.lexsort((columns['Date'], ticker_codes))
+    df_pricing = pd.DataFrame({name: values[order] for name, values in columns.items()})
+
+    return df_pricing, df_report
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the ETL notebooks as a dependency graph instead of by hand, running independent loads at the same time and
+skipping loads whose inputs have not changed since their last successful run.
+
+Example:
+    python run_etl_tasks.py --workers 2
+    python run_etl_tasks.py --force
+    python run_etl_tasks.py --list
+"""
+
+import os
+import sys
+import argparse
+import functools
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_python_functions import get_dates_for_years
+from custom_profiling_functions import enable_profiling, profile_summary
+from custom_scheduler_functions import add_task, validate_task_graph, run_task_graph, run_notebook
+
+
+def build_etl_tasks(etl_folder, project_folder):
+
+    """
+    Builds the task graph of the 13 ETL notebooks.
+
+    Every GICS STG notebook clears and refills the shared Data_STG table, so each STG load waits for the load that
+    reads the previous staged data. The market calendar does not use Data_STG and runs alongside the GICS loads, and
+    the prices are staged in their own Yahoo_Equity_Prices_STG table keyed by the Ticker_IDs of the Equities load.
+
+    Args:
+        - etl_folder: String with the folder holding the notebooks.
+        - project_folder: String with the Financial_Securities project folder holding the source files.
+
+    Returns:
+        - dict: The tasks built with add_task.
+    """
+
+    def notebook_task(tasks, name, depends_on=None, inputs=None):
+        path = os.path.join(etl_folder, 'Load-' + name + '.ipynb')
+        add_task(tasks, name, functools.partial(run_notebook, path), depends_on, [path] + (inputs or []))
+
+    gics_file = os.path.join(project_folder, 'Data-Source-Files', 'GICS_Industries.csv')
+    gics_file2 = os.path.join(project_folder, 'Data_Files', 'GICS_Industries.csv')
+    combined_file = os.path.join(project_folder, 'Data-Source-Files', 'SP500_GICS_Combined.csv')
+    equities_file = os.path.join(project_folder, 'Data-Source-Files', 'SP500_Equities_Prices.csv')
+
+    tasks = {}
+    notebook_task(tasks, 'Sectors_STG', inputs=[gics_file])
+    notebook_task(tasks, 'Sectors', ['Sectors_STG'])
+    notebook_task(tasks, 'Industry_Groups_STG', ['Sectors'], [gics_file2])
+    notebook_task(tasks, 'Industry_Groups', ['Industry_Groups_STG', 'Sectors'])
+    notebook_task(tasks, 'Industries_STG', ['Industry_Groups'], [gics_file2])
+    notebook_task(tasks, 'Industries', ['Industries_STG', 'Industry_Groups'])
+    notebook_task(tasks, 'Sub_Industries_STG', ['Industries'], [gics_file2])
+    notebook_task(tasks, 'Sub_Industries', ['Sub_Industries_STG', 'Industries'])
+    notebook_task(tasks, 'Equities_STG', ['Sub_Industries'], [combined_file, equities_file])
+    notebook_task(tasks, 'Equities', ['Equities_STG', 'Sub_Industries'])
+
+    # The calendar and price loads change with the date range they cover
+    notebook_task(tasks, 'US_Market_Calendar', inputs=[lambda: get_dates_for_years(3, 6)])
+    notebook_task(tasks, 'Yahoo_Equity_Prices_STG', ['Equities'], [lambda: get_dates_for_years(3, 0)])
+    notebook_task(tasks, 'Yahoo_Equity_Prices', ['Yahoo_Equity_Prices_STG', 'US_Market_Calendar', 'Equities'])
+
+    return tasks
+
+
+def main():
+
+    default_project_folder = os.path.join(os.path.expanduser('~'), 'Documents', 'Projects', 'Financial_Securities')
+
+    parser = argparse.ArgumentParser(description='Run the ETL notebooks in dependency order.')
+    parser.add_argument('--workers', type=int, default=2, help='Number of notebooks that can run at the same time')
+    parser.add_argument('--project-folder', default=default_project_folder, help='Folder holding the source files')
+    parser.add_argument('--state', default='etl_task_state.json', help='Path of the task state file')
+    parser.add_argument('--force', action='store_true', help='Run every task even when its inputs are unchanged')
+    parser.add_argument('--list', action='store_true', help='List the tasks in dependency order and exit')
+    parser.add_argument('--profile-log', default=None, help='Path of a JSON-lines profiling log to write')
+    args = parser.parse_args()
+
+    tasks = build_etl_tasks(os.path.dirname(os.path.abspath(__file__)), args.project_folder)
+
+    if args.list:
+        for name in validate_task_graph(tasks):
+            print(f"{name} <- {', '.join(tasks[name]['depends_on']) or '-'}")
+        return 0
+
+    if args.profile_log:
+        enable_profiling(args.profile_log)
+
+    df_report = run_task_graph(tasks, max_workers=args.workers, state_path=args.state, force=args.force)
+    print(df_report.to_string(index=False))
+
+    critical_seconds = df_report.loc[df_report['Critical Path'], 'Seconds'].sum()
+    print(f"Wall time: {df_report['Finish'].max()} seconds, critical path: {round(critical_seconds, 4)} seconds, "
+          f"sum of task times: {round(df_report['Seconds'].sum(), 4)} seconds")
+
+    if args.profile_log:
+        print(profile_summary().to_string(index=False))
+
+    # Return a non-zero exit code when any task failed or was blocked
+    return 1 if df_report['Status'].isin(['Failed', 'Blocked']).any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
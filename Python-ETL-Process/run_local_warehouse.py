@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Mirrors the Equities schema into an embedded SQLite (or DuckDB) database and runs the SQL-Equity-Performance-Analysis
+functions and queries locally, optionally checking every query against the Python calculations.
+
+Example:
+    python run_local_warehouse.py --local-db Equities_Local.db --parity
+    python run_local_warehouse.py --prices-file prices.parquet --local-db Equities_Local.db
+    python run_local_warehouse.py --no-refresh --query FN_Yahoo_Ticker_Year_Returns --ticker AAPL
+"""
+
+import os
+import sys
+import argparse
+import pandas as pd
+import sqlalchemy as sa
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_python_functions import create_connection, load_key, decrypt
+from custom_profiling_functions import enable_profiling, profile_summary
+from custom_rollup_functions import GICS_COMBINED_FILE
+from custom_local_backend_functions import (BACKENDS, LOCAL_QUERIES, QUERY_PARAMETERS, LocalWarehouse,
+                                            build_local_tables, read_price_file, read_warehouse_tables,
+                                            create_local_warehouse, run_local_query, check_backend_parity)
+
+
+def create_engine(args):
+
+    """
+    Creates the engine of the database given by --db-url, or of the Azure data warehouse using the encrypted keys.
+    """
+
+    if args.db_url:
+        return sa.create_engine(args.db_url)
+
+    key_path = args.key_folder.rstrip('/\\') + '/'
+    uid = decrypt(key_path, 'user_key.txt', load_key(key_path, 'user_key.ky'))
+    passwd = decrypt(key_path, 'pass_key.txt', load_key(key_path, 'pass_key.ky'))
+
+    _, e = create_connection(args.server, args.database, uid, passwd)
+
+    return e
+
+
+def read_local_pricing(warehouse):
+
+    """
+    Reads the daily prices of every Ticker from the local copy, for the parity check.
+    """
+
+    return warehouse.query("""SELECT
+            TRIM(q2.Ticker) AS Ticker,
+            q1."Date",
+            q1."Open",
+            q1."High",
+            q1."Low",
+            q1."Close",
+            q1.Volume
+    FROM Yahoo_Equity_Prices q1
+    INNER JOIN Equities q2
+    ON q1.Ticker_ID = q2.Ticker_ID
+    ORDER BY q2.Ticker, q1."Date"
+    """)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Run the warehouse analysis queries on a local embedded copy.')
+    parser.add_argument('--db-url', default=None, help='SQLAlchemy URL of the database (default: Azure warehouse)')
+    parser.add_argument('--server', default='danvuk.database.windows.net', help='SQL Server name')
+    parser.add_argument('--database', default='Financial_Securities', help='Database name')
+    parser.add_argument('--key-folder', default=external_folder_path, help='Folder holding the encrypted keys')
+    parser.add_argument('--schema', default=None, help="Schema name (default: 'Equities', none for SQLite)")
+    parser.add_argument('--prices-file', default=None, help='Parquet or CSV file of daily prices to load instead '
+                                                            'of mirroring the warehouse')
+    parser.add_argument('--gics-file', default=GICS_COMBINED_FILE, help='Path of SP500_GICS_Combined.csv')
+    parser.add_argument('--local-db', default='Equities_Local.db', help='Path of the local database file')
+    parser.add_argument('--backend', default='sqlite', choices=BACKENDS, help='Embedded engine')
+    parser.add_argument('--no-refresh', action='store_true', help='Query the existing local database as is')
+    parser.add_argument('--query', default=None, choices=list(LOCAL_QUERIES), help='Function or query to run')
+    parser.add_argument('--ticker', default=None, help='Ticker of the FN_Yahoo_Ticker_* functions (default: all)')
+    parser.add_argument('--top-n', type=int, default=None, help='Highest rank of the ranking queries')
+    parser.add_argument('--percentile', type=int, default=None, help='Lowest percentile of the percentile query')
+    parser.add_argument('--parity', action='store_true', help='Compare every query with the Python calculations')
+    parser.add_argument('--profile-log', default=None, help='Path of a JSON-lines profiling log to write')
+    args = parser.parse_args()
+
+    if args.schema is None:
+        args.schema = None if (args.db_url or '').startswith('sqlite') else 'Equities'
+
+    if args.profile_log:
+        enable_profiling(args.profile_log)
+
+    if args.no_refresh:
+        warehouse = LocalWarehouse(args.local_db, args.backend)
+    else:
+        if args.prices_file:
+            tables = build_local_tables(pd.read_csv(args.gics_file, encoding='utf-8-sig'),
+                                        read_price_file(args.prices_file))
+        else:
+            tables = read_warehouse_tables(create_engine(args), args.schema)
+        warehouse = create_local_warehouse(tables, args.local_db, args.backend)
+        print(f"Loaded {len(tables['Yahoo_Equity_Prices'])} prices of {len(tables['Equities'])} Equities "
+              f"into {args.local_db}")
+
+    exit_code = 0
+    try:
+        if args.query:
+            params = {'ticker': args.ticker, 'top_n': args.top_n, 'percentile': args.percentile}
+            params = {name: value for name, value in params.items()
+                      if value is not None and name in QUERY_PARAMETERS[args.query]}
+            print(run_local_query(warehouse, args.query, **params).to_string(index=False))
+
+        if args.parity:
+            df_report = check_backend_parity(warehouse, read_local_pricing(warehouse))
+            print(df_report.to_string(index=False))
+            exit_code = 0 if df_report['Passed'].all() else 1
+    finally:
+        warehouse.close()
+
+    if args.profile_log:
+        print(profile_summary().to_string(index=False))
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Serves the bars, returns, statistics, drawdowns and rankings of the Tickers and GICS groups over HTTP from one
+in-memory copy of the daily prices, reloading the prices from the data warehouse on a schedule.
+
+Example:
+    python run_metrics_service.py --port 8050 --reload-minutes 60
+    python run_metrics_service.py --port 8050 --partitions 8 --pool-size 4
+    python run_metrics_service.py --prices-file prices.parquet --port 8050
+    curl "http://localhost:8050/returns?period=Year&ticker=MSFT"
+    curl "http://localhost:8050/rankings?period=Quarter&level=Sector&top=3&start=2024-01-01"
+"""
+
+import os
+import sys
+import argparse
+import threading
+import sqlalchemy as sa
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_python_functions import create_connection, load_key, decrypt
+from custom_profiling_functions import enable_profiling
+from custom_rollup_functions import load_gics_membership
+from custom_local_backend_functions import read_price_file
+from custom_service_functions import MetricsStore, create_metrics_server, read_service_prices
+from custom_warehouse_functions import PARTITION_KEYS, read_partitioned_prices
+
+
+def create_engine(args):
+
+    """
+    Creates the pooled engine of the database given by --db-url, or of the Azure data warehouse using the encrypted
+    keys. Pooled connections are checked before use and recycled, since the warehouse closes idle connections.
+    """
+
+    pool_options = {'pool_size': args.pool_size, 'pool_pre_ping': True, 'pool_recycle': 1800}
+
+    if args.db_url:
+        return sa.create_engine(args.db_url, **pool_options)
+
+    key_path = args.key_folder.rstrip('/\\') + '/'
+    uid = decrypt(key_path, 'user_key.txt', load_key(key_path, 'user_key.ky'))
+    passwd = decrypt(key_path, 'pass_key.txt', load_key(key_path, 'pass_key.ky'))
+
+    _, e = create_connection(args.server, args.database, uid, passwd, **pool_options)
+
+    return e
+
+
+def read_partitions(e, args):
+
+    """
+    Reads the prices with --partitions concurrent queries on the --pool-size pooled connections, printing the latency
+    of every partition with --verbose.
+    """
+
+    df_pricing, df_report = read_partitioned_prices(e, args.schema, args.partition_by, args.partitions, args.pool_size)
+    if args.verbose:
+        print(df_report.to_string(index=False))
+
+    return df_pricing
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Serve the equity metrics over HTTP from memory.')
+    parser.add_argument('--db-url', default=None, help='SQLAlchemy URL of the database (default: Azure warehouse)')
+    parser.add_argument('--server', default='danvuk.database.windows.net', help='SQL Server name')
+    parser.add_argument('--database', default='Financial_Securities', help='Database name')
+    parser.add_argument('--key-folder', default=external_folder_path, help='Folder holding the encrypted keys')
+    parser.add_argument('--schema', default=None, help="Schema name (default: 'Equities', none for SQLite)")
+    parser.add_argument('--prices-file', default=None, help='Parquet or CSV file of daily prices to serve instead '
+                                                            'of the warehouse')
+    parser.add_argument('--gics-file', default=None, help='Path of SP500_GICS_Combined.csv')
+    parser.add_argument('--host', default='localhost', help='Host name to listen on')
+    parser.add_argument('--port', type=int, default=8050, help='Port to listen on')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Responses kept in the response cache')
+    parser.add_argument('--pool-size', type=int, default=2, help='Database connections kept in the pool')
+    parser.add_argument('--partitions', type=int, default=1, help='Partitions of the price reads, read concurrently '
+                                                                   'on the pooled connections (default: one query)')
+    parser.add_argument('--partition-by', default='ticker', choices=PARTITION_KEYS, help='Split the price reads by '
+                                                                                       'Ticker_ID or Year ranges')
+    parser.add_argument('--reload-minutes', type=float, default=None, help='Minutes between price reloads '
+                                                                           '(default: never)')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    parser.add_argument('--profile-log', default=None, help='Path of a JSON-lines profiling log to write')
+    args = parser.parse_args()
+
+    if args.schema is None:
+        args.schema = None if (args.db_url or '').startswith('sqlite') else 'Equities'
+
+    if args.profile_log:
+        enable_profiling(args.profile_log)
+
+    df_membership = load_gics_membership(args.gics_file)
+
+    if args.prices_file:
+        read_prices = lambda: read_price_file(args.prices_file)
+    elif args.partitions > 1:
+        e = create_engine(args)
+        read_prices = lambda: read_partitions(e, args)
+    else:
+        e = create_engine(args)
+        read_prices = lambda: read_service_prices(e, args.schema)
+
+    store = MetricsStore(read_prices(), df_membership, cache_size=args.cache_size)
+    server = create_metrics_server(store, args.host, args.port, args.verbose)
+
+    # Reload the prices in the background, the responses of the previous version are served until the load finishes
+    stop = threading.Event()
+
+    def reload_prices():
+        while not stop.wait(args.reload_minutes * 60):
+            try:
+                version = store.load(read_prices(), df_membership)
+                print(f"Prices reloaded, data version {version}")
+            except (sa.exc.SQLAlchemyError, OSError, ValueError) as err:
+                print(f"Issue reloading the prices, still serving version {store.version}! Error: {err}")
+
+    if args.reload_minutes:
+        threading.Thread(target=reload_prices, name='reload', daemon=True).start()
+
+    print(f"Serving data version {store.version} on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Exports the Year, Quarter and Month bars, returns and statistics of every Ticker and GICS level for the Power BI
+data model, regenerating only the periods touched by the prices loaded since the last export.
+
+Example:
+    python run_period_export.py --output-folder Power_BI_Export
+    python run_period_export.py --output-folder Power_BI_Export --format csv --full
+    python run_period_export.py --output-folder Power_BI_Export --compute arrow
+    python run_period_export.py --db-url sqlite:///prices.db --output-folder Power_BI_Export --to-warehouse
+"""
+
+import os
+import sys
+import argparse
+import pandas as pd
+import sqlalchemy as sa
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_python_functions import create_connection, load_key, decrypt
+from custom_profiling_functions import enable_profiling, profile_summary
+from custom_rollup_functions import GICS_LEVELS
+from custom_export_functions import PERIODS, COMPUTE_PATHS, export_period_tables
+
+
+def create_engine(args):
+
+    """
+    Creates the engine of the database given by --db-url, or of the Azure data warehouse using the encrypted keys.
+    """
+
+    if args.db_url:
+        return sa.create_engine(args.db_url)
+
+    key_path = args.key_folder.rstrip('/\\') + '/'
+    uid = decrypt(key_path, 'user_key.txt', load_key(key_path, 'user_key.ky'))
+    passwd = decrypt(key_path, 'pass_key.txt', load_key(key_path, 'pass_key.ky'))
+
+    _, e = create_connection(args.server, args.database, uid, passwd)
+
+    return e
+
+
+def read_pricing(e, schema):
+
+    """
+    Reads the daily prices of every Ticker with its GICS levels, like the Sector/Sub_Industry analysis query.
+    """
+
+    prefix = '' if schema is None else schema + '.'
+    sql_stat = f"""SELECT
+            TRIM(q6.Name) AS Sector,
+            TRIM(q5.Name) AS Industry_Group,
+            TRIM(q4.Name) AS Industry,
+            TRIM(q3.Name) AS Sub_Industry,
+            q2.Ticker_ID,
+            TRIM(q2.Ticker) AS Ticker,
+            q1.Date,
+            ROUND(q1.[Open], 2) AS "Open",
+            ROUND(q1.[High], 2) AS "High",
+            ROUND(q1.[Low], 2) AS "Low",
+            ROUND(q1.[Close], 2) AS "Close",
+            q1.Volume AS "Volume"
+    FROM {prefix}Yahoo_Equity_Prices q1
+    INNER JOIN {prefix}Equities q2
+    ON q1.Ticker_ID = q2.Ticker_ID
+    INNER JOIN {prefix}Sub_Industries q3
+    ON q2.Sub_Industry_ID = q3.Sub_Industry_ID
+    INNER JOIN {prefix}Industries q4
+    ON q3.Industry_ID = q4.Industry_ID
+    INNER JOIN {prefix}Industry_Groups q5
+    ON q4.Industry_Group_ID = q5.Industry_Group_ID
+    INNER JOIN {prefix}Sectors q6
+    ON q5.Sector_ID = q6.Sector_ID
+    ORDER BY q2.Ticker, q1.Date
+    """
+
+    df_pricing = pd.read_sql(sql_stat, e)
+    if df_pricing.empty:
+        raise ValueError("DataFrame is empty after SQL query.")
+
+    df_pricing['Date'] = pd.to_datetime(df_pricing['Date'])
+    df_pricing['Year'] = df_pricing['Date'].dt.year
+
+    return df_pricing
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Export the period tables of the Power BI data model.')
+    parser.add_argument('--db-url', default=None, help='SQLAlchemy URL of the database (default: Azure warehouse)')
+    parser.add_argument('--server', default='danvuk.database.windows.net', help='SQL Server name')
+    parser.add_argument('--database', default='Financial_Securities', help='Database name')
+    parser.add_argument('--key-folder', default=external_folder_path, help='Folder holding the encrypted keys')
+    parser.add_argument('--schema', default=None, help="Schema name (default: 'Equities', none for SQLite)")
+    parser.add_argument('--output-folder', default='Power_BI_Export', help='Folder to export the tables to')
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'csv'], help='File format of the tables')
+    parser.add_argument('--periods', nargs='+', default=list(PERIODS), help='Period types to export')
+    parser.add_argument('--since', default=None, help='First Date with new prices (default: last exported Date)')
+    parser.add_argument('--full', action='store_true', help='Regenerate every period, e.g. after price corrections')
+    parser.add_argument('--to-warehouse', action='store_true', help='Also write the tables to the database')
+    parser.add_argument('--compute', default='pandas', choices=COMPUTE_PATHS, help='Compute path of the period bars '
+                                                                                  'and returns')
+    parser.add_argument('--profile-log', default=None, help='Path of a JSON-lines profiling log to write')
+    args = parser.parse_args()
+
+    if args.schema is None:
+        args.schema = None if (args.db_url or '').startswith('sqlite') else 'Equities'
+
+    if args.profile_log:
+        enable_profiling(args.profile_log)
+
+    e = create_engine(args)
+    df_pricing = read_pricing(e, args.schema)
+    df_membership = df_pricing[['Ticker'] + GICS_LEVELS].drop_duplicates(subset='Ticker')
+
+    df_report = export_period_tables(df_pricing, args.output_folder, df_membership, periods=args.periods,
+                                     file_format=args.format, since_date=args.since, full=args.full,
+                                     engine=e if args.to_warehouse else None, schema=args.schema,
+                                     compute=args.compute)
+
+    print(df_report.to_string(index=False))
+    print(f"Wrote {df_report['Written'].sum()} of {df_report['Partitions'].sum()} partitions to {args.output_folder}")
+
+    if args.profile_log:
+        print(profile_summary().to_string(index=False))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Loads the Yahoo Finance daily prices into Yahoo_Equity_Prices without the notebooks, overlapping the fetch, staging
+and merge stages. Re-running the same command after a failure resumes from the checkpoint file.
+
+Example:
+    python run_price_pipeline.py --years 3 --batch-size 25 --checkpoint price_pipeline_checkpoint.json
+    python run_price_pipeline.py --db-url sqlite:///prices.db --tickers MSFT AAPL --pause 0 --verify
+    python run_price_pipeline.py --gics-file ../Data-Source-Files/SP500_GICS_Combined.csv
+"""
+
+import os
+import sys
+import argparse
+import pandas as pd
+import sqlalchemy as sa
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_python_functions import create_connection, load_key, decrypt, get_dates_for_years
+from custom_profiling_functions import enable_profiling, profile_summary
+from custom_etl_functions import run_price_pipeline
+
+
+def create_engine(args):
+
+    """
+    Creates the engine of the database given by --db-url, or of the Azure data warehouse using the encrypted keys.
+    """
+
+    if args.db_url:
+        return sa.create_engine(args.db_url)
+
+    key_path = args.key_folder.rstrip('/\\') + '/'
+    uid = decrypt(key_path, 'user_key.txt', load_key(key_path, 'user_key.ky'))
+    passwd = decrypt(key_path, 'pass_key.txt', load_key(key_path, 'pass_key.ky'))
+
+    _, e = create_connection(args.server, args.database, uid, passwd)
+
+    return e
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Load the Yahoo Finance daily prices with a pipelined ETL.')
+    parser.add_argument('--db-url', default=None, help='SQLAlchemy URL of the database (default: Azure warehouse)')
+    parser.add_argument('--server', default='danvuk.database.windows.net', help='SQL Server name')
+    parser.add_argument('--database', default='Financial_Securities', help='Database name')
+    parser.add_argument('--key-folder', default=external_folder_path, help='Folder holding the encrypted keys')
+    parser.add_argument('--schema', default=None, help="Schema name (default: 'Equities', none for SQLite)")
+    parser.add_argument('--tickers', nargs='+', default=None, help='Tickers to load (default: all Equities)')
+    parser.add_argument('--years', type=int, default=3, help='Years of daily prices to load')
+    parser.add_argument('--batch-size', type=int, default=25, help='Tickers staged and merged per transaction')
+    parser.add_argument('--queue-size', type=int, default=4, help='Batches each queue holds before blocking')
+    parser.add_argument('--fetch-workers', type=int, default=1, help='Number of fetcher threads')
+    parser.add_argument('--pause', type=float, default=1.0, help='Seconds between downloads per fetcher')
+    parser.add_argument('--checkpoint', default='price_pipeline_checkpoint.json', help='Checkpoint file path')
+    parser.add_argument('--gics-file', default=None, help='SP500_GICS_Combined.csv of tickers to create in Equities '
+                                                          'before the load when they are missing')
+    parser.add_argument('--verify', action='store_true', help='Verify the staged and merged rows after the load')
+    parser.add_argument('--profile-log', default=None, help='Path of a JSON-lines profiling log to write')
+    args = parser.parse_args()
+
+    if args.schema is None:
+        args.schema = None if (args.db_url or '').startswith('sqlite') else 'Equities'
+
+    if args.profile_log:
+        enable_profiling(args.profile_log)
+
+    e = create_engine(args)
+
+    df_new_equities = pd.read_csv(args.gics_file, encoding='utf-8-sig') if args.gics_file else None
+
+    # Generate the date range of the years back as of yesterday
+    start_date, end_date = get_dates_for_years(args.years, 0)
+
+    report = run_price_pipeline(e, start_date, end_date, tickers=args.tickers, schema=args.schema,
+                                batch_size=args.batch_size, queue_size=args.queue_size,
+                                n_fetch_workers=args.fetch_workers, pause=args.pause,
+                                checkpoint_path=args.checkpoint, verify=args.verify,
+                                df_new_equities=df_new_equities)
+
+    if report['Created']:
+        print(f"Created {len(report['Created'])} tickers in Equities: {', '.join(report['Created'])}")
+
+    print(report['Stages'].to_string(index=False))
+    print(f"Merged {len(report['Merged'])} of {report['Tickers']} tickers ({report['Resumed']} resumed from the "
+          f"checkpoint) in {report['Seconds']} seconds")
+
+    for ticker, reason in report['Failed'].items():
+        print(f"{ticker}: {reason}")
+
+    verified = True
+    for table, verification in report.get('Verification', {}).items():
+        verified = verified and verification['Verified']
+        print(f"{table}: {verification['Rows']} rows of {verification['Keys']} tickers, "
+              f"{len(verification['Diverged'])} diverged")
+        if not verification['Verified']:
+            print(verification['Diverged'].to_string(index=False))
+            print(verification['Dates'].to_string(index=False))
+
+    if args.profile_log:
+        print(profile_summary().to_string(index=False))
+
+    # Return a non-zero exit code when any ticker was not loaded or did not verify
+    return 1 if report['Failed'] or not verified else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Applies Barchart price snapshots of the S&P 500 universe as they arrive, from files dropped in a folder or from a
+local socket, and prints the intraday Sector aggregates and top and bottom tickers after every snapshot.
+
+Example:
+    python run_snapshot_stream.py --files ../Data-Source-Files/SP500_Equities_Prices.csv
+    python run_snapshot_stream.py --drop-folder Snapshots --idle-timeout 600 --top-n 5
+    python run_snapshot_stream.py --socket localhost:9009 --levels Sector Industry
+"""
+
+import os
+import sys
+import argparse
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_profiling_functions import enable_profiling, profile_summary
+from custom_rollup_functions import GICS_LEVELS, load_gics_membership
+from custom_streaming_functions import (SnapshotBook, parse_snapshot, iter_snapshot_folder, iter_snapshot_socket,
+                                        run_snapshot_stream)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Apply S&P 500 price snapshots to an in-memory latest-price table.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--files', nargs='+', default=None, help='Snapshot files to apply in order')
+    source.add_argument('--drop-folder', default=None, help='Folder that new snapshot files are dropped in')
+    source.add_argument('--socket', default=None, help='host:port of a local socket sending snapshots')
+    parser.add_argument('--gics-file', default=None, help='Path of SP500_GICS_Combined.csv')
+    parser.add_argument('--levels', nargs='+', default=['Sector'], choices=GICS_LEVELS, help='GICS levels to aggregate')
+    parser.add_argument('--top-n', type=int, default=10, help='Number of top and bottom tickers to print')
+    parser.add_argument('--poll-seconds', type=float, default=1.0, help='Seconds between scans of the drop folder')
+    parser.add_argument('--idle-timeout', type=float, default=None, help='Stop after this many seconds without a '
+                                                                         'new file (default: wait forever)')
+    parser.add_argument('--quiet', action='store_true', help='Only print the processing time of each snapshot')
+    parser.add_argument('--profile-log', default=None, help='Path of a JSON-lines profiling log to write')
+    args = parser.parse_args()
+
+    if args.profile_log:
+        enable_profiling(args.profile_log)
+
+    book = SnapshotBook(load_gics_membership(args.gics_file), levels=args.levels)
+
+    if args.files:
+        snapshots = ((path, parse_snapshot(path)) for path in args.files)
+    elif args.drop_folder:
+        snapshots = iter_snapshot_folder(args.drop_folder, args.poll_seconds, args.idle_timeout)
+    else:
+        host, port = args.socket.rsplit(':', 1)
+        snapshots = iter_snapshot_socket(host, int(port))
+
+    def print_update(book, report):
+        print(f"Snapshot {report['Snapshot']}: {report['Changed']} of {report['Rows']} tickers changed, "
+              f"{report['Unknown']} unknown, {report['Milliseconds']} ms")
+        if args.quiet:
+            return
+        for level in args.levels:
+            print(book.group_summary(level).to_string(index=False))
+        print(book.top(args.top_n).to_string(index=False))
+        print(book.top(args.top_n, largest=False).to_string(index=False))
+
+    try:
+        df_report = run_snapshot_stream(book, snapshots, on_update=print_update)
+    except KeyboardInterrupt:
+        return 0
+
+    if len(df_report) > 0:
+        print(f"Applied {len(df_report)} snapshots, median {df_report['Milliseconds'].median()} ms and maximum "
+              f"{df_report['Milliseconds'].max()} ms per snapshot")
+
+    if args.profile_log:
+        print(profile_summary().to_string(index=False))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
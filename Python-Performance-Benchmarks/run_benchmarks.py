@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the benchmark suite on synthetic S&P-scale pricing panels and optionally saves or compares a baseline.
+
+Example:
+    python run_benchmarks.py --tickers 100 500 --years 3 --save-baseline baselines/baseline.json
+    python run_benchmarks.py --tickers 100 500 --years 3 --compare baselines/baseline.json
+"""
+
+import os
+import sys
+import argparse
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_benchmark_functions import BENCHMARKS, run_benchmark_suite, save_benchmark_baseline, compare_benchmark_baseline
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the custom Python functions on synthetic data.')
+    parser.add_argument('--tickers', type=int, nargs='+', default=[100, 500, 5000], help='Ticker counts to benchmark')
+    parser.add_argument('--years', type=int, default=3, help='Years of daily prices per ticker')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic data')
+    parser.add_argument('--repeats', type=int, default=1, help='Runs per benchmark, the fastest is kept')
+    parser.add_argument('--benchmarks', nargs='+', default=None, help='Benchmark names to run (default: all)')
+    parser.add_argument('--list', action='store_true', help='List the registered benchmarks and exit')
+    parser.add_argument('--save-baseline', default=None, help='Path of the baseline file to write')
+    parser.add_argument('--compare', default=None, help='Path of the baseline file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed relative regression')
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return 0
+
+    df_results = run_benchmark_suite(tuple(args.tickers), args.years, args.seed, args.benchmarks, args.repeats)
+    print(df_results.to_string(index=False))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        save_benchmark_baseline(df_results, args.save_baseline)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        df_compare = compare_benchmark_baseline(df_results, args.compare, args.tolerance)
+        print(df_compare.to_string(index=False))
+        # Return a non-zero exit code when any benchmark regressed
+        if df_compare['Regression'].any():
+            print("Benchmark regressions found!")
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Load tests the metrics service with concurrent keep-alive clients and reports the requests per second and the p50,
+p95 and p99 latencies. Without --url the service is started in this process on synthetic prices.
+
+Example:
+    python run_service_load_test.py --tickers 500 --years 3 --requests 5000 --concurrency 8
+    python run_service_load_test.py --url http://localhost:8050 --requests 2000 --cold
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+
+# Make the custom function library importable the same way the notebooks do
+external_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Custom-Python-Functions')
+sys.path.append(external_folder_path)
+from custom_benchmark_functions import generate_synthetic_pricing, generate_synthetic_gics
+from custom_rollup_functions import GICS_LEVELS
+from custom_service_functions import MetricsStore, create_metrics_server, run_load_test
+
+
+def build_request_mix(tickers, groups, n_tickers=50):
+
+    """
+    Builds a mix of single Ticker requests, GICS group requests and rankings across the periods.
+    """
+
+    paths = []
+    for number, ticker in enumerate(tickers[:n_tickers]):
+        period = ['Year', 'Quarter', 'Month'][number % 3]
+        paths.append(f'/returns?period={period}&ticker={ticker}')
+        paths.append(f'/bars?period={period}&ticker={ticker}')
+        paths.append(f'/drawdowns?period=Month&ticker={ticker}')
+    for group in groups:
+        paths.append('/returns?period=Month&level=Sector&name=' + urllib.parse.quote(group))
+    paths += ['/stats?period=Quarter&level=Sector', '/rankings?period=Year&top=10',
+              '/rankings?period=Quarter&level=Sector&top=3', '/stats?period=Year&level=Industry']
+
+    return paths
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Load test the metrics service.')
+    parser.add_argument('--url', default=None, help='URL of a running service (default: start one on synthetic data)')
+    parser.add_argument('--tickers', type=int, default=500, help='Synthetic tickers of the in-process service')
+    parser.add_argument('--years', type=int, default=3, help='Synthetic years of daily prices')
+    parser.add_argument('--requests', type=int, default=5000, help='Total number of requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients')
+    parser.add_argument('--cold', action='store_true', help='Do not send every request once before measuring')
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        df_pricing = generate_synthetic_pricing(args.tickers, args.years)
+        df_gics = generate_synthetic_gics(args.tickers)
+        store = MetricsStore(df_pricing, df_gics[['Ticker'] + GICS_LEVELS])
+        server = create_metrics_server(store, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.url = f'http://localhost:{server.server_address[1]}'
+        tickers = df_pricing['Ticker'].unique().tolist()
+        groups = sorted(df_gics['Sector'].unique())
+    else:
+        with urllib.request.urlopen(args.url + '/returns?period=Year&limit=100000') as response:
+            tickers = sorted({row['Ticker'] for row in json.loads(response.read())['data']})
+        with urllib.request.urlopen(args.url + '/returns?period=Year&level=Sector') as response:
+            groups = sorted({row['Sector'] for row in json.loads(response.read())['data']})
+
+    paths = build_request_mix(tickers, groups)
+
+    try:
+        if not args.cold:
+            # Calculate the derived metrics and fill the response cache so the test measures the steady state
+            warm = run_load_test(args.url, paths, len(paths), 1)
+            print(f"Warm-up: {warm['Requests']} requests in {warm['Seconds']} seconds")
+
+        report = run_load_test(args.url, paths, args.requests, args.concurrency)
+        for name, value in report.items():
+            print(f"{name}: {value}")
+
+        with urllib.request.urlopen(args.url + '/cache') as response:
+            print(response.read().decode('utf-8'))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    return 1 if report['Errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())